@@ -1151,6 +1151,7 @@ def clean():
                    "xpra/net/vsock/vsock.c",
                    "xpra/net/lz4/lz4.c",
                    "xpra/buffers/membuf.c",
+                   "xpra/buffers/arena.c",
                    "xpra/buffers/xxh.c",
                    "xpra/buffers/cyxor.c",
                    "xpra/codecs/vpx/encoder.c",
@@ -1186,6 +1187,7 @@ def clean():
                    "xpra/server/cystats.c",
                    "xpra/rectangle.c",
                    "xpra/server/window/motion.c",
+                   "xpra/server/window/region_stats.c",
                    "xpra/server/pam.c",
                    "fs/etc/xpra/xpra.conf",
                    #special case for the generated xpra conf files in build (see #891):
@@ -2015,6 +2017,7 @@ if cython_ENABLED:
     extra_compile_args = "-mfpmath=387" if platform.machine()=="i386" else None
     tace(cython_ENABLED, "xpra.buffers.membuf,xpra/buffers/memalign.c", optimize=3, extra_compile_args=extra_compile_args)
     tace(cython_ENABLED, "xpra.buffers.xxh,xpra/buffers/xxhash.c", optimize=3, extra_compile_args=extra_compile_args)
+    tace(cython_ENABLED, "xpra.buffers.arena", optimize=3)
 
 toggle_packages(dbus_ENABLED, "xpra.dbus")
 toggle_packages(server_ENABLED or proxy_ENABLED, "xpra.server", "xpra.server.auth")
@@ -2049,7 +2052,7 @@ if x11_ENABLED:
     ace("xpra.x11.bindings.posix_display_source", "x11")
     ace("xpra.x11.bindings.randr", "x11,xrandr")
     ace("xpra.x11.bindings.keyboard", "x11,xtst,xfixes,xkbfile")
-    ace("xpra.x11.bindings.window", "x11,xtst,xfixes,xcomposite,xdamage,xext")
+    ace("xpra.x11.bindings.window", "x11,x11-xcb,xtst,xfixes,xcomposite,xdamage,xext")
     ace("xpra.x11.bindings.ximage", "x11,xext,xcomposite")
     ace("xpra.x11.bindings.res", "x11,xres")
     tace(xinput_ENABLED, "xpra.x11.bindings.xi2", "x11,xi")
@@ -2129,6 +2132,7 @@ tace(client_ENABLED or server_ENABLED, "xpra.buffers.cyxor", optimize=3)
 tace(client_ENABLED or server_ENABLED or shadow_ENABLED, "xpra.rectangle", optimize=3)
 tace(server_ENABLED or shadow_ENABLED, "xpra.server.cystats", optimize=3)
 tace(server_ENABLED or shadow_ENABLED, "xpra.server.window.motion", optimize=3)
+tace(server_ENABLED or shadow_ENABLED, "xpra.server.window.region_stats", optimize=3)
 if pam_ENABLED:
     if pkg_config_ok("--exists", "pam", "pam_misc"):
         pam_kwargs = {"pkgconfig_names" : "pam,pam_misc"}
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+from random import Random
+
+from xpra.audio.jitter import JitterBuffer, JITTER_MIN_SAMPLES
+
+
+BUFFER_DURATION = 20
+
+
+def feed(jb, count, delay_fn, clock_offset=123456):
+    #sender emits a buffer every BUFFER_DURATION ms,
+    #the receiver's clock has an arbitrary offset:
+    for i in range(count):
+        sent = i*BUFFER_DURATION
+        jb.record(sent, clock_offset+sent+delay_fn(i), BUFFER_DURATION)
+
+
+class TestJitterBuffer(unittest.TestCase):
+
+    def test_not_ready(self):
+        jb = JitterBuffer(50, 20, 500)
+        feed(jb, JITTER_MIN_SAMPLES-1, lambda i : 5)
+        assert not jb.is_ready()
+        #we keep the initial (maximum) target until we have enough data:
+        assert jb.get_target()==500
+
+    def test_low_jitter(self):
+        jb = JitterBuffer(50, 20, 1000)
+        rand = Random(0)
+        feed(jb, 500, lambda i : 10+rand.randint(0, 5))
+        assert jb.is_ready()
+        target = jb.get_target()
+        assert target<60, f"target is too high: {target}"
+        assert jb.get_info()["jitter"]<=5
+
+    def test_high_jitter(self):
+        jb = JitterBuffer(50, 20, 1000)
+        rand = Random(0)
+        feed(jb, 500, lambda i : 10+rand.randint(0, 150))
+        target = jb.get_target()
+        assert 150<target<=1000, f"unexpected target: {target}"
+
+    def test_spikes(self):
+        #a small percentage of late packets should not inflate the target:
+        jb = JitterBuffer(50, 20, 1000)
+        feed(jb, 500, lambda i : 400 if i%100==0 else 10)
+        assert jb.get_target()<60
+
+    def test_underrun(self):
+        jb = JitterBuffer(50, 20, 1000)
+        feed(jb, 100, lambda i : 10)
+        now = 1000
+        base = jb.get_target(now)
+        jb.underrun(now)
+        boosted = jb.get_target(now)
+        assert boosted>base
+        jb.underrun(now+1)
+        assert jb.get_target(now+1)>boosted
+        #the boost decays:
+        assert jb.get_target(now+1000)==base
+        assert jb.get_info()["underruns"]==2
+
+    def test_bounds(self):
+        jb = JitterBuffer(0, 30, 100)
+        feed(jb, 100, lambda i : 0)
+        assert jb.get_target()==30
+        feed(jb, 500, lambda i : (i*37)%1000)
+        assert jb.get_target()==100
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import os
+import unittest
+
+from xpra.os_util import POSIX
+from xpra.audio.shm_ring import create_audio_ring, open_audio_ring
+
+
+class TestAudioRing(unittest.TestCase):
+
+    def test_wraparound(self):
+        writer = create_audio_ring(4096)
+        reader = open_audio_ring(writer.filename)
+        try:
+            assert writer.capacity==reader.capacity==4096
+            for i in range(100):
+                data = bytes((i+j)%256 for j in range(1000+i))
+                ref = writer.write(data)
+                assert ref
+                assert reader.read(ref)==data
+            assert reader.get_info()["pending"]==0
+        finally:
+            reader.close()
+            writer.close()
+
+    def test_full(self):
+        writer = create_audio_ring(4096)
+        reader = open_audio_ring(writer.filename)
+        try:
+            refs = [writer.write(b"\1"*1024) for _ in range(4)]
+            assert all(refs)
+            #no more space:
+            assert writer.write(b"\2") is None
+            assert writer.get_info()["full"]==1
+            #too big:
+            assert writer.write(b"\3"*8192) is None
+            assert reader.read(refs[0])==b"\1"*1024
+            ref = writer.write(b"\4"*1024)
+            assert ref
+            for r in refs[1:]:
+                reader.read(r)
+            assert reader.read(ref)==b"\4"*1024
+            #references to data that was never written are rejected:
+            with self.assertRaises(ValueError):
+                reader.read((ref[0]+1024, 1024))
+        finally:
+            reader.close()
+            writer.close()
+
+    def test_unlink(self):
+        writer = create_audio_ring(4096)
+        filename = writer.filename
+        reader = open_audio_ring(filename)
+        #once mapped by both ends, the file can be removed:
+        writer.unlink()
+        assert not os.path.exists(filename)
+        data = b"audio"*100
+        assert reader.read(writer.write(data))==data
+        reader.close()
+        writer.close()
+
+    def test_compare_transports(self):
+        #both transports must deliver the same data as the packet serialization used by the subprocess pipe,
+        #see tests/xpra/net/benchmark_audio_transport.py for the timing comparison:
+        from xpra.net.packet_encoding import init_all, get_enabled_encoders, get_encoder, decode, PERFORMANCE_ORDER
+        init_all()
+        encoders = get_enabled_encoders(PERFORMANCE_ORDER)
+        if not encoders:
+            return
+        encode = get_encoder(encoders[0])
+        writer = create_audio_ring()
+        reader = open_audio_ring(writer.filename)
+        buffers = [os.urandom(512+i%1024) for i in range(256)]
+        try:
+            pipe_data = []
+            for data in buffers:
+                packet, flags = encode(("add_data", data, {}, ()))
+                pipe_data.append(decode(packet, flags)[1])
+            shm_data = []
+            for data in buffers:
+                packet, flags = encode(("add_shm_data", writer.write(data), {}, ()))
+                shm_data.append(reader.read(decode(packet, flags)[1]))
+            assert pipe_data==shm_data==buffers
+            assert reader.get_info()["pending"]==0
+        finally:
+            reader.close()
+            writer.close()
+
+
+def main():
+    if POSIX:
+        unittest.main()
+
+if __name__ == '__main__':
+    main()
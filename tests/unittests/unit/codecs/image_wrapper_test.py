@@ -7,7 +7,7 @@
 import unittest
 from time import monotonic
 
-from xpra.codecs.image_wrapper import ImageWrapper
+from xpra.codecs.image_wrapper import ImageWrapper, get_copy_info
 from xpra.util import envbool
 
 SHOW_PERF = envbool("XPRA_SHOW_PERF")
@@ -97,6 +97,26 @@ class TestImageWrapper(unittest.TestCase):
         assert img.freeze() is False
         img.clone_pixel_data()
 
+    def test_sub_image_rows(self):
+        W, H = 64, 32
+        pixels = bytes(y for y in range(H) for _ in range(W*4))
+        img = ImageWrapper(0, 0, W, H, pixels, "BGRX", 24, W*4)
+        copied = get_copy_info().get("sub-image", {}).get("bytes", 0)
+        #full rows are not copied:
+        sub = img.get_sub_image(0, 8, W, 4)
+        assert isinstance(sub.get_pixels(), memoryview)
+        assert sub.get_rowstride()==W*4
+        assert sub.get_target_y()==8
+        assert bytes(sub.get_pixels())==bytes([8])*W*4+bytes([9])*W*4+bytes([10])*W*4+bytes([11])*W*4
+        assert get_copy_info().get("sub-image", {}).get("bytes", 0)==copied
+        #the sub-image remains valid after the source is freed:
+        img.free()
+        assert bytes(sub.get_pixels()[:4])==bytes([8])*4
+        #partial rows are:
+        img = ImageWrapper(0, 0, W, H, pixels, "BGRX", 24, W*4)
+        img.get_sub_image(1, 0, W-1, 2)
+        assert get_copy_info()["sub-image"]["bytes"]==copied+(W-1)*4*2
+
     def test_restride(self):
         #restride of planar is not supported:
         img = ImageWrapper(0, 0, 1, 1, ["0"*10, "0"*10, "0"*10, "0"*10],
@@ -112,6 +112,30 @@ class TestLZ4(unittest.TestCase):
                 c = self.tc(v, level=l)
                 self.td(c, v)
 
+    def test_stream(self):
+        from xpra.net.lz4.lz4 import stream_compressor, stream_decompressor, compress, STREAM_MAX_SIZE  # @UnresolvedImport
+        c = stream_compressor()
+        d = stream_decompressor()
+        blocks = [b"window-metadata %i" % i for i in range(1000)]
+        blocks += [os.urandom(i*97 % STREAM_MAX_SIZE) for i in range(100)]
+        blocks.append(b"\0"*STREAM_MAX_SIZE)
+        stream_size = block_size = 0
+        for block in blocks:
+            cdata = c.compress(block)
+            assert mtb(d.decompress(cdata))==block
+            stream_size += len(cdata)
+            block_size += len(compress(block))
+        assert stream_size<block_size
+        with self.assertRaises(ValueError):
+            c.compress(b"\0"*(STREAM_MAX_SIZE+1))
+        #a new decompressor does not have the history:
+        block = os.urandom(1024)
+        c.compress(block)
+        cdata = c.compress(block)
+        assert len(cdata)<len(block)
+        with self.assertRaises(ValueError):
+            stream_decompressor().decompress(cdata)
+
 
 def main():
     if "-v" in sys.argv or "--verbose" in sys.argv:
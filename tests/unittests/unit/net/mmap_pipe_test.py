@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import mmap
+import unittest
+from threading import Thread
+
+from xpra.net.mmap_pipe import (
+    MmapSlots, get_slot_layout, mmap_read, mmap_free_slots, mmap_slots_write,
+    SLOT_FLAGS_OFFSET,
+    )
+
+SLOT_SIZE = 4096
+
+
+def make_slots(nslots=16):
+    size = (nslots+1)*SLOT_SIZE
+    area = mmap.mmap(-1, size)
+    return area, MmapSlots(area, size, SLOT_SIZE)
+
+
+class TestMmapSlots(unittest.TestCase):
+
+    def test_layout(self):
+        for size in (SLOT_SIZE*2, SLOT_SIZE*17, 1024*1024+123):
+            data_offset, nslots = get_slot_layout(size, SLOT_SIZE)
+            assert nslots>0
+            assert data_offset>=SLOT_FLAGS_OFFSET+nslots
+            assert data_offset%SLOT_SIZE==0
+            assert data_offset+nslots*SLOT_SIZE<=size
+        assert get_slot_layout(SLOT_SIZE, SLOT_SIZE)==(0, 0)
+        with self.assertRaises(ValueError):
+            MmapSlots(mmap.mmap(-1, SLOT_SIZE), SLOT_SIZE, SLOT_SIZE)
+
+    def test_roundtrip(self):
+        area, slots = make_slots()
+        data = bytes(i%251 for i in range(SLOT_SIZE*3+100))
+        chunks, free = slots.write(memoryview(data))
+        assert len(chunks)==1
+        assert free==slots.get_free_size()==(slots.nslots-4)*SLOT_SIZE
+        assert bytes(mmap_read(area, *chunks))==data
+        mmap_free_slots(area, SLOT_SIZE, *chunks)
+        assert slots.get_free_size()==slots.nslots*SLOT_SIZE
+        #same signature as mmap_write:
+        chunks, _ = mmap_slots_write(slots, len(area), b"\1"*10)
+        assert bytes(mmap_read(area, *chunks))==b"\1"*10
+        slots.close()
+        area.close()
+
+    def test_out_of_order_release(self):
+        area, slots = make_slots(8)
+        writes = [slots.write(bytes([i])*SLOT_SIZE)[0] for i in range(8)]
+        assert all(writes)
+        #full:
+        assert slots.write(b"\0")[0] is None
+        assert slots.get_info()["full"]==1
+        #release a slot in the middle, it can be re-used immediately:
+        mmap_free_slots(area, SLOT_SIZE, *writes[3])
+        chunks = slots.write(b"\x09"*SLOT_SIZE)[0]
+        assert chunks==writes[3]
+        #two free slots that are not contiguous cannot hold 2 slots of data:
+        mmap_free_slots(area, SLOT_SIZE, *writes[1])
+        mmap_free_slots(area, SLOT_SIZE, *writes[5])
+        assert slots.write(b"\0"*(SLOT_SIZE+1))[0] is None
+        mmap_free_slots(area, SLOT_SIZE, *writes[6])
+        chunks = slots.write(b"\0"*(SLOT_SIZE+1))[0]
+        assert chunks[0][0]==writes[5][0][0]
+        #the other buffers were not modified:
+        for i in (0, 2, 4, 7):
+            assert bytes(mmap_read(area, *writes[i]))==bytes([i])*SLOT_SIZE
+        slots.close()
+        area.close()
+
+    def test_concurrent_writers(self):
+        area, slots = make_slots(64)
+        results = {}
+        def writer(n):
+            chunks = []
+            for i in range(4):
+                data = bytes([n*4+i])*(SLOT_SIZE*2-n)
+                c = slots.write(data)[0]
+                assert c
+                chunks.append((c, data))
+            results[n] = chunks
+        threads = [Thread(target=writer, args=(n,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        offsets = set()
+        for chunks in results.values():
+            for c, data in chunks:
+                assert bytes(mmap_read(area, *c))==data
+                offsets.add(c[0][0])
+        #no two writers were given the same slots:
+        assert len(offsets)==32
+        assert slots.get_free_size()==0
+        slots.close()
+        area.close()
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -9,7 +9,7 @@ import time
 import unittest
 from gi.repository import GLib  # @UnresolvedImport
 
-from xpra.util import csv, envint, envbool
+from xpra.util import csv, envint, envbool, typedict
 from xpra.common import noop
 from xpra.net.protocol import socket_handler
 from xpra.net.protocol import check
@@ -222,6 +222,56 @@ class ProtocolTest(unittest.TestCase):
         log("do_test_read_speed(%i) %iMB in %ims", pixel_data_size, total_size, elapsed*1000)
         return N*len(packets), total_size, elapsed
 
+    def test_stream_compression(self):
+        from xpra.net import compression
+        if not compression.has_stream_compression():
+            return
+        #a recorded mix of small, repetitive packets:
+        packets = []
+        for i in range(200):
+            packets.append(("draw", 1, i%64, 0, 64, 64, "webp", b"", i, 0, {"flush" : 0, "quality" : 50}))
+            packets.append(("cursor", "png", 10+i%3, 20, 32, 32, 1, 1, 1000+i, b"", "default"))
+            packets.append(("pointer-position", 1, 100+i, 200, (100+i, 200), 0, {}))
+            packets.append(("ping", 100000+i, 100, "localhost"))
+        def write_all(stream):
+            p = self.make_memory_protocol()
+            p.enable_encoder("rencodeplus")
+            p.enable_compressor("lz4")
+            p.set_compression_level(1)
+            if stream:
+                p.parse_remote_caps(typedict({"lz4.stream" : True}))
+                assert p.stream_compression
+            data = []
+            def raw_write(items, *_args):
+                data.extend(items)
+            p.raw_write = raw_write
+            for packet in packets:
+                p._add_packet_to_queue(packet)
+            return data
+        plain = write_all(False)
+        streamed = write_all(True)
+        plain_size = sum(len(x) for x in plain)
+        stream_size = sum(len(x) for x in streamed)
+        assert stream_size<plain_size, f"stream compression did not help: {stream_size} vs {plain_size}"
+        #parse the stream compressed data:
+        parsed = []
+        def process_packet_cb(proto, packet):
+            if packet[0]==CONNECTION_LOST:
+                loop.quit()
+            else:
+                parsed.append(packet)
+        loop = GLib.MainLoop()
+        GLib.timeout_add(TIMEOUT*1000, loop.quit)
+        proto = self.make_memory_protocol(streamed, read_buffer_size=65536, process_packet_cb=process_packet_cb)
+        proto.start()
+        loop.run()
+        assert len(parsed)==len(packets), f"expected {len(packets)} packets but got {len(parsed)}"
+        for i, packet in enumerate(parsed):
+            assert packet[0]==packets[i][0] and packet[1]==packets[i][1]
+        if SHOW_PERF:
+            print("%-9s stream compression:\t\t%i bytes vs %i bytes" % (
+                self.protocol_class.TYPE, stream_size, plain_size))
+
     def make_test_packets(self, pixel_data_size=2**18):
         pixel_data = os.urandom(pixel_data_size)
         return (
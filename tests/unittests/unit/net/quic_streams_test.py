@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+
+from xpra.net.common import WINDOW_STREAM_PACKET_TYPES
+from xpra.net.websockets.header import encode_hybi_header
+from xpra.net.quic.common import get_packet_stream_type, get_frame_size, StreamFrames, DRAW_STREAMS, STREAM_PACKET_TYPES
+
+
+def frame(payload:bytes) -> bytes:
+    return encode_hybi_header(0x2, len(payload))+payload
+
+
+class TestQuicStreams(unittest.TestCase):
+
+    def test_stream_types(self):
+        assert get_packet_stream_type("") == ""
+        assert get_packet_stream_type("hello") == ""
+        assert get_packet_stream_type("new-window") == ""
+        assert get_packet_stream_type("sound-data") == "sound"
+        assert get_packet_stream_type("pointer-position") == "input"
+        assert get_packet_stream_type("key-action") == "input"
+        assert get_packet_stream_type("focus") == "input"
+        assert get_packet_stream_type("webcam-frame") == "webcam"
+        assert get_packet_stream_type("cursor") == "cursor"
+        assert get_packet_stream_type("draw") == "draw-0"
+        assert get_packet_stream_type("draw-1") == f"draw-{1 % DRAW_STREAMS}"
+        assert get_packet_stream_type(f"draw-{DRAW_STREAMS+2}") == f"draw-{2 % DRAW_STREAMS}"
+
+    def test_window_lifecycle(self):
+        #the packets that refer to a window must not overtake its creation or destruction:
+        lifecycle = ("new-window", "new-override-redirect", "new-tray", "lost-window")
+        dependent = ("draw", "eos", "window-metadata", "window-icon", "raise-window", "restack-window",
+                     "initiate-moveresize", "window-move-resize", "window-resized", "configure-override-redirect")
+        for packet_type in lifecycle+dependent:
+            assert packet_type in WINDOW_STREAM_PACKET_TYPES, f"{packet_type!r} is not sent on the window's stream"
+            for packet_types in STREAM_PACKET_TYPES.values():
+                assert packet_type not in packet_types
+
+    def test_frame_size(self):
+        for size in (0, 10, 125, 126, 65535, 65536, 100000):
+            f = frame(b"x"*size)
+            assert get_frame_size(f)==len(f)
+        assert get_frame_size(b"\x82")==0
+
+    def test_interleaved(self):
+        frames = {
+            0 : [frame(b"a"*10), frame(b"b"*300), frame(b"c"*70000)],
+            4 : [frame(b"d"*200), frame(b"e")],
+            }
+        data = dict((stream_id, b"".join(f)) for stream_id, f in frames.items())
+        sf = StreamFrames()
+        received = {0 : [], 4 : []}
+        #feed the streams in small interleaved pieces:
+        pos = 0
+        while any(pos<len(v) for v in data.values()):
+            for stream_id, v in data.items():
+                piece = v[pos:pos+97]
+                if piece:
+                    received[stream_id] += sf.add(stream_id, piece)
+            pos += 97
+        assert received==frames
+        assert sf.get_info()=={0 : 0, 4 : 0}
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
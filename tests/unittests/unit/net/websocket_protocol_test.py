@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import os
+import zlib
+import unittest
+
+from xpra.common import noop
+from xpra.net import packet_encoding, compression
+from xpra.net.bytestreams import Connection
+from xpra.net.websockets.common import OPCODE_BINARY, OPCODE_CONTINUE
+from xpra.net.websockets.header import encode_hybi_header
+from xpra.net.websockets.mask import hybi_mask     #@UnresolvedImport
+from xpra.net.websockets.handler import accept_deflate
+from xpra.net.websockets.protocol import WebSocketProtocol
+
+
+class Scheduler:
+    timeout_add = idle_add = source_remove = staticmethod(noop)
+
+
+def make_protocol(deflate=False):
+    conn = Connection("local", "ws", {})
+    conn.websocket_deflate = deflate
+    protocol = WebSocketProtocol(Scheduler(), conn, noop)
+    received = []
+    protocol._read_queue_put = received.append
+    return protocol, received
+
+
+def make_frame(payload, opcode=OPCODE_BINARY, fin=True, rsv1=False, mask=True):
+    if not mask:
+        return encode_hybi_header(opcode, len(payload), False, fin, rsv1)+payload
+    key = os.urandom(4)
+    return encode_hybi_header(opcode, len(payload), True, fin, rsv1)+key+bytes(hybi_mask(key, payload))
+
+
+class WebsocketProtocolTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        packet_encoding.init_encoders("none")
+        compression.init_compressors("none")
+
+    def test_split_reads(self):
+        payloads = [os.urandom(size) for size in (1, 125, 126, 1000, 65536, 70000)]
+        for mask in (True, False):
+            data = b"".join(make_frame(payload, mask=mask) for payload in payloads)
+            for chunk in (3, 1500, 65536, len(data)):
+                protocol, received = make_protocol()
+                for i in range(0, len(data), chunk):
+                    protocol.parse_ws_frame(data[i:i+chunk])
+                assert [bytes(v) for v in received]==payloads
+                assert protocol.ws_buffered==0 and not protocol.ws_buffers
+
+    def test_leading_newlines(self):
+        protocol, received = make_protocol()
+        protocol.parse_ws_frame(b"\r\n"+make_frame(b"hello"))
+        assert [bytes(v) for v in received]==[b"hello"]
+
+    def test_continuation(self):
+        protocol, received = make_protocol()
+        protocol.parse_ws_frame(make_frame(b"foo", fin=False))
+        protocol.parse_ws_frame(make_frame(b"bar", OPCODE_CONTINUE, fin=False))
+        assert not received
+        protocol.parse_ws_frame(make_frame(b"baz", OPCODE_CONTINUE))
+        assert [bytes(v) for v in received]==[b"foobarbaz"]
+
+    def test_deflate(self):
+        #compressed by the client, one message split into two frames:
+        protocol, received = make_protocol(True)
+        deflater = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+        messages = [b"ping-%i" % i * 20 for i in range(4)]
+        for message in messages:
+            data = deflater.compress(message)+deflater.flush(zlib.Z_SYNC_FLUSH)
+            assert data.endswith(b"\0\0\xff\xff")
+            data = data[:-4]
+            protocol.parse_ws_frame(make_frame(data[:5], fin=False, rsv1=True))
+            protocol.parse_ws_frame(make_frame(data[5:], OPCODE_CONTINUE))
+        assert [bytes(v) for v in received]==messages
+        #compressed by us, for the client:
+        peer, received = make_protocol(True)
+        for packet_type, message in (("ping", messages[0]), ("draw", messages[1]), ("ping", messages[2])):
+            items = [message[:10], message[10:]]
+            header = protocol.make_wsframe_header(packet_type, items)
+            assert bool(header[0] & 0x40)==(packet_type!="draw")
+            peer.parse_ws_frame(header+b"".join(items))
+        assert [bytes(v) for v in received]==messages[:3]
+        #not negotiated:
+        protocol, received = make_protocol(False)
+        with self.assertRaises(ValueError):
+            protocol.parse_ws_frame(make_frame(b"foo", rsv1=True))
+
+    def test_deflate_bomb(self):
+        protocol, received = make_protocol(True)
+        protocol.max_packet_size = 64*1024
+        deflater = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+        data = deflater.compress(bytes(protocol.max_packet_size+1))+deflater.flush(zlib.Z_SYNC_FLUSH)
+        assert len(data)<1024
+        with self.assertRaises(ValueError):
+            protocol.parse_ws_frame(make_frame(data[:-4], rsv1=True))
+        assert not received
+        #just below the limit is fine:
+        protocol, received = make_protocol(True)
+        protocol.max_packet_size = 64*1024
+        deflater = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+        data = deflater.compress(bytes(protocol.max_packet_size))+deflater.flush(zlib.Z_SYNC_FLUSH)
+        protocol.parse_ws_frame(make_frame(data[:-4], rsv1=True))
+        assert len(received)==1 and len(received[0])==protocol.max_packet_size
+
+    def test_accept_deflate(self):
+        assert accept_deflate("permessage-deflate")
+        assert accept_deflate("permessage-deflate; client_max_window_bits")
+        assert accept_deflate("foo, permessage-deflate")
+        assert not accept_deflate("")
+        assert not accept_deflate("permessage-deflate; server_max_window_bits=10")
+        assert not accept_deflate("x-webkit-deflate-frame")
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
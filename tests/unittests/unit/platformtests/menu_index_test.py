@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from xpra.platform.posix.menu_index import MenuIndex, normalize
+
+
+class MenuIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="xpra-menu-index-test-")
+        self.index_filename = os.path.join(self.tmpdir, "cache", "menu-index.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, data):
+        filename = os.path.join(self.tmpdir, name)
+        with open(filename, "wb") as f:
+            f.write(data)
+        return filename
+
+    def test_roundtrip(self):
+        desktop = self.write("app.desktop", b"[Desktop Entry]")
+        icon = self.write("app.png", b"\x89PNG")
+        index = MenuIndex(self.index_filename, {"LANG" : "C"})
+        props = {"Name" : "app", "Categories" : ["Utility"], "IconData" : b"\x89PNG", "IconType" : "png"}
+        index.set_entry(desktop, props, icon)
+        index.set_icon(icon, (b"\x89PNG", "png"))
+        index.save()
+        #load it back:
+        index = MenuIndex(self.index_filename, {"LANG" : "C"})
+        index.load()
+        assert index.get_entry(desktop)==({"Name" : "app", "Categories" : ["Utility"]}, icon)
+        assert index.get_icon(icon)==(b"\x89PNG", "png")
+        #different settings:
+        index = MenuIndex(self.index_filename, {"LANG" : "fr_FR"})
+        index.load()
+        assert index.get_entry(desktop) is None
+        assert index.get_icon(icon)==()
+
+    def test_modified(self):
+        desktop = self.write("app.desktop", b"[Desktop Entry]")
+        other = self.write("other.desktop", b"[Desktop Entry]")
+        index = MenuIndex(self.index_filename)
+        index.set_entry(desktop, {"Name" : "app"})
+        index.set_entry(other, {})
+        assert index.get_entry(desktop)==({"Name" : "app"}, "")
+        #hidden entries are indexed too:
+        assert index.get_entry(other)==({}, "")
+        #only the modified file needs to be reloaded:
+        time.sleep(0.01)
+        self.write("app.desktop", b"[Desktop Entry]\nName=new")
+        assert index.get_entry(desktop) is None
+        assert index.get_entry(other)==({}, "")
+        #removed files are dropped when saving:
+        os.unlink(other)
+        index.save()
+        assert other not in index.entries and desktop in index.entries
+        assert index.get_info()["misses"]==1
+
+    def test_invalid(self):
+        desktop = self.write("app.desktop", b"[Desktop Entry]")
+        index = MenuIndex(self.index_filename)
+        #not serializable:
+        index.set_entry(desktop, {"Name" : object()})
+        assert index.get_entry(desktop) is None
+        assert not index.dirty
+        #corrupted file:
+        self.write("index.json", b"not json")
+        index = MenuIndex(os.path.join(self.tmpdir, "index.json"))
+        index.load()
+        assert not index.entries
+
+    def test_normalize(self):
+        desktop = self.write("app.desktop", b"[Desktop Entry]")
+        props = {"Name" : "app", "Categories" : ("Utility", "Development"), "OnlyShowIn" : []}
+        fresh = dict((k, normalize(v)) for k, v in props.items())
+        index = MenuIndex(self.index_filename)
+        index.set_entry(desktop, props)
+        index.save()
+        index = MenuIndex(self.index_filename)
+        index.load()
+        #the cached entry is identical to the freshly parsed one:
+        assert index.get_entry(desktop)==(fresh, "")
+
+    def test_tryexec(self):
+        desktop = self.write("app.desktop", b"[Desktop Entry]")
+        command = os.path.join(self.tmpdir, "app")
+        index = MenuIndex(self.index_filename)
+        #the command is missing, so the entry is not exported:
+        index.set_entry(desktop, {}, "", command)
+        assert index.get_entry(desktop)==({}, "")
+        #once it is installed, the entry must be loaded again:
+        self.write("app", b"#!/bin/sh\n")
+        os.chmod(command, 0o755)
+        assert index.get_entry(desktop) is None
+        index.set_entry(desktop, {"Name" : "app"}, "", command)
+        assert index.get_entry(desktop)==({"Name" : "app"}, "")
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from xpra.os_util import OSEnvContext
+from xpra.scripts import config
+
+
+class ConfigCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="xpra-config-cache-test-")
+        self.conf_dir = os.path.join(self.tmpdir, "etc")
+        os.makedirs(os.path.join(self.conf_dir, "conf.d"))
+        self.saved = config.CONFIG_CACHE, config.CONFIG_CACHE_FILENAME
+        config.CONFIG_CACHE_FILENAME = os.path.join(self.tmpdir, "cache", "config.json")
+
+    def tearDown(self):
+        config.CONFIG_CACHE, config.CONFIG_CACHE_FILENAME = self.saved
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, contents):
+        with open(os.path.join(self.conf_dir, name), "w", encoding="utf8") as f:
+            f.write(contents)
+
+    def read(self, cache=True):
+        config.CONFIG_CACHE = cache
+        with OSEnvContext(XPRA_SYSTEM_CONF_DIRS=self.conf_dir):
+            return config.read_xpra_defaults()
+
+    def test_cache(self):
+        self.write("conf.d/10_test.conf", "# comment\nspeaker = off\nbind-tcp = 0.0.0.0:10000\n")
+        self.write("xpra.conf", "bind-tcp = 0.0.0.0:10001\ndpi = 96\n")
+        uncached = self.read(False)
+        assert not os.path.exists(config.CONFIG_CACHE_FILENAME)
+        assert uncached["speaker"]=="off"
+        assert self.read()==uncached
+        assert os.path.exists(config.CONFIG_CACHE_FILENAME)
+        assert config.load_config_cache(config.get_config_stamps(config.conf_files(self.conf_dir)))
+        #from the cache:
+        assert self.read()==uncached
+        #modifying a file invalidates the cache:
+        self.write("xpra.conf", "bind-tcp = 0.0.0.0:10001\ndpi = 144\n")
+        assert self.read()["dpi"]=="144"
+        #so does adding one:
+        self.write("conf.d/20_test.conf", "speaker = on\n")
+        assert self.read()["speaker"]=="on"
+        assert self.read()==self.read(False)
+
+    def test_invalid_cache(self):
+        self.write("xpra.conf", "dpi = 96\n")
+        os.makedirs(os.path.dirname(config.CONFIG_CACHE_FILENAME))
+        with open(config.CONFIG_CACHE_FILENAME, "w", encoding="utf8") as f:
+            f.write("not json")
+        assert self.read()["dpi"]=="96"
+        assert self.read()["dpi"]=="96"
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+
+from xpra.server.source.bandwidth_model import BandwidthModel, WindowedFilter, BANDWIDTH_WINDOW, PROBE_GAIN
+
+MBPS = 1000*1000
+
+
+class SimulatedLink:
+    """
+        A bottleneck link with a fixed rate (in bits per second) and propagation delay,
+        the packets queue up at the bottleneck when they are sent faster than the link rate.
+    """
+    def __init__(self, model, rate:int, delay:float, now:float=1):
+        self.model = model
+        self.rate = rate
+        self.delay = delay
+        self.now = now
+        self.link_free = now
+        self.sequence = 0
+        self.acks = []
+
+    def send(self, size:int):
+        self.sequence += 1
+        self.model.on_send(self.sequence, size, self.now)
+        start = max(self.now, self.link_free)
+        self.link_free = start+size*8/self.rate
+        self.acks.append((self.link_free+2*self.delay, self.sequence))
+        return self.link_free+2*self.delay-self.now
+
+    def advance(self, until:float):
+        for ack_time, sequence in sorted(self.acks):
+            if ack_time>until:
+                break
+            self.model.on_ack(sequence, 0, ack_time)
+            self.acks.remove((ack_time, sequence))
+        self.now = until
+
+    def run(self, duration:float, size:int, send_rate:int=0):
+        """ send as fast as the bandwidth model allows, or at the given rate """
+        end = self.now+duration
+        latencies = []
+        while self.now<end:
+            #start with a small window until we have an estimate:
+            limit = self.model.get_inflight_limit() or 4*size
+            if not send_rate and self.model.inflight_bytes+size>limit:
+                #wait for the next ack:
+                self.advance(min(self.acks)[0])
+                continue
+            latencies.append(self.send(size))
+            rate = send_rate or self.model.get_pacing_rate(self.now) or 1000*MBPS
+            self.advance(self.now+size*8/rate)
+        self.advance(end+1)
+        return latencies
+
+
+class TestBandwidthModel(unittest.TestCase):
+
+    def test_filter(self):
+        f = WindowedFilter(10, lambda a, b: a>b)
+        assert f.get()==0
+        f.update(0, 5)
+        f.update(1, 10)
+        f.update(2, 7)
+        assert f.get()==10
+        f.update(12, 3)
+        assert f.get()==7
+        #expired, but we keep the latest value:
+        f.update(30, 1)
+        assert f.get()==1
+
+    def test_bottleneck(self):
+        for rate, delay in (
+            (1000*MBPS, 0.0005),
+            (100*MBPS, 0.005),
+            (2*MBPS, 0.050),
+            ):
+            model = BandwidthModel()
+            link = SimulatedLink(model, rate, delay)
+            #long enough to go through a min rtt probe:
+            latencies = link.run(BANDWIDTH_WINDOW+5, 64*1024)
+            bw = model.get_bandwidth()
+            #no arbitrary cap on fast links:
+            assert 0.9*rate<=bw<=1.1*rate, f"expected {rate} but got {bw}"
+            #the propagation delay plus the transmission time of one packet:
+            min_rtt = model.get_min_rtt()
+            assert 2*delay<=min_rtt<=2*delay+2*64*1024*8/rate, f"min-rtt {min_rtt} for delay {delay}"
+            #the bottleneck queue does not grow without bounds:
+            tx = 64*1024*8/rate
+            assert max(latencies[-100:])<=3*min_rtt+2*tx, f"latency {max(latencies[-100:])} for min-rtt {min_rtt}"
+            assert model.get_pacing_rate()==bw*PROBE_GAIN//100
+            assert not model.inflight and model.inflight_bytes==0
+
+    def test_app_limited(self):
+        model = BandwidthModel()
+        link = SimulatedLink(model, 50*MBPS, 0.010)
+        link.run(2, 64*1024)
+        bw = model.get_bandwidth()
+        assert bw>=45*MBPS
+        #small updates sent far apart do not lower the estimate:
+        model.app_limited = True
+        link.run(BANDWIDTH_WINDOW*2, 1024, 1*MBPS)
+        assert model.get_bandwidth()>=bw
+        #but a slower link does, once the old samples expire:
+        model.app_limited = False
+        link.rate = 5*MBPS
+        link.run(BANDWIDTH_WINDOW*2, 16*1024)
+        assert 4.5*MBPS<=model.get_bandwidth()<=5.5*MBPS
+
+    def test_idle_then_trickle(self):
+        model = BandwidthModel()
+        link = SimulatedLink(model, 80*MBPS, 0.010)
+        link.run(2, 64*1024)
+        bw = model.get_bandwidth()
+        assert bw>=70*MBPS
+        #pairs of small packets sent back to back, with more data queued when sending the first one,
+        #so the sender does not flag them as app limited:
+        model.app_limited = False
+        for _ in range(int((BANDWIDTH_WINDOW+5)/0.1)):
+            link.send(2*1024)
+            link.send(2*1024)
+            link.advance(link.now+0.1)
+        assert model.get_bandwidth()>=bw, f"estimate dropped from {bw} to {model.get_bandwidth()}"
+        assert model.get_pacing_rate()>=bw
+
+    def test_lost(self):
+        model = BandwidthModel()
+        model.on_send("a", 1000, 1)
+        model.on_send("b", 1000, 1)
+        assert model.get_info()["inflight"]=={"packets" : 2, "bytes" : 2000}
+        model.on_lost("a")
+        #unknown keys are ignored:
+        model.on_lost("a")
+        assert model.on_ack("c", 0, 2)==0
+        assert model.on_ack("b", 0.5, 2)>0
+        info = model.get_info()
+        assert info["lost"]==1 and info["inflight"]["bytes"]==0
+        #the decode time is not part of the rtt:
+        assert info["min-rtt"]==500
+        assert model.is_ready()
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+from random import Random
+
+from xpra.codecs.image_wrapper import ImageWrapper
+from xpra.server.window import content_classifier
+from xpra.server.window.content_classifier import (
+    classify, get_change_rate, allow_lossless_text, ContentClassifier,
+    TEXT, PICTURE, VIDEO,
+    )
+
+
+def make_image(w:int, h:int, pixel_fn):
+    pixels = bytearray(w*h*4)
+    for y in range(h):
+        for x in range(w):
+            i = (y*w+x)*4
+            pixels[i:i+3] = pixel_fn(x, y)
+            pixels[i+3] = 255
+    return ImageWrapper(0, 0, w, h, bytes(pixels), "BGRX", 24, w*4, planes=ImageWrapper.PACKED)
+
+
+def text_pixel(x:int, y:int) -> bytes:
+    #black glyph strokes on a white background:
+    if y%16<10 and x%7 in (1, 2) and (x//7+y//16)%3:
+        return b"\0\0\0"
+    return b"\xff\xff\xff"
+
+
+def photo_pixel_fn(seed:int=0):
+    rnd = Random(seed)
+    def photo_pixel(x:int, y:int) -> bytes:
+        #smooth gradients with noise:
+        return bytes(((x+rnd.randint(0, 15))%256, (y*2+rnd.randint(0, 15))%256, (x+y+rnd.randint(0, 15))%256))
+    return photo_pixel
+
+
+class TestContentClassifier(unittest.TestCase):
+
+    def test_classify(self):
+        #few colours:
+        assert classify(16, 0.2, 0.1)==TEXT
+        #anti-aliased text, many colours but mostly flat background:
+        assert classify(300, 0.15, 0.7)==TEXT
+        assert classify(300, 0.15, 0.45)==TEXT
+        #photographic content:
+        assert classify(2000, 0.05, 0.02)==PICTURE
+        #the same content, updated frequently:
+        assert classify(2000, 0.05, 0.02, 25)==VIDEO
+        #a text area scrolling quickly is still text:
+        assert classify(16, 0.2, 0.8, 25)==TEXT
+        #inconclusive:
+        assert classify(200, 0.02, 0.3)==""
+
+    def test_change_rate(self):
+        now = 100
+        events = (
+            (now-2, 0, 0, 100, 100),        #too old
+            (now-0.5, 0, 0, 100, 100),
+            (now-0.2, 50, 50, 10, 10),
+            (now-0.1, 200, 200, 10, 10),    #elsewhere
+            )
+        assert get_change_rate(events, 0, 0, 100, 100, now)==2
+        assert get_change_rate(events, 200, 200, 50, 50, now)==1
+        assert get_change_rate((), 0, 0, 100, 100, now)==0
+
+    def test_allow_lossless_text(self):
+        fullscreen = 1920*1080
+        #small regions and high quality:
+        assert allow_lossless_text(200*20, 10)
+        assert allow_lossless_text(fullscreen, 90)
+        #the quality has been lowered and we don't know the bandwidth:
+        assert not allow_lossless_text(fullscreen, 30)
+        #congested link:
+        assert not allow_lossless_text(fullscreen, 30, 2*1000*1000)
+        #fast enough to send it quickly:
+        assert allow_lossless_text(fullscreen, 30, 1000*1000*1000)
+
+    def test_classify_image(self):
+        if content_classifier.get_pixel_stats is None:
+            print("region stats module is not available, skipped")
+            return
+        cc = ContentClassifier()
+        text = make_image(128, 128, text_pixel)
+        photo = make_image(128, 128, photo_pixel_fn())
+        assert cc.classify_image(text)==TEXT
+        assert cc.classify_image(photo)==PICTURE
+        events = tuple((content_classifier.monotonic()-i/100, 0, 0, 128, 128) for i in range(50))
+        assert cc.classify_image(photo, events)==VIDEO
+        #too small to bother:
+        assert cc.classify_image(make_image(8, 8, text_pixel))==""
+        info = cc.get_info()
+        assert info[TEXT]==1 and info[PICTURE]==1 and info[VIDEO]==1
+
+    def test_pixel_stats(self):
+        get_pixel_stats = content_classifier.get_pixel_stats
+        if get_pixel_stats is None:
+            print("region stats module is not available, skipped")
+            return
+        solid = make_image(64, 64, lambda x, y : b"\x10\x20\x30")
+        assert get_pixel_stats(solid)==(1, 0, 1)
+        colors, edges, flat = get_pixel_stats(make_image(64, 64, photo_pixel_fn(1)))
+        assert colors>1000 and flat<0.1
+        #sampling limits the work done on large images:
+        colors, edges, flat = get_pixel_stats(make_image(256, 256, photo_pixel_fn(2)), 1024)
+        assert colors<=1024
+        #not a 32-bit format:
+        rgb = ImageWrapper(0, 0, 4, 4, b"\0"*48, "RGB", 24, 12, planes=ImageWrapper.PACKED)
+        assert get_pixel_stats(rgb) is None
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
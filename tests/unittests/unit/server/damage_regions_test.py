@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+
+from xpra.server.shadow import damage_regions
+from xpra.server.shadow.damage_regions import DamageRegions
+
+
+class TestDamageRegions(unittest.TestCase):
+
+    def test_add_take(self):
+        dr = DamageRegions()
+        assert not dr
+        assert dr.take()==[]
+        assert dr.add(0, 0, 100, 100)==100*100
+        #already covered:
+        assert dr.add(10, 10, 20, 20)==0
+        #partially covered:
+        assert dr.add(50, 50, 100, 100)==100*100-50*50
+        #invalid:
+        assert dr.add(0, 0, 0, 10)==0
+        assert dr
+        assert dr.pixels==100*100*2-50*50
+        rects = dr.take()
+        assert sum(r.width*r.height for r in rects)==100*100*2-50*50
+        assert not dr and dr.pixels==0
+        info = dr.get_info()
+        assert info["events"]==4 and info["captures"]==1
+        assert info["captured-pixels"]==100*100*2-50*50
+
+    def test_blinking_cursor(self):
+        #a small area damaged repeatedly should never grow:
+        dr = DamageRegions()
+        for _ in range(100):
+            dr.add(200, 300, 2, 16)
+        rects = dr.take()
+        assert len(rects)==1
+        assert rects[0].get_geometry()==(200, 300, 2, 16)
+
+    def test_merge(self):
+        dr = DamageRegions()
+        n = damage_regions.MAX_DAMAGE_REGIONS+1
+        for i in range(n):
+            dr.add(i*20, i*10, 10, 10)
+        rects = dr.take()
+        #too many rectangles, merged into the bounding box:
+        assert len(rects)==1
+        assert rects[0].get_geometry()==(0, 0, (n-1)*20+10, (n-1)*10+10)
+        assert dr.get_info()["merged"]==1
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
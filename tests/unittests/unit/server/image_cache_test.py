@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+
+from xpra.server.window.image_cache import EncodedImageCache, get_image_key
+
+
+class TestImageCache(unittest.TestCase):
+
+    def test_keys(self):
+        pixels = b"\1\2\3\4"*16
+        key = get_image_key("cursor", pixels, 4, 4, "png")
+        assert key==get_image_key("cursor", memoryview(pixels), 4, 4, "png")
+        assert key!=get_image_key("icon", pixels, 4, 4, "png")
+        assert key!=get_image_key("cursor", pixels, 8, 2, "png")
+        assert key!=get_image_key("cursor", b"\0"+pixels[1:], 4, 4, "png")
+
+    def test_encode_once(self):
+        cache = EncodedImageCache(1024)
+        calls = []
+        def encode():
+            calls.append(True)
+            return b"encoded", 7
+        key = get_image_key("icon", b"pixels", 1, 1)
+        for _ in range(10):
+            assert cache.get_or_encode(key, encode)==b"encoded"
+        assert len(calls)==1
+        info = cache.get_info()
+        assert info["hits"]==9 and info["misses"]==1
+        assert info["hit-rate"]==90
+        #failures are not cached:
+        key = get_image_key("icon", b"other", 1, 1)
+        assert cache.get_or_encode(key, lambda : (None, 0)) is None
+        assert cache.get(key) is None
+
+    def test_eviction(self):
+        cache = EncodedImageCache(100)
+        keys = [get_image_key("cursor", bytes([i])) for i in range(4)]
+        for i, key in enumerate(keys[:3]):
+            cache.set(key, i, 40)
+        #the first one was evicted:
+        assert cache.get(keys[0]) is None
+        assert cache.get(keys[1])==1
+        #keys[2] is now the least recently used:
+        cache.set(keys[3], 3, 40)
+        assert cache.get(keys[2]) is None
+        assert cache.get(keys[1])==1
+        assert cache.get_info()["evicted"]==2
+        assert cache.size==80
+        #too big:
+        cache.set(keys[0], 0, 101)
+        assert cache.get(keys[0]) is None
+        cache.clear()
+        assert cache.size==0 and not cache.entries
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
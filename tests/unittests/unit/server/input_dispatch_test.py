@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+
+from xpra.server.input_dispatch import InputDispatcher, INPUT_PACKET_TYPES, ORDERED_PACKET_TYPES
+
+
+class FakeProtocol:
+    def __init__(self):
+        self.closed = False
+    def is_closed(self):
+        return self.closed
+
+
+class TestInputDispatch(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduled = []
+        self.processed = []
+        self.dispatcher = InputDispatcher(self.scheduled.append)
+
+    def handler(self, proto, packet):
+        self.processed.append((proto, packet))
+
+    def add(self, proto, *packet):
+        return self.dispatcher.add(proto, packet[0], self.handler, packet)
+
+    def dispatch(self):
+        assert len(self.scheduled)==1
+        self.scheduled.pop()()
+
+    def test_collapse_motion(self):
+        proto = FakeProtocol()
+        for x in range(10):
+            assert self.add(proto, "pointer", 1, 1, (x, 0))
+        self.add(proto, "pointer", 2, 1, (100, 0))
+        self.add(proto, "pointer", 2, 1, (200, 0))
+        self.dispatch()
+        assert [p[1][3] for p in self.processed]==[(9, 0), (200, 0)]
+        info = self.dispatcher.get_info()
+        assert info["dispatched"]==2 and info["collapsed"]==10
+        assert info["queued"]==0
+
+    def test_ordering(self):
+        proto = FakeProtocol()
+        self.add(proto, "pointer", 1, 1, (0, 0))
+        self.add(proto, "pointer-button", 1, 1, 1, True, (0, 0))
+        #cannot be merged with the motion event sent before the button press:
+        self.add(proto, "pointer", 1, 1, (10, 0))
+        self.add(proto, "key-action", 1, "a", True)
+        self.add(proto, "pointer", 1, 1, (20, 0))
+        self.dispatch()
+        types = [p[1][0] for p in self.processed]
+        assert types==["pointer", "pointer-button", "pointer", "key-action", "pointer"]
+        #dispatched, so the next packet needs to be scheduled again:
+        self.add(proto, "pointer", 1, 1, (30, 0))
+        self.dispatch()
+        assert len(self.processed)==6
+
+    def test_closed(self):
+        proto1 = FakeProtocol()
+        proto2 = FakeProtocol()
+        self.add(proto1, "key-action", 1, "a", True)
+        self.add(proto2, "key-action", 1, "b", True)
+        proto1.closed = True
+        self.dispatch()
+        assert self.processed==[(proto2, ("key-action", 1, "b", True))]
+
+    def test_pending(self):
+        proto = FakeProtocol()
+        calls = []
+        callback = self.dispatcher.wrap(lambda : calls.append(True))
+        #a packet is still waiting in the idle queue,
+        #so this one must not be processed before it:
+        assert not self.add(proto, "key-action", 1, "a", True)
+        assert not self.scheduled
+        callback()
+        assert calls and self.dispatcher.pending==0
+        assert self.add(proto, "key-action", 1, "a", True)
+        self.dispatch()
+        assert len(self.processed)==1
+
+    def route(self, idle, proto, *packet):
+        #same as ServerBase.process_packet:
+        packet_type = packet[0]
+        if packet_type in INPUT_PACKET_TYPES and self.add(proto, *packet):
+            return
+        def call_handler():
+            self.handler(proto, packet)
+        if packet_type in ORDERED_PACKET_TYPES or packet_type in INPUT_PACKET_TYPES:
+            call_handler = self.dispatcher.wrap(call_handler)
+        idle.append(call_handler)
+
+    def test_input_after_focus(self):
+        proto = FakeProtocol()
+        idle = []
+        self.route(idle, proto, "focus", 1)
+        self.route(idle, proto, "key-action", 1, "A", True)
+        assert len(idle)==2 and not self.scheduled
+        #the focus packet is processed, but "A" is still waiting in the idle queue:
+        idle.pop(0)()
+        self.route(idle, proto, "key-action", 1, "B", True)
+        assert not self.scheduled
+        while idle:
+            idle.pop(0)()
+        assert [p[1][2] if p[1][0]=="key-action" else p[1][0] for p in self.processed]==["focus", "A", "B"]
+        #once the idle queue is empty, the fast path can be used again:
+        self.route(idle, proto, "key-action", 1, "C", True)
+        assert not idle
+        self.dispatch()
+        assert self.processed[-1][1][2]=="C"
+
+    def test_ordered_types(self):
+        for packet_type in ("focus", "configure-window", "map-window"):
+            assert packet_type in ORDERED_PACKET_TYPES
+        #frequent packets must not hold back the input:
+        for packet_type in ("damage-sequence", "ping_echo", "connection-data"):
+            assert packet_type not in ORDERED_PACKET_TYPES
+        assert not set(INPUT_PACKET_TYPES) & set(ORDERED_PACKET_TYPES)
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
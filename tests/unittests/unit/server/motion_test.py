@@ -153,6 +153,51 @@ class TestMotion(unittest.TestCase):
         #log("na1:\n%s" % (na1, ))
         #log("na2:\n%s" % (na2, ))
 
+    def test_incremental_update(self):
+        W, H, BPP = 64, 32, 4
+        rows = [bytes([i])*W*BPP for i in range(H)]
+        sd = motion.ScrollData(0, 0, W, H)
+        sd.update(b"".join(rows), 0, 0, W, H, W*BPP, BPP)
+        assert sd.get_update_info()[0]==H
+        #modify two rows, but only tell it about one of them:
+        rows[4] = b"\xff"*W*BPP
+        rows[20] = b"\xfe"*W*BPP
+        sd.update(b"".join(rows), 0, 0, W, H, W*BPP, BPP, ((4, 1), ))
+        assert sd.get_update_info()[0]==1
+        sd.calculate()
+        scrolls, non_scrolls = sd.get_scroll_values(1)
+        assert non_scrolls=={4 : 1}, "expected row 4 to be updated but got %s" % (non_scrolls, )
+        #invalidated rows are always checksummed again:
+        sd.invalidate(0, 10, W, 2)
+        sd.update(b"".join(rows), 0, 0, W, H, W*BPP, BPP, ())
+        assert sd.get_update_info()[0]==2
+        #a different position needs a full update,
+        #which finds the row we did not tell it about:
+        sd.update(b"".join(rows), 0, 1, W, H, W*BPP, BPP, ())
+        assert sd.get_update_info()[0]==1
+
+    def test_horizontal(self):
+        W, H, BPP = 64, 16, 4
+        def row(i, shift=0):
+            return b"".join(bytes((i, (x+shift)%256, 0, 0)) for x in range(W))
+        sd = motion.ScrollData(0, 0, W, H)
+        sd.update(b"".join(row(i) for i in range(H)), 0, 0, W, H, W*BPP, BPP)
+        #scroll rows 2 to 9 to the right by 3 pixels:
+        shifted = b"".join(row(i, -3 if 2<=i<10 else 0) for i in range(H))
+        sd.update(shifted, 0, 0, W, H, W*BPP, BPP)
+        hashed, distance, matches = sd.get_update_info()
+        assert distance==3 and matches==8, "expected distance 3 for 8 rows but got %i for %i rows" % (distance, matches)
+        distance, moved, repaint = sd.get_horizontal_scroll()
+        assert moved=={2 : 8} and not repaint
+        #scroll all the rows to the left:
+        sd = motion.ScrollData(0, 0, W, H)
+        sd.update(b"".join(row(i) for i in range(H)), 0, 0, W, H, W*BPP, BPP)
+        sd.update(b"".join(row(i, 2) for i in range(H)), 0, 0, W, H, W*BPP, BPP)
+        assert sd.get_update_info()[1:]==(-2, H), "expected distance -2, got %s" % (sd.get_update_info(), )
+        #not a horizontal scroll:
+        sd.update(b"".join(row(i+1, 2) for i in range(H)), 0, 0, W, H, W*BPP, BPP)
+        assert sd.get_horizontal_scroll() is None
+
     def test_csum_data(self):
         a1=[
             5992220345606009987, 15040563112965825180, 420530012284267555, 3380071419019115782, 14243596304267993264, 834861281570233459, 10803583843784306120, 1379296002677236226,
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+from time import sleep
+
+from xpra.server.source import packet_scheduler
+from xpra.server.source.packet_scheduler import PacketScheduler, PACKET, WID
+
+
+def draw(wid:int, x:int, y:int, w:int, h:int, coding:str="png", size:int=100, **options):
+    return ("draw", wid, x, y, w, h, coding, b"x"*size, 0, 0, options)
+
+
+class TestPacketScheduler(unittest.TestCase):
+
+    def add(self, scheduler, packet, evict_cb=None):
+        wid = packet[1] if packet[0]=="draw" else 0
+        scheduler.add(packet, wid, packet[4]*packet[5] if wid else 0, evict_cb=evict_cb)
+
+    def drain(self, scheduler):
+        packets = []
+        while True:
+            entry = scheduler.pop()
+            if not entry:
+                return packets
+            packets.append(entry[PACKET])
+
+    def test_fairness(self):
+        s = PacketScheduler()
+        #window 1 floods the queue with large video frames:
+        for i in range(20):
+            self.add(s, draw(1, 0, 0, 1000, 1000, "h264", 64*1024))
+        for i in range(4):
+            self.add(s, draw(2, i*10, 0, 10, 10, "png", 1000))
+        assert len(s)==24
+        assert s.get_pixels(1)==20*1000*1000
+        assert s.get_pixels(2)==4*100
+        wids = [p[1] for p in self.drain(s)]
+        assert len(wids)==24 and len(s)==0
+        #window 2 does not have to wait for all the frames of window 1:
+        assert wids.index(2)<=2
+        assert wids[:8].count(2)==4
+        assert s.get_pixels(1)==0 and not tuple(s)
+
+    def test_deadline(self):
+        s = PacketScheduler()
+        for i in range(10):
+            self.add(s, draw(1, 0, i*10, 100, 10, "png", 4*1024))
+        self.add(s, draw(2, 0, 0, 100, 100, "h264", 1000, frame=1))
+        #first packet from window 1 before the frame is due:
+        assert s.pop()[WID]==1
+        sleep(packet_scheduler.VIDEO_FRAME_DEADLINE/1000+0.01)
+        #the frame is overdue, so it is sent before the other packets of window 1:
+        assert s.pop()[WID]==2
+        assert s.get_info()["deadline-sends"]==1
+
+    def test_evict(self):
+        s = PacketScheduler()
+        evicted = []
+        #not a stateless encoding:
+        self.add(s, draw(1, 0, 0, 50, 50, "h264"), lambda : evicted.append(4))
+        #the client needs to see the tile cache instructions:
+        self.add(s, draw(1, 0, 0, 50, 50, "png", **{"tile" : b"key"}), lambda : evicted.append(5))
+        #another window:
+        self.add(s, draw(2, 0, 0, 50, 50), lambda : evicted.append(6))
+        self.add(s, draw(1, 10, 10, 20, 20), lambda : evicted.append(1))
+        self.add(s, draw(1, 0, 0, 50, 10), lambda : evicted.append(2))
+        #not covered by the next update:
+        self.add(s, draw(1, 90, 90, 20, 20), lambda : evicted.append(3))
+        assert len(s)==6
+        self.add(s, draw(1, 0, 0, 100, 100, "webp"))
+        assert sorted(evicted)==[1, 2]
+        assert len(s)==5
+        assert s.get_pixels(1)==20*20+50*50*2+100*100
+        info = s.get_info()
+        assert info["evicted"]["packets"]==2
+        packets = self.drain(s)
+        assert len(packets)==5
+        #the order within each window is preserved:
+        w1 = [p[2:7] for p in packets if p[1]==1]
+        assert w1==[(0, 0, 50, 50, "h264"), (0, 0, 50, 50, "png"), (90, 90, 20, 20, "png"), (0, 0, 100, 100, "webp")]
+
+    def test_evict_before_scroll(self):
+        s = PacketScheduler()
+        evicted = []
+        self.add(s, draw(1, 0, 100, 100, 50), lambda : evicted.append(1))
+        #the scroll packet copies the pixels painted by the previous packet:
+        s.add(("draw", 1, 0, 0, 100, 200, "scroll", (), 0, 0, {}), 1, 100*200)
+        self.add(s, draw(1, 0, 100, 100, 50), lambda : evicted.append(2))
+        assert not evicted
+        assert [p[6] for p in self.drain(s)]==["png", "scroll", "png"]
+        #but the packets queued after it can still be evicted:
+        s.add(("draw", 1, 0, 0, 100, 200, "scroll", (), 0, 0, {}), 1, 100*200)
+        self.add(s, draw(1, 0, 100, 100, 50), lambda : evicted.append(3))
+        self.add(s, draw(1, 0, 100, 100, 50), lambda : evicted.append(4))
+        assert evicted==[3]
+        assert [p[6] for p in self.drain(s)]==["scroll", "png"]
+
+    def test_focus(self):
+        s = PacketScheduler()
+        s.set_focus(2)
+        size = packet_scheduler.SCHEDULER_QUANTUM
+        for wid in (1, 2, 3):
+            for _ in range(20):
+                self.add(s, draw(wid, 0, 0, 1000, 1000, "h264", size))
+        wids = [s.pop()[WID] for _ in range(20)]
+        #the focused window gets a bigger share:
+        weight = packet_scheduler.FOCUS_FLOW_WEIGHT
+        assert wids.count(2)>=wids.count(1)*weight-1, wids
+        assert s.get_info()["flows"][2]["weight"]==weight
+        #the weights follow the focus:
+        s.set_focus(1)
+        info = s.get_info()
+        assert info["focus"]==1
+        assert info["flows"][1]["weight"]==weight and info["flows"][2]["weight"]==1
+
+    def test_non_window_packets(self):
+        s = PacketScheduler()
+        s.add(("clipboard-token", "CLIPBOARD"))
+        s.add(("window-icon", 1, 16, 16, "png", b"x"), 0)
+        assert len(s)==2
+        assert [p[0] for p in self.drain(s)]==["clipboard-token", "window-icon"]
+        assert s.pop() is None
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+
+from xpra.rectangle import rectangle    #@UnresolvedImport
+from xpra.server.source.bandwidth_model import BandwidthModel
+from xpra.server.window.progressive_refresh import (
+    split_tiles, order_tiles, plan_tiles, remove_tiles, take_batch, get_refresh_budget,
+    )
+
+
+def geometry(tiles):
+    return sorted((t.x, t.y, t.width, t.height) for t in tiles)
+
+
+class TestProgressiveRefresh(unittest.TestCase):
+
+    def test_split(self):
+        tiles = split_tiles([rectangle(0, 0, 300, 100)], 256)
+        assert geometry(tiles)==[(0, 0, 256, 100), (256, 0, 44, 100)]
+        #overlapping regions do not produce overlapping tiles:
+        tiles = split_tiles([rectangle(0, 0, 200, 200), rectangle(100, 100, 200, 200)], 256)
+        assert sum(t.width*t.height for t in tiles)==2*200*200-100*100
+        for i, t1 in enumerate(tiles):
+            for t2 in tiles[i+1:]:
+                assert not t1.intersects_rect(t2)
+
+    def test_order(self):
+        tiles = split_tiles([rectangle(0, 0, 1024, 256)], 256)
+        ordered = order_tiles(tiles, (900, 100), (), 256)
+        assert [t.x for t in ordered]==[768, 512, 256, 0]
+        #without a pointer, the most recently updated tiles come first:
+        recent = ((1, rectangle(0, 0, 10, 10)), (2, rectangle(600, 0, 10, 10)))
+        ordered = order_tiles(tiles, None, recent, 256)
+        assert [t.x for t in ordered[:2]]==[512, 0]
+
+    def test_plan(self):
+        tiles = [rectangle(0, 0, 10, 10), rectangle(10, 0, 10, 10)]
+        assert plan_tiles(tiles, 100, ())==[(tiles[0], 100), (tiles[1], 100)]
+        plan = plan_tiles(tiles, 100, (80, 100, 120))
+        assert [q for _, q in plan]==[80, 80, 100, 100]
+        #an update covering the first tile removes it from all the passes:
+        plan = remove_tiles(plan, rectangle(0, 0, 10, 10))
+        assert plan==[(tiles[1], 80), (tiles[1], 100)]
+        plan = remove_tiles(plan, rectangle(15, 0, 10, 10))
+        assert geometry(t for t, _ in plan)==[(10, 0, 5, 10), (10, 0, 5, 10)]
+
+    def test_batch(self):
+        tiles = [rectangle(i*100, 0, 100, 100) for i in range(5)]
+        plan = plan_tiles(tiles, 100, (50, ))
+        #budget for 2 tiles:
+        batch, quality, plan = take_batch(plan, 20000, 1, 10)
+        assert len(batch)==2 and quality==50 and len(plan)==8
+        #no budget left:
+        batch, _, plan = take_batch(plan, 0, 1, 10)
+        assert not batch and len(plan)==8
+        #at least one tile, even if it does not fit:
+        batch, _, plan = take_batch(plan, 100, 1, 10)
+        assert len(batch)==1
+        #unknown budget, stops at the next quality step:
+        batch, quality, plan = take_batch(plan, -1, 1, 10)
+        assert len(batch)==2 and quality==50
+        batch, quality, plan = take_batch(plan, -1, 1, 3)
+        assert len(batch)==3 and quality==100 and len(plan)==2
+
+    def test_budget(self):
+        assert get_refresh_budget(None, 0, 0.1)==-1
+        assert get_refresh_budget(BandwidthModel(), 8*1000*1000, 0.1)==50000
+        model = BandwidthModel()
+        model.on_send(1, 100000, 1)
+        model.on_ack(1, 0, 1.125)
+        #6.4Mbps, with nothing in flight:
+        assert get_refresh_budget(model, 0, 0.1)==80000
+        model.on_send(2, 60000, 2)
+        assert get_refresh_budget(model, 0, 0.1)==20000
+        model.on_send(3, 60000, 2)
+        #the link is busy, but we still send something:
+        assert get_refresh_budget(model, 0, 0.1)==1
+        assert get_refresh_budget(model, 0, 0.1, 65536)==65536
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -14,6 +14,7 @@ from unit.test_util import LoggerSilencer, silence_error, silence_info
 
 from xpra.util import typedict, AdHocStruct
 from xpra.os_util import POSIX, OSX, get_util_logger
+from xpra.server.source.packet_scheduler import PacketScheduler
 
 
 class SourceMixinsTest(unittest.TestCase):
@@ -54,7 +55,7 @@ class SourceMixinsTest(unittest.TestCase):
         m.source_remove = GLib.source_remove
         m.idle_add = GLib.idle_add
         m.timeout_add = GLib.timeout_add
-        m.packet_queue = []
+        m.packet_queue = PacketScheduler()
         m.protocol = protocol
         def encode_queue_size():
             return 0
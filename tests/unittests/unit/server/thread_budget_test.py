@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+
+from xpra.server.window.thread_budget import (
+    ThreadBudget,
+    allocate, get_weight, needs_rebalance,
+    )
+
+
+class FakeSource:
+    pass
+
+
+class TestThreadBudget(unittest.TestCase):
+
+    def test_allocate(self):
+        assert allocate(8, {})=={}
+        #everyone gets at least one thread, even when oversubscribed:
+        assert allocate(2, {"a" : 1, "b" : 1, "c" : 1})=={"a" : 1, "b" : 1, "c" : 1}
+        #proportional to the weight:
+        alloc = allocate(8, {"a" : 3, "b" : 1})
+        assert alloc=={"a" : 6, "b" : 2}, alloc
+        #capped, the spare threads go to the other keys:
+        alloc = allocate(16, {"a" : 100, "b" : 1}, max_threads=4)
+        assert alloc=={"a" : 4, "b" : 4}, alloc
+        #never more than the total:
+        for total in range(1, 20):
+            alloc = allocate(total, {"a" : 5, "b" : 3, "c" : 1})
+            assert sum(alloc.values())<=max(total, 3), alloc
+            assert alloc["a"]>=alloc["b"]>=alloc["c"]>=1
+
+    def test_weight(self):
+        small = get_weight(False, 320*200, 5)
+        large = get_weight(False, 1920*1080, 5)
+        fast = get_weight(False, 1920*1080, 30)
+        focused = get_weight(True, 1920*1080, 5)
+        assert small<large<fast
+        assert large<focused
+        assert get_weight(False, 0, 0)==1
+
+    def test_rebalance(self):
+        assert not needs_rebalance(0, 4)
+        assert not needs_rebalance(4, 3)
+        assert needs_rebalance(4, 2)
+        assert needs_rebalance(1, 4)
+
+    def test_budget(self):
+        budget = ThreadBudget(8, 8, 2)
+        a = FakeSource()
+        b = FakeSource()
+        assert budget.get_threads(a)==8
+        budget.update(b, 1)
+        assert budget.get_threads(a)==4 and budget.get_threads(b)==4
+        budget.update(a, 3)
+        assert budget.get_threads(a)==6 and budget.get_threads(b)==2
+        #the encode threads use some of the budget:
+        budget.add_encode_loop()
+        budget.add_encode_loop()
+        budget.add_encode_loop()
+        assert budget.get_video_threads()==6
+        assert budget.get_threads(a)+budget.get_threads(b)==6
+        budget.remove(a)
+        assert budget.get_threads(b)==6
+        info = budget.get_info()
+        assert info["encode-loops"]==3 and len(info["encoders"])==1
+        for _ in range(3):
+            budget.remove_encode_loop()
+        #released when the source goes away:
+        del b
+        assert not budget.get_info()["encoders"]
+
+    def test_recreate(self):
+        budget = ThreadBudget(8, 8, 1)
+        a = FakeSource()
+        #the first window creates its encoder with all the threads:
+        budget.set_encoder_threads(a, budget.get_threads(a))
+        assert budget.get_encoder_threads(a)==8
+        assert not budget.should_recreate(a)
+        #each frame queries the allocation, that does not change the encoder:
+        budget.get_threads(a)
+        assert budget.get_encoder_threads(a)==8
+        #a second window joins with a higher weight:
+        b = FakeSource()
+        budget.set_encoder_threads(b, budget.get_threads(b, 3))
+        assert budget.get_threads(a)==2
+        #so the first window's pipeline must be re-created:
+        assert budget.should_recreate(a)
+        budget.set_encoder_threads(a, budget.get_threads(a))
+        assert not budget.should_recreate(a) and not budget.should_recreate(b)
+        assert budget.get_info()["encoders"][0]["encoder-threads"]==2
+        budget.remove(a)
+        assert budget.get_encoder_threads(a)==0
+
+    def test_slots(self):
+        budget = ThreadBudget(4, 4, 1)
+        budget.acquire_slot()
+        assert not budget.slots.acquire(blocking=False)
+        budget.release_slot()
+        assert budget.slots.acquire(blocking=False)
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
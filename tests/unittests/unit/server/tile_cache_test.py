@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+
+from xpra.codecs.image_wrapper import ImageWrapper
+from xpra.server.window.tile_cache import TileCache, get_tile_hash, is_lossless
+
+
+def make_image(pixels, w=16, h=16, x=0, y=0):
+    return ImageWrapper(x, y, w, h, pixels, "BGRX", 24, w*4)
+
+
+class TestTileCache(unittest.TestCase):
+
+    def test_hash(self):
+        pixels = bytes(range(256))*16
+        key = get_tile_hash(make_image(pixels))
+        assert len(key)==16
+        #the position does not matter:
+        assert key==get_tile_hash(make_image(memoryview(pixels), x=100, y=50))
+        assert key!=get_tile_hash(make_image(pixels, w=32, h=8))
+        assert key!=get_tile_hash(make_image(b"\1"+pixels[1:]))
+
+    def test_lossless(self):
+        assert is_lossless("rgb24", {})
+        assert is_lossless("png", {})
+        assert not is_lossless("png", {"scaled_size" : (10, 10)})
+        assert is_lossless("webp", {"quality" : 100})
+        assert not is_lossless("webp", {"quality" : 90})
+        assert not is_lossless("webp", {"quality" : 100, "csc" : "YUV420P"})
+
+    def test_lookup(self):
+        cache = TileCache(1000)
+        assert not cache.lookup(b"a")
+        assert cache.add(b"a", 100)==()
+        #already recorded:
+        assert cache.add(b"a", 100) is None
+        for _ in range(3):
+            assert cache.lookup(b"a")
+        info = cache.get_info()
+        assert info["hits"]==3 and info["misses"]==1
+        assert info["hit-rate"]==75
+        assert info["bytes-saved"]==300
+        #too big:
+        assert cache.add(b"b", 251) is None
+        assert not cache.lookup(b"b")
+
+    def test_eviction(self):
+        cache = TileCache(1000)
+        for key in (b"a", b"b", b"c", b"d"):
+            assert cache.add(key, 250)==()
+        #"a" is now the most recently used:
+        assert cache.lookup(b"a")
+        assert cache.add(b"e", 250)==(b"b", )
+        assert cache.add(b"f", 200)==(b"c", )
+        assert cache.size==950
+        assert cache.get_info()["evicted"]==2
+        cache.clear()
+        assert cache.size==0 and not cache.lookup(b"a")
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+
+from xpra.server.window.video_context_pool import (
+    VideoContextPool,
+    get_csc_key, get_encoder_key,
+    )
+
+
+class FakeContext:
+    def __init__(self, can_reset=True):
+        self.closed = False
+        self.resets = 0
+        self.can_reset = can_reset
+    def is_closed(self):
+        return self.closed
+    def clean(self):
+        self.closed = True
+
+class FakeEncoder(FakeContext):
+    def reset_stream(self):
+        self.resets += 1
+        return self.can_reset
+
+
+class TestVideoContextPool(unittest.TestCase):
+
+    def test_csc_reuse(self):
+        pool = VideoContextPool(4, 60)
+        key = get_csc_key("libyuv", 640, 480, "BGRX", 640, 480, "YUV420P")
+        assert pool.acquire(key) is None
+        csc = FakeContext()
+        pool.register(csc, key)
+        pool.release(csc)
+        assert not csc.is_closed()
+        other = get_csc_key("libyuv", 640, 482, "BGRX", 640, 482, "YUV420P")
+        assert pool.acquire(other) is None
+        assert pool.acquire(key) is csc
+        assert pool.acquire(key) is None
+        info = pool.get_info()
+        assert info["hits"]==1 and info["misses"]==3
+
+    def test_encoder_options(self):
+        pool = VideoContextPool(4, 60)
+        key = get_encoder_key("x264", "h264", 640, 480, "YUV420P", {"speed" : 50, "b-frames" : True})
+        #speed and quality changes do not require a new context:
+        assert key==get_encoder_key("x264", "h264", 640, 480, "YUV420P", {"speed" : 20, "b-frames" : True})
+        assert key!=get_encoder_key("x264", "h264", 640, 480, "YUV420P", {"speed" : 50, "b-frames" : False})
+        ve = FakeEncoder()
+        pool.register(ve, key)
+        pool.release(ve)
+        assert ve.resets==1
+        assert pool.acquire(key) is ve
+
+    def test_rejected(self):
+        pool = VideoContextPool(4, 60)
+        key = get_encoder_key("x264", "h264", 640, 480, "YUV420P", {})
+        #cannot reset its stream:
+        ve = FakeEncoder(False)
+        pool.register(ve, key)
+        pool.release(ve)
+        assert ve.is_closed()
+        assert pool.acquire(key) is None
+        #encoders without reset_stream() are never pooled:
+        ctx = FakeContext()
+        pool.register(ctx, key)
+        pool.release(ctx)
+        assert ctx.is_closed()
+        #unknown contexts are cleaned:
+        unknown = FakeContext()
+        pool.release(unknown)
+        assert unknown.is_closed()
+        assert pool.get_info()["rejected"]==3
+
+    def test_eviction(self):
+        pool = VideoContextPool(2, 60)
+        contexts = []
+        for i in range(3):
+            key = get_csc_key("cython", 100+i*2, 100, "BGRX", 100+i*2, 100, "YUV420P")
+            csc = FakeContext()
+            pool.register(csc, key)
+            pool.release(csc)
+            contexts.append(csc)
+        #the oldest one was evicted:
+        assert contexts[0].is_closed()
+        assert not contexts[1].is_closed()
+        assert pool.get_info()["evicted"]==1
+        #zero timeout: everything expires
+        pool.timeout = -1
+        pool.expire()
+        assert all(csc.is_closed() for csc in contexts)
+        assert pool.get_info()["idle"]==0
+
+    def test_cleanup(self):
+        pool = VideoContextPool(4, 60)
+        key = get_csc_key("cython", 100, 100, "BGRX", 100, 100, "YUV420P")
+        csc = FakeContext()
+        pool.register(csc, key)
+        pool.release(csc)
+        pool.cleanup()
+        assert csc.is_closed()
+        assert pool.acquire(key) is None
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
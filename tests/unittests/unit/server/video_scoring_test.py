@@ -10,6 +10,7 @@ from xpra.util import AdHocStruct
 from xpra.server.window.video_scoring import (
     get_quality_score, get_speed_score,
     get_pipeline_score, get_encoder_dimensions,
+    score_bucket, PipelineScoreCache, SCORE_BUCKET,
     )
 
 
@@ -134,6 +135,33 @@ class TestVideoScoring(unittest.TestCase):
         w, h = get_encoder_dimensions(encoder_spec, 102, 102, (1, 2))
         assert w==50 and h==50
 
+    def test_score_bucket(self):
+        assert score_bucket(0)==0
+        assert score_bucket(100)==100
+        assert score_bucket(150)==100
+        assert score_bucket(-10)==0
+        for v in range(101):
+            b = score_bucket(v)
+            assert b%SCORE_BUCKET==0 or b==100
+            assert abs(b-v)<=SCORE_BUCKET
+
+    def test_score_cache(self):
+        cache = PipelineScoreCache(2)
+        assert cache.get((1, "h264")) is None
+        cache.set((1, "h264"), ("score", ))
+        assert cache.get((1, "h264"))==("score", )
+        #a new generation of the specs does not match:
+        assert cache.get((2, "h264")) is None
+        cache.set((2, "h264"), ())
+        cache.set((3, "h264"), ())
+        #least recently used entry was dropped:
+        assert cache.get((1, "h264")) is None
+        info = cache.get_info()
+        assert info["hits"]==1 and info["misses"]==3
+        assert info["size"]==2
+        cache.clear()
+        assert cache.get((3, "h264")) is None
+
 
 def main():
     unittest.main()
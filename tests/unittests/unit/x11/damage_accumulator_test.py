@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+
+from xpra.x11.bindings.events import DamageAccumulator, MAX_DAMAGE_RECTANGLES  # @UnresolvedImport
+
+
+def covers(rects, x, y, w, h) -> bool:
+    return any(rx<=x and ry<=y and rx+rw>=x+w and ry+rh>=y+h for rx, ry, rw, rh in rects)
+
+
+class TestDamageAccumulator(unittest.TestCase):
+
+    def test_covered(self):
+        acc = DamageAccumulator(1)
+        acc.add(0, 0, 100, 100)
+        acc.add(10, 10, 20, 20)
+        acc.add(0, 0, 100, 100)
+        assert acc.get_rectangles()==[(0, 0, 100, 100)]
+
+    def test_merge(self):
+        acc = DamageAccumulator(1)
+        #the union of adjacent rectangles does not waste any pixels:
+        acc.add(0, 0, 10, 10)
+        acc.add(10, 0, 10, 10)
+        acc.add(0, 10, 20, 10)
+        assert acc.get_rectangles()==[(0, 0, 20, 20)]
+
+    def test_distant(self):
+        acc = DamageAccumulator(1)
+        acc.add(0, 0, 100, 100)
+        acc.add(1000, 1000, 100, 100)
+        assert acc.get_rectangles()==[(0, 0, 100, 100), (1000, 1000, 100, 100)]
+
+    def test_limit(self):
+        acc = DamageAccumulator(1)
+        damaged = tuple((i*1000, (i%3)*500, 10, 10) for i in range(MAX_DAMAGE_RECTANGLES*3))
+        for rect in damaged:
+            acc.add(*rect)
+        rects = acc.get_rectangles()
+        assert len(rects)==MAX_DAMAGE_RECTANGLES
+        #merging must never lose any damage:
+        for rect in damaged:
+            assert covers(rects, *rect), f"{rect} is not covered by {rects}"
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
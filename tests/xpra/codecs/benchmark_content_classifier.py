@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+# Splits screenshots into tiles, classifies each tile using its pixel statistics,
+# then reports the bytes and encode time per content type
+# for the encoding chosen by the classifier and for each fixed encoding.
+
+import sys
+from time import monotonic
+from PIL import Image
+
+from xpra.net import compression
+from xpra.codecs.image_wrapper import ImageWrapper
+from xpra.codecs.loader import load_codec
+from xpra.server.window.content_classifier import ContentClassifier, CONTENT_TYPES
+
+TILE_SIZE = 256
+CODECS = ("enc_rgb", "enc_spng", "enc_webp", "enc_jpeg")
+#what the classifier would route each type of content to:
+CLASSIFIED = {
+    "text"      : "rgb24",
+    "picture"   : "jpeg",
+    "video"     : "jpeg",
+    ""          : "png",
+    }
+options = {
+    "quality"   : 80,
+    "speed"     : 50,
+    "lz4"       : True,
+    "rgb_formats" : ("BGRX", "BGRA", "RGB"),
+    }
+
+
+def load_tiles(files):
+    for f in files:
+        img = Image.open(f).convert("RGBA")
+        w, h = img.size
+        #BGRX:
+        r, g, b, a = img.split()
+        data = Image.merge("RGBA", (b, g, r, a)).tobytes("raw")
+        image = ImageWrapper(0, 0, w, h, data, "BGRX", 24, w*4, planes=ImageWrapper.PACKED, thread_safe=True)
+        for y in range(0, h, TILE_SIZE):
+            for x in range(0, w, TILE_SIZE):
+                tile = image.get_sub_image(x, y, min(TILE_SIZE, w-x), min(TILE_SIZE, h-y))
+                tile.restride(tile.get_width()*4)
+                yield tile
+
+
+def main(files):
+    compression.init_all()
+    encoders = {}
+    for codec in CODECS:
+        enc = load_codec(codec)
+        if enc:
+            for encoding in enc.get_encodings():
+                encoders.setdefault(encoding, enc)
+    cc = ContentClassifier()
+    #content type -> encoding -> [count, bytes, time]
+    results = {}
+    for tile in load_tiles(files):
+        content_type = cc.classify_image(tile)
+        for encoding in ("classified", "png", "jpeg", "webp", "rgb24"):
+            actual = CLASSIFIED[content_type] if encoding=="classified" else encoding
+            enc = encoders.get(actual)
+            if not enc:
+                continue
+            start = monotonic()
+            r = enc.encode(actual, tile, dict(options))
+            elapsed = monotonic()-start
+            if not r:
+                continue
+            v = results.setdefault(content_type or "unknown", {}).setdefault(encoding, [0, 0, 0])
+            v[0] += 1
+            v[1] += len(r[1])
+            v[2] += elapsed
+    print(f"classifier: {cc.get_info()}")
+    for content_type in CONTENT_TYPES+("unknown", ):
+        for encoding, (count, size, elapsed) in results.get(content_type, {}).items():
+            print(f"{content_type:8} {encoding:12} {count:>5} tiles  {size//1024:>8}KB  {1000*elapsed:8.1f}ms")
+
+
+if __name__ == '__main__':
+    assert len(sys.argv)>1, "specify the screenshots to use for the benchmark"
+    main(sys.argv[1:])
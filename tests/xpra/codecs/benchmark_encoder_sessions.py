@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+# Encodes the same image repeatedly with the still image encoders,
+# and shows how many output buffers had to be allocated:
+# once warm, the encoder sessions should only be reusing their buffers.
+
+import sys
+from time import monotonic
+
+from xpra.net import compression
+from xpra.codecs.codec_checks import make_test_image
+from xpra.codecs.loader import load_codec
+
+N = 100
+SIZES = ((64, 64), (256, 256), (1024, 768), (1920, 1080))
+ENCODINGS = {
+    "enc_jpeg"  : ("jpeg", "jpega"),
+    "enc_webp"  : ("webp", ),
+    "enc_spng"  : ("png", ),
+    }
+
+
+def get_session_info(enc) -> dict:
+    if hasattr(enc, "get_session"):
+        return enc.get_session().get_info().get("arenas", {})
+    if hasattr(enc, "get_arenas"):
+        return enc.get_arenas().get_info()
+    return {}
+
+
+def main(sizes=SIZES):
+    compression.init_all()
+    for codec, encodings in ENCODINGS.items():
+        enc = load_codec(codec)
+        if not enc:
+            print(f"{codec} is not available")
+            continue
+        for encoding in encodings:
+            for w, h in sizes:
+                image = make_test_image("BGRA", w, h)
+                options = {"quality" : 80, "speed" : 50, "alpha" : encoding in ("jpega", "webp", "png")}
+                #warm up:
+                enc.encode(encoding, image, options)
+                before = get_session_info(enc)
+                start = monotonic()
+                size = 0
+                for _ in range(N):
+                    r = enc.encode(encoding, image, options)
+                    if not r:
+                        print(f"Error: no data for {encoding} {w}x{h}")
+                        break
+                    size += len(r[1])
+                end = monotonic()
+                after = get_session_info(enc)
+                allocated = after.get("allocated", 0)-before.get("allocated", 0)
+                grown = after.get("grown", 0)-before.get("grown", 0)
+                per_frame = 1000*(end-start)/N
+                sizek = size//N//1024
+                print(f"{encoding:6} {w:>5}x{h:<5} {per_frame:8.2f}ms per frame  {sizek:>6}KB  "
+                      f"{allocated:>3} buffers allocated, {grown:>3} grown")
+
+
+if __name__ == '__main__':
+    sizes = SIZES
+    if len(sys.argv)>1:
+        sizes = tuple(tuple(int(v) for v in arg.split("x", 1)) for arg in sys.argv[1:])
+    main(sizes)
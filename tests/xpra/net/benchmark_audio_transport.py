@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+"""
+Compares the time it takes to pass audio buffers to the audio subprocess,
+serialized in the packets or using the shared memory ring.
+usage: benchmark_audio_transport.py [BUFFERS] [ITERATIONS]
+"""
+
+import os
+import sys
+from time import monotonic
+
+from xpra.net.packet_encoding import init_all, get_enabled_encoders, get_encoder, decode, PERFORMANCE_ORDER
+from xpra.audio.shm_ring import create_audio_ring, open_audio_ring
+
+
+def measure(fn, buffers, iterations):
+    times = []
+    for _ in range(iterations):
+        start = monotonic()
+        fn(buffers)
+        times.append(monotonic()-start)
+    times.sort()
+    return times[0], times[len(times)//2]
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv)>1 else 256
+    iterations = int(argv[2]) if len(argv)>2 else 20
+    init_all()
+    encoders = get_enabled_encoders(PERFORMANCE_ORDER)
+    if not encoders:
+        print("no packet encoders available")
+        return 1
+    encode = get_encoder(encoders[0])
+    buffers = [os.urandom(512+i%1024) for i in range(count)]
+    writer = create_audio_ring()
+    reader = open_audio_ring(writer.filename)
+
+    def pipe(buffers):
+        for data in buffers:
+            packet, flags = encode(("add_data", data, {}, ()))
+            decode(packet, flags)
+
+    def shm(buffers):
+        for data in buffers:
+            packet, flags = encode(("add_shm_data", writer.write(data), {}, ()))
+            reader.read(decode(packet, flags)[1])
+
+    try:
+        for name, fn in (("pipe", pipe), ("shm", shm)):
+            best, median = measure(fn, buffers, iterations)
+            print(f"{name:4} {count} buffers using {encoders[0]}: best={best*1000:.2f}ms median={median*1000:.2f}ms")
+    finally:
+        reader.close()
+        writer.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
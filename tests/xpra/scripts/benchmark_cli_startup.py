@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+"""
+Measures the wall-clock time of short-lived xpra subcommands,
+with and without the parsed config cache.
+usage: benchmark_cli_startup.py [XPRA_COMMAND] [ITERATIONS]
+"""
+
+import os
+import sys
+from time import monotonic
+from subprocess import Popen, DEVNULL
+
+
+def measure(cmd, env, iterations):
+    times = []
+    for _ in range(iterations):
+        start = monotonic()
+        proc = Popen(cmd, stdout=DEVNULL, stderr=DEVNULL, env=env)
+        proc.wait()
+        times.append(monotonic()-start)
+    times.sort()
+    return times[0], times[len(times)//2]
+
+
+def main(argv):
+    xpra_cmd = argv[1] if len(argv)>1 else "xpra"
+    iterations = int(argv[2]) if len(argv)>2 else 20
+    for subcommand in ("version", "list"):
+        for cache in (False, True):
+            env = os.environ.copy()
+            env["XPRA_CONFIG_CACHE"] = str(int(cache))
+            cmd = [sys.executable, xpra_cmd, subcommand] if xpra_cmd.endswith(".py") else [xpra_cmd, subcommand]
+            #populate the cache and the OS file cache first:
+            measure(cmd, env, 1)
+            best, median = measure(cmd, env, iterations)
+            print(f"xpra {subcommand:8} config-cache={cache!s:5}: best={best*1000:.1f}ms median={median*1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    main(sys.argv)
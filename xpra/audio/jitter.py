@@ -0,0 +1,128 @@
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+from time import monotonic
+from collections import deque
+from typing import Any
+
+from xpra.util import envint, envbool
+from xpra.log import Logger
+
+log = Logger("audio")
+
+JITTER_BUFFER : bool = envbool("XPRA_SOUND_JITTER_BUFFER", True)
+#the range of queue depths we can target, in milliseconds:
+JITTER_MIN : int = max(0, envint("XPRA_SOUND_JITTER_MIN", 20))
+JITTER_MAX : int = max(JITTER_MIN, envint("XPRA_SOUND_JITTER_MAX", 1000))
+#how many packets we use for estimating the delay spread:
+JITTER_WINDOW : int = max(10, envint("XPRA_SOUND_JITTER_WINDOW", 250))
+#we need this many packets before we can trust the estimate:
+JITTER_MIN_SAMPLES : int = max(2, envint("XPRA_SOUND_JITTER_MIN_SAMPLES", 20))
+#percentile of the delay spread we want to absorb:
+JITTER_PERCENTILE : int = max(50, min(100, envint("XPRA_SOUND_JITTER_PERCENTILE", 95)))
+#how much we add to the target after an underrun, and how quickly it decays (in seconds):
+UNDERRUN_STEP : int = envint("XPRA_SOUND_JITTER_UNDERRUN_STEP", 40)
+UNDERRUN_DECAY : int = max(1, envint("XPRA_SOUND_JITTER_UNDERRUN_DECAY", 20))
+
+
+class JitterBuffer:
+    """
+        Estimates the arrival jitter of audio packets from the timestamps
+        set by the sender, and calculates the smallest queue depth
+        that can absorb it.
+        The sender and receiver clocks do not need to be synchronized,
+        only the variations in transit time are used.
+    """
+
+    def __init__(self, margin:int=50, min_target:int=JITTER_MIN, max_target:int=JITTER_MAX):
+        self.margin = margin
+        self.min_target = min_target
+        self.max_target = max_target
+        #relative transit time of the recent packets, in milliseconds:
+        self.transits : deque[float] = deque(maxlen=JITTER_WINDOW)
+        self.durations : deque[int] = deque(maxlen=JITTER_WINDOW)
+        self.last_transit = None
+        #RFC 3550 style smoothed jitter:
+        self.jitter = 0.0
+        self.packets = 0
+        self.underruns = 0
+        self.boost = 0
+        self.last_underrun = 0.0
+        self.target = max_target
+
+    def __repr__(self):
+        return f"JitterBuffer({self.target}ms)"
+
+    def record(self, sent:int, received:float=0, duration:int=0) -> None:
+        """
+            sent: the sender's timestamp in milliseconds,
+            received: our own timestamp in milliseconds,
+            duration: the duration of the audio data in milliseconds
+        """
+        transit = (received or monotonic()*1000)-sent
+        if self.last_transit is not None:
+            d = abs(transit-self.last_transit)
+            self.jitter += (d-self.jitter)/16
+        self.last_transit = transit
+        self.transits.append(transit)
+        if duration>0:
+            self.durations.append(duration)
+        self.packets += 1
+
+    def is_ready(self) -> bool:
+        return len(self.transits)>=JITTER_MIN_SAMPLES
+
+    def get_spread(self) -> int:
+        """
+            The extra delay that the late packets experience,
+            compared to the fastest packet in the window.
+        """
+        transits = sorted(self.transits)
+        if not transits:
+            return 0
+        index = min(len(transits)-1, len(transits)*JITTER_PERCENTILE//100)
+        return round(transits[index]-transits[0])
+
+    def get_boost(self, now:float=0) -> int:
+        if not self.boost:
+            return 0
+        elapsed = (now or monotonic())-self.last_underrun
+        return max(0, round(self.boost*(1-elapsed/UNDERRUN_DECAY)))
+
+    def underrun(self, now:float=0) -> None:
+        """
+            The queue ran dry: raise the target immediately,
+            the extra depth decays over UNDERRUN_DECAY seconds.
+        """
+        now = now or monotonic()
+        self.underruns += 1
+        self.boost = min(self.max_target, self.get_boost(now)+UNDERRUN_STEP)
+        self.last_underrun = now
+        log("underrun: boost=%i", self.boost)
+
+    def get_target(self, now:float=0) -> int:
+        """
+            The queue depth we should aim for, in milliseconds.
+        """
+        if not self.is_ready():
+            return self.target
+        #we need to hold at least one buffer:
+        duration = max(self.durations or (0, ))
+        target = (self.get_spread()+duration)*(100+self.margin)//100
+        target += self.get_boost(now)
+        self.target = max(self.min_target, min(self.max_target, target))
+        return self.target
+
+    def get_info(self) -> dict[str,Any]:
+        return {
+            "target"    : self.target,
+            "jitter"    : round(self.jitter),
+            "spread"    : self.get_spread(),
+            "boost"     : self.get_boost(),
+            "packets"   : self.packets,
+            "underruns" : self.underruns,
+            "min"       : self.min_target,
+            "max"       : self.max_target,
+            }
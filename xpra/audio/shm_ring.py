@@ -0,0 +1,162 @@
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import os
+import mmap
+import tempfile
+from struct import pack_into, unpack_from
+from typing import Any
+
+from xpra.util import envint, envbool
+from xpra.os_util import POSIX
+from xpra.log import Logger
+
+log = Logger("audio")
+
+AUDIO_SHM : bool = POSIX and envbool("XPRA_AUDIO_SHM", True)
+AUDIO_SHM_SIZE : int = envint("XPRA_AUDIO_SHM_SIZE", 1024*1024)
+#the environment variable used for passing the ring filename to the audio subprocess:
+AUDIO_SHM_ENV = "XPRA_AUDIO_SHM_FILENAME"
+
+#header: write position, read position
+#both are byte counters that only ever increase,
+#the write position is only modified by the writer,
+#and the read position only by the reader.
+HEADER_SIZE : int = 16
+WRITE_POS : int = 0
+READ_POS : int = 8
+
+
+class AudioRing:
+    """
+        Single producer, single consumer ring buffer in a shared memory file.
+        The writer copies the audio payload into the ring and only sends
+        the (position, size) reference through the subprocess pipe,
+        the reader copies the data out and releases the space.
+        References must be read in the order they were written.
+    """
+    __slots__ = ("filename", "area", "view", "capacity", "owner",
+                 "buffers", "bytes", "full")
+
+    def __init__(self, filename:str, area, owner:bool=False):
+        self.filename = filename
+        self.area = area
+        self.view = memoryview(area)
+        self.capacity = len(area)-HEADER_SIZE
+        self.owner = owner
+        self.buffers = 0
+        self.bytes = 0
+        self.full = 0
+
+    def __repr__(self):
+        return f"AudioRing({self.filename!r})"
+
+    def get_info(self) -> dict[str,Any]:
+        if not self.area:
+            return {}
+        wpos = self.get_pos(WRITE_POS)
+        rpos = self.get_pos(READ_POS)
+        return {
+            "size"      : self.capacity,
+            "pending"   : wpos-rpos,
+            "buffers"   : self.buffers,
+            "bytes"     : self.bytes,
+            "full"      : self.full,
+            }
+
+    def get_pos(self, offset:int) -> int:
+        return unpack_from("<Q", self.area, offset)[0]
+
+    def set_pos(self, offset:int, value:int) -> None:
+        pack_into("<Q", self.area, offset, value)
+
+    def write(self, data) -> tuple[int,int] | None:
+        """
+            Copies the data into the ring and returns the reference to send to the reader,
+            or None if there isn't enough free space.
+        """
+        size = len(data)
+        if not self.area or size<=0 or size>self.capacity:
+            return None
+        wpos = self.get_pos(WRITE_POS)
+        rpos = self.get_pos(READ_POS)
+        if self.capacity-(wpos-rpos)<size:
+            self.full += 1
+            return None
+        start = wpos % self.capacity
+        first = min(size, self.capacity-start)
+        self.view[HEADER_SIZE+start:HEADER_SIZE+start+first] = data[:first]
+        if first<size:
+            self.view[HEADER_SIZE:HEADER_SIZE+size-first] = data[first:]
+        #only publish the new position once the data is in place:
+        self.set_pos(WRITE_POS, wpos+size)
+        self.buffers += 1
+        self.bytes += size
+        return wpos, size
+
+    def read(self, ref) -> bytes:
+        """
+            Returns a copy of the data for this reference
+            and releases the space it used in the ring.
+        """
+        pos, size = ref
+        wpos = self.get_pos(WRITE_POS)
+        if size<0 or size>self.capacity or pos+size>wpos or wpos-pos>self.capacity:
+            raise ValueError(f"invalid audio ring reference {ref}")
+        start = pos % self.capacity
+        first = min(size, self.capacity-start)
+        data = bytes(self.view[HEADER_SIZE+start:HEADER_SIZE+start+first])
+        if first<size:
+            data += self.view[HEADER_SIZE:HEADER_SIZE+size-first]
+        self.set_pos(READ_POS, pos+size)
+        self.buffers += 1
+        self.bytes += size
+        return data
+
+    def close(self) -> None:
+        view = self.view
+        if view:
+            self.view = None
+            view.release()
+        area = self.area
+        if area:
+            self.area = None
+            area.close()
+        if self.owner:
+            self.unlink()
+
+    def unlink(self) -> None:
+        filename = self.filename
+        if filename:
+            self.filename = ""
+            try:
+                os.unlink(filename)
+            except OSError:
+                log("unlink() failed to remove %r", filename, exc_info=True)
+
+
+def create_audio_ring(size:int=AUDIO_SHM_SIZE) -> AudioRing:
+    """
+        Creates a new ring file, only readable by the current user.
+        The caller owns the file and removes it when closing the ring.
+    """
+    fd, filename = tempfile.mkstemp(prefix="xpra-audio-", suffix=".shm")
+    try:
+        size = max(mmap.PAGESIZE, size)
+        os.ftruncate(fd, HEADER_SIZE+size)
+        area = mmap.mmap(fd, HEADER_SIZE+size)
+    except Exception:
+        os.unlink(filename)
+        raise
+    finally:
+        os.close(fd)
+    log("create_audio_ring(%i)=%r", size, filename)
+    return AudioRing(filename, area, True)
+
+def open_audio_ring(filename:str) -> AudioRing:
+    with open(filename, "r+b") as f:
+        area = mmap.mmap(f.fileno(), 0)
+    log("open_audio_ring(%r) %i bytes", filename, len(area))
+    return AudioRing(filename, area)
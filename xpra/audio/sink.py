@@ -12,6 +12,7 @@ from typing import Any, Literal
 from gi.repository import GObject  # @UnresolvedImport
 
 from xpra.audio.audio_pipeline import AudioPipeline
+from xpra.audio.jitter import JitterBuffer, JITTER_BUFFER
 from xpra.gst_common import (
     normv, make_buffer, plugin_str,
     get_default_appsrc_attributes, get_element_str,
@@ -56,6 +57,8 @@ MARGIN = max(0, min(200, envint("XPRA_SOUND_MARGIN", 50)))
 #how high we push up the min-level to prevent underruns:
 UNDERRUN_MIN_LEVEL = max(0, envint("XPRA_SOUND_UNDERRUN_MIN_LEVEL", 150))
 CLOCK_SYNC = envbool("XPRA_CLOCK_SYNC", False)
+#how often we update the queue levels from the jitter buffer target, in milliseconds:
+JITTER_UPDATE_DELAY = envint("XPRA_SOUND_JITTER_UPDATE_DELAY", 250)
 
 
 class AudioSink(AudioPipeline):
@@ -102,6 +105,9 @@ class AudioSink(AudioPipeline):
         self.last_max_update = monotonic()
         self.last_min_update = monotonic()
         self.level_lock = Lock()
+        self.jitter = None
+        if JITTER_BUFFER and QUEUE_TIME>0:
+            self.jitter = JitterBuffer(MARGIN)
         pipeline_els = [get_element_str("appsrc", get_default_appsrc_attributes())]
         if parser:
             pipeline_els.append(parser)
@@ -227,8 +233,12 @@ class AudioSink(AudioPipeline):
             if qmin==0 and clt<10:
                 self.last_underrun = now
                 self.refill = True
-                self.set_max_level()
-                self.set_min_level()
+                if self.jitter and self.jitter.is_ready():
+                    self.jitter.underrun(now)
+                    self.set_jitter_levels(True)
+                else:
+                    self.set_max_level()
+                    self.set_min_level()
         self.emit_info()
         return True
 
@@ -255,7 +265,8 @@ class AudioSink(AudioPipeline):
         # which causes more overruns!)
         if now-self.last_overrun>2:
             self.last_overrun = now
-            self.set_max_level()
+            if not (self.jitter and self.jitter.is_ready()):
+                self.set_max_level()
             self.overrun_events.append(now)
         self.overruns += 1
         return True
@@ -336,6 +347,49 @@ class AudioSink(AudioPipeline):
             self.level_lock.release()
 
 
+    def record_jitter(self, metadata) -> bool:
+        """
+            Feeds the sender's timestamp to the jitter buffer,
+            returns True if the jitter buffer is ready to drive the queue levels.
+        """
+        jitter = self.jitter
+        if not jitter or not metadata:
+            return False
+        sent = metadata.get("time")
+        if sent is None:
+            #the sender does not provide timestamps
+            return False
+        duration = max(0, normv(metadata.get("duration", 0)))//MS_TO_NS
+        jitter.record(int(sent), monotonic()*1000, duration)
+        return jitter.is_ready()
+
+    def set_jitter_levels(self, force:bool=False) -> None:
+        if not self.queue:
+            return
+        now = monotonic()
+        if not force and 1000*(now-self.last_max_update)<JITTER_UPDATE_DELAY:
+            return
+        target = self.jitter.get_target(now)
+        #leave some headroom above the target before the queue starts to leak:
+        mst = target + max(20, target//2)
+        #when refilling, wait until we reach the target before playing again:
+        mtt = target if self.refill else 0
+        if not self.level_lock.acquire(False):
+            gstlog("cannot get level lock for setting jitter levels")
+            return
+        try:
+            cmst = self.queue.get_property("max-size-time")//MS_TO_NS
+            if cmst!=mst:
+                self.queue.set_property("max-size-time", mst*MS_TO_NS)
+            cmtt = self.queue.get_property("min-threshold-time")//MS_TO_NS
+            if cmtt!=mtt:
+                self.queue.set_property("min-threshold-time", mtt*MS_TO_NS)
+            gstlog("set_jitter_levels target=%3i, max-size-time=%3i, min-threshold-time=%3i", target, mst, mtt)
+            self.last_max_update = self.last_min_update = now
+        finally:
+            self.level_lock.release()
+
+
     def eos(self) -> int:
         gstlog("eos()")
         if self.src:
@@ -358,6 +412,8 @@ class AudioSink(AudioPipeline):
                              "underruns"    : self.underruns,
                              "state"        : self.queue_state,
                              }
+            if self.jitter:
+                info["jitter"] = self.jitter.get_info()
         info["sink"] = self.get_element_properties(
             self.sink,
             "buffer-time", "latency-time",
@@ -403,8 +459,11 @@ class AudioSink(AudioPipeline):
             self.do_add_data(x)
         if self.do_add_data(data, metadata):
             self.rec_queue_level(data)
-            self.set_max_level()
-            self.set_min_level()
+            if self.record_jitter(metadata):
+                self.set_jitter_levels()
+            else:
+                self.set_max_level()
+                self.set_min_level()
             #drop back down quickly if the level has reached min:
             if self.refill:
                 clt = self.queue.get_property("current-level-time")//MS_TO_NS
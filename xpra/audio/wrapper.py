@@ -13,10 +13,11 @@ from xpra.audio.gstreamer_util import (
     parse_audio_source, get_source_plugins, get_sink_plugins, get_default_sink_plugin, get_default_source,
     can_decode, can_encode, get_muxers, get_demuxers, get_all_plugin_names,
     )
+from xpra.audio.shm_ring import AUDIO_SHM, AUDIO_SHM_ENV, create_audio_ring, open_audio_ring
 from xpra.net.subprocess_wrapper import subprocess_caller, subprocess_callee, exec_kwargs, exec_env
 from xpra.platform.paths import get_audio_command
 from xpra.common import FULL_INFO
-from xpra.os_util import WIN32, OSX, POSIX, BITS
+from xpra.os_util import WIN32, OSX, POSIX, BITS, bytestostr
 from xpra.util import typedict, parse_simple_dict, envint, envbool
 from xpra.scripts.config import InitExit, InitException
 from xpra.log import Logger
@@ -71,6 +72,8 @@ def get_audio_wrapper_env():
 # FIXME: CODEC_OPTIONS should allow us to specify different options for each CODEC
 # The output will be a regular xpra packet, containing serialized signals that we receive
 # The input can be a regular xpra packet, those are converted into method calls
+# When the caller provides a shared memory ring (see shm_ring.py),
+# the audio payload is copied into the ring and the packets only carry a reference to it.
 
 class audio_subprocess(subprocess_callee):
     """ Utility superclass for audio subprocess wrappers
@@ -83,8 +86,20 @@ class audio_subprocess(subprocess_callee):
         super().__init__(wrapped_object=wrapped_object, method_whitelist=methods)
         for x in exports:
             self.connect_export(x)
+        self.ring = None
+        filename = os.environ.get(AUDIO_SHM_ENV)
+        if filename:
+            try:
+                self.ring = open_audio_ring(filename)
+            except Exception as e:
+                log("open_audio_ring(%r)", filename, exc_info=True)
+                log.warn("Warning: cannot use the audio shared memory ring")
+                log.warn(" %s", e)
 
     def start(self):
+        if self.ring:
+            #let the caller know that it can use the ring:
+            self.idle_add(self.send, "shm", True)
         if not FAKE_START_FAILURE:
             self.idle_add(self.wrapped_object.start)
         if FAKE_EXIT>0:
@@ -110,6 +125,13 @@ class audio_subprocess(subprocess_callee):
                 log("cleanup() failed to clean %s", wo, exc_info=True)
         self.timeout_add(1000, self.do_stop)
 
+    def do_stop(self):
+        super().do_stop()
+        ring = self.ring
+        if ring:
+            self.ring = None
+            ring.close()
+
     def export_info(self):
         wo = self.wrapped_object
         if wo:
@@ -122,9 +144,19 @@ class audio_record(audio_subprocess):
     def __init__(self, *pipeline_args):
         from xpra.audio.src import AudioSource
         audio_pipeline = AudioSource(*pipeline_args)
-        super().__init__(audio_pipeline, [], ["new-stream", "new-buffer"])
+        super().__init__(audio_pipeline, [], ["new-stream"])
+        audio_pipeline.connect("new-buffer", self.new_buffer)
         self.large_packets = ["new-buffer"]
 
+    def new_buffer(self, _audio_pipeline, data, metadata, packet_metadata):
+        ring = self.ring
+        if ring:
+            ref = ring.write(data)
+            if ref:
+                self.send("new-shm-buffer", ref, metadata, packet_metadata)
+                return
+        self.send("new-buffer", data, metadata, packet_metadata)
+
 class audio_play(audio_subprocess):
     """ wraps AudioSink as a subprocess """
     def __init__(self, *pipeline_args):
@@ -132,6 +164,15 @@ class audio_play(audio_subprocess):
         audio_pipeline = AudioSink(*pipeline_args)
         super().__init__(audio_pipeline, ["add_data"], [])
 
+    def process_packet(self, proto, packet):
+        if bytestostr(packet[0])=="add_shm_data":
+            ring = self.ring
+            if not ring:
+                log.warn("Warning: received shared memory audio data without a ring")
+                return
+            packet = ["add_data", ring.read(packet[1])]+list(packet[2:])
+        super().process_packet(proto, packet)
+
 
 def run_audio(mode, error_cb, options, args):
     """ this function just parses command line arguments to feed into the audio subprocess class,
@@ -239,20 +280,33 @@ class audio_subprocess_wrapper(subprocess_caller):
         self.codec = "unknown"
         self.codec_description = ""
         self.info = {}
+        #the shared memory ring, once the subprocess has confirmed that it can use it:
+        self.ring = None
+        self.ring_ready = False
         #hook some default packet handlers:
         self.connect("state-changed", self.state_changed)
         self.connect("info", self.info_update)
         self.connect("signal", self.subprocess_signal)
+        self.connect("shm", self.shm_ready)
 
     def get_env(self):
         env = super().get_env()
         env.update(get_audio_wrapper_env())
         env.pop("DISPLAY", None)
         #env.pop("WAYLAND_DISPLAY", None)
+        if self.ring:
+            env[AUDIO_SHM_ENV] = self.ring.filename
         return env
 
     def start(self):
         self.state = "starting"
+        if AUDIO_SHM:
+            try:
+                self.ring = create_audio_ring()
+            except Exception as e:
+                log("create_audio_ring()", exc_info=True)
+                log.warn("Warning: cannot create the audio shared memory ring")
+                log.warn(" %s", e)
         super().start()
         log("start() %s subprocess(%s)=%s", self.description, self.command, self.process.pid)
         self.timeout_add(SOUND_START_TIMEOUT, self.verify_started)
@@ -266,6 +320,22 @@ class audio_subprocess_wrapper(subprocess_caller):
         self.timeout_add(1000, self.send, "exit")
         self.timeout_add(1500, self.stop)
 
+    def stop(self):
+        super().stop()
+        self.ring_ready = False
+        ring = self.ring
+        if ring:
+            self.ring = None
+            ring.close()
+
+    def shm_ready(self, _wrapper, ready):
+        log("shm_ready(%s) ring=%s", ready, self.ring)
+        ring = self.ring
+        if ring:
+            self.ring_ready = bool(ready)
+            #the subprocess has mapped it, so the file is no longer needed:
+            ring.unlink()
+
 
     def verify_started(self):
         p = self.process
@@ -296,7 +366,10 @@ class audio_subprocess_wrapper(subprocess_caller):
 
 
     def get_info(self) -> dict:
-        return self.info
+        ring = self.ring
+        if not ring:
+            return self.info
+        return dict(self.info) | {"shm" : ring.get_info()}
 
     def info_update(self, _wrapper, info):
         log("info_update: %s", info)
@@ -328,6 +401,14 @@ class source_subprocess_wrapper(audio_subprocess_wrapper):
             ]
         _add_debug_args(self.command)
 
+    def process_packet(self, proto, packet):
+        if bytestostr(packet[0])=="new-shm-buffer":
+            ring = self.ring
+            if not ring:
+                return
+            packet = ["new-buffer", ring.read(packet[1])]+list(packet[2:])
+        super().process_packet(proto, packet)
+
     def __repr__(self):
         proc = self.process
         if proc:
@@ -355,6 +436,12 @@ class sink_subprocess_wrapper(audio_subprocess_wrapper):
     def add_data(self, data, metadata=None, packet_metadata=()):
         if DEBUG_SOUND:
             log("add_data(%s bytes, %s, %s) forwarding to %s", len(data), metadata, len(packet_metadata), self.protocol)
+        ring = self.ring
+        if ring and self.ring_ready:
+            ref = ring.write(data)
+            if ref:
+                self.send("add_shm_data", ref, dict(metadata or {}), packet_metadata)
+                return
         self.send("add_data", data, dict(metadata or {}), packet_metadata)
 
     def __repr__(self):
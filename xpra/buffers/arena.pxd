@@ -0,0 +1,35 @@
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+from xpra.buffers.membuf cimport MemBuf
+
+
+cdef unsigned char *arena_alloc(size_t size) noexcept nogil
+cdef void arena_free(const void *p) noexcept nogil
+cdef size_t arena_capacity(const void *p) noexcept nogil
+
+
+ctypedef struct arena_writer:
+    unsigned char *buf
+    size_t size
+    size_t capacity
+    unsigned int grown
+
+cdef int arena_write(arena_writer *writer, const void *data, size_t length) noexcept nogil
+
+
+cdef class ArenaPool:
+    cdef object name
+    cdef unsigned int max_free
+    cdef list free_arenas
+    cdef unsigned long allocated
+    cdef unsigned long reused
+    cdef unsigned long grown
+
+    cdef unsigned char *acquire(self, size_t size) except NULL
+    cdef void release(self, const void *p)
+    cdef MemBuf wrap(self, const void *p, size_t used)
+    cdef int init_writer(self, arena_writer *writer, size_t size) except -1
+    cdef MemBuf wrap_writer(self, arena_writer *writer)
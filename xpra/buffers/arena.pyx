@@ -0,0 +1,152 @@
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+# Reusable output buffers for the encoders:
+# the arenas are handed out as MemBuf objects,
+# and they go back to the pool they came from when the MemBuf is garbage collected
+# (ie: once the packet containing the compressed data has been sent)
+# so that encoding does not need to allocate memory in the steady state.
+
+#cython: wraparound=False
+
+from cpython.ref cimport Py_INCREF, Py_DECREF  #pylint: disable=syntax-error
+from libc.stdlib cimport free
+from libc.string cimport memcpy
+from libc.stdint cimport uintptr_t
+from xpra.buffers.membuf cimport memalign, wrapbuf, MemBuf
+
+from xpra.util import envint
+from xpra.log import Logger
+log = Logger("encoder", "util")
+
+#the arenas are aligned like the other buffers,
+#so the header containing their capacity uses the same amount of space:
+DEF ARENA_HEADER = 64
+#round up the arena sizes so that similar images can share them:
+DEF ARENA_GRANULARITY = 64*1024
+
+cdef unsigned int MAX_FREE_ARENAS = max(0, envint("XPRA_MAX_FREE_ARENAS", 4))
+
+
+cdef unsigned char *arena_alloc(size_t size) noexcept nogil:
+    cdef size_t capacity = (size+ARENA_GRANULARITY-1) & ~(<size_t> (ARENA_GRANULARITY-1))
+    cdef unsigned char *base = <unsigned char *> memalign(ARENA_HEADER+capacity)
+    if base==NULL:
+        return NULL
+    (<size_t *> base)[0] = capacity
+    return base+ARENA_HEADER
+
+cdef void arena_free(const void *p) noexcept nogil:
+    if p!=NULL:
+        free(<void *> (<uintptr_t> p - ARENA_HEADER))
+
+cdef size_t arena_capacity(const void *p) noexcept nogil:
+    return (<size_t *> (<uintptr_t> p - ARENA_HEADER))[0]
+
+
+cdef int arena_write(arena_writer *writer, const void *data, size_t length) noexcept nogil:
+    """
+        Appends the data to the arena,
+        the arena is replaced with a larger one if the size bound was too low.
+        Returns 0 on success.
+    """
+    cdef unsigned char *buf
+    cdef size_t capacity
+    if writer.size+length>writer.capacity:
+        capacity = max(writer.capacity*2, writer.size+length)
+        buf = arena_alloc(capacity)
+        if buf==NULL:
+            return -1
+        if writer.size:
+            memcpy(buf, writer.buf, writer.size)
+        arena_free(writer.buf)
+        writer.buf = buf
+        writer.capacity = arena_capacity(buf)
+        writer.grown += 1
+    memcpy(writer.buf+writer.size, data, length)
+    writer.size += length
+    return 0
+
+
+cdef void release_arena(const void *p, size_t l, void *arg):
+    cdef ArenaPool pool = <ArenaPool> arg
+    pool.release(p)
+    #drop the reference added by wrap():
+    Py_DECREF(pool)
+
+
+cdef class ArenaPool:
+    """
+        Keeps a few arenas around for reuse,
+        this object must only be accessed with the GIL held.
+    """
+
+    def __init__(self, name:str="", max_free:int=MAX_FREE_ARENAS):
+        self.name = name
+        self.max_free = max_free
+        self.free_arenas = []
+        self.allocated = self.reused = self.grown = 0
+
+    def __repr__(self):
+        return f"ArenaPool({self.name})"
+
+    def __dealloc__(self):
+        cdef uintptr_t p
+        for p in self.free_arenas or ():
+            arena_free(<const void *> p)
+        self.free_arenas = []
+
+    def get_info(self) -> dict:
+        return {
+            "free"      : len(self.free_arenas),
+            "allocated" : int(self.allocated),
+            "reused"    : int(self.reused),
+            "grown"     : int(self.grown),
+            }
+
+    cdef unsigned char *acquire(self, size_t size) except NULL:
+        """ returns an arena that can hold at least 'size' bytes """
+        cdef uintptr_t p
+        for i, p in enumerate(self.free_arenas):
+            if arena_capacity(<const void *> p)>=size:
+                self.free_arenas.pop(i)
+                self.reused += 1
+                return <unsigned char *> p
+        cdef unsigned char *arena = arena_alloc(size)
+        if arena==NULL:
+            raise MemoryError(f"failed to allocate an arena of {size} bytes")
+        self.allocated += 1
+        log("%s allocated a new arena of %i bytes", self, arena_capacity(arena))
+        return arena
+
+    cdef void release(self, const void *p):
+        """ puts the arena back in the pool, or frees it if we already have enough """
+        cdef uintptr_t smallest
+        self.free_arenas.append(<uintptr_t> p)
+        if len(self.free_arenas)>self.max_free:
+            #keep the largest ones, they can be used for any image:
+            smallest = min(self.free_arenas, key=lambda v : arena_capacity(<const void *> (<uintptr_t> v)))
+            self.free_arenas.remove(smallest)
+            arena_free(<const void *> smallest)
+
+    cdef MemBuf wrap(self, const void *p, size_t used):
+        """ the arena is returned to this pool when the MemBuf is freed """
+        cdef MemBuf membuf = wrapbuf(p, used, &release_arena, <void *> self)
+        Py_INCREF(self)
+        return membuf
+
+    cdef int init_writer(self, arena_writer *writer, size_t size) except -1:
+        writer.buf = self.acquire(size)
+        writer.size = 0
+        writer.capacity = arena_capacity(writer.buf)
+        writer.grown = 0
+        return 0
+
+    cdef MemBuf wrap_writer(self, arena_writer *writer):
+        self.grown += writer.grown
+        cdef MemBuf membuf = self.wrap(writer.buf, writer.size)
+        writer.buf = NULL
+        writer.size = writer.capacity = 0
+        return membuf
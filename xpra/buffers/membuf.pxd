@@ -11,6 +11,8 @@ cdef buffer_context(object obj)
 
 ctypedef void dealloc_callback(const void *p, size_t l, void *arg)
 
+cdef MemBuf wrapbuf(const void *p, size_t l, dealloc_callback *dealloc_cb_p, void *dealloc_cb_arg, int readonly=*)
+
 
 cdef void *memalign(size_t size) nogil
 
@@ -50,6 +50,12 @@ cdef MemBuf makebuf(void *p, size_t l, int readonly=1):
         raise ValueError(f"invalid NULL buffer pointer")
     return MemBuf_init(p, l, &free_buf, NULL, readonly)
 
+cdef MemBuf wrapbuf(const void *p, size_t l, dealloc_callback *dealloc_cb_p, void *dealloc_cb_arg, int readonly=1):
+    #the callback is responsible for releasing the memory:
+    if p==NULL:
+        raise ValueError(f"invalid NULL buffer pointer")
+    return MemBuf_init(p, l, dealloc_cb_p, dealloc_cb_arg, readonly)
+
 
 cdef void *memalign(size_t size) nogil:
     return xmemalign(size)
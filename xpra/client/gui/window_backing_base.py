@@ -30,6 +30,9 @@ WEBP_PILLOW = envbool("XPRA_WEBP_PILLOW", False)
 SCROLL_ENCODING = envbool("XPRA_SCROLL_ENCODING", True)
 REPAINT_ALL = envbool("XPRA_REPAINT_ALL", False)
 SHOW_FPS = envbool("XPRA_SHOW_FPS", False)
+TILE_CACHE_SIZE = envint("XPRA_TILE_CACHE_SIZE", 32*1024*1024)
+#these options only apply to the packet that carried the tile:
+TILE_PACKET_OPTIONS = ("tile", "tile-evict", "tile-reset", "flush", "encoding", "z.len", "z.sha256")
 
 
 _PIL_font = None
@@ -164,12 +167,17 @@ class WindowBackingBase:
         self.repaint_all : bool = REPAINT_ALL
         self.mmap = None
         self.mmap_enabled : bool = False
+        self.mmap_slot_size : int = 0
         self.fps_events : deque = deque(maxlen=120)
         self.fps_buffer_size : tuple[int,int] = (0, 0)
         self.fps_buffer_update_time : float = 0
         self.fps_value : int = 0
         self.fps_refresh_timer : int = 0
         self.paint_stats : dict[str,int] = {}
+        #tiles the server may ask us to paint again,
+        #hash -> (coding, data, rowstride, options)
+        self.tile_cache : dict[bytes,tuple] = {}
+        self.tile_cache_size : int = 0
 
     def idle_add(self, *_args, **_kwargs):
         raise NotImplementedError()
@@ -194,6 +202,10 @@ class WindowBackingBase:
             "offsets"       : self.offsets,
             "fps"           : self.fps_value,
             "paint"         : self.paint_stats,
+            "tile-cache"    : {
+                "entries"   : len(self.tile_cache),
+                "size"      : self.tile_cache_size,
+                },
             }
         vd = self._video_decoder
         if vd:
@@ -260,9 +272,10 @@ class WindowBackingBase:
             GLib.source_remove(frt)
 
 
-    def enable_mmap(self, mmap_area) -> None:
+    def enable_mmap(self, mmap_area, slot_size:int=0) -> None:
         self.mmap = mmap_area
         self.mmap_enabled = True
+        self.mmap_slot_size = slot_size
 
     def gravity_copy_coords(self, oldw:int, oldh:int, bw:int, bh:int):
         sx = sy = dx = dy = 0
@@ -405,6 +418,8 @@ class WindowBackingBase:
         self.free_cuda_context()
         self.cancel_fps_refresh()
         self._backing = None
+        self.tile_cache = {}
+        self.tile_cache_size = 0
         log("%s.close() video_decoder=%s", self, self._video_decoder)
         #try without blocking, if that fails then
         #the lock is held by the decoding thread,
@@ -860,10 +875,16 @@ class WindowBackingBase:
         """ must be called from UI thread
             see _mmap_send() in server.py for details """
         assert self.mmap_enabled
-        data = mmap_read(self.mmap, *img_data)
+        try:
+            data = mmap_read(self.mmap, *img_data)
+        except Exception as e:
+            log("paint_mmap%s", (img_data, x, y, width, height), exc_info=True)
+            fire_paint_callbacks(callbacks, False, f"failed to read mmap data: {e}")
+            return
         rgb_format = options.strget("rgb_format", "RGB")
         #Note: BGR(A) is only handled by gl_window_backing
         x, y = self.gravity_adjust(x, y, options)
+        #the callbacks will free the mmap slots once the pixels have been uploaded:
         self.do_paint_rgb(rgb_format, data, x, y, width, height, width, height, rowstride, options, callbacks)
 
     def paint_scroll(self, img_data, options, callbacks):
@@ -882,7 +903,11 @@ class WindowBackingBase:
             options["encoding"] = coding            #used for choosing the color of the paint box
             if INTEGRITY_HASH:
                 verify_checksum(img_data, options)
-            if coding == "mmap":
+            if "tile" in options:
+                self.update_tile_cache(coding, img_data, rowstride, options)
+            if coding == "tile":
+                self.paint_tile(img_data, x, y, width, height, options, callbacks)
+            elif coding == "mmap":
                 self.idle_add(self.paint_mmap, img_data, x, y, width, height, rowstride, options, callbacks)
             elif coding in ("rgb24", "rgb32"):
                 #avoid confusion over how many bytes-per-pixel we may have:
@@ -921,6 +946,47 @@ class WindowBackingBase:
             else:
                 raise
 
+    def update_tile_cache(self, coding:str, img_data, rowstride:int, options) -> None:
+        """
+            The server decides which tiles we keep and when we evict them,
+            we only enforce a hard limit in case it misbehaves.
+        """
+        if options.boolget("tile-reset"):
+            self.tile_cache = {}
+            self.tile_cache_size = 0
+        for key in options.tupleget("tile-evict"):
+            self.remove_tile(key)
+        key = options.get("tile")
+        if not key or coding=="tile":
+            return
+        self.remove_tile(key)
+        if isinstance(img_data, memoryview):
+            img_data = img_data.tobytes()
+        size = len(img_data)
+        if self.tile_cache_size+size>TILE_CACHE_SIZE:
+            log.warn("Warning: tile cache limit of %iMB exceeded", TILE_CACHE_SIZE//1024//1024)
+            return
+        tile_options = typedict((k, v) for k, v in options.items() if k not in TILE_PACKET_OPTIONS)
+        self.tile_cache[key] = (coding, img_data, rowstride, tile_options)
+        self.tile_cache_size += size
+
+    def remove_tile(self, key) -> None:
+        tile = self.tile_cache.pop(key, None)
+        if tile:
+            self.tile_cache_size -= len(tile[1])
+
+    def paint_tile(self, key, x:int, y:int, width:int, height:int, options, callbacks:Iterable[Callable]) -> None:
+        tile = self.tile_cache.get(key)
+        if not tile:
+            fire_paint_callbacks(callbacks, False, "tile not found in cache")
+            return
+        coding, img_data, rowstride, tile_options = tile
+        log("paint_tile: %s at %s", coding, (x, y, width, height))
+        tile_options = typedict(tile_options)
+        if "flush" in options:
+            tile_options["flush"] = options.intget("flush")
+        self.draw_region(x, y, width, height, coding, img_data, rowstride, tile_options, callbacks)
+
     # noinspection PyMethodMayBeStatic
     def do_draw_region(self, _x:int, _y:int, _width:int, _height:int, coding:str, _img_data, _rowstride:int, _options, callbacks):
         msg = f"invalid encoding: {coding!r}"
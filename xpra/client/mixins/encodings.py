@@ -25,6 +25,8 @@ PAINT_FLUSH = envbool("XPRA_PAINT_FLUSH", True)
 MAX_SOFT_EXPIRED = envint("XPRA_MAX_SOFT_EXPIRED", 5)
 SEND_TIMESTAMPS = envbool("XPRA_SEND_TIMESTAMPS", False)
 SCROLL_ENCODING = envbool("XPRA_SCROLL_ENCODING", True)
+TILE_CACHE = envbool("XPRA_TILE_CACHE", True)
+TILE_CACHE_SIZE = envint("XPRA_TILE_CACHE_SIZE", 32*1024*1024)
 
 #we assume that any server will support at least those:
 DEFAULT_ENCODINGS = os.environ.get("XPRA_DEFAULT_ENCODINGS", "rgb32,rgb24,jpeg,png").split(",")
@@ -207,6 +209,7 @@ class Encodings(StubClientMixin):
             "video_max_size"            : self.video_max_size,
             "max-soft-expired"          : MAX_SOFT_EXPIRED,
             "send-timestamps"           : SEND_TIMESTAMPS,
+            "tile-cache"                : TILE_CACHE_SIZE if TILE_CACHE else 0,
             }
         if self.video_scaling is not None:
             caps["scaling.control"] = self.video_scaling
@@ -34,6 +34,7 @@ class MmapClient(StubClientMixin):
         self.mmap_token_bytes : int = 0
         self.mmap_filename : str = ""
         self.mmap_size : int = 0
+        self.mmap_slot_size : int = 0
         self.mmap_group : str = ""
         self.mmap_tempfile = None
         self.mmap_delete : bool = False
@@ -81,7 +82,11 @@ class MmapClient(StubClientMixin):
                 self.mmap_enabled = False
                 self.quit(ExitCode.MMAP_TOKEN_FAILURE)
                 return False
+            #servers that support slots will tell us the slot size they chose:
+            self.mmap_slot_size = c.intget("slot-size", 0)
             log.info("enabled fast mmap transfers using %sB shared memory area", std_unit(self.mmap_size, unit=1024))
+            if self.mmap_slot_size:
+                log(" using %sB slots", std_unit(self.mmap_slot_size, unit=1024))
         #the server will have a handle on the mmap file by now, safe to delete:
         if not KEEP_MMAP_FILE:
             self.clean_mmap()
@@ -105,12 +110,14 @@ class MmapClient(StubClientMixin):
             }
 
     def get_raw_caps(self) -> dict[str,Any]:
+        from xpra.net.mmap_pipe import MMAP_SLOTS  #pylint: disable=import-outside-toplevel
         return {
             "file"          : self.mmap_filename,
             "size"          : self.mmap_size,
             "token"         : self.mmap_token,
             "token_index"   : self.mmap_token_index,
             "token_bytes"   : self.mmap_token_bytes,
+            "slots"         : MMAP_SLOTS,
             }
 
     def init_mmap(self, mmap_filename, mmap_group, socket_filename) -> None:
@@ -1516,11 +1516,15 @@ class WindowClient(StubClientMixin):
             def draw_cleanup():
                 if coding=="mmap":
                     assert self.mmap_enabled
-                    from xpra.net.mmap_pipe import int_from_buffer
                     #we need to ack the data to free the space!
-                    data_start = int_from_buffer(self.mmap, 0)
-                    offset, length = data[-1]
-                    data_start.value = offset+length
+                    if self.mmap_slot_size:
+                        from xpra.net.mmap_pipe import mmap_free_slots
+                        mmap_free_slots(self.mmap, self.mmap_slot_size, *data)
+                    else:
+                        from xpra.net.mmap_pipe import int_from_buffer
+                        data_start = int_from_buffer(self.mmap, 0)
+                        offset, length = data[-1]
+                        data_start.value = offset+length
                     #clear the mmap area via idle_add so any pending draw requests
                     #will get a chance to run first (preserving the order)
                 self.send_damage_sequence(wid, packet_sequence, width, height, WINDOW_NOT_FOUND, "window not found")
@@ -1553,10 +1557,18 @@ class WindowClient(StubClientMixin):
                 paintlog("record_decode_time(%s, %s) decoding or painting skipped on wid=%s, %s: %sx%s",
                          success, message, wid, coding, width, height)
             self.send_damage_sequence(wid, packet_sequence, width, height, decode_time, repr_ellipsized(message, 512))
+        callbacks = [record_decode_time]
+        free_slots = None
+        if coding=="mmap" and self.mmap_slot_size:
+            #the slots must be freed once the paint has completed, whether it succeeded or not:
+            free_slots = self.make_mmap_free_slots_cb(data)
+            callbacks.insert(0, free_slots)
         self._draw_counter += 1
         if PAINT_FAULT_RATE>0 and (self._draw_counter % PAINT_FAULT_RATE)==0:
             drawlog.warn("injecting paint fault for %s draw packet %i, sequence number=%i",
                          coding, self._draw_counter, packet_sequence)
+            if free_slots:
+                self.idle_add(free_slots)
             if PAINT_FAULT_TELL:
                 self.idle_add(record_decode_time, False, "fault injection for %s draw packet %i, sequence number=%i" % (coding, self._draw_counter, packet_sequence))
             return
@@ -1565,12 +1577,25 @@ class WindowClient(StubClientMixin):
         #    options["client-scaling"] = self.xscale, self.yscale
         try:
             window.draw_region(x, y, width, height, coding, data, rowstride,
-                               packet_sequence, options, [record_decode_time])
+                               packet_sequence, options, callbacks)
         except Exception as e:
             drawlog.error("Error drawing on window %i", wid, exc_info=True)
+            if free_slots:
+                self.idle_add(free_slots)
             self.idle_add(record_decode_time, False, str(e))
             raise
 
+    def make_mmap_free_slots_cb(self, descr_data) -> Callable:
+        freed = []
+        def free_slots(*_args):
+            #freeing a slot twice could release it after the server has re-used it:
+            if freed:
+                return
+            freed.append(True)
+            from xpra.net.mmap_pipe import mmap_free_slots  #pylint: disable=import-outside-toplevel
+            mmap_free_slots(self.mmap, self.mmap_slot_size, *descr_data)
+        return free_slots
+
 
     ######################################################################
     # screen scaling:
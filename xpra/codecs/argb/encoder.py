@@ -6,6 +6,7 @@
 from typing import Any
 
 from xpra.codecs.rgb_transform import rgb_reformat
+from xpra.codecs.image_wrapper import record_copy
 from xpra.codecs import rgb_transform
 from xpra.net.compression import Compressed, LevelCompressed, compressed_wrapper
 from xpra.log import Logger
@@ -100,11 +101,14 @@ def encode(coding : str, image, options : dict) -> tuple[str,Compressed,dict[str
             # and `memoryview` pixel data cannot be handled by the packet encoders,
             # so we have to convert it to bytes:
             cwrapper.data = rgb_transform.pixels_to_bytes(pixels)
+            record_copy("packet", l)
     else:
         #can't pass a raw buffer to rencodeplus,
         #and even if we could, the image containing those pixels may be freed by the time we get to the encoder
         algo = "not"
         cwrapper = Compressed(coding, rgb_transform.pixels_to_bytes(pixels), True)
+        if isinstance(pixels, memoryview):
+            record_copy("packet", l)
     if pixel_format.find("A")>=0 or pixel_format.find("X")>=0:
         bpp = 32
     else:
@@ -6,10 +6,53 @@
 
 from enum import IntEnum
 from time import monotonic
+from threading import Lock
+from typing import Any
 from xpra.util import roundup
 from xpra.os_util import memoryview_to_bytes
 
+
+#pixel data copies, by reason: [count, bytes]
+copy_lock = Lock()
+copy_stats : dict[str,list[int]] = {}
+copy_frames : int = 0
+
+def record_copy(reason : str, size : int) -> None:
+    """
+        Records a copy of `size` bytes of pixel data,
+        so that we can tell how many bytes we copy for each frame we send.
+    """
+    with copy_lock:
+        stats = copy_stats.setdefault(reason, [0, 0])
+        stats[0] += 1
+        stats[1] += size
+
+def record_frame() -> None:
+    global copy_frames
+    with copy_lock:
+        copy_frames += 1
+
+def get_copy_info() -> dict[str,Any]:
+    with copy_lock:
+        frames = copy_frames
+        stats = {reason : tuple(v) for reason, v in copy_stats.items()}
+    total = sum(v[1] for v in stats.values())
+    info : dict[str,Any] = {
+        "frames"    : frames,
+        "bytes"     : total,
+        }
+    if frames>0:
+        info["per-frame"] = total//frames
+    for reason, (count, size) in stats.items():
+        info[reason] = {
+            "count" : count,
+            "bytes" : size,
+            }
+    return info
+
+
 def clone_plane(plane):
+    record_copy("clone", len(plane))
     if isinstance(plane, memoryview):
         return plane.tobytes()
     return plane[:]
@@ -24,6 +67,15 @@ class PlanarFormat(IntEnum):
 
 
 class ImageWrapper:
+    """
+        Pixel data is exposed by `get_pixels()` as an object
+        supporting the buffer protocol (bytes, memoryview, etc),
+        or as a list of such objects for planar images.
+        These buffers may be borrowed from the capture backend (ie: XShm)
+        so they are only valid until the image wrapper is freed:
+        consumers must not keep a reference to them after that,
+        and must call `clone_pixel_data()` if they need the pixels for longer.
+    """
 
     PACKED : PlanarFormat = PlanarFormat.PACKED
     PLANAR_2 : PlanarFormat = PlanarFormat.PLANAR_2
@@ -190,6 +242,7 @@ class ImageWrapper:
                     break
         self.rowstride = rowstride
         self.pixels = b"".join(lines)
+        record_copy("restride", len(self.pixels))
         return True
 
     def freeze(self) -> bool:
@@ -233,12 +286,21 @@ class ImageWrapper:
         #copy to local variables:
         pixels = self.pixels
         oldstride = self.rowstride
+        if x==0 and w==self.width and isinstance(pixels, bytes):
+            #full rows from an immutable buffer can be referenced without copying:
+            pixels = memoryview(pixels)[y*oldstride:(y+h)*oldstride]
+            image = ImageWrapper(self.x, self.y+y, w, h, pixels, self.pixel_format, self.depth, oldstride,
+                                 planes=self.planes, thread_safe=True, palette=self.palette)
+            image.set_target_x(self.target_x)
+            image.set_target_y(self.target_y+y)
+            return image
         pos = y*oldstride + x*self.bytesperpixel
         newstride = w*self.bytesperpixel
         lines = []
         for _ in range(h):
             lines.append(memoryview_to_bytes(pixels[pos:pos+newstride]))
             pos += oldstride
+        record_copy("sub-image", newstride*h)
         image = ImageWrapper(self.x+x, self.y+y, w, h, b"".join(lines), self.pixel_format, self.depth, newstride,
                             planes=self.planes, thread_safe=True, palette=self.palette)
         image.set_target_x(self.target_x+x)
@@ -7,9 +7,11 @@
 
 from typing import Any, Dict
 from time import monotonic
+from threading import local
 
 from libc.stdint cimport uintptr_t
-from xpra.buffers.membuf cimport makebuf, MemBuf, buffer_context    #pylint: disable=syntax-error
+from xpra.buffers.membuf cimport MemBuf, buffer_context    #pylint: disable=syntax-error
+from xpra.buffers.arena cimport ArenaPool
 from xpra.codecs.codec_constants import get_subsampling_divs
 from xpra.codecs.codec_debug import may_save_image
 from xpra.net.compression import Compressed
@@ -53,12 +55,13 @@ cdef extern from "turbojpeg.h":
     int TJFLAG_FASTUPSAMPLE
     int TJFLAG_FASTDCT
     int TJFLAG_ACCURATEDCT
+    int TJFLAG_NOREALLOC
 
     ctypedef void* tjhandle
     tjhandle tjInitCompress()
     int tjDestroy(tjhandle handle)
     char* tjGetErrorStr()
-    #unsigned long tjBufSize(int width, int height, int jpegSubsamp)
+    unsigned long tjBufSize(int width, int height, int jpegSubsamp)
     int tjCompress2(tjhandle handle, const unsigned char *srcBuf,
                     int width, int pitch, int height, int pixelFormat, unsigned char **jpegBuf,
                     unsigned long *jpegSize, int jpegSubsamp, int jpegQual, int flags) nogil
@@ -160,8 +163,122 @@ cdef inline int norm_quality(int quality) nogil:
         return 100
     return <int> round(sqrt(<double> quality)*10)
 
-cdef class Encoder:
+cdef class JPEGSession:
+    """
+        A persistent compressor and a pool of output buffers sized using the worst-case bound,
+        so that compressing images does not allocate any memory once the pool is warm.
+        A session must only be used from one thread at a time.
+    """
     cdef tjhandle compressor
+    cdef ArenaPool arenas
+    cdef unsigned long frames
+    cdef object __weakref__
+
+    def __init__(self):
+        self.frames = 0
+        self.arenas = ArenaPool("jpeg")
+        self.compressor = tjInitCompress()
+        if self.compressor==NULL:
+            raise RuntimeError("Error: failed to instantiate a JPEG compressor")
+
+    def __repr__(self):
+        return "JPEGSession(%i frames)" % self.frames
+
+    def __dealloc__(self):
+        self.close()
+
+    def is_closed(self):
+        return self.compressor==NULL
+
+    def close(self):
+        if self.compressor:
+            r = tjDestroy(self.compressor)
+            self.compressor = NULL
+            if r:
+                log.error("Error: failed to destroy the JPEG compressor, code %i:", r)
+                log.error(" %s", get_error_str())
+
+    def get_info(self) -> Dict[str,Any]:
+        return {
+            "frames"    : int(self.frames),
+            "arenas"    : self.arenas.get_info(),
+            }
+
+    def encode_planes(self, image, int quality=50, int grayscale=0, int with_alpha=0):
+        """
+            Compresses the image, and its alpha channel as a separate greyscale image.
+            Both are written to the same buffer, the alpha data immediately follows the colour data.
+            Returns the whole buffer and the colour and alpha parts of it,
+            or None if the compression failed.
+        """
+        if self.compressor==NULL:
+            raise RuntimeError("the JPEG compressor has been closed")
+        pfstr = image.get_pixel_format()
+        cdef int width = image.get_width()
+        cdef int height = image.get_height()
+        cdef TJSAMP subsamp = get_image_subsamp(pfstr, quality, grayscale)
+        cdef unsigned long colour_bound = tjBufSize(width, height, subsamp)
+        cdef unsigned long alpha_bound = 0
+        if with_alpha:
+            alpha_bound = tjBufSize(width, height, TJSAMP_GRAY)
+        if colour_bound==<unsigned long> -1 or alpha_bound==<unsigned long> -1:
+            log.error("Error: invalid jpeg buffer size for %ix%i", width, height)
+            log.error(" %s", get_error_str())
+            return None
+        cdef unsigned char *out = self.arenas.acquire(colour_bound+alpha_bound)
+        cdef unsigned long colour_size = 0
+        cdef unsigned long alpha_size = 0
+        cdef MemBuf membuf = None
+        try:
+            if pfstr in ("YUV420P", "YUV422P", "YUV444P"):
+                colour_size = do_encode_yuv(self.compressor, out, colour_bound,
+                                            pfstr, image.get_pixels(),
+                                            width, height, image.get_rowstride(),
+                                            quality, subsamp)
+            else:
+                pf = TJPF_VAL.get(pfstr)
+                if pf is None:
+                    raise ValueError(f"invalid pixel format {pfstr!r}")
+                colour_size = do_encode_rgb(self.compressor, out, colour_bound,
+                                            pfstr, image.get_pixels(),
+                                            width, height, image.get_rowstride(),
+                                            quality, pf, subsamp)
+            if not colour_size:
+                return None
+            if with_alpha:
+                from xpra.codecs.argb.argb import alpha  #@UnresolvedImport
+                planes = (alpha(image), )
+                rowstrides = (image.get_rowstride()//4, )
+                alpha_size = do_encode_yuv(self.compressor, out+colour_size, alpha_bound,
+                                           "YUV400P", planes,
+                                           width, height, rowstrides,
+                                           quality, TJSAMP_GRAY)
+                if not alpha_size:
+                    return None
+            membuf = self.arenas.wrap(out, colour_size+alpha_size)
+        finally:
+            if membuf is None:
+                self.arenas.release(out)
+        self.frames += 1
+        data = memoryview(membuf)
+        if not with_alpha:
+            return data, data, None
+        return data, data[:colour_size], data[colour_size:]
+
+
+#each encoding thread gets its own session:
+thread_sessions = local()
+
+def get_session() -> JPEGSession:
+    session = getattr(thread_sessions, "session", None)
+    if session is None:
+        session = JPEGSession()
+        thread_sessions.session = session
+    return session
+
+
+cdef class Encoder:
+    cdef JPEGSession session
     cdef int width
     cdef int height
     cdef object encoding
@@ -173,9 +290,7 @@ cdef class Encoder:
 
     def __init__(self):
         self.width = self.height = self.quality = self.frames = 0
-        self.compressor = tjInitCompress()
-        if self.compressor==NULL:
-            raise RuntimeError("Error: failed to instantiate a JPEG compressor")
+        self.session = JPEGSession()
 
     def init_context(self, encoding, width : int, height : int, src_format, options : typedict):
         assert encoding in ("jpeg", "jpega"), "invalid encoding: %s" % encoding
@@ -191,19 +306,14 @@ cdef class Encoder:
         self.quality = options.intget("quality", 50)
 
     def is_ready(self):
-        return self.compressor!=NULL
+        return not self.session.is_closed()
 
     def is_closed(self):
-        return self.compressor==NULL
+        return self.session.is_closed()
 
     def clean(self):
         self.width = self.height = self.quality = 0
-        if self.compressor:
-            r = tjDestroy(self.compressor)
-            self.compressor = NULL
-            if r:
-                log.error("Error: failed to destroy the JPEG compressor, code %i:", r)
-                log.error(" %s", get_error_str())
+        self.session.close()
 
     def get_encoding(self):
         return self.encoding
@@ -229,6 +339,7 @@ cdef class Encoder:
             "height"        : self.height,
             "quality"       : self.quality,
             "grayscale"     : bool(self.grayscale),
+            "session"       : self.session.get_info(),
         }
         return info
 
@@ -240,28 +351,20 @@ cdef class Encoder:
         else:
             quality = self.quality
         pfstr = image.get_pixel_format()
-        if pfstr in ("YUV420P", "YUV422P", "YUV444P"):
-            cdata = encode_yuv(self.compressor, image, quality, self.grayscale)
-        else:
-            cdata = encode_rgb(self.compressor, image, quality, self.grayscale)
-        if not cdata:
+        if pfstr.startswith("YUV") and pfstr not in ("YUV420P", "YUV422P"):
+            raise ValueError(f"invalid yuv pixel format {pfstr!r}")
+        r = self.session.encode_planes(image, quality, self.grayscale, self.encoding=="jpega")
+        if not r:
             return None
+        cdata, colour, alpha = r
         now = monotonic()
-        may_save_image("jpeg", cdata, now)
+        may_save_image("jpeg", colour, now)
         client_options = {}
-        if self.encoding=="jpega":
-            from xpra.codecs.argb.argb import alpha  #@UnresolvedImport
-            a = alpha(image)
-            planes = (a, )
-            rowstrides = (image.get_rowstride()//4, )
-            adata = do_encode_yuv(self.compressor, "YUV400P", planes,
-                                  self.width, self.height, rowstrides,
-                                  quality, TJSAMP_GRAY)
-            client_options["alpha-offset"] = len(cdata)
-            may_save_image("jpeg", adata, now)
-            cdata = memoryview(cdata).tobytes()+memoryview(adata).tobytes()
+        if alpha is not None:
+            client_options["alpha-offset"] = len(colour)
+            may_save_image("jpeg", alpha, now)
         self.frames += 1
-        return memoryview(cdata), client_options
+        return cdata, client_options
 
 
 def get_error_str():
@@ -302,36 +405,18 @@ def encode(coding, image, options=None):
     client_options = {
         "quality"   : quality
         }
-    cdef tjhandle compressor = tjInitCompress()
-    if compressor==NULL:
-        log.error("Error: failed to instantiate a JPEG compressor")
+    r = get_session().encode_planes(image, quality, grayscale, coding=="jpega")
+    if not r:
         return None
-    cdef int r
-    try:
-        cdata = encode_rgb(compressor, image, quality, grayscale)
-        if not cdata:
-            return None
-        now = monotonic()
-        may_save_image("jpeg", cdata, now)
-        bpp = 24
-        if coding=="jpega":
-            from xpra.codecs.argb.argb import alpha  #@UnresolvedImport
-            a = alpha(image)
-            planes = (a, )
-            rowstrides = (image.get_rowstride()//4, )
-            adata = do_encode_yuv(compressor, "YUV400P", planes,
-                                  width, height, rowstrides,
-                                  quality, TJSAMP_GRAY)
-            may_save_image("jpeg", adata, now)
-            client_options["alpha-offset"] = len(cdata)
-            cdata = memoryview(cdata).tobytes()+memoryview(adata).tobytes()
-            bpp = 32
-        return coding, Compressed(coding, memoryview(cdata), False), client_options, width, height, 0, bpp
-    finally:
-        r = tjDestroy(compressor)
-        if r:
-            log.error("Error: failed to destroy the JPEG compressor, code %i:", r)
-            log.error(" %s", get_error_str())
+    cdata, colour, alpha = r
+    now = monotonic()
+    may_save_image("jpeg", colour, now)
+    bpp = 24
+    if alpha is not None:
+        may_save_image("jpeg", alpha, now)
+        client_options["alpha-offset"] = len(colour)
+        bpp = 32
+    return coding, Compressed(coding, cdata, False), client_options, width, height, 0, bpp
 
 cdef TJSAMP get_subsamp(int quality):
     if quality<60:
@@ -340,31 +425,24 @@ cdef TJSAMP get_subsamp(int quality):
         return TJSAMP_422
     return TJSAMP_444
 
-cdef encode_rgb(tjhandle compressor, image, int quality, int grayscale=0):
-    pfstr = image.get_pixel_format()
-    pf = TJPF_VAL.get(pfstr)
-    if pf is None:
-        raise ValueError(f"invalid pixel format {pfstr!r}")
-    cdef TJPF tjpf = pf
-    cdef TJSAMP subsamp
+cdef TJSAMP get_image_subsamp(pfstr, int quality, int grayscale):
     if grayscale:
-        subsamp = TJSAMP_GRAY
-    else:
-        subsamp = get_subsamp(quality)
-    cdef int width = image.get_width()
-    cdef int height = image.get_height()
-    cdef int stride = image.get_rowstride()
-    pixels = image.get_pixels()
-    return do_encode_rgb(compressor, pfstr, pixels,
-                         width, height, stride,
-                         quality, tjpf, subsamp)
-
-cdef do_encode_rgb(tjhandle compressor, pfstr, pixels,
-                   int width, int height, int stride,
-                   int quality, TJPF tjpf, TJSAMP subsamp):
-    cdef int flags = 0
-    cdef unsigned char *out = NULL
-    cdef unsigned long out_size = 0
+        return TJSAMP_GRAY
+    if pfstr=="YUV420P":
+        return TJSAMP_420
+    if pfstr=="YUV422P":
+        return TJSAMP_422
+    if pfstr=="YUV444P":
+        return TJSAMP_444
+    return get_subsamp(quality)
+
+cdef unsigned long do_encode_rgb(tjhandle compressor, unsigned char *out, unsigned long out_size,
+                                 pfstr, pixels,
+                                 int width, int height, int stride,
+                                 int quality, TJPF tjpf, TJSAMP subsamp) except? 0:
+    """ compresses to the 'out' buffer, which must be large enough, returns the compressed size """
+    #the buffer is sized from tjBufSize, so turbojpeg never has to allocate one:
+    cdef int flags = TJFLAG_NOREALLOC
     cdef int r = -1
     cdef const unsigned char *src
     log("jpeg.encode_rgb with subsampling=%s for pixel format=%s with quality=%s",
@@ -385,38 +463,16 @@ cdef do_encode_rgb(tjhandle compressor, pfstr, pixels,
         log.error(" width=%i, stride=%i, height=%i", width, stride, height)
         log.error(" quality=%i (from %i), flags=%x", norm_quality(quality), quality, flags)
         log.error(" pixel format=%s", pfstr)
-        return None
-    assert out_size>0 and out!=NULL, "jpeg compression produced no data"
-    return makebuf(out, out_size)
-
-cdef encode_yuv(tjhandle compressor, image, int quality, int grayscale=0):
-    pfstr = image.get_pixel_format()
-    assert pfstr in ("YUV420P", "YUV422P"), "invalid yuv pixel format %s" % pfstr
-    cdef TJSAMP subsamp
-    if grayscale:
-        subsamp = TJSAMP_GRAY
-    elif pfstr=="YUV420P":
-        subsamp = TJSAMP_420
-    elif pfstr=="YUV422P":
-        subsamp = TJSAMP_422
-    elif pfstr=="YUV444P":
-        subsamp = TJSAMP_444
-    else:
-        raise ValueError("invalid yuv pixel format %s" % pfstr)
-    cdef int width = image.get_width()
-    cdef int height = image.get_height()
-    rowstrides = image.get_rowstride()
-    planes = image.get_pixels()
-    return do_encode_yuv(compressor, pfstr, planes,
-                         width, height, rowstrides,
-                         quality, subsamp)
-
-cdef do_encode_yuv(tjhandle compressor, pfstr, planes,
-                   int width, int height, rowstrides,
-                   int quality, TJSAMP subsamp):
-    cdef int flags = 0
-    cdef unsigned char *out = NULL
-    cdef unsigned long out_size = 0
+        return 0
+    assert out_size>0, "jpeg compression produced no data"
+    return out_size
+
+cdef unsigned long do_encode_yuv(tjhandle compressor, unsigned char *out, unsigned long out_size,
+                                 pfstr, planes,
+                                 int width, int height, rowstrides,
+                                 int quality, TJSAMP subsamp) except? 0:
+    """ compresses to the 'out' buffer, which must be large enough, returns the compressed size """
+    cdef int flags = TJFLAG_NOREALLOC
     cdef int r = -1
     cdef int strides[3]
     cdef const unsigned char *src[3]
@@ -455,12 +511,12 @@ cdef do_encode_yuv(tjhandle compressor, pfstr, planes,
             log.error(" quality=%i (from %i), flags=%x", norm_quality(quality), quality, flags)
             log.error(" pixel format=%s, subsampling=%s", pfstr, TJSAMP_STR.get(subsamp, subsamp))
             log.error(" planes: %s", csv(<uintptr_t> src[i] for i in range(3)))
-            return None
+            return 0
     finally:
         for bc in contexts:
             bc.__exit__()
-    assert out_size>0 and out!=NULL, "jpeg compression produced no data"
-    return makebuf(out, out_size)
+    assert out_size>0, "jpeg compression produced no data"
+    return out_size
 
 
 def selftest(full=False):
@@ -133,9 +133,6 @@ def encode(coding : str, image, options=None) -> tuple[str,Compressed,dict[str,A
             raise ValueError(f"invalid pixel format {pixel_format}")
     pil_import_format = pixel_format.replace("A", "a")
     try:
-        #PIL cannot use the memoryview directly:
-        if isinstance(pixels, memoryview):
-            pixels = pixels.tobytes()
         # it is safe to use frombuffer() here since the convert()
         # calls below will not convert and modify the data in place,
         # and we save the compressed data then discard the image
@@ -8,7 +8,7 @@ from time import monotonic
 
 from xpra.os_util import memoryview_to_bytes
 from xpra.util import first_time, csv
-from xpra.codecs.image_wrapper import ImageWrapper
+from xpra.codecs.image_wrapper import ImageWrapper, record_copy
 from xpra.log import Logger
 try:
     from xpra.codecs.argb.argb import argb_swap #@UnresolvedImport
@@ -39,6 +39,13 @@ PIL_conv_noalpha : dict[str, tuple[tuple[str,str], ...]] = {
              }
 
 
+def argb_reformat(image : ImageWrapper, rgb_formats, supports_transparency:bool) -> bool:
+    if not argb_swap(image, rgb_formats, supports_transparency):
+        return False
+    record_copy("reformat", image.get_size())
+    return True
+
+
 def rgb_reformat(image : ImageWrapper, rgb_formats, supports_transparency:bool) -> bool:
     """ convert the RGB pixel data into a format supported by the client """
     #need to convert to a supported format!
@@ -51,7 +58,7 @@ def rgb_reformat(image : ImageWrapper, rgb_formats, supports_transparency:bool)
         #(required for r210 which is not handled by PIL directly)
         assert argb_swap, "no argb codec"
         log("rgb_reformat: using argb_swap for %s", image)
-        return argb_swap(image, rgb_formats, supports_transparency)
+        return argb_reformat(image, rgb_formats, supports_transparency)
     modes : tuple[tuple[str,str], ...] = ()
     try:
         # pylint: disable=import-outside-toplevel
@@ -69,7 +76,7 @@ def rgb_reformat(image : ImageWrapper, rgb_formats, supports_transparency:bool)
         log("rgb_reformat: no matching target modes for converting %s to %s", image, rgb_formats)
         #try argb module:
         assert argb_swap, "no argb codec"
-        if argb_swap(image, rgb_formats, supports_transparency):
+        if argb_reformat(image, rgb_formats, supports_transparency):
             return True
         warning_key = f"rgb_reformat({pixel_format}, {rgb_formats}, {supports_transparency})"
         if first_time(warning_key):
@@ -80,14 +87,12 @@ def rgb_reformat(image : ImageWrapper, rgb_formats, supports_transparency:bool)
     start = monotonic()
     w = image.get_width()
     h = image.get_height()
-    #PIL cannot use the memoryview directly:
-    if isinstance(pixels, memoryview):
-        pixels = pixels.tobytes()
     img = Image.frombuffer(target_format, (w, h), pixels, "raw", input_format, image.get_rowstride())
     rowstride = w*len(target_format)    #number of characters is number of bytes per pixel!
     data = img.tobytes("raw", target_format)
     if len(data)!=rowstride*h:
         raise RuntimeError(f"expected {rowstride*h} bytes in {target_format} format but got {len(data)}")
+    record_copy("reformat", len(data))
     image.set_pixels(data)
     image.set_rowstride(rowstride)
     image.set_pixel_format(target_format)
@@ -5,6 +5,8 @@
 
 #cython: wraparound=False
 
+from threading import local
+
 from xpra.log import Logger
 log = Logger("decoder", "spng")
 
@@ -17,7 +19,7 @@ from xpra.codecs.spng.spng cimport (
     SPNG_INTERLACE_NONE,
     SPNG_ENCODE_FINALIZE,
     SPNG_FILTER_CHOICE, SPNG_FILTER_CHOICE_NONE, SPNG_FILTER_CHOICE_SUB,
-    SPNG_ENCODE_TO_BUFFER,
+    SPNG_IO_ERROR,
     SPNG_IMG_COMPRESSION_LEVEL,
     SPNG_IMG_MEM_LEVEL,
     SPNG_IMG_COMPRESSION_STRATEGY,
@@ -27,11 +29,12 @@ from xpra.codecs.spng.spng cimport (
     spng_ctx, spng_ihdr, spng_strerror,
     spng_ctx_new, spng_ctx_free,
     spng_set_option, spng_set_ihdr,
-    spng_encode_image, spng_get_png_buffer,
+    spng_encode_image, spng_set_png_stream,
     spng_format,
     )
 from libc.stdint cimport uintptr_t, uint32_t, uint8_t
-from xpra.buffers.membuf cimport makebuf, MemBuf, buffer_context #pylint: disable=syntax-error
+from xpra.buffers.membuf cimport MemBuf, buffer_context #pylint: disable=syntax-error
+from xpra.buffers.arena cimport ArenaPool, arena_writer, arena_write
 
 
 cdef extern from "zconf.h":
@@ -39,6 +42,7 @@ cdef extern from "zconf.h":
 
 cdef extern from "zlib.h":
     int Z_HUFFMAN_ONLY
+    unsigned long compressBound(unsigned long sourceLen)
 
 
 def get_version():
@@ -65,6 +69,27 @@ def log_error(int r, msg):
 
 INPUT_FORMATS = "RGBA", "RGB"
 
+#each encoding thread gets its own pool of output buffers:
+thread_arenas = local()
+
+def get_arenas() -> ArenaPool:
+    arenas = getattr(thread_arenas, "arenas", None)
+    if arenas is None:
+        arenas = ArenaPool("spng")
+        thread_arenas.arenas = arenas
+    return arenas
+
+cdef size_t png_bound(int width, int height, int Bpp):
+    #each row starts with the filter type byte:
+    cdef unsigned long raw = height*(1+width*Bpp)
+    #signature, IHDR and IEND, plus the header and crc of each IDAT chunk:
+    return compressBound(raw) + 8 + 25 + 12 + 12*(raw//8192+1)
+
+cdef int write_png_stream(spng_ctx *ctx, void *user, void *data, size_t length) noexcept nogil:
+    if arena_write(<arena_writer *> user, data, length):
+        return SPNG_IO_ERROR
+    return 0
+
 def encode(coding, image, options=None):
     assert coding in ("png", "png/L")
     options = options or {}
@@ -121,13 +146,36 @@ def encode(coding, image, options=None):
         else:
             raise ValueError(f"invalid rgb pixel format {rgb_format!r}")
 
+    cdef ArenaPool arenas = get_arenas()
+    cdef arena_writer writer
+    arenas.init_writer(&writer, png_bound(scaled_width, scaled_height, len(rgb_format)))
     cdef spng_ctx *ctx = spng_ctx_new(SPNG_CTX_ENCODER)
     if ctx==NULL:
+        arenas.release(writer.buf)
         raise RuntimeError("failed to instantiate an spng context")
+    try:
+        membuf = do_encode(ctx, &writer, arenas, pixels, rgb_format, scaled_width, scaled_height, speed)
+    finally:
+        spng_ctx_free(ctx)
+        if writer.buf!=NULL:
+            arenas.release(writer.buf)
+    if membuf is None:
+        log.error(" for %s", image)
+        return None
+    cdata = memoryview(membuf)
+    may_save_image("png", cdata)
+    return coding, Compressed(coding, cdata), {}, width, height, 0, len(rgb_format)*8
+
 
+cdef MemBuf do_encode(spng_ctx *ctx, arena_writer *writer, ArenaPool arenas,
+                      pixels, rgb_format, int width, int height, int speed):
+    """
+        Writes the png data to the arena,
+        the arena is only handed over to the MemBuf returned if the encoding succeeds.
+    """
     cdef spng_ihdr ihdr
-    ihdr.width = scaled_width
-    ihdr.height = scaled_height
+    ihdr.width = width
+    ihdr.height = height
     ihdr.bit_depth = 8
     if rgb_format=="L":
         ihdr.color_type = SPNG_COLOR_TYPE_GRAYSCALE
@@ -145,37 +193,31 @@ def encode(coding, image, options=None):
     ihdr.interlace_method = SPNG_INTERLACE_NONE
     if check_error(spng_set_ihdr(ctx, &ihdr),
                    "failed to set encode-to-buffer option"):
-        spng_ctx_free(ctx)
         return None
 
     cdef int clevel = 1
     if check_error(spng_set_option(ctx, SPNG_IMG_COMPRESSION_LEVEL, clevel),
                    "failed to set compression level"):
-        spng_ctx_free(ctx)
         return None
     if check_error(spng_set_option(ctx, SPNG_TEXT_WINDOW_BITS, 15),
                    "failed to set window bits"):
-        spng_ctx_free(ctx)
         return None
     if check_error(spng_set_option(ctx, SPNG_IMG_COMPRESSION_STRATEGY, Z_HUFFMAN_ONLY),
                    "failed to set compression strategy"):
-        spng_ctx_free(ctx)
         return None
     if check_error(spng_set_option(ctx, SPNG_IMG_MEM_LEVEL, MAX_MEM_LEVEL),
                    "failed to set mem level"):
-        spng_ctx_free(ctx)
         return None
     cdef int filter = SPNG_FILTER_CHOICE_NONE
     if speed<30:
         filter |= SPNG_FILTER_CHOICE_SUB
     if check_error(spng_set_option(ctx, SPNG_FILTER_CHOICE, filter),
                    "failed to set filter choice"):
-        spng_ctx_free(ctx)
         return None
 
-    if check_error(spng_set_option(ctx, SPNG_ENCODE_TO_BUFFER, 1),
-                   "failed to set encode-to-buffer option"):
-        spng_ctx_free(ctx)
+    #write directly to the arena instead of letting spng grow its own buffer:
+    if check_error(spng_set_png_stream(ctx, &write_png_stream, <void *> writer),
+                   "failed to set png stream"):
         return None
 
     cdef spng_format fmt = SPNG_FMT_PNG
@@ -194,27 +236,11 @@ def encode(coding, image, options=None):
             r = spng_encode_image(ctx, <const void*> data_ptr, data_len, fmt, flags)
     if check_error(r, "failed to encode image"):
         log.error(" %i bytes of %s pixel data", data_len, rgb_format)
-        log.error(" for %s", image)
-        spng_ctx_free(ctx)
         return None
-
-    cdef int error
-    cdef size_t png_len
-    cdef void *png_data = spng_get_png_buffer(ctx, &png_len, &error)
-    if check_error(error,
-                   "failed get png buffer"):
-        spng_ctx_free(ctx)
-        return None
-    if png_data==NULL:
-        log.error("Error: spng buffer is NULL")
-        spng_ctx_free(ctx)
+    if writer.size==0:
+        log.error("Error: spng did not produce any data")
         return None
-
-    cdef membuf = makebuf(png_data, png_len)
-    spng_ctx_free(ctx)
-    cdata = memoryview(membuf)
-    may_save_image("png", cdata)
-    return coding, Compressed(coding, cdata), {}, width, height, 0, len(rgb_format)*8
+    return arenas.wrap_writer(writer)
 
 
 def selftest(full=False):
@@ -19,6 +19,8 @@ cdef extern from "spng.h":
 
     int SPNG_DECODE_TRNS
 
+    int SPNG_IO_ERROR
+
     enum spng_format:
         SPNG_FMT_RGBA8
         SPNG_FMT_RGBA16
@@ -40,6 +42,8 @@ cdef extern from "spng.h":
     ctypedef struct spng_ctx:
         pass
 
+    ctypedef int spng_rw_fn(spng_ctx *ctx, void *user, void *dst_src, size_t length) noexcept nogil
+
     cdef struct spng_ihdr:
         uint32_t height
         uint32_t width
@@ -89,6 +93,7 @@ cdef extern from "spng.h":
     int spng_set_ihdr(spng_ctx *ctx, spng_ihdr *ihdr)
     int spng_encode_image(spng_ctx *ctx, const void *img, size_t len, int fmt, int flags) nogil
     void *spng_get_png_buffer(spng_ctx *ctx, size_t *len, int *error)
+    int spng_set_png_stream(spng_ctx *ctx, spng_rw_fn *rw_func, void *user)
 
     int spng_get_ihdr(spng_ctx *ctx, spng_ihdr *ihdr)
     int spng_set_png_buffer(spng_ctx *ctx, const void *buf, size_t size) nogil
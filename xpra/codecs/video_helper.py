@@ -7,6 +7,7 @@
 
 import sys
 import traceback
+from itertools import count
 from threading import Lock
 from typing import Any
 
@@ -137,6 +138,10 @@ def filt(prefix, name, inlist, all_fn, all_list):
 VdictEntry = dict[str,list[str]]
 Vdict = dict[str,VdictEntry]
 
+#each modification of the specs gets a new generation number,
+#so that cached scoring results can be invalidated:
+spec_generation = count(1)
+
 class VideoHelper:
     """
         This class is a bit like a registry of known encoders, csc modules and decoders.
@@ -145,10 +150,12 @@ class VideoHelper:
         We can also clone it to modify it (used by per client proxy encoders)
     """
 
-    def __init__(self, vencspecs=None, cscspecs=None, vdecspecs=None, init=False):
+    def __init__(self, vencspecs=None, cscspecs=None, vdecspecs=None, init=False, generation=0):
         self._video_encoder_specs : Vdict = vencspecs or {}
         self._csc_encoder_specs : Vdict = cscspecs or {}
         self._video_decoder_specs : Vdict = vdecspecs or {}
+        #clones share the generation of the specs they were copied from:
+        self.generation : int = generation or next(spec_generation)
         self.video_encoders = []
         self.csc_modules = []
         self.video_decoders = []
@@ -194,6 +201,7 @@ class VideoHelper:
             self.video_encoders = []
             self.csc_modules = []
             self.video_decoders = []
+            self.generation = next(spec_generation)
             self._initialized = False
 
     def clone(self):
@@ -211,7 +219,7 @@ class VideoHelper:
         ves = deepish_clone_dict(self._video_encoder_specs)
         ces = deepish_clone_dict(self._csc_encoder_specs)
         vds = deepish_clone_dict(self._video_decoder_specs)
-        return VideoHelper(ves, ces, vds, True)
+        return VideoHelper(ves, ces, vds, True, self.generation)
 
     def get_info(self) -> dict[str,Any]:
         d : dict[str,Any] = {}
@@ -326,6 +334,7 @@ class VideoHelper:
 
     def add_encoder_spec(self, encoding:str, colorspace:str, spec):
         self._video_encoder_specs.setdefault(encoding, {}).setdefault(colorspace, []).append(spec)
+        self.generation = next(spec_generation)
 
 
     def init_csc_options(self) -> None:
@@ -363,6 +372,7 @@ class VideoHelper:
 
     def add_csc_spec(self, in_csc:str, out_csc:str, spec) -> None:
         self._csc_encoder_specs.setdefault(in_csc, {}).setdefault(out_csc, []).append(spec)
+        self.generation = next(spec_generation)
 
 
     def init_video_decoders_options(self) -> None:
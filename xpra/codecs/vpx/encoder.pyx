@@ -519,6 +519,18 @@ cdef class Encoder:
     def is_closed(self):
         return self.context==NULL
 
+    def reset_stream(self) -> bool:
+        """
+            Prepares this context for starting a new stream,
+            so that it can be re-used by the video context pool.
+            The next frame will be a keyframe.
+        """
+        if self.context==NULL:
+            return False
+        self.frames = 0
+        self.last_frame_times = deque(maxlen=200)
+        return True
+
     def get_type(self):
         return  "vpx"
 
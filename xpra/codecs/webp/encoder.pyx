@@ -5,12 +5,13 @@
 
 import os
 from time import monotonic
+from threading import local
 from typing import Any, Dict
 
 from libc.stdint cimport uint8_t, uint32_t, uintptr_t   #pylint: disable=syntax-error
-from libc.stdlib cimport free   #pylint: disable=syntax-error
 from libc.string cimport memset #pylint: disable=syntax-error
-from xpra.buffers.membuf cimport buffer_context
+from xpra.buffers.membuf cimport buffer_context, MemBuf
+from xpra.buffers.arena cimport ArenaPool, arena_writer, arena_write
 
 from xpra.net.compression import Compressed
 from xpra.codecs.codec_debug import may_save_image
@@ -443,10 +444,12 @@ cdef class Encoder:
     cdef long frames
     cdef WebPConfig config
     cdef WebPPreset preset
+    cdef ArenaPool arenas
     cdef object __weakref__
 
     def __init__(self):
         self.width = self.height = self.quality = self.frames = 0
+        self.arenas = ArenaPool("webp")
 
     def init_context(self, encoding, width : int, height : int, src_format, options : typedict):
         assert encoding=="webp", "invalid encoding: %s" % encoding
@@ -506,6 +509,7 @@ cdef class Encoder:
             "alpha"         : bool(self.alpha),
             "pixel-format"  : self.src_format,
             "content-type"  : self.content_type or "",
+            "arenas"        : self.arenas.get_info(),
         }
         return info
 
@@ -560,7 +564,7 @@ cdef class Encoder:
                 to_yuv(&pic, WEBP_YUV420)
             client_options["subsampling"] = "YUV420P"
 
-        cdata = webp_encode(&self.config, &pic)
+        cdata = webp_encode(&self.config, &pic, self.arenas)
 
         if self.config.lossless:
             client_options["quality"] = 100
@@ -643,6 +647,58 @@ cdef validate_config(WebPConfig *config):
         raise RuntimeError("invalid webp configuration: %s" % info)
 
 
+cdef class WebPSession:
+    """
+        The configuration is only updated when the encoding parameters change,
+        and the compressed data is written to reusable buffers.
+        A session must only be used from one thread at a time.
+    """
+    cdef WebPConfig config
+    cdef object config_key
+    cdef ArenaPool arenas
+    cdef unsigned long frames
+    cdef object __weakref__
+
+    def __init__(self):
+        self.config_key = None
+        self.arenas = ArenaPool("webp")
+        self.frames = 0
+
+    def __repr__(self):
+        return "WebPSession(%i frames)" % self.frames
+
+    def get_info(self) -> Dict[str,Any]:
+        return {
+            "frames"    : int(self.frames),
+            "arenas"    : self.arenas.get_info(),
+            }
+
+    cdef WebPConfig *get_config(self, unsigned int width, unsigned int height,
+                                int quality, int speed, unsigned char alpha, content_type) except NULL:
+        cdef WebPPreset preset = get_preset(width, height, content_type)
+        key = (preset, quality, speed, alpha, content_type)
+        if key!=self.config_key:
+            self.config_key = None
+            config_init(&self.config)
+            configure_preset(&self.config, preset, quality)
+            configure_encoder(&self.config, quality, speed, alpha)
+            configure_image_hint(&self.config, content_type)
+            validate_config(&self.config)
+            self.config_key = key
+        return &self.config
+
+
+#each encoding thread gets its own session:
+thread_sessions = local()
+
+def get_session() -> WebPSession:
+    session = getattr(thread_sessions, "session", None)
+    if session is None:
+        session = WebPSession()
+        thread_sessions.session = session
+    return session
+
+
 def encode(coding, image, options=None):
     log("webp.encode(%s, %s, %s)", coding, image, options)
     assert coding=="webp"
@@ -664,15 +720,9 @@ def encode(coding, image, options=None):
     cdef int quality = options.get("quality", 50)
     cdef int speed = options.get("speed", 50)
 
-    cdef WebPConfig config
-    config_init(&config)
-
     content_type = options.get("content-type", None)
-    cdef WebPPreset preset = get_preset(width, height, content_type)
-    configure_preset(&config, preset, quality)
-    configure_encoder(&config, quality, speed, alpha)
-    configure_image_hint(&config, content_type)
-    validate_config(&config)
+    cdef WebPSession session = get_session()
+    cdef WebPConfig *config = session.get_config(width, height, quality, speed, alpha, content_type)
 
     pixels = image.get_pixels()
     cdef WebPPicture pic
@@ -694,7 +744,8 @@ def encode(coding, image, options=None):
             to_yuv(&pic, WEBP_YUV420)
         client_options["subsampling"] = "YUV420P"
 
-    cdata = webp_encode(&config, &pic)
+    cdata = webp_encode(config, &pic, session.arenas)
+    session.frames += 1
 
     if config.lossless:
         client_options["quality"] = 100
@@ -704,7 +755,7 @@ def encode(coding, image, options=None):
         client_options["has_alpha"] = True
     log("webp.compress ratio=%i%%, client-options=%s", 100*len(cdata)//(width*height*Bpp), client_options)
     if LOG_CONFIG>0:
-        log("webp.compress used config: %s", get_config_info(&config))
+        log("webp.compress used config: %s", get_config_info(config))
     may_save_image("webp", cdata)
     return "webp", Compressed("webp", cdata), client_options, width, height, 0, len(pixel_format.replace("A", ""))*8
 
@@ -777,28 +828,35 @@ cdef to_yuv(WebPPicture *pic, WebPEncCSP csp=WEBP_YUV420):
     log("webp subsampling ARGB to %s took %.1fms", CSP_NAMES.get(csp, csp), 1000*(end-start))
 
 
-cdef webp_encode(WebPConfig *config, WebPPicture *pic):
+cdef int webp_arena_write(const uint8_t* data, size_t data_size, const WebPPicture* picture) noexcept nogil:
+    #webp writers return 1 on success:
+    return arena_write(<arena_writer *> picture.custom_ptr, data, data_size)==0
+
+cdef webp_encode(WebPConfig *config, WebPPicture *pic, ArenaPool arenas):
     cdef double start = monotonic()
-    cdef WebPMemoryWriter memory_writer
-    memset(&memory_writer, 0, sizeof(WebPMemoryWriter))
+    #there is no worst case bound for webp, start with a buffer which is usually large enough:
+    cdef size_t size = pic.width*pic.height*4
+    if not config.lossless:
+        size //= 4
+    cdef arena_writer writer
+    arenas.init_writer(&writer, size+4096)
+    cdef MemBuf membuf = None
     try:
-        #TODO: custom writer that over-allocates memory
-        WebPMemoryWriterInit(&memory_writer)
-        pic.writer = <WebPWriterFunction> WebPMemoryWrite
-        pic.custom_ptr = <void*> &memory_writer
+        pic.writer = <WebPWriterFunction> webp_arena_write
+        pic.custom_ptr = <void*> &writer
         with nogil:
             ret = WebPEncode(config, pic)
         if not ret:
             raise RuntimeError("WebPEncode failed: %s, config=%s" % (
                 ERROR_TO_NAME.get(pic.error_code, pic.error_code), get_config_info(config)))
-        cdata = memory_writer.mem[:memory_writer.size]
+        membuf = arenas.wrap_writer(&writer)
     finally:
-        if memory_writer.mem:
-            free(memory_writer.mem)
+        if membuf is None:
+            arenas.release(writer.buf)
         WebPPictureFree(pic)
     cdef double end = monotonic()
     log("webp encode took %.1fms", 1000*(end-start))
-    return cdata
+    return memoryview(membuf)
 
 
 def selftest(full=False):
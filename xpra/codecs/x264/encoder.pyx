@@ -475,6 +475,7 @@ cdef class Encoder:
     cdef int quality
     cdef int speed
     cdef int b_frames
+    cdef int threads
     cdef int max_delayed
     cdef int delayed_frames
     cdef int export_nals
@@ -487,6 +488,8 @@ cdef class Encoder:
     cdef object blank_buffer
     cdef uint64_t first_frame_timestamp
     cdef uint8_t ready
+    cdef uint8_t force_idr
+    cdef uint8_t flushed
 
     cdef object __weakref__
 
@@ -510,6 +513,8 @@ cdef class Encoder:
         #self.opencl = USE_OPENCL and width>=32 and height>=32
         self.content_type = options.strget("content-type", "unknown")      #ie: "video"
         self.b_frames = options.intget("b-frames", 0)
+        #the server may allocate fewer threads to this encoder, zero if it did not:
+        self.threads = max(0, options.intget("threads", 0))
         self.fast_decode = options.boolget("h264.fast-decode", False)
         self.max_delayed = options.intget("max-delayed", MAX_DELAYED_FRAMES) * int(not self.fast_decode) * int(self.b_frames)
         self.preset = get_x264_preset(self.speed)
@@ -521,6 +526,8 @@ cdef class Encoder:
         self.last_frame_times = deque(maxlen=200)
         self.time = 0
         self.first_frame_timestamp = 0
+        self.force_idr = 0
+        self.flushed = 0
         self.bandwidth_limit = options.intget("bandwidth-limit", 0)
         default_profile = os.environ.get("XPRA_X264_PROFILE")
         self.profile = get_profile(options, csc_mode=self.src_format, default_profile=default_profile)
@@ -549,6 +556,24 @@ cdef class Encoder:
     def is_ready(self) -> bool:
         return bool(self.ready)
 
+    def reset_stream(self) -> bool:
+        """
+            Prepares this context for starting a new stream,
+            so that it can be re-used by the video context pool.
+            The next frame will be an IDR frame.
+        """
+        if self.context==NULL or self.flushed:
+            #x264 cannot continue after a flush
+            return False
+        if x264_encoder_delayed_frames(self.context)>0:
+            return False
+        self.frames = 0
+        self.frame_types = {}
+        self.last_frame_times = deque(maxlen=200)
+        self.first_frame_timestamp = 0
+        self.force_idr = 1
+        return True
+
     def get_tune(self) -> bytes:
         log("x264: get_tune() TUNE=%s, fast_decode=%s, content_type=%s", TUNE, self.fast_decode, self.content_type)
         if TUNE:
@@ -583,12 +608,17 @@ cdef class Encoder:
 
     cdef tune_param(self, x264_param_t *param, options:typedict):
         param.i_lookahead_threads = 0
+        #keep using the allocation we were created with, even when re-configuring:
+        cdef int threads = self.threads or max(1, THREADS)
         if MIN_SLICED_THREADS_SPEED>0 and self.speed>=MIN_SLICED_THREADS_SPEED and not self.fast_decode:
             param.b_sliced_threads = 1
-            param.i_threads = THREADS
+            param.i_threads = threads
         else:
             #cap i_threads since i_thread_frames will be set to i_threads
-            param.i_threads = min(self.max_delayed, THREADS)
+            param.i_threads = min(self.max_delayed, threads)
+            if param.i_threads==0 and self.threads>0:
+                #don't let x264 pick its own number of threads, stay within our allocation:
+                param.i_threads = threads
         #we never lose frames or use seeking, so no need for regular I-frames:
         param.i_keyint_max = X264_KEYINT_MAX_INFINITE
         #we don't want IDR frames either:
@@ -845,6 +875,10 @@ cdef class Encoder:
         istrides = image.get_rowstride()
 
         x264_picture_init(&pic_in)
+        if self.force_idr:
+            #this context is being re-used for a new stream:
+            pic_in.i_type = X264_TYPE_IDR
+            self.force_idr = 0
         cdef Py_buffer py_buf[3]
         for i in range(3):
             pic_in.img.plane[i] = NULL
@@ -960,6 +994,7 @@ cdef class Encoder:
             return None, {}
         self.delayed_frames = x264_encoder_delayed_frames(self.context)
         log("x264 flush(%i) %i delayed frames", frame_no, self.delayed_frames)
+        self.flushed = 1
         if self.delayed_frames<=0:
             return None, {}
         cdef x264_picture_t pic_out
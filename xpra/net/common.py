@@ -76,6 +76,18 @@ URL_MODES : dict[str,str] = {
     }
 
 
+#these packets depend on the lifecycle of the window given as first argument,
+#so transports that send each window's pixels on a separate stream
+#must send these packets on the same stream to keep them in order:
+WINDOW_STREAM_PACKET_TYPES : tuple[str, ...] = (
+    "draw", "eos",
+    "new-window", "new-override-redirect", "new-tray",
+    "window-metadata", "window-icon",
+    "raise-window", "restack-window", "initiate-moveresize",
+    "window-move-resize", "window-resized", "configure-override-redirect",
+    "lost-window",
+    )
+
 #this is used for generating aliases:
 PACKET_TYPES : list[str] = [
     #generic:
@@ -94,6 +106,7 @@ PACKET_TYPES : list[str] = [
     "open-url", "send-file", "send-data-request", "send-data-response", "ack-file-chunk", "send-file-chunk",
     #audio:
     "sound-data", "new-stream", "state-changed", "new-buffer", "cleanup", "add_data", "stop",
+    "shm", "new-shm-buffer", "add_shm_data",
     #display:
     "show-desktop",
     #windows and trays:
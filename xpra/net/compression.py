@@ -25,6 +25,9 @@ Compression = namedtuple("Compression", ["name", "version", "compress", "decompr
 
 COMPRESSION : dict[str,Compression] = {}
 
+#keep the lz4 compression history across packets when the peer supports it:
+STREAM_COMPRESSION : bool = envbool("XPRA_STREAM_COMPRESSION", True)
+
 
 def init_lz4() -> Compression:
     #pylint: disable=import-outside-toplevel
@@ -97,6 +100,28 @@ def use(compressor) -> bool:
     return compressor in COMPRESSION
 
 
+def has_stream_compression() -> bool:
+    if not STREAM_COMPRESSION or "lz4" not in COMPRESSION:
+        return False
+    try:
+        from xpra.net.lz4 import lz4  # @UnresolvedImport pylint: disable=import-outside-toplevel
+    except ImportError:
+        return False
+    return hasattr(lz4, "stream_compressor")
+
+def get_stream_compressor():
+    from xpra.net.lz4.lz4 import stream_compressor  # @UnresolvedImport pylint: disable=import-outside-toplevel
+    return stream_compressor()
+
+def get_stream_decompressor():
+    from xpra.net.lz4.lz4 import stream_decompressor  # @UnresolvedImport pylint: disable=import-outside-toplevel
+    return stream_decompressor()
+
+def get_stream_max_size() -> int:
+    from xpra.net.lz4.lz4 import STREAM_MAX_SIZE  # @UnresolvedImport pylint: disable=import-outside-toplevel
+    return STREAM_MAX_SIZE
+
+
 def get_compression_caps(full_info : int=1) -> dict[str,Any]:
     caps : dict[str,Any] = {}
     for x in TRY_COMPRESSORS:
@@ -107,6 +132,8 @@ def get_compression_caps(full_info : int=1) -> dict[str,Any]:
         if full_info>1 and c.version:
             ccaps["version"] = c.version
         ccaps[""] = True
+        if x=="lz4" and has_stream_compression():
+            ccaps["stream"] = True
     return caps
 
 def get_enabled_compressors(order=TRY_COMPRESSORS) -> tuple[str,...]:
@@ -8,6 +8,8 @@
 
 import struct
 from libc.stdint cimport uintptr_t
+from libc.stdlib cimport malloc, free
+from libc.string cimport memcpy
 from xpra.buffers.membuf cimport MemBuf, getbuf
 
 from xpra.log import Logger
@@ -34,6 +36,23 @@ cdef extern from "lz4_compat.h":
 
     int LZ4_decompress_safe(const char* src, char* dst, int compressedSize, int dstCapacity) nogil
 
+    ctypedef struct LZ4_streamDecode_t:
+        pass
+    int LZ4_setStreamDecode(LZ4_streamDecode_t* LZ4_streamDecode, const char* dictionary, int dictSize)
+    int LZ4_decompress_safe_continue(LZ4_streamDecode_t* LZ4_streamDecode,
+                                     const char* src, char* dst,
+                                     int srcSize, int dstCapacity) nogil
+
+
+#the streaming compressor and decompressor use identical ring buffers,
+#and wrap around at the same block boundaries ("synchronized mode"),
+#so the data previously sent is always available as history:
+DEF STREAM_HISTORY = 64*1024
+#blocks larger than this cannot be streamed:
+DEF STREAM_MAX_BLOCK = 64*1024
+DEF STREAM_RING_SIZE = STREAM_HISTORY+2*STREAM_MAX_BLOCK
+STREAM_MAX_SIZE = STREAM_MAX_BLOCK
+
 
 def get_version():
     cdef int v = LZ4_versionNumber()
@@ -105,3 +124,96 @@ def decompress(data, int max_size=0, int size=0):
         log("LZ4_decompress_safe failed for input size %i", in_buf.len)
         return None
     return memoryview(out_buf)[:r]
+
+
+cdef class stream_compressor:
+    """
+        Compresses each block using the blocks compressed before it as history,
+        the blocks must be decompressed in the same order using a `stream_decompressor`.
+    """
+    cdef LZ4_stream_t state
+    cdef char *ring
+    cdef int offset
+
+    def __init__(self):
+        LZ4_resetStream_fast(&self.state)
+        self.ring = <char *> malloc(STREAM_RING_SIZE)
+        if self.ring==NULL:
+            raise MemoryError("failed to allocate the lz4 stream buffer")
+        self.offset = 0
+
+    def __dealloc__(self):
+        if self.ring!=NULL:
+            free(self.ring)
+            self.ring = NULL
+
+    def compress(self, data, int acceleration=1):
+        cdef Py_buffer in_buf
+        if PyObject_GetBuffer(data, &in_buf, PyBUF_ANY_CONTIGUOUS):
+            raise ValueError("failed to read data from %s" % type(data))
+        cdef int size = in_buf.len
+        if size>STREAM_MAX_BLOCK:
+            PyBuffer_Release(&in_buf)
+            raise ValueError("block is too large for stream compression: %i bytes" % size)
+        cdef int max_size = LZ4_compressBound(size)
+        cdef MemBuf out_buf = getbuf(4+max_size, False)
+        mem = memoryview(out_buf)
+        struct.pack_into(b"@I", mem, 0, size)
+        cdef char *block = self.ring+self.offset
+        cdef char *out_ptr = <char *> ((<uintptr_t> out_buf.get_mem())+4)
+        cdef int r
+        with nogil:
+            memcpy(block, in_buf.buf, size)
+            r = LZ4_compress_fast_continue(&self.state, block, out_ptr, size, max_size, acceleration)
+        PyBuffer_Release(&in_buf)
+        if r<=0:
+            raise RuntimeError("LZ4_compress_fast_continue failed for input size %i" % size)
+        self.offset += size
+        if self.offset>STREAM_RING_SIZE-STREAM_MAX_BLOCK:
+            self.offset = 0
+        return mem[:(4+r)]
+
+
+cdef class stream_decompressor:
+    """
+        Decompresses the blocks produced by a `stream_compressor`,
+        in the order they were compressed.
+    """
+    cdef LZ4_streamDecode_t state
+    cdef char *ring
+    cdef int offset
+
+    def __init__(self):
+        LZ4_setStreamDecode(&self.state, NULL, 0)
+        self.ring = <char *> malloc(STREAM_RING_SIZE)
+        if self.ring==NULL:
+            raise MemoryError("failed to allocate the lz4 stream buffer")
+        self.offset = 0
+
+    def __dealloc__(self):
+        if self.ring!=NULL:
+            free(self.ring)
+            self.ring = NULL
+
+    def decompress(self, data):
+        cdef int size = struct.unpack_from(b"@I", data[:4])[0]
+        if size<0 or size>STREAM_MAX_BLOCK:
+            raise ValueError("invalid stream block size %i" % size)
+        cdef Py_buffer in_buf
+        if PyObject_GetBuffer(data, &in_buf, PyBUF_ANY_CONTIGUOUS):
+            raise ValueError("failed to read data from %s" % type(data))
+        cdef char *in_ptr = <char*> ((<uintptr_t> in_buf.buf) + 4)
+        cdef int l = <int> in_buf.len
+        cdef char *block = self.ring+self.offset
+        cdef int r
+        with nogil:
+            r = LZ4_decompress_safe_continue(&self.state, in_ptr, block, l-4, size)
+        PyBuffer_Release(&in_buf)
+        if r!=size:
+            raise ValueError("LZ4_decompress_safe_continue failed for input size %i" % l)
+        #the ring buffer will be re-used, so we have to copy the block out:
+        v = block[:r]
+        self.offset += r
+        if self.offset>STREAM_RING_SIZE-STREAM_MAX_BLOCK:
+            self.offset = 0
+        return v
@@ -5,10 +5,11 @@
 
 import os
 import sys
+from threading import Lock
 from ctypes import c_ubyte, c_char, c_uint32
 from typing import Any
 
-from xpra.util import roundup, envbool
+from xpra.util import roundup, envint, envbool
 from xpra.os_util import memoryview_to_bytes, shellsub, get_group_id, WIN32, POSIX
 from xpra.scripts.config import FALSE_OPTIONS, TRUE_OPTIONS
 from xpra.simple_stats import std_unit
@@ -22,6 +23,13 @@ MADVISE_FLAGS = os.environ.get("XPRA_MMAP_MADVISE_FLAGS", "SEQUENTIAL,DONTFORK,U
 
 DEFAULT_TOKEN_BYTES : int = 128
 
+#use fixed size slots that can be released in any order:
+MMAP_SLOTS : bool = envbool("XPRA_MMAP_SLOTS", True)
+MMAP_SLOT_SIZE : int = max(4096, envint("XPRA_MMAP_SLOT_SIZE", 64*1024))
+#the first 8 bytes are used by the legacy ring header,
+#the slot ownership flags follow:
+SLOT_FLAGS_OFFSET : int = 8
+
 
 """
 Utility functions for communicating via mmap
@@ -361,3 +369,142 @@ def mmap_write(mmap_area, mmap_size:int, data):
             mmap_data_end.value = 8+l2
     log("sending damage with mmap: %s bytes", len(data))
     return chunks, mmap_free_size
+
+
+def get_slot_layout(mmap_size:int, slot_size:int=MMAP_SLOT_SIZE) -> tuple[int,int]:
+    """
+        Returns the offset of the first slot and the number of slots
+        for an mmap area of the given size.
+        The flags table uses one byte per slot and the data starts
+        at the first slot boundary after it.
+    """
+    #each slot costs slot_size bytes of data plus its flag byte:
+    nslots = max(0, (mmap_size-SLOT_FLAGS_OFFSET)//(slot_size+1))
+    while nslots>0:
+        data_offset = roundup(SLOT_FLAGS_OFFSET+nslots, slot_size)
+        if data_offset+nslots*slot_size<=mmap_size:
+            return data_offset, nslots
+        nslots -= 1
+    return 0, 0
+
+
+class MmapSlots:
+    """
+        Divides the mmap area into fixed size slots,
+        each slot has a flag byte in the table at the start of the area:
+        the server sets it when the slot is reserved
+        and the client clears it once it is done with the data.
+        Slots can therefore be released in any order,
+        and multiple threads can write their data concurrently:
+        only the reservation of the slots is serialized.
+    """
+
+    def __init__(self, mmap_area, mmap_size:int, slot_size:int=MMAP_SLOT_SIZE):
+        self.mmap_area = mmap_area
+        self.mmap_size = mmap_size
+        self.slot_size = slot_size
+        self.data_offset, self.nslots = get_slot_layout(mmap_size, slot_size)
+        if not self.nslots:
+            raise ValueError(f"mmap area of {mmap_size} bytes is too small for {slot_size} byte slots")
+        self.view = memoryview(mmap_area)
+        self.flags = self.view[SLOT_FLAGS_OFFSET:SLOT_FLAGS_OFFSET+self.nslots]
+        self.lock = Lock()
+        self.hint = 0
+        self.full = 0
+
+    def __repr__(self):
+        return f"MmapSlots({self.nslots}x{self.slot_size})"
+
+    def get_info(self) -> dict[str,Any]:
+        return {
+            "slot-size" : self.slot_size,
+            "slots"     : self.nslots,
+            "free"      : self.get_free_size(),
+            "full"      : self.full,
+            }
+
+    def clear(self) -> None:
+        self.flags[:] = bytes(self.nslots)
+
+    def get_free_size(self) -> int:
+        return bytes(self.flags).count(0)*self.slot_size
+
+    def reserve(self, size:int) -> int:
+        """
+            Marks enough contiguous slots as used to hold 'size' bytes,
+            returns the index of the first slot or -1 if there is no room.
+        """
+        count = (size+self.slot_size-1)//self.slot_size
+        if count<=0 or count>self.nslots:
+            return -1
+        free = bytes(count)
+        with self.lock:
+            flags = bytes(self.flags)
+            #next-fit: start searching after the last reservation,
+            #so the client has time to release the slots behind it
+            index = flags.find(free, self.hint)
+            if index<0:
+                index = flags.find(free, 0, self.hint+count-1)
+            if index<0:
+                self.full += 1
+                return -1
+            self.flags[index:index+count] = b"\1"*count
+            self.hint = index+count
+        return index
+
+    def write(self, data) -> tuple[list[tuple[int,int]] | None,int]:
+        """
+            Copies 'data' directly into free slots of the mmap area,
+            returns the chunk used (or None if it failed)
+            and the mmap area's free memory.
+        """
+        mv = memoryview(data)
+        if mv.ndim!=1 or mv.format!="B":
+            mv = mv.cast("B")
+        l = len(mv)
+        index = self.reserve(l)
+        if index<0:
+            free_size = self.get_free_size()
+            log.warn("Warning: mmap area is full!")
+            log.warn(" we need to store %s bytes but only have %s free space left", l, free_size)
+            return None, free_size-l
+        offset = self.data_offset+index*self.slot_size
+        self.view[offset:offset+l] = mv
+        log("mmap: wrote %i bytes to slot %i", l, index)
+        return [(offset, l)], self.get_free_size()
+
+    def close(self) -> None:
+        flags = self.flags
+        if flags:
+            self.flags = None
+            flags.release()
+        view = self.view
+        if view:
+            self.view = None
+            view.release()
+
+
+def mmap_slots_write(mmap_slots : MmapSlots, _mmap_size:int, data):
+    """
+        Same signature as 'mmap_write', for callers that switch between the two.
+    """
+    return mmap_slots.write(data)
+
+
+def mmap_free_slots(mmap_area, slot_size:int, *descr_data) -> None:
+    """
+        Called by the client once it no longer needs the data
+        written by 'MmapSlots.write', so the server can re-use the slots.
+    """
+    data_offset, nslots = get_slot_layout(len(mmap_area), slot_size)
+    if not nslots:
+        return
+    with memoryview(mmap_area) as view:
+        for offset, length in descr_data:
+            first = (offset-data_offset)//slot_size
+            count = (length+slot_size-1)//slot_size
+            if first<0 or first+count>nslots:
+                log.warn("Warning: invalid mmap slot chunk %s", (offset, length))
+                continue
+            start = SLOT_FLAGS_OFFSET+first
+            view[start:start+count] = bytes(count)
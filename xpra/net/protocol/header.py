@@ -25,6 +25,9 @@ ZLIB_FLAG       = 0x0       #assume zlib if no other compression flag is set
 LZ4_FLAG        = 0x10
 #LZO_FLAG        = 0x20
 BROTLI_FLAG     = 0x40
+#the data is compressed using the history of the previous packets with the same flag,
+#(only valid when combined with LZ4_FLAG)
+STREAM_FLAG     = 0x80
 FLAGS_NOHEADER  = 0x10000   #never encoded, so we can use a value bigger than a byte
 
 
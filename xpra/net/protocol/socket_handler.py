@@ -23,11 +23,12 @@ from xpra.net.bytestreams import SOCKET_TIMEOUT, set_socket_timeout
 from xpra.net.protocol.header import (
     unpack_header, pack_header, find_xpra_header,
     FLAGS_CIPHER, FLAGS_NOHEADER, FLAGS_FLUSH, HEADER_SIZE,
+    LZ4_FLAG, STREAM_FLAG,
     )
 from xpra.net.protocol.constants import CONNECTION_LOST, INVALID, GIBBERISH
 from xpra.net.common import (
     ConnectionClosedException, may_log_packet,
-    MAX_PACKET_SIZE, FLUSH_HEADER,
+    MAX_PACKET_SIZE, FLUSH_HEADER, WINDOW_STREAM_PACKET_TYPES,
     PacketType, NetPacketType,
     )
 from xpra.net.bytestreams import ABORT
@@ -59,6 +60,8 @@ LOG_RAW_PACKET_SIZE = envbool("XPRA_LOG_RAW_PACKET_SIZE", False)
 INLINE_SIZE = envint("XPRA_INLINE_SIZE", 32768)
 FAKE_JITTER = envint("XPRA_FAKE_JITTER", 0)
 MIN_COMPRESS_SIZE = envint("XPRA_MIN_COMPRESS_SIZE", 378)
+#with stream compression, even small packets compress well:
+STREAM_MIN_COMPRESS_SIZE = envint("XPRA_STREAM_MIN_COMPRESS_SIZE", 32)
 SEND_INVALID_PACKET = envint("XPRA_SEND_INVALID_PACKET", 0)
 SEND_INVALID_PACKET_DATA = strtobytes(os.environ.get("XPRA_SEND_INVALID_PACKET_DATA", b"ZZinvalid-packetZZ"))
 
@@ -140,6 +143,11 @@ class SocketProtocol:
         self.compressor = "none"
         self._compress = compression.get_compressor("none")
         self.compression_level = 0
+        #lz4 stream compression, enabled if the peer supports it:
+        self.stream_compression = False
+        self.stream_max_size = 0
+        self._stream_compressor = None
+        self._stream_decompressor = None
         self.authenticators = ()
         self.encryption = ""
         self.keyfile = ""
@@ -227,6 +235,10 @@ class SocketProtocol:
                                                                     iv, password,
                                                                     key_salt, key_hash, key_size, iterations)
         self.cipher_out_padding = padding
+        disable_substreams = getattr(self._conn, "disable_substreams", None)
+        if self.cipher_out and disable_substreams:
+            #the cipher requires the packets to arrive in the order they were encrypted:
+            disable_substreams()
         if self.cipher_out_name!=ciphername:
             cryptolog.info("sending data using %s encryption", ciphername)
             self.cipher_out_name = ciphername
@@ -247,6 +259,12 @@ class SocketProtocol:
         for k,v in caps.dictget("aliases", {}).items():
             self.send_aliases[bytestostr(k)] = v
         self.send_flush_flag = FLUSH_HEADER and caps.boolget("flush", False)
+        #stream compression requires the packets to arrive in the order they were compressed,
+        #which is not guaranteed with quic substreams and datagrams:
+        if caps.boolget("lz4.stream") and compression.has_stream_compression() and \
+            getattr(self._conn, "socktype_wrapped", "")!="quic":
+            self.stream_max_size = compression.get_stream_max_size()
+            self.stream_compression = True
         set_socket_timeout(self._conn, SOCKET_TIMEOUT)
 
 
@@ -261,6 +279,7 @@ class SocketProtocol:
             "max_packet_size"       : self.max_packet_size,
             "aliases"               : USE_ALIASES,
             "flush"                 : self.send_flush_flag,
+            "stream-compression"    : self.stream_compression,
             "has_more"              : shm and shm.is_set(),
             "receive-pending"       : self.receive_pending,
             }
@@ -374,6 +393,11 @@ class SocketProtocol:
             return
         #log("add_packet_to_queue(%s ... %s, %s, %s)", packet[0], synchronous, has_more, wait_for_more)
         packet_type : str | int = packet[0]
+        write_type = packet_type
+        if packet_type in WINDOW_STREAM_PACKET_TYPES and getattr(self._conn, "socktype_wrapped", "")=="quic":
+            #quic connections can send the pixels of each window on a separate stream,
+            #along with the packets that must stay in order with them:
+            write_type = f"draw-{packet[1]}"
         chunks : NetPacketType = self.encode(packet)
         with self._write_lock:
             if self._closed:
@@ -381,7 +405,7 @@ class SocketProtocol:
             try:
                 self._add_chunks_to_queue(packet_type, chunks,
                                           start_cb, end_cb, fail_cb,
-                                          synchronous, has_more or wait_for_more)
+                                          synchronous, has_more or wait_for_more, write_type)
             except:
                 log.error("Error: failed to queue '%s' packet", packet[0])
                 log("add_chunks_to_queue%s", (chunks, start_cb, end_cb, fail_cb), exc_info=True)
@@ -389,10 +413,16 @@ class SocketProtocol:
 
     def _add_chunks_to_queue(self, packet_type:str, chunks,
                              start_cb:Callable|None=None, end_cb:Callable|None=None, fail_cb:Callable|None=None,
-                             synchronous=True, more=False) -> None:
-        """ the write_lock must be held when calling this function """
+                             synchronous=True, more=False, write_type:str="") -> None:
+        """
+            the write_lock must be held when calling this function,
+            the `write_type` is passed to the connection instead of the packet type
+        """
         items = []
         for proto_flags,index,level,data in chunks:
+            if level==STREAM_FLAG:
+                #stream compression must be done in the order the packets are sent:
+                level, data = self.stream_compress(data)
             payload_size = len(data)
             if not payload_size:
                 raise RuntimeError(f"missing data in chunk {index}")
@@ -446,7 +476,7 @@ class SocketProtocol:
                 items[0] = frame_header + item0
             else:
                 items.insert(0, frame_header)
-        self.raw_write(items, packet_type, start_cb, end_cb, fail_cb, synchronous, more)
+        self.raw_write(items, write_type or packet_type, start_cb, end_cb, fail_cb, synchronous, more)
 
     @staticmethod
     def make_xpra_header(_packet_type, proto_flags, level, index, payload_size) -> ByteString:
@@ -638,7 +668,11 @@ class SocketProtocol:
             log.warn(" sizes: %s", csv(len(strtobytes(x)) for x in packet[1:]))
             log.warn(f" packet: {repr_ellipsized(packet, limit=4096)}")
         #compress, but don't bother for small packets:
-        if level>0 and l>min_comp_size:
+        if level>0 and self.stream_compression and self.compressor=="lz4" and \
+            STREAM_MIN_COMPRESS_SIZE<l<=self.stream_max_size:
+            #this marker tells _add_chunks_to_queue to compress it:
+            packets.append((proto_flags, 0, STREAM_FLAG, main_packet))
+        elif level>0 and l>min_comp_size:
             try:
                 cl, cdata = self._compress(main_packet, level)
                 if LOG_RAW_PACKET_SIZE and packet_type!="logging":
@@ -655,6 +689,22 @@ class SocketProtocol:
             log.info(f"sending  {packet_type:<32}: %i bytes", HEADER_SIZE + payload_size)
         return packets
 
+    def stream_compress(self, data) -> tuple[int, ByteString]:
+        """ the write_lock must be held when calling this function """
+        sc = self._stream_compressor
+        if sc is None:
+            sc = self._stream_compressor = compression.get_stream_compressor()
+        level = max(1, min(15, self.compression_level))
+        return level | LZ4_FLAG | STREAM_FLAG, sc.compress(data, acceleration=max(0, 5-level//3))
+
+    def stream_decompress(self, data) -> ByteString:
+        sd = self._stream_decompressor
+        if sd is None:
+            if not compression.has_stream_compression():
+                raise InvalidCompressionException("stream compression is not available")
+            sd = self._stream_decompressor = compression.get_stream_decompressor()
+        return sd.decompress(data)
+
     def set_compression_level(self, level : int) -> None:
         #this may be used next time encode() is called
         if level<0 or level>10:
@@ -1029,7 +1079,10 @@ class SocketProtocol:
                 #uncompress if needed:
                 if compression_level>0:
                     try:
-                        data = decompress(data, compression_level)
+                        if compression_level & STREAM_FLAG:
+                            data = self.stream_decompress(data)
+                        else:
+                            data = decompress(data, compression_level)
                     except InvalidCompressionException as e:
                         self.invalid(f"invalid compression: {e}", data)
                         return
@@ -57,6 +57,7 @@ class ClientWebSocketConnection(XpraQuicConnection):
                  host : str, port : int, info=None, options=None) -> None:
         super().__init__(connection, stream_id, transmit, host, port, info, options)
         self.write_buffer = SimpleQueue()
+        self.request_headers : dict = {}
 
     def flush_writes(self):
         #flush the buffered writes:
@@ -93,6 +94,24 @@ class ClientWebSocketConnection(XpraQuicConnection):
             return
         super().http_event_received(event)
 
+    def allocate_new_stream_id(self, stream_type:str) -> int:
+        """
+            Opens a new request stream,
+            the server uses the 'substream' header to associate it with this connection.
+        """
+        stream_id = self.connection._quic.get_next_available_stream_id()
+        headers = dict(self.request_headers)
+        headers |= {
+            "substream"     : self.stream_id,
+            "stream-type"   : stream_type,
+            }
+        log(f"new stream {stream_id} for {stream_type!r}")
+        def send_substream_headers():
+            self.send_headers(stream_id=stream_id, headers=headers)
+        #the headers must be sent before the data:
+        get_threaded_loop().call(send_substream_headers)
+        return stream_id
+
 
 class WebSocketClient(QuicConnectionProtocol):
     def __init__(self, *args, **kwargs) -> None:
@@ -116,6 +135,7 @@ class WebSocketClient(QuicConnectionProtocol):
             ":path" : path,
             }
         headers.update(WS_HEADERS)
+        websocket.request_headers = headers
         log("open: sending http headers for websocket upgrade")
         self._http.send_headers(stream_id=stream_id, headers=binary_headers(headers))
         self.transmit()
@@ -3,17 +3,39 @@
 # Xpra is released under the terms of the GNU GPL v2, or, at your option, any
 # later version. See the file COPYING for details.
 
+import os
 from time import time
 from email.utils import formatdate
 
-from xpra.util import envint
+from xpra.util import envint, envbool
 from xpra.os_util import strtobytes
+from xpra.net.websockets.header import decode_hybi_header
 
 SERVER_NAME = "xpra/aioquic"
 USER_AGENT = "xpra/aioquic"
 
 MAX_DATAGRAM_FRAME_SIZE = envint("XPRA_MAX_DATAGRAM_FRAME_SIZE", 65536)
 
+#send each class of packets on its own ordered stream,
+#so that a lost datagram only delays the packets of the same class:
+SUBSTREAMS = envbool("XPRA_QUIC_SUBSTREAMS", False)
+SUBSTREAM_TYPES = tuple(x.strip() for x in os.environ.get("XPRA_QUIC_SUBSTREAM_PACKET_TYPES",
+                                                          "draw,sound,webcam,input,cursor").split(",") if x.strip())
+#windows share this number of draw streams:
+DRAW_STREAMS = envint("XPRA_QUIC_DRAW_STREAMS", 4)
+STREAM_PACKET_TYPES : dict[str,tuple[str,...]] = {
+    "sound"     : ("sound-data", ),
+    "webcam"    : ("webcam-frame", ),
+    "input"     : (
+        #keystrokes must be delivered to the window that has the focus:
+        "focus",
+        "key-action", "key-repeat",
+        "button-action", "pointer-button",
+        "pointer", "pointer-position",
+        ),
+    "cursor"    : ("cursor", ),
+    }
+
 def http_date():
     """ GMT date in a format suitable for http headers """
     return formatdate(time(), usegmt=True)
@@ -35,3 +57,73 @@ def override_aioquic_logger():
     else:
         aioquic_logger.setLevel(logging.WARN)
     logger.addHandler(aioquic_logger)               # type: ignore
+
+
+def get_packet_stream_type(packet_type:str) -> str:
+    """
+        Returns the name of the stream to use for this type of packet,
+        or an empty string for the main stream.
+        Draw packets are labelled with their window id, ie: "draw-1",
+        so that each window's pixels can be sent independently,
+        the other packets in `xpra.net.common.WINDOW_STREAM_PACKET_TYPES` are labelled the same way.
+    """
+    if not packet_type:
+        return ""
+    if packet_type.startswith("draw"):
+        if "draw" not in SUBSTREAM_TYPES:
+            return ""
+        try:
+            wid = int(packet_type.split("-", 1)[1])
+        except (IndexError, ValueError):
+            wid = 0
+        return f"draw-{wid % max(1, DRAW_STREAMS)}"
+    for stream_type, packet_types in STREAM_PACKET_TYPES.items():
+        if packet_type in packet_types:
+            return stream_type if stream_type in SUBSTREAM_TYPES else ""
+    return ""
+
+
+def get_frame_size(buf) -> int:
+    """ returns the size of the websocket frame at the start of this buffer, or 0 if incomplete """
+    header = decode_hybi_header(buf)
+    if header is None:
+        return 0
+    hlen, payload_len = header[4:6]
+    return hlen+payload_len
+
+
+class StreamFrames:
+    """
+        The data received on each stream is an ordered sequence of websocket frames,
+        but the frames from different streams can arrive interleaved:
+        only complete frames are passed on to the websocket protocol layer.
+    """
+    __slots__ = ("buffers", )
+
+    def __init__(self):
+        self.buffers : dict[int,bytearray] = {}
+
+    def __repr__(self):
+        return f"StreamFrames({len(self.buffers)} streams)"
+
+    def get_info(self) -> dict[int,int]:
+        return dict((stream_id, len(buf)) for stream_id, buf in self.buffers.items())
+
+    def add(self, stream_id:int, data) -> list[bytes]:
+        buf = self.buffers.get(stream_id)
+        if buf is None:
+            buf = self.buffers[stream_id] = bytearray()
+        buf += data
+        frames = []
+        pos = 0
+        view = memoryview(buf)
+        while True:
+            size = get_frame_size(view[pos:])
+            if not size or pos+size>len(buf):
+                break
+            frames.append(bytes(view[pos:pos+size]))
+            pos += size
+        view.release()
+        if pos:
+            del buf[:pos]
+        return frames
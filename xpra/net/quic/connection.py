@@ -14,7 +14,11 @@ from aioquic.h3.events import DataReceived, DatagramReceived, H3Event
 from xpra.net.quic.asyncio_thread import get_threaded_loop
 from xpra.net.bytestreams import Connection
 from xpra.net.websockets.header import close_packet
-from xpra.net.quic.common import binary_headers, override_aioquic_logger
+from xpra.net.quic.common import (
+    binary_headers, override_aioquic_logger,
+    get_packet_stream_type, get_frame_size, StreamFrames,
+    SUBSTREAMS, MAX_DATAGRAM_FRAME_SIZE,
+    )
 from xpra.util import ellipsizer, envbool
 from xpra.os_util import memoryview_to_bytes
 from xpra.log import Logger
@@ -22,7 +26,8 @@ log = Logger("quic")
 
 HttpConnection = Union[H0Connection, H3Connection]
 
-#DATAGRAM_PACKET_TYPES = os.environ.get("XPRA_QUIC_DATAGRAM_PACKET_TYPES", "pointer,pointer-button").split(",")
+#small packets which are superseded by the next one of the same type can be sent unreliably,
+#ie: XPRA_QUIC_DATAGRAM_PACKET_TYPES=pointer-position,cursor
 DATAGRAM_PACKET_TYPES = tuple(x.strip() for x in os.environ.get("XPRA_QUIC_DATAGRAM_PACKET_TYPES", "").split(",") if x.strip())
 
 if envbool("XPRA_QUIC_LOGGER", True):
@@ -40,15 +45,32 @@ class XpraQuicConnection(Connection):
         self.transmit: Callable[[], None] = transmit
         self.accepted : bool = False
         self.closed : bool = False
+        self.stream_frames = StreamFrames()
+        #stream type -> stream id
+        self._packet_type_streams : dict[str,int] = {}
+        self._use_substreams : bool = SUBSTREAMS
 
     def __repr__(self):
         return f"XpraQuicConnection<{self.stream_id}>"
 
+    def disable_substreams(self) -> None:
+        """
+            Used when the packets must be received in the order they were sent,
+            ie: when the protocol layer uses a stream cipher.
+        """
+        log("disable_substreams()")
+        self._use_substreams = False
+
     def get_info(self) -> dict[str,Any]:
         info = super().get_info()
         qinfo = {
             "read-queue"    : self.read_queue.qsize(),
             "stream-id"     : self.stream_id,
+            "substreams"    : {
+                "enabled"   : self._use_substreams,
+                "streams"   : dict(self._packet_type_streams),
+                "buffered"  : self.stream_frames.get_info(),
+                },
             "accepted"      : self.accepted,
             "closed"        : self.closed,
         }
@@ -70,8 +92,12 @@ class XpraQuicConnection(Connection):
         log("quic:http_event_received(%s)", ellipsizer(event))
         if self.closed:
             return
-        if isinstance(event, (DataReceived, DatagramReceived)):
+        if isinstance(event, DatagramReceived):
+            #each datagram contains a complete websocket frame:
             self.read_queue.put(event.data)
+        elif isinstance(event, DataReceived):
+            for frame in self.stream_frames.add(event.stream_id, event.data):
+                self.read_queue.put(frame)
         else:
             log.warn(f"Warning: unhandled websocket http event {event}")
 
@@ -106,7 +132,8 @@ class XpraQuicConnection(Connection):
         data = memoryview_to_bytes(buf)
         if not packet_type:
             log.warn(f"Warning: missing packet type for {data}")
-        if packet_type in DATAGRAM_PACKET_TYPES:
+        if packet_type in DATAGRAM_PACKET_TYPES and len(data)<=MAX_DATAGRAM_FRAME_SIZE and get_frame_size(data)==len(data):
+            #only complete frames can be sent as datagrams:
             self.connection.send_datagram(flow_id=self.stream_id, data=data)
             log(f"sending {packet_type} using datagram")
             return len(buf)
@@ -125,8 +152,25 @@ class XpraQuicConnection(Connection):
         get_threaded_loop().call(do_write)
         return len(buf)
 
-    def get_packet_stream_id(self, packet_type):
-        return self.stream_id
+    def get_packet_stream_id(self, packet_type) -> int:
+        if self.closed or not self._use_substreams or not self.accepted:
+            return self.stream_id
+        stream_type = get_packet_stream_type(packet_type)
+        if not stream_type:
+            return self.stream_id
+        stream_id = self._packet_type_streams.get(stream_type)
+        if stream_id is not None:
+            #already allocated substream:
+            return stream_id
+        # allocate a new one and record it
+        # (even if it fails, so we don't retry to allocate it again and again):
+        stream_id = self.allocate_new_stream_id(stream_type) or self.stream_id
+        self._packet_type_streams[stream_type] = stream_id
+        return stream_id
+
+    def allocate_new_stream_id(self, _stream_type:str) -> int:
+        #overridden in subclasses
+        return 0
 
 
     def read(self, n):
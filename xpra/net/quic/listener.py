@@ -68,6 +68,11 @@ class HttpServerProtocol(QuicConnectionProtocol):
         handler = self._handlers.get(hid)
         log(f"hsp:http_event_received(%s) handler {hid}: {handler}", ellipsizer(event))
         if isinstance(event, HeadersReceived) and not handler:
+            hdict = dict((k.decode(), v.decode()) for k, v in event.headers)
+            if "substream" in hdict:
+                #this stream carries some of the packets of an existing connection:
+                self.add_substream(event.stream_id, hdict)
+                return
             handler = self.new_http_handler(event)
             handler.xpra_server = self._xpra_server
             self._handlers[event.stream_id] = handler
@@ -84,6 +89,19 @@ class HttpServerProtocol(QuicConnectionProtocol):
             handler = self._handlers[event.session_id]
             handler.http_event_received(event)
 
+    def add_substream(self, stream_id : int, hdict : dict[str,str]) -> None:
+        try:
+            sub = int(hdict.get("substream", -1))
+        except ValueError:
+            sub = -1
+        handler = self._handlers.get(sub)
+        if not isinstance(handler, ServerWebSocketConnection):
+            log.warn(f"Warning: stream {sub} not found for substream {stream_id}")
+            return
+        subtype = hdict.get("stream-type")
+        log(f"new quic substream {stream_id} for {subtype} packets")
+        self._handlers[stream_id] = handler
+
     def new_http_handler(self, event) -> Handler:
         authority = None
         headers = []
@@ -3,7 +3,6 @@
 # Xpra is released under the terms of the GNU GPL v2, or, at your option, any
 # later version. See the file COPYING for details.
 
-import os
 from typing import Callable, Any
 
 from aioquic.h3.events import HeadersReceived, H3Event
@@ -16,9 +15,6 @@ from xpra.util import ellipsizer, first_time
 from xpra.log import Logger
 log = Logger("quic")
 
-#can be used to use substreams based on packet prefix: sound,webcam,draw
-SUBSTREAM_PACKET_TYPES = tuple(x.strip() for x in os.environ.get("XPRA_QUIC_SUBSTREAM_PACKET_TYPES", "").split(",") if x.strip())
-#SUBSTREAM_PACKET_LOSS_PCT = envint("XPRA_QUIC_SUBSTREAM_PACKET_LOSS_PCT", 0)
 
 
 class ServerWebSocketConnection(XpraQuicConnection):
@@ -26,8 +22,6 @@ class ServerWebSocketConnection(XpraQuicConnection):
                  stream_id: int, transmit: Callable[[], None]) -> None:
         super().__init__(connection, stream_id, transmit, "", 0, info=None, options=None)
         self.scope: dict = scope
-        self._packet_type_streams : dict[str,int] = {}
-        self._use_substreams = bool(SUBSTREAM_PACKET_TYPES)
 
     def get_info(self) -> dict[str,Any]:
         info = super().get_info()
@@ -65,23 +59,6 @@ class ServerWebSocketConnection(XpraQuicConnection):
             "sec-websocket-protocol" : "xpra",
             })
 
-    def get_packet_stream_id(self, packet_type) -> int:
-        if self.closed or not self._use_substreams or not packet_type:
-            return self.stream_id
-        if not any(packet_type.startswith(x) for x in SUBSTREAM_PACKET_TYPES):
-            return self.stream_id
-        #ie: "sound-data" -> "sound"
-        stream_type = packet_type.split("-", 1)[0]
-        stream_id = self._packet_type_streams.get(stream_type)
-        if stream_id is not None:
-            #already allocated substream:
-            return stream_id
-        # allocate a new one and record it
-        # (even if it fails, so we don't retry to allocate it again and again):
-        stream_id = self.allocate_new_stream_id(stream_type) or self.stream_id
-        self._packet_type_streams[stream_type] = stream_id
-        return stream_id
-
     def allocate_new_stream_id(self, stream_type) -> int:
         log(f"allocate_new_stream_id({stream_type!r})")
         # should use more "correct" values here
@@ -62,8 +62,6 @@ def zlib_encode(window, x, y, w, h):
         return []
     pixels = raw_pixels(img)
     import zlib  #pylint: disable=import-outside-toplevel
-    if isinstance(pixels, memoryview):
-        pixels = pixels.tobytes()
     data = zlib.compress(pixels, 1)
     log("zlib compressed %i down to %i", len(pixels), len(data))
     header = make_header(RFBEncoding.ZLIB, x, y, w, h) + struct.pack(b"!I", len(data))
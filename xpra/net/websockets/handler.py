@@ -13,6 +13,7 @@ from xpra.log import Logger
 log = Logger("network", "websocket")
 
 WEBSOCKET_ONLY_UPGRADE = envbool("XPRA_WEBSOCKET_ONLY_UPGRADE", False)
+WEBSOCKET_DEFLATE = envbool("XPRA_WEBSOCKET_DEFLATE", True)
 
 # HyBi-07 report version 7
 # HyBi-08 - HyBi-12 report version 8
@@ -20,6 +21,21 @@ WEBSOCKET_ONLY_UPGRADE = envbool("XPRA_WEBSOCKET_ONLY_UPGRADE", False)
 SUPPORT_HyBi_PROTOCOLS : tuple[str,...] = ("7", "8", "13")
 
 
+def accept_deflate(extensions:str) -> bool:
+    """
+        Returns True if one of the extension offers is 'permessage-deflate'
+        with parameters we can honour without adding any to our response:
+        we use the default window size and keep the context between messages.
+    """
+    for offer in extensions.split(","):
+        params = [x.strip() for x in offer.split(";")]
+        if params[0]!="permessage-deflate":
+            continue
+        if all(param=="client_max_window_bits" for param in params[1:]):
+            return True
+    return False
+
+
 class WebSocketRequestHandler(HTTPRequestHandler):
 
     server_version = "Xpra-WebSocket-Server"
@@ -33,6 +49,7 @@ class WebSocketRequestHandler(HTTPRequestHandler):
                  ):
         self.new_websocket_client : Callable = new_websocket_client
         self.only_upgrade = WEBSOCKET_ONLY_UPGRADE
+        self.deflate = False
         self.redirect_https = redirect_https
         super().__init__(sock, addr,
                          web_root, http_headers_dir, script_paths,
@@ -60,14 +77,19 @@ class WebSocketRequestHandler(HTTPRequestHandler):
             raise ValueError("Missing Sec-WebSocket-Key header")
         accept = make_websocket_accept_hash(key)
         log(f"websocket hash for key {key!r} = {accept!r}")
-        self.write_byte_strings(
+        headers = [
             b"HTTP/1.1 101 Switching Protocols",
             b"Upgrade: websocket",
             b"Connection: Upgrade",
             b"Sec-WebSocket-Accept: %s" % accept,
             b"Sec-WebSocket-Protocol: %s" % b"binary",
-            b"",
-            )
+            ]
+        self.deflate = WEBSOCKET_DEFLATE and accept_deflate(self.headers.get("Sec-WebSocket-Extensions", ""))
+        if self.deflate:
+            headers.append(b"Sec-WebSocket-Extensions: permessage-deflate")
+        log(f"permessage-deflate={self.deflate}")
+        headers.append(b"")
+        self.write_byte_strings(*headers)
         self.new_websocket_client(self)
         #don't use our finish method that closes the socket,
         #but do call the superclass's finish() method:
@@ -21,12 +21,12 @@ def close_packet(code : int = 1000, reason : str = "") -> bytes:
     return header + data
 
 
-def encode_hybi_header(opcode, payload_len, has_mask=False, fin=True) -> bytes:
+def encode_hybi_header(opcode, payload_len, has_mask=False, fin=True, rsv1=False) -> bytes:
     """ Encode a HyBi style WebSocket frame """
     if (opcode & 0x0f)!=opcode:
         raise ValueError(f"invalid opcode {opcode:x}")
     mask_bit = 0x80*has_mask
-    b1 = opcode | (0x80 * fin)
+    b1 = opcode | (0x80 * fin) | (0x40 * rsv1)
     if payload_len <= 125:
         return struct.pack('>BB', b1, payload_len | mask_bit)
     if payload_len < 65536:
@@ -34,8 +34,13 @@ def encode_hybi_header(opcode, payload_len, has_mask=False, fin=True) -> bytes:
     return struct.pack('>BBQ', b1, 127 | mask_bit, payload_len)
 
 
-def decode_hybi(buf:ByteString) -> tuple[int,ByteString,int,int] | None:
-    """ Decode HyBi style WebSocket packets """
+def decode_hybi_header(buf:ByteString) -> tuple[int,bool,bool,bool,int,int] | None:
+    """
+        Decode the header of a HyBi style WebSocket frame,
+        returns the opcode, fin, rsv1 and masked flags, the header length
+        (including the mask) and the payload length,
+        or None if the buffer is too small.
+    """
     blen = len(buf)
     hlen = 2
     if blen < hlen:
@@ -45,6 +50,7 @@ def decode_hybi(buf:ByteString) -> tuple[int,ByteString,int,int] | None:
     b1, b2 = struct.unpack(">BB", buf[:2])
     opcode = b1 & 0x0f
     fin = bool(b1 & 0x80)
+    rsv1 = bool(b1 & 0x40)
     masked = bool(b2 & 0x80)
     if masked:
         hlen += 4
@@ -65,9 +71,18 @@ def decode_hybi(buf:ByteString) -> tuple[int,ByteString,int,int] | None:
             #log("decode_hybi_header() buffer too small for 127 payload: %i", blen)
             return None
         payload_len = struct.unpack('>Q', buf[2:10])[0]
-
     #log("decode_hybi_header() decoded header '%s': hlen=%i,
     #    payload_len=%i, buffer len=%i", binascii.hexlify(buf[:hlen]), hlen, payload_len, blen)
+    return opcode, fin, rsv1, masked, hlen, payload_len
+
+
+def decode_hybi(buf:ByteString) -> tuple[int,ByteString,int,int] | None:
+    """ Decode HyBi style WebSocket packets """
+    blen = len(buf)
+    header = decode_hybi_header(buf)
+    if header is None:
+        return None
+    opcode, fin, _, masked, hlen, payload_len = header
     length = hlen + payload_len
     if blen < length:
         #log("decode_hybi_header() buffer too small for payload: %i (needed %i)", blen, length)
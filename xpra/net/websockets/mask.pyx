@@ -7,6 +7,12 @@ from libc.stdint cimport uint32_t, uintptr_t  #pylint: disable=syntax-error
 from xpra.buffers.membuf cimport getbuf, MemBuf, buffer_context
 
 
+cdef extern from "Python.h":
+    int PyObject_GetBuffer(object obj, Py_buffer *view, int flags)
+    void PyBuffer_Release(Py_buffer *view)
+    int PyBUF_WRITABLE
+
+
 def hybi_unmask(data, unsigned int offset, unsigned int datalen):
     cdef uintptr_t mp
     cdef unsigned int min_len = offset+4+datalen
@@ -23,6 +29,48 @@ def hybi_mask(mask, data):
         with buffer_context(data) as dbc:
             return do_hybi_mask(<uintptr_t> int(mbc), <uintptr_t> int(dbc), len(dbc))
 
+def hybi_unmask_inplace(mask, data) -> None:
+    """
+        Unmasks the data in place,
+        'data' must be a writable buffer, ie: a bytearray.
+    """
+    cdef Py_buffer py_buf
+    cdef unsigned char *mcbuf
+    with buffer_context(mask) as mbc:
+        if len(mbc)<4:
+            raise ValueError(f"mask buffer too small: {len(mbc)} bytes")
+        mcbuf = <unsigned char *> (<uintptr_t> int(mbc))
+        if PyObject_GetBuffer(data, &py_buf, PyBUF_WRITABLE):
+            raise ValueError(f"failed to get a writable buffer from {type(data)}")
+        try:
+            do_hybi_unmask_inplace(mcbuf, <unsigned char *> py_buf.buf, py_buf.len)
+        finally:
+            PyBuffer_Release(&py_buf)
+
+cdef void do_hybi_unmask_inplace(unsigned char *mcbuf, unsigned char *dcbuf, size_t datalen) nogil:
+    cdef size_t i = 0
+    cdef uint32_t mask_value = 0
+    cdef uint32_t *dbuf
+    #bytes at a time until we reach the 32-bit boundary:
+    while i<datalen and ((<uintptr_t> (dcbuf+i)) & 0x3):
+        dcbuf[i] ^= mcbuf[i & 0x3]
+        i += 1
+    #the mask, starting from the current position, in memory order:
+    (<unsigned char *> &mask_value)[0] = mcbuf[i & 0x3]
+    (<unsigned char *> &mask_value)[1] = mcbuf[(i+1) & 0x3]
+    (<unsigned char *> &mask_value)[2] = mcbuf[(i+2) & 0x3]
+    (<unsigned char *> &mask_value)[3] = mcbuf[(i+3) & 0x3]
+    dbuf = <uint32_t *> (dcbuf+i)
+    cdef size_t uint32_steps = (datalen-i) // 4
+    cdef size_t j
+    for j in range(uint32_steps):
+        dbuf[j] ^= mask_value
+    i += uint32_steps*4
+    #bytes at a time again at the end:
+    while i<datalen:
+        dcbuf[i] ^= mcbuf[i & 0x3]
+        i += 1
+
 cdef object do_hybi_mask(uintptr_t mp, uintptr_t dp, unsigned int datalen):
     #we skip the first 'align' bytes in the output buffer,
     #to ensure that its alignment is the same as the input data buffer
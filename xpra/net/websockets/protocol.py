@@ -4,23 +4,33 @@
 # later version. See the file COPYING for details.
 
 import os
+import zlib
 import struct
-from typing import ByteString, Callable
+from collections import deque
+from typing import Any, ByteString, Callable
 
-from xpra.net.websockets.mask import hybi_mask     #@UnresolvedImport
-from xpra.net.websockets.header import encode_hybi_header, decode_hybi, close_packet
+from xpra.net.websockets.mask import hybi_mask, hybi_unmask_inplace     #@UnresolvedImport
+from xpra.net.websockets.header import encode_hybi_header, decode_hybi_header, close_packet
 from xpra.net.websockets.common import (
     OPCODES,
     OPCODE_BINARY, OPCODE_CONTINUE, OPCODE_TEXT, OPCODE_CLOSE, OPCODE_PING, OPCODE_PONG,
     )
 from xpra.net.protocol.socket_handler import SocketProtocol
-from xpra.util import first_time, envbool
+from xpra.util import first_time, envbool, envint
 from xpra.os_util import memoryview_to_bytes, hexstr
 from xpra.log import Logger
 
 log = Logger("websocket")
 
 MASK = envbool("XPRA_WEBSOCKET_MASK", False)
+#only compress the small packets, the large ones are already compressed:
+DEFLATE_MAX_SIZE = envint("XPRA_WEBSOCKET_DEFLATE_MAX_SIZE", 16*1024)
+DEFLATE_LEVEL = envint("XPRA_WEBSOCKET_DEFLATE_LEVEL", 1)
+NO_DEFLATE_PACKET_TYPES = ("draw", "sound-data", "webcam-frame")
+#the largest possible frame header, including the mask:
+MAX_HEADER_SIZE = 14
+#RFC 7692: the compressed payload is missing the end of the deflate block:
+DEFLATE_TAIL = b"\x00\x00\xff\xff"
 
 
 class WebSocketProtocol(SocketProtocol):
@@ -29,10 +39,20 @@ class WebSocketProtocol(SocketProtocol):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.ws_data : ByteString = b""
+        #the data we have received but not parsed yet:
+        self.ws_buffers : deque[ByteString] = deque()
+        self.ws_buffered : int = 0
         self.ws_payload : list[ByteString] = []
         self.ws_payload_opcode : int = 0
+        self.ws_payload_compressed : bool = False
         self.ws_mask : bool = MASK
+        #negotiated by the http handler using the 'Sec-WebSocket-Extensions' header:
+        self.ws_deflate : bool = getattr(self._conn, "websocket_deflate", False)
+        self.ws_deflater = None
+        self.ws_inflater = None
+        if self.ws_deflate:
+            self.ws_deflater = zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+            self.ws_inflater = zlib.decompressobj(-zlib.MAX_WBITS)
         self._process_read = self.parse_ws_frame
         self.make_chunk_header : Callable = self.make_xpra_header
         self.make_frame_header : Callable = self.make_wsframe_header
@@ -40,12 +60,22 @@ class WebSocketProtocol(SocketProtocol):
     def __repr__(self):
         return f"WebSocket({self._conn})"
 
+    def get_info(self, alias_info:bool=True) -> dict[str,Any]:
+        info = super().get_info(alias_info)
+        info["websocket"] = {
+            "mask"      : self.ws_mask,
+            "deflate"   : self.ws_deflate,
+            "buffered"  : self.ws_buffered,
+            }
+        return info
+
     def close(self, message=None) -> None:
         if self._closed:
             return
         self.send_ws_close(reason=message)
         super().close(message)
-        self.ws_data = b""
+        self.ws_buffers.clear()
+        self.ws_buffered = 0
         self.ws_payload = []
 
     def send_ws_close(self, code:int=1000, reason:str="closing") -> None:
@@ -55,9 +85,20 @@ class WebSocketProtocol(SocketProtocol):
 
     def make_wsframe_header(self, packet_type, items) -> ByteString:
         payload_len = sum(len(item) for item in items)
-        header = encode_hybi_header(OPCODE_BINARY, payload_len, self.ws_mask)
-        log("make_wsframe_header(%s, %i items) %i bytes, ws_mask=%s, header=0x%s (%i bytes)",
-            packet_type, len(items), payload_len, self.ws_mask, hexstr(header), len(header))
+        rsv1 = False
+        if self.ws_deflater and payload_len<=DEFLATE_MAX_SIZE and packet_type not in NO_DEFLATE_PACKET_TYPES:
+            #this is called with the write lock held,
+            #so the frames are compressed in the order they are sent:
+            deflater = self.ws_deflater
+            data = b"".join(deflater.compress(item) for item in items)+deflater.flush(zlib.Z_SYNC_FLUSH)
+            if data.endswith(DEFLATE_TAIL):
+                data = data[:-4]
+            items[:] = [data]
+            payload_len = len(data)
+            rsv1 = True
+        header = encode_hybi_header(OPCODE_BINARY, payload_len, self.ws_mask, rsv1=rsv1)
+        log("make_wsframe_header(%s, %i items) %i bytes, ws_mask=%s, deflate=%s, header=0x%s (%i bytes)",
+            packet_type, len(items), payload_len, self.ws_mask, rsv1, hexstr(header), len(header))
         if self.ws_mask:
             mask = os.urandom(4)
             #now mask all the items:
@@ -66,30 +107,73 @@ class WebSocketProtocol(SocketProtocol):
             return header+mask
         return header
 
+    def ws_read(self, size:int) -> list[ByteString]:
+        """
+            Removes 'size' bytes from the buffers we have received,
+            the buffers are sliced and not copied.
+        """
+        parts = []
+        self.ws_buffered -= size
+        while size>0:
+            buf = self.ws_buffers[0]
+            if len(buf)<=size:
+                parts.append(self.ws_buffers.popleft())
+                size -= len(buf)
+            else:
+                parts.append(buf[:size])
+                self.ws_buffers[0] = buf[size:]
+                size = 0
+        return parts
+
+    def ws_peek(self, size:int) -> bytes:
+        size = min(size, self.ws_buffered)
+        buf = self.ws_buffers[0]
+        if len(buf)>=size:
+            return bytes(buf[:size])
+        data = b""
+        for buf in self.ws_buffers:
+            data += memoryview_to_bytes(buf[:size-len(data)])
+            if len(data)==size:
+                break
+        return data
+
     def parse_ws_frame(self, buf:ByteString) -> None:
         if not buf:
             self._read_queue_put(buf)
             return
-        if self.ws_data:
-            ws_data = self.ws_data+buf
-            self.ws_data = b""
-        else:
-            ws_data = buf
-        while self.input_packetcount==0 and ws_data.startswith(b"\r\n"):
-            ws_data = ws_data[2:]
-        log("parse_ws_frame(%i bytes) total buffer is %i bytes", len(buf), len(ws_data))
-        while ws_data and not self._closed:
-            parsed = decode_hybi(ws_data)
-            if parsed is None:
-                log("parse_ws_frame(%i bytes) not enough data: %r", len(ws_data), ws_data)
+        if self.input_packetcount==0 and not self.ws_buffers:
+            while buf.startswith(b"\r\n"):
+                buf = buf[2:]
+            if not buf:
+                return
+        self.ws_buffers.append(memoryview(buf))
+        self.ws_buffered += len(buf)
+        log("parse_ws_frame(%i bytes) total buffered is %i bytes", len(buf), self.ws_buffered)
+        while self.ws_buffered and not self._closed:
+            header = self.ws_peek(MAX_HEADER_SIZE)
+            parsed = decode_hybi_header(header)
+            if parsed is None or self.ws_buffered<parsed[4]+parsed[5]:
+                log("parse_ws_frame(%i bytes) not enough data: %i bytes buffered", len(buf), self.ws_buffered)
                 #not enough data to get a full websocket frame,
-                #save it for later:
-                self.ws_data = ws_data
+                #wait for more:
                 return
-            opcode, payload, processed, fin = parsed
-            ws_data = ws_data[processed:]
-            log("parse_ws_frame(%i bytes) payload=%i bytes, processed=%i, remaining=%i, opcode=%s, fin=%s",
-                len(buf), len(payload), processed, len(ws_data), OPCODES.get(opcode, opcode), fin)
+            opcode, fin, rsv1, masked, hlen, payload_len = parsed
+            self.ws_read(hlen)
+            parts = self.ws_read(payload_len)
+            payload : ByteString
+            if masked:
+                #we have to copy the data to unmask it,
+                #so we may as well join the buffers at the same time:
+                payload = bytearray().join(parts)
+                hybi_unmask_inplace(header[hlen-4:hlen], payload)
+            elif len(parts)==1:
+                payload = parts[0]
+            else:
+                payload = b"".join(parts)
+            log("parse_ws_frame(%i bytes) payload=%i bytes, remaining=%i, opcode=%s, fin=%s, rsv1=%s",
+                len(buf), payload_len, self.ws_buffered, OPCODES.get(opcode, opcode), fin, rsv1)
+            if rsv1 and (not self.ws_deflate or opcode not in (OPCODE_BINARY, OPCODE_TEXT)):
+                raise ValueError(f"unexpected RSV1 bit in {OPCODES.get(opcode, opcode)} frame")
             if opcode==OPCODE_CONTINUE:
                 assert self.ws_payload_opcode and self.ws_payload, "continuation frame does not follow a partial frame"
                 self.ws_payload.append(payload)
@@ -97,15 +181,18 @@ class WebSocketProtocol(SocketProtocol):
                     #wait for more
                     continue
                 #join all the frames and process the payload:
-                full_payload = b"".join(memoryview_to_bytes(v) for v in self.ws_payload)
+                full_payload = b"".join(self.ws_payload)
+                compressed = self.ws_payload_compressed
                 self.ws_payload = []
                 opcode = self.ws_payload_opcode
                 self.ws_payload_opcode = 0
+                self.ws_payload_compressed = False
             else:
                 if self.ws_payload and self.ws_payload_opcode:
                     op = OPCODES.get(opcode, opcode)
                     raise ValueError(f"expected a continuation frame not {op}")
                 full_payload = payload
+                compressed = rsv1
                 if not fin:
                     if opcode not in (OPCODE_BINARY, OPCODE_TEXT):
                         op = OPCODES.get(opcode, opcode)
@@ -114,8 +201,19 @@ class WebSocketProtocol(SocketProtocol):
                         raise RuntimeError(f"cannot handle fragmented {op} frames")
                     #fragmented, keep this payload for later
                     self.ws_payload_opcode = opcode
+                    self.ws_payload_compressed = rsv1
                     self.ws_payload.append(payload)
                     continue
+            if compressed:
+                inflater = self.ws_inflater
+                #limit the output size, the compression is negotiated before authentication:
+                max_size = self.max_packet_size
+                data = inflater.decompress(full_payload, max_size)
+                if not inflater.unconsumed_tail:
+                    data += inflater.decompress(DEFLATE_TAIL, max(1, max_size-len(data)))
+                if inflater.unconsumed_tail or len(data)>max_size:
+                    raise ValueError(f"decompressed websocket frame is larger than {max_size} bytes")
+                full_payload = data
             if opcode==OPCODE_BINARY:
                 self._read_queue_put(full_payload)
             elif opcode==OPCODE_TEXT:
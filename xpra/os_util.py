@@ -9,7 +9,6 @@ import re
 import os
 import sys
 import stat
-import uuid
 import signal
 import socket
 import struct
@@ -255,9 +254,11 @@ def platform_name(sys_platform=sys.platform, release=None) -> str:
 
 
 def get_hex_uuid() -> str:
+    import uuid
     return uuid.uuid4().hex
 
 def get_int_uuid() -> int:
+    import uuid
     return uuid.uuid4().int
 
 def get_machine_id() -> str:
@@ -274,6 +275,7 @@ def get_machine_id() -> str:
                 v = bytestostr(b)
                 break
     elif WIN32:
+        import uuid
         v = str(uuid.getnode())
     return v.strip("\n\r")
 
@@ -7,9 +7,7 @@
 
 import sys
 import shlex
-import inspect
 import os.path
-import tempfile
 from typing import Callable
 
 from xpra.platform import platform_import
@@ -122,12 +120,14 @@ def do_get_download_dir() -> str:
 def get_mmap_dir() -> str:
     return env_or_delegate("XPRA_MMAP_DIR", do_get_mmap_dir)
 def do_get_mmap_dir() -> str:
+    import tempfile  #pylint: disable=import-outside-toplevel
     return tempfile.gettempdir()
 
 
 def get_xpra_tmp_dir() -> str:
     return env_or_delegate("XPRA_TMP_DIR", do_get_xpra_tmp_dir)
 def do_get_xpra_tmp_dir() -> str:
+    import tempfile  #pylint: disable=import-outside-toplevel
     return tempfile.gettempdir()
 
 
@@ -180,7 +180,8 @@ def default_get_app_dir() -> str:
             adir = os.path.join(prefix, "share", "xpra")
             if valid_dir(adir):
                 return adir
-    adir = os.path.dirname(inspect.getfile(sys._getframe(1)))  #pylint: disable=protected-access
+    #same as `inspect.getfile()`, without importing `inspect`:
+    adir = os.path.dirname(sys._getframe(1).f_code.co_filename)  #pylint: disable=protected-access
     def root_module(d):
         for psep in (os.path.sep, "/", "\\"):
             pos = d.find(f"xpra{psep}platform")
@@ -20,6 +20,7 @@ from xpra.util import envbool, first_time
 from xpra.os_util import OSEnvContext, get_saved_env
 from xpra.codecs import icon_util
 from xpra.platform.paths import get_icon_filename
+from xpra.platform.posix.menu_index import get_menu_index, normalize
 from xpra.log import Logger
 
 log = Logger("exec", "menu")
@@ -68,7 +69,6 @@ def export(entry, properties : tuple[str, ...]) -> dict[str,Any]:
             l("error on %s", entry, exc_info=True)
             log.error(f"Error parsing {prop!r}: {e}")
     l(f"properties({name})={props}")
-    load_entry_icon(props)
     return props
 
 
@@ -147,8 +147,56 @@ def clear_cache() -> None:
     IconTheme.icon_cache = {}
 
 
-def load_entry_icon(props:dict):
-    #load icon binary data
+def get_index_settings() -> dict[str,Any]:
+    """
+        The cached menu entries are only valid with the same settings:
+    """
+    env = get_saved_env()
+    settings = {
+        "export-icons"      : EXPORT_ICONS,
+        "export-terminal"   : EXPORT_TERMINAL_APPLICATIONS,
+        "export-self"       : EXPORT_SELF,
+        "load-from"         : [LOAD_FROM_RESOURCES, LOAD_FROM_PIXMAPS, LOAD_FROM_THEME, LOAD_GLOB],
+        "max-icon-size"     : icon_util.MAX_ICON_SIZE,
+        "themes"            : sorted(themes.keys()),
+        }
+    for k in ("LANG", "LANGUAGE", "LC_ALL", "LC_MESSAGES", "PATH", "XDG_DATA_DIRS"):
+        settings[k] = os.environ.get(k, env.get(k, ""))
+    if Config:
+        settings["icon-theme"] = Config.icon_theme
+        settings["icon-size"] = Config.icon_size
+    return settings
+
+def get_index():
+    return get_menu_index(get_index_settings)
+
+def save_index() -> None:
+    index = get_index()
+    if index:
+        index.save()
+
+
+def load_icon(filename:str) -> tuple:
+    """
+        loads the icon data from the index if the file has not been modified,
+        or using icon_util
+    """
+    index = get_index()
+    if index:
+        icondata = index.get_icon(filename)
+        if icondata:
+            return icondata
+    icondata = icon_util.load_icon_from_file(filename)
+    if index and icondata:
+        index.set_icon(filename, icondata)
+    return icondata
+
+
+def load_entry_icon(props:dict) -> str:
+    """
+        load icon binary data,
+        returns the filename we have loaded it from
+    """
     names = []
     for x in ("Icon", "Name", "GenericName"):
         name = props.get(x)
@@ -163,14 +211,15 @@ def load_entry_icon(props:dict):
     filename = find_icon(*names)
     icondata = None
     if filename:
-        icondata = icon_util.load_icon_from_file(filename)
+        icondata = load_icon(filename)
         if icondata:
             bdata, ext = icondata
             props["IconData"] = bdata
             props["IconType"] = ext
     if not icondata:
         log(f"no icon found for {names} from {props}")
-    return props
+        return ""
+    return filename
 
 
 def find_icon(*names):
@@ -254,6 +303,32 @@ def noicondata(d:dict) -> dict:
 
 
 def load_xdg_entry(de) -> dict[str,Any]:
+    """
+        Uses the index to avoid exporting the desktop entry again
+        if the file has not been modified.
+    """
+    index = get_index()
+    filename = de.getFileName()
+    if index and filename:
+        cached = index.get_entry(filename)
+        if cached:
+            props, icon_filename = cached
+            if not icon_filename:
+                return props
+            icondata = load_icon(icon_filename)
+            if icondata:
+                props["IconData"], props["IconType"] = icondata
+                return props
+            #the icon is gone, so we have to look for a new one
+    props, icon_filename = do_load_xdg_entry(de)
+    #use the same types as the entries loaded from the index,
+    #so that comparing the menus does not find spurious changes:
+    props = dict((k, v if k=="IconData" else normalize(v)) for k, v in props.items())
+    if index and filename and (icon_filename or not props.get("IconData")):
+        index.set_entry(filename, props, icon_filename, de.getTryExec() or "")
+    return props
+
+def do_load_xdg_entry(de) -> tuple[dict[str,Any],str]:
     # not exposed:
     # * `MimeType` is a `re`
     # * `Version` is a `float`
@@ -264,7 +339,7 @@ def load_xdg_entry(de) -> dict[str,Any]:
         "Categories", "StartupNotify", "StartupWMClass", "URL",
         ))
     if props.get("NoDisplay", False) or props.get("Hidden", False):
-        return {}
+        return {}, ""
     if de.getTryExec():
         try:
             command = de.findTryExec()
@@ -274,12 +349,13 @@ def load_xdg_entry(de) -> dict[str,Any]:
         command = de.getExec()
     if not command:
         #this command is not executable!
-        return {}
+        return {}, ""
     props["command"] = command
     if not EXPORT_SELF and command and command.find("xpra")>=0:
-        return {}
+        return {}, ""
     if not EXPORT_TERMINAL_APPLICATIONS and props.get("Terminal", False):
-        return {}
+        return {}, ""
+    icon_filename = load_entry_icon(props)
     icondata = props.get("IconData")
     if not icondata:
         #try harder:
@@ -288,7 +364,7 @@ def load_xdg_entry(de) -> dict[str,Any]:
             bdata, ext = icondata
             props["IconData"] = bdata
             props["IconType"] = ext
-    return props
+    return props, icon_filename
 
 def load_xdg_menu(submenu) -> dict[str,Any]:
     #log.info("submenu %s: %s, %s", name, submenu, dir(submenu))
@@ -296,6 +372,7 @@ def load_xdg_menu(submenu) -> dict[str,Any]:
         "Name", "GenericName", "Comment",
         "Path", "Icon",
         ))
+    load_entry_icon(submenu_data)
     icondata = submenu_data.get("IconData")
     if not icondata:
         #try harder:
@@ -348,6 +425,7 @@ def load_menu():
     start = monotonic()
     with IconLoadingContext():
         xdg_menu_data = load_xdg_menu_data()
+    save_index()
     end = monotonic()
     if xdg_menu_data:
         l = sum(len(x) for x in xdg_menu_data.values())
@@ -526,7 +604,7 @@ def load_desktop_sessions() -> dict[str,Any]:
                     names = get_icon_names_for_session(name.lower())
                     icon_filename = find_icon(*names)
                     if icon_filename:
-                        icondata = icon_util.load_icon_from_file(icon_filename)
+                        icondata = load_icon(icon_filename)
                         if icondata:
                             entry["IconData"] = icondata[0]
                             entry["IconType"] = icondata[1]
@@ -535,6 +613,7 @@ def load_desktop_sessions() -> dict[str,Any]:
                 log("load_desktop_sessions(%s)", remove_icons, exc_info=True)
                 log.error(f"Error loading desktop entry {filename!r}:")
                 log.estr(e)
+    save_index()
     return xsessions
 
 
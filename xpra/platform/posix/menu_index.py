@@ -0,0 +1,209 @@
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+"""
+Persistent index of the xdg menu entries and icons we have already loaded,
+so that we only need to process the files that have changed since.
+"""
+
+import os
+import json
+import shutil
+from base64 import b64encode, b64decode
+from threading import Lock
+from typing import Any, Callable
+
+from xpra.util import envbool
+from xpra.os_util import osexpand
+from xpra.log import Logger
+
+log = Logger("exec", "menu")
+
+MENU_INDEX : bool = envbool("XPRA_MENU_INDEX", True)
+MENU_INDEX_FILENAME : str = os.environ.get("XPRA_MENU_INDEX_FILENAME",
+                                           os.path.join(os.environ.get("XDG_CACHE_HOME", "~/.cache"),
+                                                        "xpra", "menu-index.json"))
+INDEX_VERSION : int = 2
+
+
+def get_file_stamp(filename:str) -> list[int] | None:
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def get_tryexec_target(tryexec:str) -> str:
+    """ the executable that a 'TryExec' key refers to, or an empty string if it is not installed """
+    if not tryexec:
+        return ""
+    if os.path.isabs(tryexec):
+        return tryexec if os.access(tryexec, os.X_OK) else ""
+    return shutil.which(tryexec) or ""
+
+
+def normalize(value):
+    """
+        The values loaded from the index are json values,
+        so convert the freshly parsed ones the same way, ie: tuples become lists.
+    """
+    if isinstance(value, (list, tuple)):
+        return [normalize(v) for v in value]
+    if isinstance(value, dict):
+        return dict((k, normalize(v)) for k, v in value.items())
+    return value
+
+
+class MenuIndex:
+    """
+        Maps the '.desktop' files to the menu entry properties we have exported,
+        and the icon files to their (possibly converted) image data.
+        Each record is only valid for as long as the file's modification time
+        and size remain the same.
+        The whole index is discarded if the 'settings' change,
+        ie: locale, icon theme or export options.
+    """
+    __slots__ = ("filename", "settings", "lock", "entries", "icons", "dirty", "hits", "misses")
+
+    def __init__(self, filename:str="", settings=None):
+        self.filename = filename
+        self.settings = settings
+        self.lock = Lock()
+        self.entries : dict[str,dict[str,Any]] = {}
+        self.icons : dict[str,dict[str,Any]] = {}
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return f"MenuIndex({self.filename!r})"
+
+    def get_info(self) -> dict[str,Any]:
+        return {
+            "filename"  : self.filename,
+            "entries"   : len(self.entries),
+            "icons"     : len(self.icons),
+            "hits"      : self.hits,
+            "misses"    : self.misses,
+            }
+
+    def load(self) -> None:
+        if not self.filename or not os.path.exists(self.filename):
+            return
+        try:
+            with open(self.filename, "r", encoding="utf8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            log(f"load() {self.filename!r}", exc_info=True)
+            log.warn(f"Warning: failed to load menu index {self.filename!r}")
+            log.warn(f" {e}")
+            return
+        if data.get("version")!=INDEX_VERSION or data.get("settings")!=self.settings:
+            log(f"menu index {self.filename!r} is out of date")
+            return
+        with self.lock:
+            self.entries = data.get("entries", {})
+            self.icons = data.get("icons", {})
+        log(f"loaded {len(self.entries)} entries and {len(self.icons)} icons from {self.filename!r}")
+
+    def save(self) -> None:
+        if not self.filename or not self.dirty:
+            return
+        with self.lock:
+            #forget about the files that have been removed:
+            for records in (self.entries, self.icons):
+                for filename in tuple(records.keys()):
+                    if not os.path.exists(filename):
+                        del records[filename]
+            data = {
+                "version"   : INDEX_VERSION,
+                "settings"  : self.settings,
+                "entries"   : self.entries,
+                "icons"     : self.icons,
+                }
+            self.dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.filename), mode=0o700, exist_ok=True)
+            tmp = f"{self.filename}.tmp"
+            with open(tmp, "w", encoding="utf8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.filename)
+        except (OSError, TypeError, ValueError) as e:
+            log(f"save() {self.filename!r}", exc_info=True)
+            log.warn(f"Warning: failed to save menu index {self.filename!r}")
+            log.warn(f" {e}")
+        else:
+            log(f"saved {len(self.entries)} entries and {len(self.icons)} icons to {self.filename!r}")
+
+    def get_icon(self, filename:str) -> tuple:
+        """ returns the icon data and type, or an empty tuple if not found or out of date """
+        with self.lock:
+            record = self.icons.get(filename)
+        if not record or record.get("stamp")!=get_file_stamp(filename):
+            return ()
+        return b64decode(record["data"]), record["type"]
+
+    def set_icon(self, filename:str, icondata:tuple) -> None:
+        stamp = get_file_stamp(filename)
+        if not stamp or not icondata:
+            return
+        data, ext = icondata
+        record = {"stamp" : stamp, "data" : b64encode(data).decode("latin1"), "type" : ext}
+        with self.lock:
+            self.icons[filename] = record
+            self.dirty = True
+
+    def get_entry(self, filename:str) -> tuple[dict[str,Any],str] | None:
+        """
+            returns the cached properties and icon filename for this menu entry,
+            or None if we don't have a valid record for it
+        """
+        with self.lock:
+            record = self.entries.get(filename)
+        if not record or record.get("stamp")!=get_file_stamp(filename):
+            self.misses += 1
+            return None
+        #the entry may depend on a command being installed or removed since:
+        tryexec = record.get("tryexec", "")
+        if tryexec and get_tryexec_target(tryexec)!=record.get("tryexec-target", ""):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return dict(record["props"]), record.get("icon", "")
+
+    def set_entry(self, filename:str, props:dict[str,Any], icon_filename:str="", tryexec:str="") -> None:
+        stamp = get_file_stamp(filename)
+        if not stamp:
+            return
+        props = dict((k, normalize(v)) for k, v in props.items() if k not in ("IconData", "IconType"))
+        try:
+            #make sure that we will be able to save it:
+            json.dumps(props)
+        except (TypeError, ValueError):
+            log(f"cannot index {filename!r}: {props}", exc_info=True)
+            return
+        record = {"stamp" : stamp, "props" : props, "icon" : icon_filename}
+        if tryexec:
+            record["tryexec"] = tryexec
+            record["tryexec-target"] = get_tryexec_target(tryexec)
+        with self.lock:
+            self.entries[filename] = record
+            self.dirty = True
+
+
+singleton = None
+def get_menu_index(get_settings:Callable) -> MenuIndex | None:
+    """
+        The settings callback is only used the first time,
+        when the index is loaded from disk.
+    """
+    global singleton
+    if not MENU_INDEX:
+        return None
+    if singleton is None:
+        singleton = MenuIndex(osexpand(MENU_INDEX_FILENAME), get_settings())
+        singleton.load()
+    return singleton
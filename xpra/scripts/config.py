@@ -11,7 +11,7 @@ import shlex
 from typing import Callable, Any
 
 from xpra.common import noop
-from xpra.util import csv, stderr_print, sorted_nicely, remove_dupes
+from xpra.util import csv, stderr_print, sorted_nicely, remove_dupes, envbool
 from xpra.os_util import (
     WIN32, OSX, POSIX,
     osexpand, getuid, getgid, get_username_for_uid,
@@ -41,6 +41,12 @@ DEBUG_CONFIG_PROPERTIES : list[str] = os.environ.get("XPRA_DEBUG_CONFIG_PROPERTI
 
 DEFAULT_XPRA_CONF_FILENAME : str = os.environ.get("XPRA_CONF_FILENAME", 'xpra.conf')
 DEFAULT_NET_WM_NAME : str = os.environ.get("XPRA_NET_WM_NAME", "Xpra")
+#the parsed config files are cached, keyed by their modification time and size:
+CONFIG_CACHE : bool = envbool("XPRA_CONFIG_CACHE", True)
+CONFIG_CACHE_FILENAME : str = os.environ.get("XPRA_CONFIG_CACHE_FILENAME",
+                                             os.path.join(os.environ.get("XDG_CACHE_HOME", "~/.cache"),
+                                                          "xpra", "config-cache.json"))
+CONFIG_CACHE_VERSION : int = 1
 
 DEFAULT_POSTSCRIPT_PRINTER : str = ""
 if POSIX:
@@ -70,7 +76,8 @@ def get_xorg_bin() -> str:
     if xorg:
         return xorg
     # Detect Xorg Binary
-    if is_arm() and is_Debian() and os.path.exists("/usr/bin/Xorg"):
+    #(test the cheapest conditions first, `is_arm()` imports the `platform` module)
+    if os.path.exists("/usr/bin/Xorg") and is_Debian() and is_arm():
         #Raspbian breaks if we use a different binary..
         return "/usr/bin/Xorg"
     for p in (
@@ -420,13 +427,76 @@ def read_xpra_defaults(username:str|None=None, uid=None, gid=None):
         If the <conf_dir> is not specified, we figure out its location.
     """
     dirs = get_xpra_defaults_dirs(username, uid, gid)
-    defaults = {}
+    #only cache our own config, and not when debugging its contents:
+    use_cache = CONFIG_CACHE and username is None and uid is None and gid is None and not DEBUG_CONFIG_PROPERTIES
+    files = []
     for d in dirs:
-        defaults.update(read_xpra_conf(d))
-        debug(f"read_xpra_defaults: updated defaults with {d}")
+        files += conf_files(d)
+    defaults = None
+    stamps = []
+    if use_cache:
+        stamps = get_config_stamps(files)
+        defaults = load_config_cache(stamps)
+    if defaults is None:
+        defaults = {}
+        for f in files:
+            cd = read_config(f)
+            debug(f"config({f})={cd}")
+            defaults.update(cd)
+        debug(f"read_xpra_defaults: updated defaults with {dirs}")
+        if use_cache:
+            save_config_cache(stamps, defaults)
     may_create_user_config()
     return defaults
 
+def get_config_stamps(files:list[str]) -> list[list]:
+    stamps = []
+    for f in files:
+        try:
+            stat = os.stat(f)
+        except OSError:
+            continue
+        stamps.append([f, stat.st_mtime_ns, stat.st_size])
+    return stamps
+
+def load_config_cache(stamps:list[list]) -> dict[str,Any] | None:
+    """
+        Returns the cached config values,
+        if the cache was generated from the exact same files.
+    """
+    filename = osexpand(CONFIG_CACHE_FILENAME)
+    if not os.path.exists(filename):
+        return None
+    import json
+    try:
+        with open(filename, "r", encoding="utf8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        debug(f"failed to load config cache {filename!r}: {e}")
+        return None
+    if data.get("version")!=CONFIG_CACHE_VERSION or data.get("files")!=stamps:
+        debug(f"config cache {filename!r} is out of date")
+        return None
+    debug(f"loaded config from cache {filename!r}")
+    return data.get("config")
+
+def save_config_cache(stamps:list[list], config:dict[str,Any]) -> None:
+    filename = osexpand(CONFIG_CACHE_FILENAME)
+    import json
+    data = {
+        "version"   : CONFIG_CACHE_VERSION,
+        "files"     : stamps,
+        "config"    : config,
+        }
+    try:
+        os.makedirs(os.path.dirname(filename), mode=0o700, exist_ok=True)
+        tmp = f"{filename}.tmp"
+        with open(tmp, "w", encoding="utf8") as f:
+            json.dump(data, f)
+        os.replace(tmp, filename)
+    except OSError as e:
+        debug(f"failed to save config cache {filename!r}: {e}")
+
 def get_xpra_defaults_dirs(username:str|None=None, uid=None, gid=None):
     from xpra.platform.paths import get_default_conf_dirs, get_system_conf_dirs, get_user_conf_dirs
     # load config files in this order (the later ones override earlier ones):
@@ -0,0 +1,148 @@
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+from time import monotonic
+from threading import Lock
+from collections import deque
+from typing import Any, Callable
+
+from xpra.util import envint, envbool
+from xpra.net.common import PacketType
+from xpra.log import Logger
+
+log = Logger("server", "mouse")
+
+INPUT_FAST_PATH : bool = envbool("XPRA_INPUT_FAST_PATH", True)
+#the main loop priority used for dispatching input events,
+#same as GLib.PRIORITY_HIGH:
+INPUT_PRIORITY : int = envint("XPRA_INPUT_PRIORITY", -100)
+COLLAPSE_MOTION : bool = envbool("XPRA_INPUT_COLLAPSE_MOTION", True)
+
+#all the input packets are dispatched in the order they were received:
+INPUT_PACKET_TYPES : tuple[str, ...] = (
+    "key-action", "key-repeat",
+    "pointer-button", "button-action",
+    "pointer", "pointer-position",
+    )
+#pointer motion packets can replace the previous one for the same device:
+MOTION_PACKET_TYPES : tuple[str, ...] = ("pointer", "pointer-position")
+#the input packets must not overtake these ones,
+#the other packets can be processed in any order relative to the input:
+ORDERED_PACKET_TYPES : tuple[str, ...] = ("focus", "configure-window", "map-window")
+
+
+def get_motion_device(packet_type:str, packet:PacketType) -> int:
+    if packet_type=="pointer":
+        return packet[1]
+    #"pointer-position": the device is optional
+    if len(packet)>=6:
+        return packet[5]
+    return -1
+
+
+class InputDispatcher:
+    """
+        Input packets are queued as soon as they are parsed,
+        and dispatched from a single high priority main loop callback,
+        so they don't have to wait behind the other pending idle callbacks.
+        Pointer motion packets that are superseded before they get dispatched are dropped,
+        but only if no other input packet was received in between,
+        so the key and button events always see the pointer position they were sent with.
+        The fast path is only used when none of the focus, configure or map packets received earlier
+        are still waiting in the main loop's idle queue,
+        so input packets are never processed ahead of the packets they depend on.
+    """
+
+    def __init__(self, schedule:Callable[[Callable],Any]):
+        self.schedule = schedule
+        self.lock = Lock()
+        #(proto, packet_type, handler, packet, received time):
+        self.queue : deque[tuple[Any,str,Callable,PacketType,float]] = deque()
+        self.scheduled = False
+        #number of packets waiting in the main loop's idle queue:
+        self.pending = 0
+        self.dispatched = 0
+        self.collapsed = 0
+        self.max_delay = 0.0
+        self.total_delay = 0.0
+
+    def __repr__(self):
+        return "InputDispatcher"
+
+    def get_info(self) -> dict[str,Any]:
+        n = self.dispatched
+        return {
+            "queued"        : len(self.queue),
+            "pending"       : self.pending,
+            "dispatched"    : n,
+            "collapsed"     : self.collapsed,
+            "delay"         : {
+                "max"   : round(1000*self.max_delay),
+                "avg"   : round(1000*self.total_delay/n) if n else 0,
+                },
+            }
+
+    def wrap(self, callback:Callable) -> Callable:
+        """
+            Keeps track of the packets that the input packets must not overtake
+            while they wait in the idle queue,
+            including the input packets that could not use the fast path,
+            returns the callback to use with `idle_add`.
+        """
+        with self.lock:
+            self.pending += 1
+        def run_pending():
+            try:
+                callback()
+            finally:
+                with self.lock:
+                    self.pending -= 1
+        return run_pending
+
+    def add(self, proto, packet_type:str, handler:Callable, packet:PacketType) -> bool:
+        """
+            this method may be called from any thread,
+            returns False if the packet must go through the idle queue
+        """
+        with self.lock:
+            if self.pending>0:
+                return False
+            if COLLAPSE_MOTION and packet_type in MOTION_PACKET_TYPES and self.queue:
+                lproto, ltype, _, lpacket, received = self.queue[-1]
+                if lproto==proto and ltype==packet_type and \
+                    get_motion_device(ltype, lpacket)==get_motion_device(packet_type, packet):
+                    #keep the original timestamp so the delay statistics remain accurate:
+                    self.queue[-1] = (proto, packet_type, handler, packet, received)
+                    self.collapsed += 1
+                    return True
+            self.queue.append((proto, packet_type, handler, packet, monotonic()))
+            if self.scheduled:
+                return True
+            self.scheduled = True
+        self.schedule(self.dispatch)
+        return True
+
+    def dispatch(self) -> bool:
+        with self.lock:
+            items = tuple(self.queue)
+            self.queue.clear()
+            self.scheduled = False
+        now = monotonic()
+        for proto, packet_type, handler, packet, received in items:
+            delay = now-received
+            self.max_delay = max(self.max_delay, delay)
+            self.total_delay += delay
+            self.dispatched += 1
+            if proto.is_closed():
+                continue
+            try:
+                handler(proto, packet)
+            except Exception:
+                log.error(f"Error processing {packet_type!r} input packet", exc_info=True)
+        return False
+
+    def cleanup(self) -> None:
+        with self.lock:
+            self.queue.clear()
@@ -104,7 +104,15 @@ class MenuProvider:
                 menu_data_updated(True, event.pathname)
             def process_IN_DELETE(self, event):
                 menu_data_updated(False, event.pathname)
-        mask = pyinotify.IN_DELETE | pyinotify.IN_CREATE  #@UndefinedVariable pylint: disable=no-member
+            #package managers usually rename files into place:
+            def process_IN_MOVED_TO(self, event):
+                menu_data_updated(True, event.pathname)
+            def process_IN_MOVED_FROM(self, event):
+                menu_data_updated(False, event.pathname)
+            def process_IN_CLOSE_WRITE(self, event):
+                menu_data_updated(True, event.pathname)
+        # pylint: disable=no-member
+        mask = pyinotify.IN_DELETE | pyinotify.IN_CREATE | pyinotify.IN_MOVED_TO | pyinotify.IN_MOVED_FROM | pyinotify.IN_CLOSE_WRITE  #@UndefinedVariable
         handler = EventHandler()
         self.watch_notifier = pyinotify.ThreadedNotifier(self.watch_manager, handler)
         self.watch_notifier.daemon = True
@@ -166,8 +174,14 @@ class MenuProvider:
             try:
                 if self.menu_data is None or force_reload:
                     from xpra.platform.menu_helper import load_menu  #pylint: disable=import-outside-toplevel
-                    self.menu_data = load_menu()
-                    add_work_item(self.got_menu_data)
+                    #only the modified entries are re-loaded from disk,
+                    #so we may well end up with the same data:
+                    new_menu_data = load_menu()
+                    if new_menu_data!=self.menu_data:
+                        self.menu_data = new_menu_data
+                        add_work_item(self.got_menu_data)
+                    else:
+                        log("menu data is unchanged")
             finally:
                 self.load_lock.release()
         if remove_icons and self.menu_data:
@@ -15,7 +15,12 @@ from xpra.version_util import vtrim
 from xpra.codecs.codec_constants import preforder, STREAM_ENCODINGS
 from xpra.codecs.loader import get_codec, has_codec, codec_versions, load_codec
 from xpra.codecs.video_helper import getVideoHelper
+from xpra.codecs.image_wrapper import get_copy_info
 from xpra.server.mixins.stub_server_mixin import StubServerMixin
+from xpra.server.window.video_context_pool import get_video_context_pool, POOL_TIMEOUT
+from xpra.server.window.thread_budget import get_thread_budget
+from xpra.server.window.image_cache import get_image_cache
+from xpra.server.window.video_scoring import get_pipeline_score_cache
 from xpra.server.source.windows import WindowsMixin
 from xpra.log import Logger
 from xpra.common import FULL_INFO
@@ -45,6 +50,7 @@ class EncodingServer(StubServerMixin):
         self.video_encoders : tuple[str,...] = ()
         self.csc_modules : tuple[str,...] = ()
         self.video = True
+        self.video_context_pool_timer : int = 0
 
     def init(self, opts) -> None:
         self.encoding = opts.encoding
@@ -99,9 +105,19 @@ class EncodingServer(StubServerMixin):
             #load video codecs:
             getVideoHelper().set_modules(video_encoders=self.video_encoders, csc_modules=self.csc_modules)
             getVideoHelper().init()
+            if POOL_TIMEOUT>0:
+                #free the video contexts that are no longer being re-used:
+                self.video_context_pool_timer = self.timeout_add(POOL_TIMEOUT*1000, get_video_context_pool().expire)
         self.init_encodings()
 
     def cleanup(self) -> None:
+        vcpt = self.video_context_pool_timer
+        if vcpt:
+            self.video_context_pool_timer = 0
+            self.source_remove(vcpt)
+        get_video_context_pool().cleanup()
+        get_image_cache().clear()
+        get_pipeline_score_cache().clear()
         getVideoHelper().cleanup()
 
 
@@ -113,9 +129,14 @@ class EncodingServer(StubServerMixin):
     def get_info(self, _proto)  -> dict[str,Any]:
         info = {
             "encodings" : self.get_encoding_info(),
+            "pixel-copies" : get_copy_info(),
+            "image-cache" : get_image_cache().get_info(),
+            "thread-budget" : get_thread_budget().get_info(),
             }
         if self.video:
             info["video"] = getVideoHelper().get_info()
+            info["video"]["context-pool"] = get_video_context_pool().get_info()
+            info["video"]["pipeline-scores"] = get_pipeline_score_cache().get_info()
         if FULL_INFO>0:
             for k,v in codec_versions.items():
                 info.setdefault("encoding", {}).setdefault(k, {})["version"] = vtrim(v)
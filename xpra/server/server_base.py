@@ -12,6 +12,10 @@ from typing import Callable, Any
 
 from xpra.server.server_core import ServerCore
 from xpra.server.background_worker import add_work_item
+from xpra.server.input_dispatch import (
+    InputDispatcher,
+    INPUT_FAST_PATH, INPUT_PRIORITY, INPUT_PACKET_TYPES, ORDERED_PACKET_TYPES,
+    )
 from xpra.common import SSH_AGENT_DISPATCH, FULL_INFO
 from xpra.net.common import may_log_packet, ServerPacketHandlerType, PacketType
 from xpra.os_util import bytestostr, is_socket, WIN32
@@ -107,6 +111,9 @@ class ServerBase(ServerBaseClass):
 
         self._authenticated_packet_handlers : dict[str,Callable] = {}
         self._authenticated_ui_packet_handlers : dict[str,Callable] = {}
+        self.input_dispatcher : InputDispatcher | None = None
+        if INPUT_FAST_PATH:
+            self.input_dispatcher = InputDispatcher(self.schedule_input_dispatch)
 
         self.display_pid : int = 0
         self._server_sources : dict = {}
@@ -145,6 +152,9 @@ class ServerBase(ServerBaseClass):
     def source_remove(self, timer) -> None:
         raise NotImplementedError()
 
+    def schedule_input_dispatch(self, dispatch:Callable) -> None:
+        self.idle_add(dispatch, priority=INPUT_PRIORITY)
+
 
     def server_event(self, *args) -> None:
         for s in self._server_sources.values():
@@ -202,6 +212,8 @@ class ServerBase(ServerBaseClass):
             if c!=ServerCore:
                 log("%s", c.cleanup)
                 c.cleanup(self)
+        if self.input_dispatcher:
+            self.input_dispatcher.cleanup()
 
 
     ######################################################################
@@ -677,6 +689,8 @@ class ServerBase(ServerBaseClass):
                 log("%s.get_info(%s) took %ims", c, proto, int(1000*(cend-cstart)))
 
         up("features",  self.get_features_info())
+        if self.input_dispatcher:
+            up("input-dispatch", self.input_dispatcher.get_info())
         up("network", {
             "sharing"                      : self.sharing is not False,
             "sharing-toggle"               : self.sharing is None,
@@ -958,12 +972,21 @@ class ServerBase(ServerBaseClass):
         handler : Callable | None = None
         try:
             packet_type = bytestostr(packet[0])
+            may_log_packet(False, packet_type, packet)
             def call_handler():
-                may_log_packet(False, packet_type, packet)
                 handler(proto, packet)
             if proto in self._server_sources:
                 handler = self._authenticated_ui_packet_handlers.get(packet_type)
                 if handler:
+                    dispatcher = self.input_dispatcher
+                    if dispatcher:
+                        #input packets skip the idle queue when they can:
+                        if packet_type in INPUT_PACKET_TYPES and dispatcher.add(proto, packet_type, handler, packet):
+                            return
+                        #the input packets that have to wait in the idle queue are counted too,
+                        #so that the ones that follow cannot overtake them:
+                        if packet_type in ORDERED_PACKET_TYPES or packet_type in INPUT_PACKET_TYPES:
+                            call_handler = dispatcher.wrap(call_handler)
                     netlog("process ui packet %s", packet_type)
                     self.idle_add(call_handler)
                     return
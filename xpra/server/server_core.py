@@ -1627,6 +1627,7 @@ class ServerCore:
                 from xpra.net.websockets.protocol import WebSocketProtocol
                 wslog("new_websocket_client(%s) socket=%s", wsh, sock)
                 newsocktype = "wss" if is_ssl else "ws"
+                conn.websocket_deflate = wsh.deflate
                 self.make_protocol(newsocktype, conn, socket_options, WebSocketProtocol)
             scripts = self.get_http_scripts()
             conn.socktype = "wss" if is_ssl else "ws"
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+from typing import Any
+
+from xpra.rectangle import rectangle, add_rectangle, merge_all  #@UnresolvedImport
+from xpra.util import envint
+from xpra.log import Logger
+
+log = Logger("shadow", "damage")
+
+#beyond this number of rectangles, we capture the bounding box instead:
+MAX_DAMAGE_REGIONS : int = envint("XPRA_SHADOW_MAX_DAMAGE_REGIONS", 32)
+
+
+class DamageRegions:
+    """
+        Accumulates the screen areas reported as damaged
+        until the next capture.
+    """
+
+    def __init__(self):
+        self.rectangles : list[rectangle] = []
+        self.pixels : int = 0
+        self.events : int = 0
+        self.merged : int = 0
+        self.captures : int = 0
+        self.captured_pixels : int = 0
+
+    def __repr__(self):
+        return f"DamageRegions({len(self.rectangles)} rectangles, {self.pixels} pixels)"
+
+    def __bool__(self) -> bool:
+        return bool(self.rectangles)
+
+    def add(self, x:int, y:int, width:int, height:int) -> int:
+        """
+            Returns the number of pixels that were not already damaged.
+        """
+        self.events += 1
+        if width<=0 or height<=0:
+            return 0
+        added = add_rectangle(self.rectangles, rectangle(x, y, width, height))
+        self.pixels += added
+        if len(self.rectangles)>MAX_DAMAGE_REGIONS:
+            bbox = merge_all(self.rectangles)
+            log("%i damage rectangles merged into %s", len(self.rectangles), bbox)
+            self.rectangles = [bbox]
+            self.pixels = bbox.width*bbox.height
+            self.merged += 1
+        return added
+
+    def take(self) -> list[rectangle]:
+        """
+            Returns the damaged rectangles and clears them.
+        """
+        rects = self.rectangles
+        if rects:
+            self.rectangles = []
+            self.captures += 1
+            self.captured_pixels += self.pixels
+            self.pixels = 0
+        return rects
+
+    def get_info(self) -> dict[str,Any]:
+        return {
+            "rectangles"        : len(self.rectangles),
+            "pixels"            : self.pixels,
+            "events"            : self.events,
+            "merged"            : self.merged,
+            "captures"          : self.captures,
+            "captured-pixels"   : self.captured_pixels,
+            }
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+from time import monotonic
+from threading import Lock
+from collections import deque
+from typing import Any, Callable, Hashable
+
+from xpra.util import envint
+from xpra.log import Logger
+
+log = Logger("network", "bandwidth")
+
+#how long the bottleneck bandwidth and minimum rtt samples are valid for (in seconds):
+BANDWIDTH_WINDOW : int = max(1, envint("XPRA_BANDWIDTH_WINDOW", 10))
+RTT_WINDOW : int = max(1, envint("XPRA_RTT_WINDOW", 10))
+#allow the senders to go this much faster than the estimated bottleneck bandwidth (in percent),
+#so that we keep probing for more bandwidth:
+PROBE_GAIN : int = max(100, envint("XPRA_BANDWIDTH_PROBE_GAIN", 125))
+#when the minimum rtt expires, slow down for this long (in milliseconds)
+#to drain the network queues and measure it again:
+PROBE_RTT_TIME : int = envint("XPRA_PROBE_RTT_TIME", 200)
+PROBE_RTT_GAIN : int = 50
+#how much data we can have in flight, as a multiple of the bandwidth-delay product:
+INFLIGHT_GAIN : int = 2
+#packets which have not been acknowledged after this delay are forgotten (in seconds):
+INFLIGHT_TIMEOUT : int = envint("XPRA_INFLIGHT_TIMEOUT", 30)
+
+
+class WindowedFilter:
+    """
+        Tracks the best value seen during the last 'window' seconds,
+        the latest best value is kept when all the samples expire.
+    """
+    __slots__ = ("window", "better", "samples")
+
+    def __init__(self, window:float, better:Callable[[float,float],bool]):
+        self.window = window
+        self.better = better
+        #(time, value) pairs, each one better than all the ones that follow it:
+        self.samples : deque[tuple[float,float]] = deque()
+
+    def update(self, now:float, value:float) -> None:
+        samples = self.samples
+        while samples and not self.better(samples[-1][1], value):
+            samples.pop()
+        samples.append((now, value))
+        min_time = now-self.window
+        while len(samples)>1 and samples[0][0]<min_time:
+            samples.popleft()
+
+    def get(self) -> float:
+        if not self.samples:
+            return 0
+        return self.samples[0][1]
+
+
+class BandwidthModel:
+    """
+        A model of the network path to the client, in the style of BBR:
+        the bottleneck bandwidth is the maximum delivery rate measured recently,
+        and the round-trip propagation time is the minimum round-trip time measured recently.
+        The packets are identified by a key when they are sent,
+        and the same key is used when the client acknowledges them.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        #key -> (size, sent, delivered, delivered_time, first_sent_time, app_limited)
+        self.inflight : dict[Hashable,tuple] = {}
+        self.inflight_bytes = 0
+        #total number of bytes delivered, and when the last ones were acknowledged:
+        self.delivered = 0
+        self.delivered_time = 0.0
+        self.first_sent_time = 0.0
+        #set by the sender when it has nothing else queued:
+        self.app_limited = False
+        self.max_bandwidth = WindowedFilter(BANDWIDTH_WINDOW, lambda a, b: a>b)
+        self.min_rtt = 0.0
+        self.min_rtt_time = 0.0
+        self.srtt = 0.0
+        #draining the queues to measure the min rtt again:
+        self.probe_rtt = False
+        self.probe_rtt_start = 0.0
+        self.samples = 0
+        self.lost = 0
+
+    def __repr__(self):
+        return "BandwidthModel(%iKbps, %ims)" % (self.get_bandwidth()//1024, 1000*self.get_min_rtt())
+
+    def is_ready(self) -> bool:
+        return self.samples>0
+
+    def get_bandwidth(self) -> int:
+        """ the bottleneck bandwidth, in bits per second """
+        return int(self.max_bandwidth.get())
+
+    def get_min_rtt(self) -> float:
+        """ the round-trip propagation time, in seconds """
+        return self.min_rtt
+
+    def get_bdp(self) -> int:
+        """ the bandwidth-delay product, in bytes """
+        return int(self.get_bandwidth()*self.get_min_rtt()/8)
+
+    def get_pacing_rate(self, now:float=0) -> int:
+        """ how fast the senders should go, in bits per second """
+        if self.probe_rtt:
+            #the probe starts when the senders slow down:
+            self.probe_rtt_start = self.probe_rtt_start or now or monotonic()
+            return self.get_bandwidth()*PROBE_RTT_GAIN//100
+        return self.get_bandwidth()*PROBE_GAIN//100
+
+    def get_inflight_limit(self) -> int:
+        """ how much data the senders should have in flight, in bytes """
+        bdp = self.get_bdp()
+        if self.probe_rtt:
+            return bdp
+        return bdp*INFLIGHT_GAIN
+
+    def get_queue_delay(self) -> float:
+        """ how much the recent round-trip times exceed the propagation time, in seconds """
+        if not self.samples:
+            return 0
+        return max(0.0, self.srtt-self.get_min_rtt())
+
+    def on_send(self, key:Hashable, size:int, now:float=0) -> None:
+        now = now or monotonic()
+        with self.lock:
+            idle = not self.inflight
+            if idle:
+                #don't count the idle time as part of the delivery interval:
+                self.first_sent_time = self.delivered_time = now
+            else:
+                self.expire_inflight(now)
+            self.inflight_bytes += size
+            #if the link went idle, or we are not sending enough to fill the pipe,
+            #the delivery rate measured for this packet is limited by the sender and not by the network:
+            app_limited = self.app_limited or idle or self.inflight_bytes<self.get_bdp()
+            self.inflight[key] = (size, now, self.delivered, self.delivered_time,
+                                  self.first_sent_time, app_limited)
+
+    def expire_inflight(self, now:float) -> None:
+        min_time = now-INFLIGHT_TIMEOUT
+        for key, entry in tuple(self.inflight.items()):
+            if entry[1]<min_time:
+                self.inflight.pop(key)
+                self.inflight_bytes -= entry[0]
+                self.lost += 1
+
+    def on_lost(self, key:Hashable) -> None:
+        with self.lock:
+            entry = self.inflight.pop(key, None)
+            if entry:
+                self.inflight_bytes -= entry[0]
+                self.lost += 1
+
+    def on_ack(self, key:Hashable, decode_time:float=0, now:float=0) -> int:
+        """
+            Records the delivery of a packet,
+            the 'decode_time' (in seconds) is the time the client spent processing it
+            before sending the acknowledgement.
+            Returns the delivery rate sample, or 0 if this packet did not provide one.
+        """
+        now = now or monotonic()
+        with self.lock:
+            entry = self.inflight.pop(key, None)
+            if not entry:
+                return 0
+            size, sent, delivered, delivered_time, first_sent_time, app_limited = entry
+            self.inflight_bytes -= size
+            ack_time = max(sent, now-decode_time)
+            self.delivered += size
+            self.delivered_time = max(self.delivered_time, ack_time)
+            self.first_sent_time = sent
+            rtt = ack_time-sent
+            if rtt>0:
+                self.update_rtt(now, sent, rtt)
+            send_elapsed = sent-first_sent_time
+            ack_elapsed = self.delivered_time-delivered_time
+            interval = max(send_elapsed, ack_elapsed)
+            #intervals shorter than the rtt are caused by ack compression:
+            if interval<=0 or interval<self.get_min_rtt():
+                return 0
+            rate = int((self.delivered-delivered)*8/interval)
+            #the sender was not using all the bandwidth available,
+            #so this sample can only tell us that there is more, it must never lower the estimate:
+            if app_limited and rate<self.get_bandwidth():
+                return 0
+            self.max_bandwidth.update(now, rate)
+            self.samples += 1
+        log("on_ack(%s, %.1fms) rate=%iKbps, rtt=%.1fms, model=%s",
+            key, decode_time*1000, rate//1024, rtt*1000, self)
+        return rate
+
+    def update_rtt(self, now:float, sent:float, rtt:float) -> None:
+        """ the lock must be held when calling this method """
+        self.srtt = rtt if not self.srtt else (self.srtt*7+rtt)/8
+        expired = self.min_rtt_time>0 and now-self.min_rtt_time>RTT_WINDOW
+        if self.min_rtt==0 or rtt<=self.min_rtt or expired:
+            self.min_rtt = rtt
+            self.min_rtt_time = now
+            #if there is nothing else in flight, this sample did not wait in any queue:
+            if expired and self.inflight_bytes>0 and not self.probe_rtt:
+                log("min rtt expired, probing")
+                self.probe_rtt = True
+                self.probe_rtt_start = 0
+        if self.probe_rtt and self.probe_rtt_start and sent>=self.probe_rtt_start+PROBE_RTT_TIME/1000:
+            #this packet was sent after the queues had time to drain:
+            self.probe_rtt = False
+            self.min_rtt_time = now
+
+    def get_info(self) -> dict[str,Any]:
+        return {
+            "bandwidth"     : self.get_bandwidth(),
+            "min-rtt"       : int(1000*self.get_min_rtt()),
+            "srtt"          : int(1000*self.srtt),
+            "bdp"           : self.get_bdp(),
+            "pacing-rate"   : self.get_bandwidth()*(PROBE_RTT_GAIN if self.probe_rtt else PROBE_GAIN)//100,
+            "probe-rtt"     : self.probe_rtt,
+            "samples"       : self.samples,
+            "lost"          : self.lost,
+            "inflight"      : {
+                "packets"   : len(self.inflight),
+                "bytes"     : self.inflight_bytes,
+                },
+            }
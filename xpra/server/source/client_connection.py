@@ -19,7 +19,9 @@ from xpra.util import notypedict, envbool, envint, typedict, AtomicInteger
 from xpra.net.common import PacketType
 from xpra.net.compression import compressed_wrapper
 from xpra.server.source.source_stats import GlobalPerformanceStatistics
+from xpra.server.source.packet_scheduler import PacketScheduler, PACKET, START_SEND_CB, END_SEND_CB, FAIL_CB, WAIT_FOR_MORE
 from xpra.server.source.stub_source_mixin import StubSourceMixin
+from xpra.server.window.thread_budget import get_thread_budget
 from xpra.log import Logger
 
 log = Logger("server")
@@ -51,6 +53,7 @@ class ClientConnection(StubSourceMixin):
 
     Strategy: if we have 'ordinary_packets' to send, send those.
     When we don't, then send packets from the 'packet_queue'. (compressed pixels or clipboard data)
+    The 'packet_queue' shares the connection fairly between windows, see 'PacketScheduler'.
     See 'next_packet'.
 
     The UI thread calls damage(), which goes into WindowSource and eventually (batching may be involved)
@@ -74,7 +77,7 @@ class ClientConnection(StubSourceMixin):
         #these packets are picked off by the "protocol" via 'next_packet()'
         #format: packet, wid, pixels, start_send_cb, end_send_cb
         #(only packet is required - the rest can be 0/None for clipboard packets)
-        self.packet_queue = deque()
+        self.packet_queue = PacketScheduler()
         # the encode work queue is used by mixins that need to encode data before sending it,
         # ie: encodings and clipboard
         #this queue will hold functions to call to compress data (pixels, clipboard)
@@ -82,7 +85,7 @@ class ClientConnection(StubSourceMixin):
         #the functions should add the packets they generate to the 'packet_queue'
         self.encode_work_queue : SimpleQueue[Union[None,tuple[bool,Callable,tuple[Any,...]]]] = SimpleQueue()
         self.encode_thread = None
-        self.ordinary_packets : list[tuple[PacketType,bool,Callable,Callable]] = []
+        self.ordinary_packets : deque[tuple[PacketType,bool,Callable,Callable]] = deque()
         self.socket_dir = socket_dir
         self.unix_socket_paths = unix_socket_paths
         self.log_disconnect = log_disconnect
@@ -156,14 +159,13 @@ class ClientConnection(StubSourceMixin):
         mmap_size = getattr(self, "mmap_size", 0)
         if mmap_size>0:
             return
-        #calculate soft bandwidth limit based on send congestion data:
+        #calculate soft bandwidth limit based on the network model:
+        #(no limit until we have measured the bandwidth)
         bandwidth_limit = 0
         if BANDWIDTH_DETECTION:
-            bandwidth_limit = self.statistics.avg_congestion_send_speed
-            bandwidthlog("avg_congestion_send_speed=%s", bandwidth_limit)
-            if bandwidth_limit>20*1024*1024:
-                #ignore congestion speed if greater 20Mbps
-                bandwidth_limit = 0
+            model = self.statistics.bandwidth_model
+            bandwidth_limit = model.get_pacing_rate()
+            bandwidthlog("bandwidth model=%s, pacing rate=%s", model, bandwidth_limit)
         if (self.bandwidth_limit or 0)>0:
             #command line options could overrule what we detect?
             bandwidth_limit = min(self.bandwidth_limit, bandwidth_limit)
@@ -262,18 +264,17 @@ class ClientConnection(StubSourceMixin):
         self.queue_encode((optional, fn, args))
 
     def queue_packet(self, packet, wid=0, pixels=0,
-                     start_send_cb=None, end_send_cb=None, fail_cb=None, wait_for_more=False):
+                     start_send_cb=None, end_send_cb=None, fail_cb=None, wait_for_more=False, evict_cb=None):
         """
             Add a new 'draw' packet to the 'packet_queue'.
+            The 'evict_cb' is called if the packet is replaced by a newer one before being sent.
             Note: this code runs in the non-ui thread
         """
         now = monotonic()
         self.statistics.packet_qsizes.append((now, len(self.packet_queue)))
         if wid>0:
-            self.statistics.damage_packet_qpixels.append(
-                (now, wid, sum(x[2] for x in tuple(self.packet_queue) if x[1]==wid))
-                )
-        self.packet_queue.append((packet, wid, pixels, start_send_cb, end_send_cb, fail_cb, wait_for_more))
+            self.statistics.damage_packet_qpixels.append((now, wid, self.packet_queue.get_pixels(wid)))
+        self.packet_queue.add(packet, wid, pixels, start_send_cb, end_send_cb, fail_cb, wait_for_more, evict_cb)
         p = self.protocol
         if p:
             p.source_has_more()
@@ -286,6 +287,14 @@ class ClientConnection(StubSourceMixin):
             to ensure all the queued items get called,
             those that are marked as optional will be skipped when is_closed()
         """
+        budget = get_thread_budget()
+        budget.add_encode_loop()
+        try:
+            self.do_encode_loop(budget)
+        finally:
+            budget.remove_encode_loop()
+
+    def do_encode_loop(self, budget):
         while True:
             item = self.encode_work_queue.get(True)
             if item is None:
@@ -295,6 +304,8 @@ class ClientConnection(StubSourceMixin):
             optional_when_closing, fn, args = item
             if optional_when_closing and self.is_closed():
                 continue
+            #limit the number of encode threads running at the same time:
+            budget.acquire_slot()
             try:
                 fn(*args)
             except Exception as e:
@@ -304,6 +315,8 @@ class ClientConnection(StubSourceMixin):
                 else:
                     log.error("Error during encoding:", exc_info=True)
                 del e
+            finally:
+                budget.release_slot()
             if YIELD:
                 sleep(0)
 
@@ -315,10 +328,19 @@ class ClientConnection(StubSourceMixin):
         synchronous, have_more, will_have_more = True, False, False
         if not self.is_closed():
             if self.ordinary_packets:
-                packet, synchronous, fail_cb, will_have_more = self.ordinary_packets.pop(0)
-            elif self.packet_queue:
-                packet, _, _, start_send_cb, end_send_cb, fail_cb, will_have_more = self.packet_queue.popleft()
+                packet, synchronous, fail_cb, will_have_more = self.ordinary_packets.popleft()
+            else:
+                entry = self.packet_queue.pop()
+                if entry:
+                    packet = entry[PACKET]
+                    start_send_cb = entry[START_SEND_CB]
+                    end_send_cb = entry[END_SEND_CB]
+                    fail_cb = entry[FAIL_CB]
+                    will_have_more = entry[WAIT_FOR_MORE]
             have_more = packet is not None and bool(self.ordinary_packets or self.packet_queue)
+            if start_send_cb:
+                #the delivery rate measured for this packet is limited by what we have to send:
+                self.statistics.bandwidth_model.app_limited = not have_more
         return packet, start_send_cb, end_send_cb, fail_cb, synchronous, have_more, will_have_more
 
     def send(self, *parts, **kwargs):
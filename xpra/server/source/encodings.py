@@ -146,6 +146,10 @@ class EncodingsMixin(StubSourceMixin):
         fullscreen_wids = tuple(wid for wid, source in sources if source is not None and source.fullscreen)
         log("recalculate_delays() wids=%s, focus=%s, maximized=%s, fullscreen=%s",
             wids, focus, maximized_wids, fullscreen_wids)
+        packet_queue = getattr(self, "packet_queue", None)
+        if packet_queue is not None:
+            #the focused window gets a bigger share of the connection:
+            packet_queue.set_focus(focus or 0)
         for wid in wids:
             #this is safe because we only add to this set from other threads:
             self.calculate_window_ids.remove(wid)
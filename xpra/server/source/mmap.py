@@ -39,11 +39,16 @@ class MMAP_Connection(StubSourceMixin):
     def init_state(self) -> None:
         self.mmap = None
         self.mmap_size = 0
+        self.mmap_slots = None
         self.mmap_client_token = 0                   #the token we write that the client may check
         self.mmap_client_token_index = 512
         self.mmap_client_token_bytes = 0
 
     def cleanup(self) -> None:
+        slots = self.mmap_slots
+        if slots:
+            self.mmap_slots = None
+            slots.close()
         mmap = self.mmap
         if mmap:
             self.mmap = None
@@ -84,6 +89,7 @@ class MMAP_Connection(StubSourceMixin):
                 read_mmap_token,
                 write_mmap_token,
                 DEFAULT_TOKEN_BYTES,
+                MMAP_SLOTS, MmapSlots,
                 )
             self.mmap, self.mmap_size = init_server_mmap(mmap_filename, mmap_size)
             log("found client mmap area: %s, %i bytes - min mmap size=%i in '%s'",
@@ -107,9 +113,20 @@ class MMAP_Connection(StubSourceMixin):
                     self.mmap_size = 0
                 else:
                     from xpra.os_util import get_int_uuid
+                    token_min = 0
+                    if c.boolget("slots") and MMAP_SLOTS:
+                        try:
+                            self.mmap_slots = MmapSlots(self.mmap, self.mmap_size)
+                        except ValueError as e:
+                            log("not using mmap slots: %s", e)
+                        else:
+                            #the client's token is no longer needed, the slots start free:
+                            self.mmap_slots.clear()
+                            #don't write our token over the slot flags:
+                            token_min = self.mmap_slots.data_offset
                     self.mmap_client_token = get_int_uuid()
                     self.mmap_client_token_bytes = DEFAULT_TOKEN_BYTES
-                    self.mmap_client_token_index = randint(0, self.mmap_size-self.mmap_client_token_bytes)
+                    self.mmap_client_token_index = randint(token_min, self.mmap_size-self.mmap_client_token_bytes)
                     write_mmap_token(self.mmap,
                                      self.mmap_client_token,
                                      self.mmap_client_token_index,
@@ -128,6 +145,8 @@ class MMAP_Connection(StubSourceMixin):
                 "token_index"   : self.mmap_client_token_index,
                 "token_bytes"   : self.mmap_client_token_bytes,
             })
+        if self.mmap_slots:
+            mmap_caps["slot-size"] = self.mmap_slots.slot_size
         return {"mmap" : mmap_caps}
 
     def get_info(self) -> dict[str,Any]:
@@ -137,5 +156,6 @@ class MMAP_Connection(StubSourceMixin):
                 "enabled"       : self.mmap is not None,
                 "size"          : self.mmap_size,
                 "filename"      : self.mmap_filename or "",
+                "slots"         : self.mmap_slots.get_info() if self.mmap_slots else {},
                 },
             }
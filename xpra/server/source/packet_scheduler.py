@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+from time import monotonic
+from threading import Lock
+from collections import deque
+from typing import Any, Callable, Iterator
+
+from xpra.util import envint, envbool
+from xpra.net.compression import Compressed, LargeStructure
+from xpra.log import Logger
+
+log = Logger("network")
+
+FAIR_SCHEDULER : bool = envbool("XPRA_FAIR_SCHEDULER", True)
+#number of bytes each window can send per round:
+SCHEDULER_QUANTUM : int = max(1024, envint("XPRA_SCHEDULER_QUANTUM", 64*1024))
+#video frames are sent ahead of their turn once they have waited this long (in milliseconds):
+VIDEO_FRAME_DEADLINE : int = envint("XPRA_VIDEO_FRAME_DEADLINE", 40)
+EVICT_OBSOLETE : bool = envbool("XPRA_EVICT_OBSOLETE_PACKETS", True)
+#the flow used for packets that do not belong to a window (clipboard, icons, ..)
+#gets a bigger share since those packets are usually small and interactive:
+DEFAULT_FLOW_WEIGHT : int = envint("XPRA_SCHEDULER_DEFAULT_WEIGHT", 2)
+#the window that has the focus gets a bigger share than the other windows:
+FOCUS_FLOW_WEIGHT : int = envint("XPRA_SCHEDULER_FOCUS_WEIGHT", 2)
+
+INFINITY = float("inf")
+#these encodings can be replaced by a newer update without side effects:
+#(unlike video frames, scroll packets or mmap areas)
+EVICTABLE_ENCODINGS : tuple[str,...] = ("rgb24", "rgb32", "png", "png/L", "png/P", "webp", "jpeg", "jpega", "avif")
+
+#the first 7 fields are the ones used by the previous FIFO queue:
+PACKET, WID, PIXELS, START_SEND_CB, END_SEND_CB, FAIL_CB, WAIT_FOR_MORE, SIZE, DEADLINE, EVICT_CB = range(10)
+
+
+def get_packet_size(packet) -> int:
+    """ a good enough estimate of the number of bytes this packet will use """
+    size = 64
+    for item in packet:
+        if isinstance(item, (bytes, bytearray, memoryview, Compressed, LargeStructure)):
+            size += len(item)
+    return size
+
+
+def get_draw_region(packet) -> tuple[int,int,int,int] | None:
+    """ returns the region painted by this draw packet, if it can be evicted """
+    if packet[0]!="draw" or packet[6] not in EVICTABLE_ENCODINGS:
+        return None
+    client_options = packet[10]
+    #the client must receive the tile cache instructions:
+    if any(str(k).startswith("tile") for k in client_options.keys()) or "scaled_size" in client_options:
+        return None
+    return packet[2], packet[3], packet[4], packet[5]
+
+
+def contains(outer, inner) -> bool:
+    x, y, w, h = outer
+    ix, iy, iw, ih = inner
+    return ix>=x and iy>=y and ix+iw<=x+w and iy+ih<=y+h
+
+
+class Flow:
+    __slots__ = ("key", "queue", "deficit", "weight", "pixels")
+
+    def __init__(self, key:int, weight:int=1):
+        self.key = key
+        self.queue : deque[tuple] = deque()
+        self.deficit = 0
+        self.weight = weight
+        self.pixels = 0
+
+    def __repr__(self):
+        return f"Flow({self.key} : {len(self.queue)})"
+
+
+class PacketScheduler:
+    """
+        Holds the packets ready for sending (already encoded) until the network layer asks for them.
+        Each window gets its own queue, and the queues are serviced using deficit round robin,
+        so a window streaming video cannot starve the other windows.
+        The window that has the focus gets a bigger share.
+        Video frames which have been waiting longer than their deadline are sent first,
+        the window's share is then reduced accordingly in the following rounds.
+        Picture updates which are fully covered by a newer queued update for the same window
+        are dropped before they get sent.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.flows : dict[int,Flow] = {}
+        #the flows that have packets queued, in round robin order:
+        self.active : deque[Flow] = deque()
+        self.focus = 0
+        self.count = 0
+        self.evicted = 0
+        self.evicted_bytes = 0
+        self.deadline_sends = 0
+
+    def __repr__(self):
+        return f"PacketScheduler({self.count} packets)"
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[tuple]:
+        with self.lock:
+            entries = tuple(entry for flow in self.active for entry in flow.queue)
+        return iter(entries)
+
+    def get_info(self) -> dict[str,Any]:
+        with self.lock:
+            flows = dict((flow.key, {
+                "packets"   : len(flow.queue),
+                "pixels"    : flow.pixels,
+                "deficit"   : flow.deficit,
+                "weight"    : flow.weight,
+                }) for flow in self.active)
+        return {
+            "fair"          : FAIR_SCHEDULER,
+            "quantum"       : SCHEDULER_QUANTUM,
+            "packets"       : self.count,
+            "evicted"       : {
+                "packets"   : self.evicted,
+                "bytes"     : self.evicted_bytes,
+                },
+            "deadline-sends" : self.deadline_sends,
+            "focus"         : self.focus,
+            "flows"         : flows,
+            }
+
+    def get_weight(self, key:int) -> int:
+        if key==0:
+            return DEFAULT_FLOW_WEIGHT
+        if key==self.focus:
+            return max(1, FOCUS_FLOW_WEIGHT)
+        return 1
+
+    def set_focus(self, wid:int) -> None:
+        with self.lock:
+            if wid==self.focus:
+                return
+            old = self.focus
+            self.focus = wid
+            for key in (old, wid):
+                flow = self.flows.get(key)
+                if flow and key:
+                    flow.weight = self.get_weight(key)
+
+    def get_pixels(self, wid:int) -> int:
+        flow = self.flows.get(wid if FAIR_SCHEDULER else 0)
+        if not flow:
+            return 0
+        if FAIR_SCHEDULER:
+            return flow.pixels
+        return sum(entry[PIXELS] for entry in tuple(flow.queue) if entry[WID]==wid)
+
+    def add(self, packet, wid:int=0, pixels:int=0,
+            start_send_cb:Callable|None=None, end_send_cb:Callable|None=None, fail_cb:Callable|None=None,
+            wait_for_more:bool=False, evict_cb:Callable|None=None) -> None:
+        size = get_packet_size(packet)
+        deadline = INFINITY
+        if packet[0]=="draw" and "frame" in packet[10]:
+            deadline = monotonic()+VIDEO_FRAME_DEADLINE/1000
+        entry = (packet, wid, pixels, start_send_cb, end_send_cb, fail_cb, wait_for_more, size, deadline, evict_cb)
+        key = wid if FAIR_SCHEDULER else 0
+        evicted : list[tuple] = []
+        with self.lock:
+            flow = self.flows.get(key)
+            if not flow:
+                flow = self.flows[key] = Flow(key, self.get_weight(key))
+            if not flow.queue:
+                self.active.append(flow)
+            elif EVICT_OBSOLETE and wid>0:
+                region = get_draw_region(packet)
+                if region:
+                    evicted = self.evict_obsolete(flow, wid, region)
+            flow.queue.append(entry)
+            flow.pixels += pixels
+            self.count += 1
+        for entry in evicted:
+            log("evicted obsolete %s packet for window %i: %s",
+                entry[PACKET][6], wid, entry[PACKET][2:6])
+            cb = entry[EVICT_CB]
+            if cb:
+                with log.trap_error("Error calling %s", cb):
+                    cb()
+
+    def evict_obsolete(self, flow:Flow, wid:int, region) -> list[tuple]:
+        """ the lock must be held when calling this method """
+        #packets queued before a packet we cannot evict must be kept,
+        #ie: a "scroll" packet copies the pixels painted by the packets before it:
+        start = 0
+        for i, entry in enumerate(flow.queue):
+            if entry[WID]==wid and not get_draw_region(entry[PACKET]):
+                start = i+1
+        keep : deque[tuple] = deque()
+        evicted = []
+        for i, entry in enumerate(flow.queue):
+            old_region = i>=start and entry[WID]==wid and get_draw_region(entry[PACKET])
+            if old_region and contains(region, old_region):
+                evicted.append(entry)
+                flow.pixels -= entry[PIXELS]
+                self.evicted_bytes += entry[SIZE]
+            else:
+                keep.append(entry)
+        if evicted:
+            flow.queue = keep
+            self.count -= len(evicted)
+            self.evicted += len(evicted)
+        return evicted
+
+    def pop(self) -> tuple | None:
+        with self.lock:
+            if not self.active:
+                return None
+            flow = self.get_overdue_flow()
+            if flow:
+                self.deadline_sends += 1
+            else:
+                flow = self.get_next_flow()
+            entry = flow.queue.popleft()
+            flow.deficit -= entry[SIZE]
+            flow.pixels -= entry[PIXELS]
+            self.count -= 1
+            if not flow.queue:
+                #idle flows do not accumulate credit:
+                self.active.remove(flow)
+                del self.flows[flow.key]
+            return entry
+
+    def get_overdue_flow(self) -> Flow | None:
+        """
+            Returns the flow with the most overdue video frame,
+            unless it has already used more than its share for this round.
+        """
+        now = monotonic()
+        best = None
+        best_deadline = now
+        for flow in self.active:
+            deadline = flow.queue[0][DEADLINE]
+            if deadline<=best_deadline and flow.deficit>-SCHEDULER_QUANTUM*flow.weight:
+                best = flow
+                best_deadline = deadline
+        return best
+
+    def get_next_flow(self) -> Flow:
+        while True:
+            flow = self.active[0]
+            if flow.deficit>=flow.queue[0][SIZE]:
+                return flow
+            #give it its share for the next round and move on:
+            flow.deficit += SCHEDULER_QUANTUM*flow.weight
+            self.active.rotate(-1)
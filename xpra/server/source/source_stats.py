@@ -15,6 +15,7 @@ from xpra.server.cystats import (                                           #@Un
     logp, calculate_time_weighted_average, calculate_size_weighted_average, #@UnresolvedImport
     calculate_for_target, time_weighted_average, queue_inspect,             #@UnresolvedImport
     )
+from xpra.server.source.bandwidth_model import BandwidthModel
 from xpra.simple_stats import get_list_stats
 from xpra.log import Logger
 
@@ -75,6 +76,7 @@ class GlobalPerformanceStatistics:
         self.frame_total_latency = d()                      #how long it takes from the time we get a damage event
                                                             #until we get the ack back from the client
                                                             #(wid, event_time, no_of_pixels, latency)
+        self.bandwidth_model = BandwidthModel()             #bottleneck bandwidth and round-trip time estimates
         self.client_load = None
         self.last_congestion_time = 0
         self.congestion_value = 0
@@ -208,6 +210,13 @@ class GlobalPerformanceStatistics:
             mayaddfac("mmap-area", {"full-pct" : int(100*full)}, logp(3*full), (3*full)**2)
         if self.congestion_value>0:
             mayaddfac("congestion", {}, 1+self.congestion_value, self.congestion_value*10)
+        #more data in flight than the network path can hold means that we are filling up buffers:
+        model = self.bandwidth_model
+        limit = model.get_inflight_limit()
+        if limit>0 and model.inflight_bytes>limit:
+            excess = model.inflight_bytes/limit
+            mayaddfac("network-inflight", {"inflight" : model.inflight_bytes, "limit" : limit},
+                      logp(excess), min(1, (excess-1)/4))
         return factors
 
     def get_connection_info(self) -> dict[str,Any]:
@@ -226,6 +235,7 @@ class GlobalPerformanceStatistics:
                 "avg-send-speed"        : self.avg_congestion_send_speed,
                 "elapsed-time"          : int(now-self.last_congestion_time),
                 },
+            "model"             : self.bandwidth_model.get_info(),
             }
         if self.min_client_latency is not None:
             info["latency"] = {"absmin" : int(self.min_client_latency*1000)}
@@ -18,6 +18,7 @@ except ImportError:
 from xpra.server.source.stub_source_mixin import StubSourceMixin
 from xpra.server.window.metadata import make_window_metadata
 from xpra.server.window.filters import get_window_filter
+from xpra.server.window.image_cache import get_image_cache, get_image_key
 from xpra.net.compression import Compressed
 from xpra.os_util import memoryview_to_bytes, bytestostr
 from xpra.util import typedict, envint, envbool, DEFAULT_METADATA_SUPPORTED, NotificationID
@@ -39,6 +40,15 @@ MIN_BANDWIDTH = envint("XPRA_MIN_BANDWIDTH", 5*1024*1024)
 PROPERTIES_DEBUG = [x.strip() for x in os.environ.get("XPRA_WINDOW_PROPERTIES_DEBUG", "").split(",")]
 
 
+def cursor_to_png(w:int, h:int, pixels:bytes) -> tuple[bytes,int]:
+    img = Image.frombytes("RGBA", (w, h), pixels, "raw", "BGRA", w*4, 1)
+    buf = BytesIO()
+    img.save(buf, "PNG")
+    pngdata = buf.getvalue()
+    buf.close()
+    return pngdata, len(pngdata)
+
+
 class WindowsMixin(StubSourceMixin):
     """
     Handle window forwarding:
@@ -199,6 +209,7 @@ class WindowsMixin(StubSourceMixin):
         info = {"damage"    : {
                                "compression_queue"      : {"size" : {"current" : self.encode_queue_size()}},
                                "packet_queue"           : {"size" : {"current" : len(self.packet_queue)}},
+                               "packet_scheduler"       : self.packet_queue.get_info(),
                                "packet_queue_pixels"    : pqpi,
                                },
             }
@@ -285,11 +296,9 @@ class WindowsMixin(StubSourceMixin):
             cpixels : bytes | Compressed = memoryview_to_bytes(pixels)
             if "png" in self.cursor_encodings and Image:
                 cursorlog(f"do_send_cursor() got {len(cpixels)} bytes of pixel data for {w}x{h} cursor named {name!r}")
-                img = Image.frombytes("RGBA", (w, h), cpixels, "raw", "BGRA", w*4, 1)
-                buf = BytesIO()
-                img.save(buf, "PNG")
-                pngdata = buf.getvalue()
-                buf.close()
+                #the same cursor image is often sent more than once, and to more than one client:
+                key = get_image_key("cursor", cpixels, w, h, "png")
+                pngdata = get_image_cache().get_or_encode(key, lambda : cursor_to_png(w, h, cpixels))
                 cpixels = Compressed("png cursor", pngdata, can_inline=True)
                 encoding = "png"
                 if SAVE_CURSORS:
@@ -562,7 +571,8 @@ class WindowsMixin(StubSourceMixin):
             batch_config = self.make_batch_config(wid, window)
             ww, wh = window.get_dimensions()
             bandwidth_limit = self.bandwidth_limit
-            mmap = getattr(self, "mmap", None)
+            #when the client supports it, windows share the slots of the mmap area:
+            mmap = getattr(self, "mmap_slots", None) or getattr(self, "mmap", None)
             mmap_size = getattr(self, "mmap_size", 0)
             av_sync = getattr(self, "av_sync", False)
             av_sync_delay = getattr(self, "av_sync_delay", 0)
@@ -586,6 +596,7 @@ class WindowsMixin(StubSourceMixin):
                               self.rgb_formats,
                               self.default_encoding_options,
                               mmap, mmap_size, bandwidth_limit, self.jitter)
+            ws.get_client_pointer_position = self.get_client_pointer_position
             ws.init_encoders()
             self.window_sources[wid] = ws
             if len(self.window_sources)>1:
@@ -594,6 +605,11 @@ class WindowsMixin(StubSourceMixin):
         return ws
 
 
+    def get_client_pointer_position(self) -> tuple[int,int] | None:
+        #only available when the input mixin is also used:
+        return getattr(self, "mouse_last_position", None)
+
+
     def damage(self, wid:int, window, x:int, y:int, w:int, h:int, options=None) -> None:
         """
             Main entry point from the window manager,
@@ -263,7 +263,7 @@ def get_target_quality(window_dimensions, batch,
     bandwidth_q = 1
     if bandwidth_limit>0:
         #below 10Mbps, lower the quality
-        bandwidth_q = int(100*sqrt(bandwidth_limit/(10.0*1000*1000)))
+        bandwidth_q = sqrt(bandwidth_limit/(10.0*1000*1000))
 
     #congestion factor:
     gcv = global_statistics.congestion_value
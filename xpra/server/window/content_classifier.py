@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+from time import monotonic
+from typing import Any, Iterable
+
+from xpra.util import envint, envbool
+from xpra.log import Logger
+
+log = Logger("encoding")
+
+#classify each screen update using its pixels, rather than relying only on the window's content-type:
+CONTENT_CLASSIFIER : bool = envbool("XPRA_CONTENT_CLASSIFIER", True)
+#smaller regions are cheap enough to send with whatever encoding was chosen:
+CLASSIFIER_MIN_PIXELS : int = envint("XPRA_CLASSIFIER_MIN_PIXELS", 64*64)
+CLASSIFIER_SAMPLES : int = envint("XPRA_CLASSIFIER_SAMPLES", 16384)
+#text and user interface elements use few colours and have large flat areas:
+TEXT_MAX_COLORS : int = envint("XPRA_CLASSIFIER_TEXT_MAX_COLORS", 64)
+TEXT_MIN_FLAT : int = envint("XPRA_CLASSIFIER_TEXT_MIN_FLAT", 60)
+#sharp edges on a flat background, ie: anti-aliased text:
+TEXT_MIN_EDGES : int = envint("XPRA_CLASSIFIER_TEXT_MIN_EDGES", 10)
+TEXT_MIN_EDGE_FLAT : int = envint("XPRA_CLASSIFIER_TEXT_MIN_EDGE_FLAT", 40)
+#photographic content uses many colours and has very few flat areas:
+PICTURE_MIN_COLORS : int = envint("XPRA_CLASSIFIER_PICTURE_MIN_COLORS", 512)
+PICTURE_MAX_FLAT : int = envint("XPRA_CLASSIFIER_PICTURE_MAX_FLAT", 25)
+#regions updated more often than this (per second) are treated as video:
+VIDEO_MIN_RATE : int = envint("XPRA_CLASSIFIER_VIDEO_MIN_RATE", 10)
+VIDEO_MIN_COLORS : int = envint("XPRA_CLASSIFIER_VIDEO_MIN_COLORS", 256)
+#how far back we look when calculating the change frequency, in seconds:
+CHANGE_WINDOW : float = 1.0
+#text only switches from a lossy encoding to a lossless one
+#if the region is small, if the quality is already high,
+#or if the lossless pixels can be sent quickly enough (in milliseconds):
+TEXT_LOSSLESS_MAX_PIXELS : int = envint("XPRA_CLASSIFIER_TEXT_LOSSLESS_MAX_PIXELS", 256*256)
+TEXT_LOSSLESS_MIN_QUALITY : int = envint("XPRA_CLASSIFIER_TEXT_LOSSLESS_MIN_QUALITY", 80)
+TEXT_LOSSLESS_MAX_DELAY : int = envint("XPRA_CLASSIFIER_TEXT_LOSSLESS_MAX_DELAY", 50)
+#compressed size of lossless text, in bytes per pixel:
+TEXT_LOSSLESS_BPP : float = 1.0
+
+TEXT : str = "text"
+PICTURE : str = "picture"
+VIDEO : str = "video"
+CONTENT_TYPES : tuple[str,...] = (TEXT, PICTURE, VIDEO)
+
+try:
+    from xpra.server.window.region_stats import get_pixel_stats  #@UnresolvedImport
+except ImportError as e:
+    log("content classifier is not available: %s", e)
+    get_pixel_stats = None
+
+
+def classify(colors:int, edges:float, flat:float, change_rate:float=0) -> str:
+    """
+        Returns the type of content based on the pixel statistics:
+        * colors: estimate of the number of distinct colours
+        * edges: ratio of pixels with a sharp transition
+        * flat: ratio of pixels identical to their neighbour
+        * change_rate: how many times per second this area is updated
+        Returns an empty string when the statistics are inconclusive.
+    """
+    if colors<=TEXT_MAX_COLORS or flat*100>=TEXT_MIN_FLAT:
+        return TEXT
+    if edges*100>=TEXT_MIN_EDGES and flat*100>=TEXT_MIN_EDGE_FLAT:
+        return TEXT
+    if change_rate>=VIDEO_MIN_RATE and colors>=VIDEO_MIN_COLORS:
+        return VIDEO
+    if colors>=PICTURE_MIN_COLORS and flat*100<=PICTURE_MAX_FLAT:
+        return PICTURE
+    return ""
+
+
+def allow_lossless_text(pixels:int, quality:int, rate:int=0) -> bool:
+    """
+        Lossless encodings use more bandwidth, so text regions only switch to them
+        when that cannot defeat the congestion control:
+        * pixels: the size of the region
+        * quality: the quality the lossy encoding would have used
+        * rate: the bandwidth available in bits per second, or zero if unknown
+    """
+    if pixels<=TEXT_LOSSLESS_MAX_PIXELS or quality>=TEXT_LOSSLESS_MIN_QUALITY:
+        return True
+    if rate<=0:
+        return False
+    return pixels*TEXT_LOSSLESS_BPP*8*1000/rate<=TEXT_LOSSLESS_MAX_DELAY
+
+
+def get_change_rate(damage_events:Iterable[tuple], x:int, y:int, w:int, h:int, now:float=0) -> float:
+    """
+        How many times per second this area has been updated recently,
+        using the (time, x, y, w, h) damage events.
+    """
+    min_time = (now or monotonic())-CHANGE_WINDOW
+    count = 0
+    for event_time, ex, ey, ew, eh in tuple(damage_events):
+        if event_time<min_time:
+            continue
+        if ex<x+w and x<ex+ew and ey<y+h and y<ey+eh:
+            count += 1
+    return count/CHANGE_WINDOW
+
+
+class ContentClassifier:
+    """
+        Classifies the screen updates of a window
+        and keeps track of the results.
+    """
+
+    def __init__(self):
+        self.counts : dict[str,int] = dict((content_type, 0) for content_type in CONTENT_TYPES)
+        self.unknown = 0
+        self.elapsed = 0.0
+
+    def classify_image(self, image, damage_events:Iterable[tuple]=()) -> str:
+        if get_pixel_stats is None:
+            return ""
+        w = image.get_width()
+        h = image.get_height()
+        if w*h<CLASSIFIER_MIN_PIXELS:
+            return ""
+        start = monotonic()
+        stats = get_pixel_stats(image, CLASSIFIER_SAMPLES)
+        if not stats:
+            return ""
+        rate = get_change_rate(damage_events, image.get_target_x(), image.get_target_y(), w, h, start)
+        content_type = classify(*stats, rate)
+        end = monotonic()
+        self.elapsed += end-start
+        if content_type:
+            self.counts[content_type] += 1
+        else:
+            self.unknown += 1
+        log("classify_image(%s) stats=%s, change rate=%i/s, content=%r, took %.1fms",
+            image, stats, rate, content_type, 1000*(end-start))
+        return content_type
+
+    def get_info(self) -> dict[str,Any]:
+        info : dict[str,Any] = dict(self.counts)
+        info["unknown"] = self.unknown
+        info["elapsed"] = int(1000*self.elapsed)
+        return info
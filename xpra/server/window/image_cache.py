@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+from hashlib import blake2b
+from threading import Lock
+from collections import OrderedDict
+from typing import Any, Callable
+
+from xpra.util import envint, envbool
+from xpra.log import Logger
+
+log = Logger("encoding")
+
+IMAGE_CACHE : bool = envbool("XPRA_IMAGE_CACHE", True)
+#maximum amount of encoded data we keep, in bytes:
+IMAGE_CACHE_SIZE : int = envint("XPRA_IMAGE_CACHE_SIZE", 16*1024*1024)
+
+
+def get_image_key(kind:str, pixels, *params) -> tuple:
+    """
+        The key for the encoded version of these pixels,
+        the parameters must include everything that affects the encoding,
+        ie: dimensions, pixel format, target size, encoding.
+    """
+    digest = blake2b(pixels, digest_size=16).digest()
+    return (kind, digest) + params
+
+
+class EncodedImageCache:
+    """
+        Server-wide cache for small images that are encoded the same way
+        for all the clients and windows: cursors and window icons.
+        The entries are keyed by the hash of the source pixels and the encoding parameters,
+        the least recently used entries are evicted first.
+    """
+    __slots__ = ("lock", "entries", "max_size", "size", "hits", "misses", "evicted")
+
+    def __init__(self, max_size:int=IMAGE_CACHE_SIZE):
+        self.lock = Lock()
+        #key -> (value, size)
+        self.entries : OrderedDict[tuple,tuple[Any,int]] = OrderedDict()
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def __repr__(self):
+        return f"EncodedImageCache({len(self.entries)} entries)"
+
+    def get_info(self) -> dict[str,Any]:
+        lookups = self.hits+self.misses
+        return {
+            "enabled"   : IMAGE_CACHE,
+            "entries"   : len(self.entries),
+            "size"      : self.size,
+            "max-size"  : self.max_size,
+            "hits"      : self.hits,
+            "misses"    : self.misses,
+            "hit-rate"  : round(100*self.hits/lookups) if lookups else 0,
+            "evicted"   : self.evicted,
+            }
+
+    def get(self, key:tuple) -> Any:
+        if not IMAGE_CACHE:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return entry[0]
+
+    def set(self, key:tuple, value, size:int) -> None:
+        if not IMAGE_CACHE or size>self.max_size:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old:
+                self.size -= old[1]
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.size>self.max_size:
+                _, (_, esize) = self.entries.popitem(last=False)
+                self.size -= esize
+                self.evicted += 1
+
+    def get_or_encode(self, key:tuple, encode:Callable) -> Any:
+        """
+            Returns the cached value for this key,
+            or calls 'encode' to get a new one.
+            The encode function returns the value and its size in bytes.
+            The value is not cached if the encode function returns None.
+        """
+        value = self.get(key)
+        if value is not None:
+            log("image cache hit for %s", key[:1]+key[2:])
+            return value
+        value, size = encode()
+        if value is not None:
+            self.set(key, value, size)
+        return value
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+singleton = None
+def get_image_cache() -> EncodedImageCache:
+    global singleton
+    if singleton is None:
+        singleton = EncodedImageCache()
+    return singleton
@@ -8,7 +8,7 @@
 
 import struct
 
-from xpra.util import envbool, repr_ellipsized, csv
+from xpra.util import envbool, envint, repr_ellipsized, csv
 from xpra.log import Logger
 log = Logger("encoding", "scroll")
 
@@ -18,11 +18,15 @@ from xpra.rectangle import rectangle
 
 
 cdef int DEBUG = envbool("XPRA_SCROLL_DEBUG", False)
+#keep a copy of the rows so we can detect horizontal scrolling:
+cdef int HORIZONTAL = envbool("XPRA_SCROLL_HORIZONTAL", True)
+#the maximum horizontal distance we look for:
+cdef int MAX_HORIZONTAL_DISTANCE = envint("XPRA_SCROLL_MAX_HORIZONTAL_DISTANCE", 256)
 
 
 from libc.stdint cimport uint8_t, int16_t, uint16_t, uint32_t, uint64_t, uintptr_t
-from libc.stdlib cimport free, malloc
-from libc.string cimport memset
+from libc.stdlib cimport free
+from libc.string cimport memset, memcpy, memcmp
 
 
 MIN_LINE_COUNT = 2
@@ -39,6 +43,28 @@ cdef da(uint64_t *a, uint16_t l):
 cdef dd(uint16_t *d, uint16_t l):
     return csv([h(d[i]) for i in range(l)])
 
+cdef inline int16_t find_hdistance(const uint8_t *prev, const uint8_t *cur,
+                                   uint16_t width, uint8_t bpp, uint16_t max_distance) nogil:
+    """
+        Find the horizontal distance that moves the row 'prev' to 'cur',
+        returns 0 if there is none.
+    """
+    cdef uint16_t d
+    if max_distance>=width:
+        max_distance = width-1
+    for d in range(1, max_distance+1):
+        if memcmp(cur+d*bpp, prev, (width-d)*bpp)==0:
+            return d
+        if memcmp(cur, prev+d*bpp, (width-d)*bpp)==0:
+            return -d
+    return 0
+
+cdef inline uint8_t match_hdistance(const uint8_t *prev, const uint8_t *cur,
+                                    uint16_t width, uint8_t bpp, int16_t distance) nogil:
+    if distance>0:
+        return memcmp(cur+distance*bpp, prev, (width-distance)*bpp)==0
+    return memcmp(cur, prev-distance*bpp, (width+distance)*bpp)==0
+
 
 cdef class ScrollData:
 
@@ -47,11 +73,19 @@ cdef class ScrollData:
     cdef uint16_t *distances
     cdef uint64_t *a1        #checksums of reference picture
     cdef uint64_t *a2        #checksums of latest picture
+    cdef uint8_t *line_state #temporary buffer used by get_scroll_values
+    cdef uint8_t *rows       #copy of the latest picture's rows, for horizontal detection
     cdef uint8_t matched
     cdef int16_t x
     cdef int16_t y
     cdef uint16_t width
     cdef uint16_t height
+    cdef uint8_t bpp
+    #rows checksummed by the last update:
+    cdef uint16_t hashed
+    #horizontal scrolling detected by the last update:
+    cdef int16_t hdistance
+    cdef uint16_t hmatches
 
     def __cinit__(self, int16_t x=0, int16_t y=0, uint16_t width=0, uint16_t height=0):
         self.x = x
@@ -62,67 +96,181 @@ cdef class ScrollData:
     def __repr__(self):
         return "ScrollDistances(%ix%i)" % (self.width, self.height)
 
+    cdef void push_checksums(self):
+        """
+            Copy the latest checksums into the reference array,
+            the arrays are allocated on first use and re-used after that.
+        """
+        cdef size_t asize = self.height*sizeof(uint64_t)
+        if self.a2==NULL:
+            self.a2 = <uint64_t*> memalign(asize)
+            assert self.a2!=NULL, "checksum memory allocation failed"
+            memset(self.a2, 0, asize)
+            return
+        if self.a1==NULL:
+            self.a1 = <uint64_t*> memalign(asize)
+            assert self.a1!=NULL, "checksum memory allocation failed"
+        memcpy(self.a1, self.a2, asize)
+
     #only used by the unit tests:
     def test_update(self, arr):
-        if self.a1:
-            free(self.a1)
-            self.a1 = NULL
-        if self.a2:
-            self.a1 = self.a2
-            self.a2 = NULL
         cdef uint16_t l = len(arr)
-        cdef size_t asize = l*(sizeof(uint64_t))
-        self.a2 = <uint64_t*> memalign(asize)
-        assert self.a2!=NULL, "checksum memory allocation failed"
+        if l!=self.height:
+            self.free()
+            self.height = l
+        self.push_checksums()
         for i,v in enumerate(arr):
             self.a2[i] = <uint64_t> abs(v)
 
-    def update(self, pixels, int16_t x, int16_t y, uint16_t width, uint16_t height, uint32_t rowstride, uint8_t bpp=4):
+    def update(self, pixels, int16_t x, int16_t y, uint16_t width, uint16_t height, uint32_t rowstride, uint8_t bpp=4,
+               damaged_rows=None):
         """
             Add a new image to compare with,
             checksum its rows into a2,
             and push existing values (if we had any) into a1.
+            If the geometry has not changed, `damaged_rows` can be used
+            to specify the only (start, count) row ranges that may have been modified,
+            the other rows keep their existing checksums
+            (unless they have been invalidated).
         """
         if DEBUG:
-            log("%s.update%s a1=%#x, a2=%#x, distances=%#x, current size: %ix%i", self, (repr_ellipsized(pixels), x, y, width, height, rowstride, bpp), <uintptr_t> self.a1, <uintptr_t> self.a2, <uintptr_t> self.distances, self.width, self.height)
+            log("%s.update%s a1=%#x, a2=%#x, distances=%#x, current size: %ix%i", self, (repr_ellipsized(pixels), x, y, width, height, rowstride, bpp, damaged_rows), <uintptr_t> self.a1, <uintptr_t> self.a2, <uintptr_t> self.distances, self.width, self.height)
         assert width>0 and height>0, "invalid dimensions: %ix%i" % (width, height)
-        #scroll area can move within the window:
-        self.x = x
-        self.y = y
-        #but cannot change size (checksums would not match):
-        if height!=self.height or width!=self.width:
+        #scroll area cannot change size (checksums would not match):
+        if height!=self.height or width!=self.width or bpp!=self.bpp:
             if self.a1!=NULL or self.a2!=NULL or self.distances!=NULL:
                 log("new image size: %ix%i (was %ix%i), clearing reference checksums", width, height, self.width, self.height)
                 self.free()
             self.width = width
             self.height = height
-        #this is a new picture, shift a2 into a1 if we have it:
-        if self.a1:
-            free(self.a1)
-            self.a1 = NULL
-        if self.a2:
-            self.a1 = self.a2
-            self.a2 = NULL
+            self.bpp = bpp
+        cdef uint8_t has_rows = self.rows!=NULL
+        #if the scroll area moved within the window, the rows we have not seen may have changed:
+        cdef uint8_t incremental = damaged_rows is not None and self.a2!=NULL and x==self.x and y==self.y and (has_rows or not HORIZONTAL)
+        self.x = x
+        self.y = y
+        self.push_checksums()
         cdef size_t row_len = width*bpp
-        #allocate new checksum array:
-        assert self.a2==NULL
-        cdef size_t asize = height*(sizeof(uint64_t))
-        self.a2 = <uint64_t*> memalign(asize)
-        assert self.a2!=NULL, "checksum memory allocation failed"
-        #checksum each line of the pixel array:
+        if HORIZONTAL and self.rows==NULL:
+            self.rows = <uint8_t*> memalign(row_len*height)
+            assert self.rows!=NULL, "row memory allocation failed"
+        #the ranges of rows we have to checksum:
+        cdef uint16_t i
+        ranges = []
+        if incremental:
+            for start, count in damaged_rows:
+                end = min(height, start+count)
+                start = max(0, start)
+                if end>start:
+                    ranges.append((start, end))
+            #rows that have been invalidated need to be checksummed again:
+            start = -1
+            for i in range(height):
+                if self.a2[i]==0:
+                    if start<0:
+                        start = i
+                elif start>=0:
+                    ranges.append((start, i))
+                    start = -1
+            if start>=0:
+                ranges.append((start, height))
+        else:
+            ranges.append((0, height))
+        #checksum those lines of the pixel array:
         cdef Py_ssize_t min_buf_len = rowstride*height
+        cdef uint64_t *a1 = self.a1
         cdef uint64_t *a2 = self.a2
-        cdef uint16_t i
+        cdef uint8_t *rows = self.rows
+        cdef uint16_t max_hdistance = MAX_HORIZONTAL_DISTANCE
+        cdef uint16_t rstart, rend
+        cdef uint16_t hashed = 0
+        cdef int16_t hdistance = 0
+        cdef uint16_t hmatches = 0
+        cdef uint8_t hfailed = a1==NULL or not has_rows
+        cdef uint64_t v
         cdef uint8_t *buf
+        cdef uint8_t *row
         with buffer_context(pixels) as bc:
             buf = <uint8_t*> (<uintptr_t> int(bc))
             assert len(bc)>=min_buf_len, "buffer length=%i is too small for %ix%i with rowstride %i, should be %i" % (
                     len(bc), width, height, rowstride, min_buf_len)
             assert row_len<=rowstride, "invalid row length: %ix%i=%i but rowstride is %i" % (width, bpp, width*bpp, rowstride)
-            with nogil:
-                for i in range(height):
-                    a2[i] = xxh3(buf, row_len)
-                    buf += rowstride
+            for rstart, rend in ranges:
+                with nogil:
+                    for i in range(rstart, rend):
+                        row = buf+i*rowstride
+                        v = xxh3(row, row_len)
+                        if v==a2[i] and has_rows:
+                            #unchanged
+                            continue
+                        hashed += 1
+                        a2[i] = v
+                        if rows==NULL:
+                            continue
+                        if not hfailed and a1[i]!=0:
+                            #this row has changed, try to find a horizontal distance:
+                            if hdistance==0:
+                                hdistance = find_hdistance(rows+i*row_len, row, width, bpp, max_hdistance)
+                                hfailed = hdistance==0
+                            else:
+                                hfailed = not match_hdistance(rows+i*row_len, row, width, bpp, hdistance)
+                            hmatches += 1
+                        memcpy(rows+i*row_len, row, row_len)
+        if hfailed:
+            hdistance = 0
+            hmatches = 0
+        self.hashed = hashed
+        self.hdistance = hdistance
+        self.hmatches = hmatches
+        if DEBUG:
+            log("update: checksummed %i rows from %s, horizontal distance=%i (%i matches)",
+                hashed, ranges, hdistance, hmatches)
+
+    def get_update_info(self):
+        """
+            The number of rows that were checksummed by the last update,
+            and the horizontal scrolling distance we have detected with its match count.
+        """
+        return self.hashed, self.hdistance, self.hmatches
+
+    def get_horizontal_scroll(self):
+        """
+            If the last update was detected as a horizontal scroll,
+            return the distance and two dictionaries:
+            * the lines which have moved by this distance
+            * the lines that need to be repainted
+            Unchanged lines are not included.
+            Otherwise, return None.
+        """
+        if self.a1==NULL or self.a2==NULL or self.hdistance==0 or self.hmatches==0:
+            return None
+        cdef uint64_t *a1 = self.a1
+        cdef uint64_t *a2 = self.a2
+        moved = {}
+        repaint = {}
+        cdef uint16_t i
+        cdef uint16_t start = 0, count = 0
+        cdef uint8_t state = 0, line_state
+        for i in range(self.height+1):
+            if i==self.height:
+                line_state = 0
+            elif a1[i]==0:
+                line_state = 2
+            elif a1[i]!=a2[i]:
+                line_state = 1
+            else:
+                line_state = 0
+            if line_state==state:
+                count += 1
+                continue
+            if state==1:
+                moved[start] = count
+            elif state==2:
+                repaint[start] = count
+            state = line_state
+            start = i
+            count = 1
+        return self.hdistance, moved, repaint
 
 
     def calculate(self, uint16_t max_distance=1000):
@@ -192,8 +340,10 @@ cdef class ScrollData:
         cdef uint16_t l = self.height
         cdef size_t asize = l*sizeof(uint8_t)
         #use a temporary buffer to track the lines we have already dealt with:
-        cdef uint8_t *line_state = <uint8_t*> malloc(asize)
-        assert line_state!=NULL, "state map memory allocation failed"
+        if self.line_state==NULL:
+            self.line_state = <uint8_t*> memalign(asize)
+            assert self.line_state!=NULL, "state map memory allocation failed"
+        cdef uint8_t *line_state = self.line_state
         #find the best values (highest match count):
         with nogil:
             memset(line_state, 0, asize)
@@ -228,31 +378,28 @@ cdef class ScrollData:
         #and the list of matching lines in a dictionary:
         # {line-start : count, ..}
         cdef uint16_t start = 0, count = 0
-        try:
-            scrolls = {}
-            #starting with the highest matches
-            for i in reversed(sorted(scroll_hits.keys())):
-                v = scroll_hits[i]
-                for scroll in v:
-                    #find matching lines:
-                    line_defs = self.match_distance(line_state, scroll, MIN_LINE_COUNT)
-                    if line_defs:
-                        scrolls[scroll] = line_defs
-            #same for the unmatched lines:
-            #all the lines in tmp which have not been set by match_distance()
-            line_defs = {}
-            for i in range(l):
-                if line_state[i]==0:
-                    if count==0:
-                        start = i
-                    count += 1
-                elif count>0:
-                    line_defs[start] = count
-                    count = 0
-            if count>0:
+        scrolls = {}
+        #starting with the highest matches
+        for i in reversed(sorted(scroll_hits.keys())):
+            v = scroll_hits[i]
+            for scroll in v:
+                #find matching lines:
+                line_defs = self.match_distance(line_state, scroll, MIN_LINE_COUNT)
+                if line_defs:
+                    scrolls[scroll] = line_defs
+        #same for the unmatched lines:
+        #all the lines in tmp which have not been set by match_distance()
+        line_defs = {}
+        for i in range(l):
+            if line_state[i]==0:
+                if count==0:
+                    start = i
+                count += 1
+            elif count>0:
                 line_defs[start] = count
-        finally:
-            free(line_state)
+                count = 0
+        if count>0:
+            line_defs[start] = count
         return scrolls, line_defs
 
     cdef match_distance(self, uint8_t *line_state, int16_t distance, const uint8_t min_line_count):
@@ -362,3 +509,13 @@ cdef class ScrollData:
         if ptr:
             self.a2 = NULL
             free(ptr)
+        ptr = <void*> self.line_state
+        if ptr:
+            self.line_state = NULL
+            free(ptr)
+        ptr = <void*> self.rows
+        if ptr:
+            self.rows = NULL
+            free(ptr)
+        self.hdistance = 0
+        self.hmatches = 0
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import os
+from math import sqrt
+from typing import Iterable
+
+from xpra.util import envint, envbool
+from xpra.rectangle import rectangle, add_rectangle, remove_rectangle  #@UnresolvedImport
+
+#send the auto-refresh as tiles, using the spare bandwidth only:
+PROGRESSIVE_REFRESH : bool = envbool("XPRA_PROGRESSIVE_REFRESH", True)
+REFRESH_TILE_SIZE : int = max(64, envint("XPRA_REFRESH_TILE_SIZE", 256))
+#minimum delay between two batches of tiles, in milliseconds:
+REFRESH_TICK : int = max(10, envint("XPRA_REFRESH_TICK", 50))
+#optional intermediate quality steps before the final refresh quality, ie: "80,90"
+REFRESH_QUALITY_STEPS : tuple[int,...] = tuple(int(x) for x in
+                                                os.environ.get("XPRA_REFRESH_QUALITY_STEPS", "").split(",")
+                                                if x.strip().isdigit())
+#bytes per pixel used for estimating the size of the tiles until we have statistics:
+DEFAULT_BYTES_PER_PIXEL : float = 1.0
+
+
+def split_tiles(regions:Iterable[rectangle], tile_size:int=REFRESH_TILE_SIZE) -> list[rectangle]:
+    """
+        Splits the regions using a fixed grid,
+        so that overlapping regions do not produce overlapping tiles.
+    """
+    cells : dict[tuple[int,int],list[rectangle]] = {}
+    for region in regions:
+        for ty in range(region.y//tile_size, (region.y+region.height-1)//tile_size+1):
+            for tx in range(region.x//tile_size, (region.x+region.width-1)//tile_size+1):
+                tile = region.intersection(tx*tile_size, ty*tile_size, tile_size, tile_size)
+                if tile:
+                    add_rectangle(cells.setdefault((tx, ty), []), tile)
+    return [tile for tiles in cells.values() for tile in tiles]
+
+
+def order_tiles(tiles:Iterable[rectangle], pointer:tuple[int,int] | None=None,
+                recent:Iterable[tuple[float,rectangle]]=(), tile_size:int=REFRESH_TILE_SIZE) -> list[rectangle]:
+    """
+        The tiles closest to the pointer come first,
+        then the ones which were updated most recently.
+    """
+    recent = tuple(recent)
+    def importance(tile:rectangle) -> tuple[int,float]:
+        distance = 0
+        if pointer:
+            dx = tile.x+tile.width//2-pointer[0]
+            dy = tile.y+tile.height//2-pointer[1]
+            distance = int(sqrt(dx*dx+dy*dy))//tile_size
+        last_update = max((t for t, r in recent if r.intersects_rect(tile)), default=0)
+        return distance, -last_update
+    return sorted(tiles, key=importance)
+
+
+def plan_tiles(tiles:Iterable[rectangle], final_quality:int,
+               steps:Iterable[int]=REFRESH_QUALITY_STEPS) -> list[tuple[rectangle,int]]:
+    """
+        Returns the list of tiles to send with the quality to use for each one,
+        all the tiles are sent at each intermediate quality step before the final pass.
+    """
+    tiles = tuple(tiles)
+    qualities = sorted(q for q in set(steps) if 0<q<final_quality)+[final_quality]
+    return [(tile, quality) for quality in qualities for tile in tiles]
+
+
+def remove_tiles(plan:list[tuple[rectangle,int]], region:rectangle) -> list[tuple[rectangle,int]]:
+    """ returns the plan without the parts that intersect the region """
+    new_plan = []
+    for tile, quality in plan:
+        if tile.intersects_rect(region):
+            pieces = [tile]
+            remove_rectangle(pieces, region)
+            new_plan += [(piece, quality) for piece in pieces]
+        else:
+            new_plan.append((tile, quality))
+    return new_plan
+
+
+def get_refresh_budget(model, bandwidth_limit:int, interval:float, min_budget:int=1) -> int:
+    """
+        How many bytes we can send for the refresh during the next 'interval' seconds,
+        without competing with the other screen updates.
+        The budget is never lower than 'min_budget', ie: one tile,
+        so that the refresh always makes progress even when the link looks busy.
+        Returns -1 when we don't know anything about the network.
+    """
+    if model and model.is_ready():
+        #what the link can carry during this interval,
+        #once the data already in flight has been delivered:
+        return max(min_budget, int(model.get_bandwidth()*interval/8)-model.inflight_bytes)
+    if bandwidth_limit>0:
+        #no model yet, keep half of the limit for the other updates:
+        return max(min_budget, int(bandwidth_limit*interval/8/2))
+    return -1
+
+
+def take_batch(plan:list[tuple[rectangle,int]], budget:int, bytes_per_pixel:float,
+               max_tiles:int) -> tuple[list[rectangle],int,list[tuple[rectangle,int]]]:
+    """
+        Takes the tiles which fit in the budget from the start of the plan,
+        they all use the same quality.
+        Returns the tiles, their quality and the rest of the plan.
+    """
+    if not plan or budget==0:
+        return [], 0, plan
+    quality = plan[0][1]
+    tiles : list[rectangle] = []
+    cost = 0
+    for tile, q in plan:
+        if q!=quality or len(tiles)>=max_tiles:
+            break
+        cost += int(tile.width*tile.height*bytes_per_pixel)
+        #always send at least one tile when we have some budget:
+        if budget>0 and tiles and cost>budget:
+            break
+        tiles.append(tile)
+    return tiles, quality, plan[len(tiles):]
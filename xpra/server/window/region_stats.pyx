@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+#cython: boundscheck=False, wraparound=False
+
+from xpra.log import Logger
+log = Logger("encoding")
+
+from xpra.buffers.membuf cimport buffer_context #pylint: disable=syntax-error
+
+from libc.stdint cimport uint8_t, uint32_t, uintptr_t
+from libc.string cimport memset
+
+
+#size of the hash set used for counting the colours, must be a power of 2:
+DEF COLOR_SLOTS = 8192
+#the colour count saturates at this value:
+DEF MAX_COLORS = 4096
+#sum of the absolute differences of the colour channels:
+DEF EDGE_THRESHOLD = 96
+
+MAX_COLORS_COUNTED = MAX_COLORS
+
+DEFAULT_SAMPLES = 16384
+
+
+cdef inline uint32_t pixel_hash(uint32_t v) nogil:
+    v ^= v >> 16
+    v *= 0x7feb352d
+    v ^= v >> 15
+    return v & (COLOR_SLOTS-1)
+
+cdef inline int pixel_diff(const uint8_t *p1, const uint8_t *p2) nogil:
+    #only the colour channels, not the alpha or padding byte:
+    return abs(<int> p1[0]-<int> p2[0]) + abs(<int> p1[1]-<int> p2[1]) + abs(<int> p1[2]-<int> p2[2])
+
+
+def get_pixel_stats(image, unsigned int max_samples=DEFAULT_SAMPLES):
+    """
+        Samples the pixels of a 32-bit image on a regular grid and returns:
+        * an estimate of the number of distinct colours (saturates at MAX_COLORS_COUNTED)
+        * the edge density: ratio of samples that differ a lot from the pixel on their right
+        * the flat ratio: ratio of samples identical to the pixel on their right
+        Returns None if the image is not in a format we can sample.
+    """
+    cdef unsigned int width = image.get_width()
+    cdef unsigned int height = image.get_height()
+    cdef unsigned int stride = image.get_rowstride()
+    pixel_format = image.get_pixel_format()
+    if len(pixel_format)!=4 or width<2 or height<1 or max_samples==0:
+        return None
+    #skip the alpha or padding byte when it comes first, ie: "XRGB":
+    cdef unsigned int offset = int(pixel_format[0] in "AX")
+    #sample every 'step' pixels in both dimensions:
+    cdef unsigned int step = 1
+    while (width//step)*(height//step)>max_samples:
+        step += 1
+    cdef uint32_t colors[COLOR_SLOTS]
+    memset(colors, 0, sizeof(colors))
+    cdef unsigned int ncolors = 0
+    cdef unsigned int samples = 0
+    cdef unsigned int edges = 0
+    cdef unsigned int flat = 0
+    cdef unsigned int x, y, slot
+    cdef int d
+    cdef uint32_t v
+    cdef const uint8_t *row
+    cdef const uint8_t *p
+    cdef uintptr_t buf
+    pixels = image.get_pixels()
+    with buffer_context(pixels) as bc:
+        if len(bc)<stride*(height-1)+width*4:
+            raise ValueError(f"pixel buffer is too small: {len(bc)} bytes for {width}x{height} with stride {stride}")
+        buf = <uintptr_t> int(bc)
+        with nogil:
+            for y in range(0, height, step):
+                row = <const uint8_t *> (buf + y*stride)
+                for x in range(0, width-1, step):
+                    p = row + x*4 + offset
+                    samples += 1
+                    d = pixel_diff(p, p+4)
+                    if d==0:
+                        flat += 1
+                    elif d>=EDGE_THRESHOLD:
+                        edges += 1
+                    if ncolors>=MAX_COLORS:
+                        continue
+                    #the hash set uses zero for empty slots, so always set the top bit:
+                    v = p[0] | (<uint32_t> p[1]) << 8 | (<uint32_t> p[2]) << 16 | 0x80000000
+                    slot = pixel_hash(v)
+                    while colors[slot]!=0 and colors[slot]!=v:
+                        slot = (slot+1) & (COLOR_SLOTS-1)
+                    if colors[slot]==0:
+                        colors[slot] = v
+                        ncolors += 1
+    if samples==0:
+        return None
+    return ncolors, edges/samples, flat/samples
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import os
+from threading import Lock, Semaphore
+from weakref import WeakKeyDictionary
+from typing import Any
+
+from xpra.util import envint, envbool
+from xpra.log import Logger
+
+log = Logger("encoding")
+
+THREAD_BUDGET : bool = envbool("XPRA_THREAD_BUDGET", True)
+#the number of threads shared by all the encoders of all the connections:
+ENCODER_THREADS : int = envint("XPRA_ENCODER_THREADS", os.cpu_count() or 1)
+#no single video encoder gets more than this:
+MAX_ENCODER_THREADS : int = envint("XPRA_MAX_ENCODER_THREADS", 8)
+#how many encode threads may be running at the same time,
+#the default leaves half the budget for the video encoders:
+ENCODE_SLOTS : int = envint("XPRA_ENCODE_SLOTS", max(1, ENCODER_THREADS//2))
+#the focused window's weight is multiplied by this value:
+FOCUS_WEIGHT : int = envint("XPRA_THREAD_BUDGET_FOCUS_WEIGHT", 4)
+#re-create a video pipeline when its allocation changes by this factor:
+REBALANCE_RATIO : int = envint("XPRA_THREAD_BUDGET_REBALANCE_RATIO", 2)
+
+
+def get_weight(focused:bool, pixels:int, fps:int) -> int:
+    """
+        Large windows updated frequently need more threads,
+        and the focused window comes first.
+    """
+    weight = max(1, pixels//(256*256)) * max(1, min(fps, 60))
+    if focused:
+        weight *= FOCUS_WEIGHT
+    return weight
+
+
+def allocate(total:int, weights:dict, max_threads:int=MAX_ENCODER_THREADS) -> dict:
+    """
+        Distributes 'total' threads proportionally to the weights,
+        every key gets at least one thread and at most 'max_threads'.
+    """
+    if not weights:
+        return {}
+    alloc = dict((key, 1) for key in weights)
+    spare = total-len(weights)
+    while spare>0:
+        #only the keys which can still use more threads:
+        candidates = dict((key, weight) for key, weight in weights.items() if alloc[key]<max_threads)
+        if not candidates:
+            break
+        total_weight = sum(candidates.values()) or 1
+        #give each candidate its share, rounded down:
+        given = 0
+        for key, weight in candidates.items():
+            n = min(max_threads-alloc[key], spare*weight//total_weight)
+            alloc[key] += n
+            given += n
+        spare -= given
+        if given==0:
+            #shares were all rounded down to zero, so hand out the remaining threads by weight:
+            for key in sorted(candidates, key=candidates.get, reverse=True)[:spare]:
+                alloc[key] += 1
+            break
+    return alloc
+
+
+def needs_rebalance(current:int, allocated:int) -> bool:
+    """
+        Changing the number of threads requires a new encoder context,
+        so only do it when the difference is significant.
+    """
+    if current<=0 or allocated<=0:
+        return False
+    return current>=allocated*REBALANCE_RATIO or allocated>=current*REBALANCE_RATIO
+
+
+class ThreadBudget:
+    """
+        Shares the encoder threads between all the video windows
+        of all the connections, according to their weight.
+        Also limits how many encode threads can be running at the same time.
+    """
+    __slots__ = ("lock", "weights", "allocations", "encoder_threads", "total", "max_threads",
+                 "slots", "slot_count", "encode_loops", "rebalanced")
+
+    def __init__(self, total:int=ENCODER_THREADS, max_threads:int=MAX_ENCODER_THREADS, slots:int=ENCODE_SLOTS):
+        self.lock = Lock()
+        #window source -> weight
+        self.weights : WeakKeyDictionary = WeakKeyDictionary()
+        self.allocations : WeakKeyDictionary = WeakKeyDictionary()
+        #window source -> number of threads its current encoder was created with
+        self.encoder_threads : WeakKeyDictionary = WeakKeyDictionary()
+        self.total = max(1, total)
+        self.max_threads = max(1, max_threads)
+        self.slot_count = max(1, slots)
+        self.slots = Semaphore(self.slot_count)
+        self.encode_loops = 0
+        self.rebalanced = 0
+
+    def __repr__(self):
+        return f"ThreadBudget({self.total} threads, {len(self.weights)} encoders)"
+
+    def get_video_threads(self) -> int:
+        #the encode threads that may be running use some of the budget:
+        return max(1, self.total-min(self.slot_count, self.encode_loops))
+
+    def update(self, source, weight:int) -> None:
+        with self.lock:
+            if self.weights.get(source)==weight:
+                return
+            self.weights[source] = weight
+            self.rebalance()
+
+    def remove(self, source) -> None:
+        with self.lock:
+            self.encoder_threads.pop(source, None)
+            if self.weights.pop(source, None) is None:
+                return
+            self.allocations.pop(source, None)
+            self.rebalance()
+
+    def rebalance(self) -> None:
+        #must be called with the lock held
+        alloc = allocate(self.get_video_threads(), dict(self.weights), self.max_threads)
+        self.allocations.clear()
+        self.allocations.update(alloc)
+        self.rebalanced += 1
+        log("rebalance() %s", dict((repr(k), v) for k, v in alloc.items()))
+
+    def get_threads(self, source, weight:int=1) -> int:
+        """
+            Returns the number of threads allocated to this window source,
+            adding it to the budget with the given weight if needed.
+        """
+        if not THREAD_BUDGET:
+            return 0
+        with self.lock:
+            if source not in self.weights:
+                self.weights[source] = weight
+                self.rebalance()
+            return self.allocations.get(source, 1)
+
+    def set_encoder_threads(self, source, threads:int) -> None:
+        """
+            Records the number of threads used by the encoder just created for this window source,
+            the encoder keeps using them until it is re-created.
+        """
+        with self.lock:
+            if threads>0:
+                self.encoder_threads[source] = threads
+            else:
+                self.encoder_threads.pop(source, None)
+
+    def get_encoder_threads(self, source) -> int:
+        with self.lock:
+            return self.encoder_threads.get(source, 0)
+
+    def should_recreate(self, source) -> bool:
+        """
+            Returns True if the encoder of this window source
+            uses a number of threads too different from its current allocation.
+        """
+        if not THREAD_BUDGET:
+            return False
+        with self.lock:
+            current = self.encoder_threads.get(source, 0)
+            allocated = self.allocations.get(source, 0)
+        return needs_rebalance(current, allocated)
+
+    def add_encode_loop(self) -> None:
+        with self.lock:
+            self.encode_loops += 1
+            self.rebalance()
+
+    def remove_encode_loop(self) -> None:
+        with self.lock:
+            self.encode_loops = max(0, self.encode_loops-1)
+            self.rebalance()
+
+    def acquire_slot(self) -> None:
+        if THREAD_BUDGET:
+            self.slots.acquire()
+
+    def release_slot(self) -> None:
+        if THREAD_BUDGET:
+            self.slots.release()
+
+    def get_info(self) -> dict[str,Any]:
+        with self.lock:
+            weights = dict(self.weights)
+            allocations = dict(self.allocations)
+            encoder_threads = dict(self.encoder_threads)
+        return {
+            "enabled"       : THREAD_BUDGET,
+            "threads"       : self.total,
+            "video-threads" : self.get_video_threads(),
+            "max-threads"   : self.max_threads,
+            "encode-slots"  : self.slot_count,
+            "encode-loops"  : self.encode_loops,
+            "rebalanced"    : self.rebalanced,
+            "encoders"      : {
+                i : {
+                    ""          : repr(source),
+                    "weight"    : weight,
+                    "threads"   : allocations.get(source, 0),
+                    "encoder-threads" : encoder_threads.get(source, 0),
+                    } for i, (source, weight) in enumerate(weights.items())
+                },
+            }
+
+
+singleton = None
+def get_thread_budget() -> ThreadBudget:
+    global singleton
+    if singleton is None:
+        singleton = ThreadBudget()
+    return singleton
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+from hashlib import blake2b
+from threading import Lock
+from collections import OrderedDict
+from typing import Any
+
+from xpra.util import envint, envbool
+from xpra.log import Logger
+
+log = Logger("encoding")
+
+TILE_CACHE : bool = envbool("XPRA_TILE_CACHE", True)
+#maximum amount of encoded data we ask each client window to keep, in bytes:
+TILE_CACHE_SIZE : int = envint("XPRA_TILE_CACHE_SIZE", 32*1024*1024)
+#smaller updates are cheap enough to send again:
+TILE_CACHE_MIN_PIXELS : int = envint("XPRA_TILE_CACHE_MIN_PIXELS", 64*64)
+#only these encodings can be replayed by the client:
+TILE_CACHE_ENCODINGS : tuple[str,...] = ("png", "png/L", "png/P", "webp", "rgb24", "rgb32")
+
+
+def get_tile_hash(image) -> bytes:
+    """
+        The hash of the source pixels of this image,
+        including everything that affects the encoding.
+    """
+    h = blake2b(digest_size=16)
+    w = image.get_width()
+    rowstride = image.get_rowstride()
+    params = (w, image.get_height(), rowstride, image.get_pixel_format(), image.get_depth())
+    h.update(repr(params).encode("latin1"))
+    h.update(image.get_pixels())
+    return h.digest()
+
+
+def is_lossless(coding:str, client_options:dict) -> bool:
+    if coding.startswith("rgb"):
+        return True
+    if client_options.get("scaled_size") or client_options.get("csc"):
+        return False
+    if coding.startswith("png"):
+        return True
+    return client_options.get("quality", 0)>=100
+
+
+class TileCache:
+    """
+        Keeps track of the tiles held by a client window,
+        so that we can send a reference to the tile instead of the pixels.
+        The client never evicts tiles on its own:
+        we tell it which tiles to drop when we need to make room,
+        so both sides always agree on the contents of the cache.
+    """
+    __slots__ = ("lock", "entries", "max_size", "size", "reset",
+                 "hits", "misses", "added", "evicted", "bytes_saved")
+
+    def __init__(self, max_size:int=TILE_CACHE_SIZE):
+        self.lock = Lock()
+        #hash -> size of the encoded data held by the client
+        self.entries : OrderedDict[bytes,int] = OrderedDict()
+        self.max_size = max_size
+        self.size = 0
+        #the client must drop all its tiles:
+        self.reset = False
+        self.hits = 0
+        self.misses = 0
+        self.added = 0
+        self.evicted = 0
+        self.bytes_saved = 0
+
+    def __repr__(self):
+        return f"TileCache({len(self.entries)} entries)"
+
+    def get_info(self) -> dict[str,Any]:
+        lookups = self.hits+self.misses
+        return {
+            "entries"       : len(self.entries),
+            "size"          : self.size,
+            "max-size"      : self.max_size,
+            "hits"          : self.hits,
+            "misses"        : self.misses,
+            "hit-rate"      : round(100*self.hits/lookups) if lookups else 0,
+            "added"         : self.added,
+            "evicted"       : self.evicted,
+            "bytes-saved"   : self.bytes_saved,
+            }
+
+    def lookup(self, key:bytes) -> bool:
+        """ returns True if the client holds this tile """
+        with self.lock:
+            size = self.entries.get(key)
+            if size is None:
+                self.misses += 1
+                return False
+            self.entries.move_to_end(key)
+            self.hits += 1
+            self.bytes_saved += size
+        return True
+
+    def add(self, key:bytes, size:int) -> tuple[bytes,...] | None:
+        """
+            Records a tile that the client is going to keep,
+            returns the list of tiles it must evict to make room for it,
+            or None if this tile should not be cached.
+        """
+        if size>self.max_size//4:
+            return None
+        evict = []
+        with self.lock:
+            if key in self.entries:
+                return None
+            self.entries[key] = size
+            self.size += size
+            self.added += 1
+            while self.size>self.max_size:
+                ekey, esize = self.entries.popitem(last=False)
+                self.size -= esize
+                self.evicted += 1
+                evict.append(ekey)
+        return tuple(evict)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+            self.reset = True
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+from time import monotonic
+from threading import Lock
+from weakref import WeakKeyDictionary
+from typing import Any
+
+from xpra.util import envint, envbool
+from xpra.log import Logger
+
+log = Logger("video", "encoding")
+
+VIDEO_CONTEXT_POOL : bool = envbool("XPRA_VIDEO_CONTEXT_POOL", True)
+#maximum number of idle contexts we keep around:
+POOL_SIZE : int = envint("XPRA_VIDEO_CONTEXT_POOL_SIZE", 8)
+#idle contexts are freed after this many seconds:
+POOL_TIMEOUT : int = envint("XPRA_VIDEO_CONTEXT_POOL_TIMEOUT", 10)
+
+#these options can be changed on a live context,
+#so they must not be part of the pool key:
+VOLATILE_OPTIONS : tuple[str,...] = ("speed", "quality", "bandwidth-limit")
+
+
+def hashable_options(options) -> tuple:
+    return tuple(sorted((str(k), repr(v)) for k,v in (options or {}).items() if k not in VOLATILE_OPTIONS))
+
+def get_csc_key(csc_type:str, src_width:int, src_height:int, src_format:str,
+                dst_width:int, dst_height:int, dst_format:str) -> tuple:
+    return ("csc", csc_type, src_width, src_height, src_format, dst_width, dst_height, dst_format)
+
+def get_encoder_key(codec_type:str, encoding:str, width:int, height:int, src_format:str, options) -> tuple:
+    return ("encoder", codec_type, encoding, width, height, src_format, hashable_options(options))
+
+
+class VideoContextPool:
+    """
+        Keeps recently released csc and video encoder contexts
+        so that a window (or another window with the same geometry)
+        can re-use them instead of paying the initialization cost again.
+        Contexts are keyed by codec type, colorspace, dimensions and options,
+        idle contexts are freed after POOL_TIMEOUT seconds.
+        Video encoders can only be pooled if they can restart their stream,
+        (they must implement `reset_stream()`), csc contexts have no state.
+    """
+    __slots__ = ("lock", "keys", "idle", "max_size", "timeout",
+                 "hits", "misses", "released", "rejected", "evicted")
+
+    def __init__(self, max_size:int=POOL_SIZE, timeout:int=POOL_TIMEOUT):
+        self.lock = Lock()
+        #the key for each context we know about:
+        self.keys : WeakKeyDictionary = WeakKeyDictionary()
+        #idle contexts, oldest first: (key, context, release-time)
+        self.idle : list[tuple[tuple,Any,float]] = []
+        self.max_size = max_size
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.released = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    def __repr__(self):
+        return f"VideoContextPool({len(self.idle)} idle)"
+
+    def get_info(self) -> dict[str,Any]:
+        with self.lock:
+            idle = tuple(self.idle)
+        now = monotonic()
+        return {
+            "enabled"   : VIDEO_CONTEXT_POOL,
+            "size"      : self.max_size,
+            "timeout"   : self.timeout,
+            "idle"      : len(idle),
+            "hits"      : self.hits,
+            "misses"    : self.misses,
+            "released"  : self.released,
+            "rejected"  : self.rejected,
+            "evicted"   : self.evicted,
+            "contexts"  : {
+                i : {
+                    ""      : str(key[1]),
+                    "type"  : key[0],
+                    "key"   : key[2:],
+                    "age"   : int(1000*(now-released_at)),
+                    } for i, (key, _, released_at) in enumerate(idle)
+                },
+            }
+
+    def acquire(self, key:tuple):
+        """
+            Returns an idle context matching this key, or None.
+        """
+        if not VIDEO_CONTEXT_POOL:
+            return None
+        expired = self.expire_idle()
+        ctx = None
+        with self.lock:
+            for i, (ikey, ictx, _) in enumerate(self.idle):
+                if ikey==key:
+                    ctx = ictx
+                    self.idle.pop(i)
+                    break
+            if ctx is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        self.clean_contexts(expired)
+        log("acquire(%s)=%s", key, ctx)
+        return ctx
+
+    def register(self, ctx, key:tuple) -> None:
+        """
+            Records the key for a newly created context,
+            so that it can be pooled when it is released.
+        """
+        if VIDEO_CONTEXT_POOL and ctx is not None:
+            with self.lock:
+                self.keys[ctx] = key
+
+    def release(self, ctx) -> None:
+        """
+            Adds this context to the pool if we can,
+            or cleans it up immediately.
+        """
+        if ctx is None:
+            return
+        if not self.may_pool(ctx):
+            with self.lock:
+                self.rejected += 1
+                self.keys.pop(ctx, None)
+            ctx.clean()
+            return
+        key = self.keys.get(ctx)
+        evicted = []
+        with self.lock:
+            self.released += 1
+            self.idle.append((key, ctx, monotonic()))
+            while len(self.idle)>self.max_size:
+                evicted.append(self.idle.pop(0)[1])
+            self.evicted += len(evicted)
+        log("release(%s) key=%s, evicted=%s", ctx, key, evicted)
+        self.clean_contexts(evicted)
+
+    def may_pool(self, ctx) -> bool:
+        if not VIDEO_CONTEXT_POOL or self.max_size<=0:
+            return False
+        if ctx not in self.keys:
+            return False
+        try:
+            if ctx.is_closed():
+                return False
+            if self.keys[ctx][0]=="csc":
+                return True
+            reset_stream = getattr(ctx, "reset_stream", None)
+            return bool(reset_stream and reset_stream())
+        except Exception as e:
+            log("may_pool(%s)", ctx, exc_info=True)
+            log.warn(f"Warning: cannot re-use video context {ctx}")
+            log.warn(f" {e}")
+            return False
+
+    def expire_idle(self) -> list:
+        """
+            Removes the contexts that have been idle for too long,
+            the caller is responsible for cleaning them.
+        """
+        cutoff = monotonic()-self.timeout
+        with self.lock:
+            expired = [ctx for _, ctx, released_at in self.idle if released_at<cutoff]
+            if expired:
+                self.idle = [x for x in self.idle if x[2]>=cutoff]
+                self.evicted += len(expired)
+        return expired
+
+    def expire(self) -> bool:
+        self.clean_contexts(self.expire_idle())
+        return True
+
+    def clean_contexts(self, contexts) -> None:
+        for ctx in contexts:
+            log("clean_contexts: freeing %s", ctx)
+            with log.trap_error(f"Error cleaning up video context {ctx}"):
+                ctx.clean()
+
+    def cleanup(self) -> None:
+        with self.lock:
+            contexts = [x[1] for x in self.idle]
+            self.idle = []
+            self.keys.clear()
+        self.clean_contexts(contexts)
+
+
+singleton = None
+def get_video_context_pool() -> VideoContextPool:
+    global singleton
+    if singleton is None:
+        singleton = VideoContextPool()
+    return singleton
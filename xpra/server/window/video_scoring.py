@@ -4,7 +4,11 @@
 # Xpra is released under the terms of the GNU GPL v2, or, at your option, any
 # later version. See the file COPYING for details.
 
-from xpra.util import envint
+from collections import OrderedDict
+from threading import Lock
+from typing import Any
+
+from xpra.util import envint, envbool
 from xpra.codecs.codec_constants import LOSSY_PIXEL_FORMATS
 from xpra.log import Logger
 
@@ -13,6 +17,12 @@ scorelog = Logger("score")
 GPU_BIAS = envint("XPRA_GPU_BIAS", 100)
 MIN_FPS_COST = envint("XPRA_MIN_FPS_COST", 4)
 
+SCORE_CACHE = envbool("XPRA_PIPELINE_SCORE_CACHE", True)
+SCORE_CACHE_SIZE = envint("XPRA_PIPELINE_SCORE_CACHE_SIZE", 256)
+#speed and quality targets are rounded to this step,
+#so that small fluctuations can re-use the same scores:
+SCORE_BUCKET = max(1, envint("XPRA_PIPELINE_SCORE_BUCKET", 5))
+
 #any colourspace conversion will lose at least some quality (due to rounding)
 #(so add 0.2 to the value we get from calculating the degradation using get_subsampling_divs)
 SUBSAMPLING_QUALITY_LOSS = {
@@ -216,3 +226,73 @@ def get_encoder_dimensions(encoder_spec, width : int, height : int, scaling=(1,1
     enc_width = int(width * v / u) & encoder_spec.width_mask
     enc_height = int(height * v / u) & encoder_spec.height_mask
     return enc_width, enc_height
+
+
+def score_bucket(value : int) -> int:
+    """
+        Rounds a speed or quality value to the nearest bucket.
+    """
+    return max(0, min(100, int(round(value/SCORE_BUCKET))*SCORE_BUCKET))
+
+
+class PipelineScoreCache:
+    """
+        A cache of video pipeline options, shared by all the windows.
+        The keys must contain all the inputs used for scoring,
+        including the generation of the video helper specs,
+        so that any change to the specs invalidates the cached values.
+    """
+    __slots__ = ("lock", "scores", "max_size", "hits", "misses")
+
+    def __init__(self, max_size:int=SCORE_CACHE_SIZE):
+        self.lock = Lock()
+        self.scores : OrderedDict[tuple,tuple] = OrderedDict()
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return f"PipelineScoreCache({len(self.scores)})"
+
+    def get(self, key:tuple) -> tuple | None:
+        if not SCORE_CACHE:
+            return None
+        with self.lock:
+            scores = self.scores.get(key)
+            if scores is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.scores.move_to_end(key)
+        return scores
+
+    def set(self, key:tuple, scores:tuple) -> None:
+        if not SCORE_CACHE or self.max_size<=0:
+            return
+        with self.lock:
+            self.scores[key] = scores
+            self.scores.move_to_end(key)
+            while len(self.scores)>self.max_size:
+                self.scores.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.scores.clear()
+
+    def get_info(self) -> dict[str,Any]:
+        return {
+            "enabled"   : SCORE_CACHE,
+            "size"      : len(self.scores),
+            "max-size"  : self.max_size,
+            "bucket"    : SCORE_BUCKET,
+            "hits"      : self.hits,
+            "misses"    : self.misses,
+            }
+
+
+singleton = None
+def get_pipeline_score_cache() -> PipelineScoreCache:
+    global singleton
+    if singleton is None:
+        singleton = PipelineScoreCache()
+    return singleton
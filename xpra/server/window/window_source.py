@@ -17,18 +17,30 @@ from contextlib import nullcontext
 from typing import Callable, Iterable, ContextManager, Any
 
 from xpra.os_util import bytestostr, POSIX, OSX
-from xpra.util import envint, envbool, csv, typedict, first_time, decode_str, repr_ellipsized
+from xpra.util import envint, envbool, csv, typedict, first_time, decode_str, repr_ellipsized, roundup
 from xpra.common import MAX_WINDOW_SIZE, WINDOW_DECODE_SKIPPED, WINDOW_DECODE_ERROR, WINDOW_NOT_FOUND
 from xpra.server.window.windowicon_source import WindowIconSource
 from xpra.server.window.window_stats import WindowPerformanceStatistics
+from xpra.server.window.tile_cache import (
+    TileCache, get_tile_hash, is_lossless,
+    TILE_CACHE, TILE_CACHE_SIZE, TILE_CACHE_MIN_PIXELS, TILE_CACHE_ENCODINGS,
+    )
 from xpra.server.window.batch_delay_calculator import calculate_batch_delay, get_target_speed, get_target_quality
+from xpra.server.window.progressive_refresh import (
+    PROGRESSIVE_REFRESH, REFRESH_TICK, REFRESH_TILE_SIZE, DEFAULT_BYTES_PER_PIXEL,
+    split_tiles, order_tiles, plan_tiles, remove_tiles, take_batch, get_refresh_budget,
+    )
+from xpra.server.window.content_classifier import (
+    ContentClassifier, CONTENT_CLASSIFIER, TEXT, PICTURE, VIDEO,
+    allow_lossless_text,
+    )
 from xpra.server.cystats import time_weighted_average, logp #@UnresolvedImport
 from xpra.server.source.source_stats import GlobalPerformanceStatistics
 from xpra.rectangle import rectangle, add_rectangle, remove_rectangle, merge_all   #@UnresolvedImport
 from xpra.simple_stats import get_list_stats
 from xpra.codecs.rgb_transform import rgb_reformat
 from xpra.codecs.loader import get_codec
-from xpra.codecs.image_wrapper import ImageWrapper
+from xpra.codecs.image_wrapper import ImageWrapper, record_frame
 from xpra.codecs.codec_constants import preforder, LOSSY_PIXEL_FORMATS
 from xpra.net.compression import use, Compressed
 from xpra.log import Logger
@@ -88,9 +100,23 @@ DAMAGE_STATISTICS : bool = envbool("XPRA_DAMAGE_STATISTICS", False)
 
 SCROLL_ALL : bool = envbool("XPRA_SCROLL_ALL", True)
 FORCE_PILLOW : bool = envbool("XPRA_FORCE_PILLOW", False)
+
+#split large picture updates into horizontal strips encoded in parallel:
+TILE_ENCODE : bool = envbool("XPRA_TILE_ENCODE", True)
+TILE_MIN_PIXELS : int = envint("XPRA_TILE_MIN_PIXELS", 1024*1024)
+TILE_MIN_HEIGHT : int = envint("XPRA_TILE_MIN_HEIGHT", 128)
+TILE_THREADS : int = envint("XPRA_TILE_THREADS", min(8, os.cpu_count() or 1))
+#these encoders release the GIL:
+TILE_ENCODERS : tuple[str,...] = tuple(os.environ.get("XPRA_TILE_ENCODERS", "webp,jpeg,spng").split(","))
 HARDCODED_ENCODING : str = os.environ.get("XPRA_HARDCODED_ENCODING", "")
 
 INFINITY = float("inf")
+
+
+def no_pointer_position() -> tuple[int,int] | None:
+    return None
+
+
 def get_env_encodings(etype:str, valid_options:Iterable[str]=()) -> tuple[str,...]:
     v = os.environ.get(f"XPRA_{etype}_ENCODINGS")
     encodings = tuple(valid_options)
@@ -100,6 +126,10 @@ def get_env_encodings(etype:str, valid_options:Iterable[str]=()) -> tuple[str,..
     log("%s encodings: %s", etype, encodings)
     return encodings
 TRANSPARENCY_ENCODINGS = get_env_encodings("TRANSPARENCY", ("webp", "png", "rgb32", "jpega"))
+#the encodings that the content classifier is allowed to replace:
+LOSSLESS_CLASSIFIER_ENCODINGS = ("png", "rgb24", "rgb32")
+LOSSY_CLASSIFIER_ENCODINGS = ("webp", "jpeg", "jpega", "avif")
+CLASSIFIER_ENCODINGS = LOSSLESS_CLASSIFIER_ENCODINGS + LOSSY_CLASSIFIER_ENCODINGS
 if TRUE_LOSSLESS:
     LOSSLESS_ENCODINGS = ("rgb", "png", "png/P", "png/L", "webp", "avif")
 else:
@@ -140,6 +170,15 @@ def capr(v) -> int:
     return min(100, max(0, int(v)))
 
 
+tile_executor = None
+def get_tile_executor():
+    global tile_executor
+    if tile_executor is None:
+        from concurrent.futures import ThreadPoolExecutor
+        tile_executor = ThreadPoolExecutor(max_workers=TILE_THREADS, thread_name_prefix="tile-encode")
+    return tile_executor
+
+
 def get_encoder_type(encoder) -> str:
     if not encoder:
         return "none"
@@ -226,6 +265,10 @@ class WindowSource(WindowIconSource):
         self.send_timetamps : bool = encoding_options.boolget("send-timestamps", SEND_TIMESTAMPS)
         self.send_window_size : bool = encoding_options.boolget("send-window-size", False)
         self.decoder_speed = typedict(self.encoding_options.dictget("decoder-speed") or {})
+        tile_cache_size = min(TILE_CACHE_SIZE, encoding_options.intget("tile-cache", 0))
+        if TILE_CACHE and tile_cache_size>0:
+            self.tile_cache = TileCache(tile_cache_size)
+        self.content_classifier = ContentClassifier()
         self.batch_config = batch_config
         #auto-refresh:
         self.auto_refresh_delay = auto_refresh_delay
@@ -391,12 +434,15 @@ class WindowSource(WindowIconSource):
         pillow = add("enc_pillow")
         if self._mmap_size>0:
             try:
-                from xpra.net.mmap_pipe import mmap_write
+                from xpra.net.mmap_pipe import mmap_write, mmap_slots_write, MmapSlots
             except ImportError:
                 if first_time("mmap_write missing"):
                     log.warn("Warning: cannot use mmap, no write method support")
             else:
-                self.mmap_write = mmap_write
+                if isinstance(self._mmap, MmapSlots):
+                    self.mmap_write = mmap_slots_write
+                else:
+                    self.mmap_write = mmap_write
                 self.insert_encoder("mmap", "mmap", self.mmap_encode)
         if not FORCE_PILLOW or not pillow:
             #prefer these native encoders over the Pillow version:
@@ -431,6 +477,7 @@ class WindowSource(WindowIconSource):
         self.suspended : bool = False
         self.strict = STRICT_MODE
         self.decoder_speed = typedict()
+        self.tile_cache : TileCache | None = None
         self.mmap_write = None
         #
         self.decode_error_refresh_timer : int = 0
@@ -445,6 +492,14 @@ class WindowSource(WindowIconSource):
         self.refresh_target_time : float = 0.0
         self.refresh_timer : int = 0
         self.refresh_regions : list[rectangle] = []
+        #progressive refresh: the tiles still to be sent, with the quality to use:
+        self.refresh_tiles : list[tuple[rectangle,int]] = []
+        self.refresh_tiles_timer : int = 0
+        self.refresh_bytes : int = 0
+        self.refresh_packets : int = 0
+        #recent lossy updates, used for choosing which tiles to refresh first:
+        self.lossy_updates : deque[tuple[float,rectangle]] = deque(maxlen=32)
+        self.get_client_pointer_position : Callable[[], tuple[int,int] | None] = no_pointer_position
         self.timeout_timer : int = 0
         self.expire_timer : int = 0
         self.soft_timer : int = 0
@@ -548,6 +603,9 @@ class WindowSource(WindowIconSource):
                 "min-delay"     : self.min_auto_refresh_delay,
                 "delay"         : self.auto_refresh_delay,
                 "base-delay"    : self.base_auto_refresh_delay,
+                "bytes"         : self.refresh_bytes,
+                "packets"       : self.refresh_packets,
+                "pending-tiles" : len(self.refresh_tiles),
                 "last-event"    : {
                     "elapsed"    : int(1000*(monotonic()-larm[0])),
                     "message"    : larm[1],
@@ -593,6 +651,10 @@ class WindowSource(WindowIconSource):
         crs = self.client_render_size
         if crs:
             info["render-size"] = crs
+        tc = self.tile_cache
+        if tc:
+            info["tile-cache"] = tc.get_info()
+        info["content-classifier"] = self.content_classifier.get_info()
         info["damage.fps"] = int(self.get_damage_fps())
         if self.pixel_format:
             info["pixel-format"] = self.pixel_format
@@ -1175,11 +1237,13 @@ class WindowSource(WindowIconSource):
         self.cancel_may_send_timer()
         self.cancel_soft_timer()
         self.cancel_refresh_timer()
+        self.cancel_refresh_tiles_timer()
         self.cancel_timeout_timer()
         self.cancel_av_sync_timer()
         self.cancel_decode_error_refresh_timer()
         #if a region was delayed, we can just drop it now:
         self.refresh_regions = []
+        self.refresh_tiles = []
         self._damage_delayed = None
         #make sure we don't account for those as they will get dropped
         #(generally before encoding - only one may still get encoded):
@@ -1213,6 +1277,12 @@ class WindowSource(WindowIconSource):
             self.refresh_event_time = 0
             self.refresh_target_time = 0
 
+    def cancel_refresh_tiles_timer(self) -> None:
+        rtt = self.refresh_tiles_timer
+        if rtt:
+            self.refresh_tiles_timer = 0
+            self.source_remove(rtt)
+
     def cancel_timeout_timer(self) -> None:
         tt = self.timeout_timer
         if tt:
@@ -1900,13 +1970,20 @@ class WindowSource(WindowIconSource):
         def get_encoding(w, h):
             return get_best_encoding(w, h, options, coding)
 
+        if exclude_region is None:
+            #full window updates can tell the scroll detection which rows may have changed:
+            full_options = dict(options)
+            full_options["damage-rows"] = tuple((r.y, r.height) for r in regions)
+        else:
+            full_options = options
+
         def send_full_window_update(cause):
             actual_encoding = get_encoding(ww, wh)
             log("send_delayed_regions: using full window update %sx%s as %5s: %s, from %s",
                 ww, wh, actual_encoding, cause, get_best_encoding)
             if not actual_encoding:
                 raise RuntimeError(f"no encoding for {ww}x{wh} full screen update")
-            self.process_damage_region(damage_time, 0, 0, ww, wh, actual_encoding, options)
+            self.process_damage_region(damage_time, 0, 0, ww, wh, actual_encoding, full_options)
 
         if exclude_region is None:
             if self.full_frames_only or self.encoding=="stream":
@@ -1972,7 +2049,7 @@ class WindowSource(WindowIconSource):
             if self.must_encode_full_frame(actual_encoding):
                 log("send_delayed_regions: using full frame for %s encoding of %ix%i",
                     actual_encoding, region.width, region.height)
-                self.process_damage_region(damage_time, 0, 0, ww, wh, actual_encoding, options)
+                self.process_damage_region(damage_time, 0, 0, ww, wh, actual_encoding, full_options)
                 #we can stop here (full screen update will include the other regions)
                 return
             i_reg_enc.append((i, region, actual_encoding))
@@ -2160,14 +2237,21 @@ class WindowSource(WindowIconSource):
             Extra care must be taken to prevent access to X11 functions on window.
         """
         self.statistics.encoding_pending[sequence] = (damage_time, w, h)
+        record_frame()
         try:
-            packet = self.make_data_packet(damage_time, process_damage_time, image, coding, sequence, options, flush)
+            coding = self.get_classified_encoding(image, coding, options)
+            tiles = self.get_encode_tiles(image, coding, options)
+            if tiles:
+                packets = self.make_tile_packets(damage_time, process_damage_time, image, tiles,
+                                                 coding, sequence, options, flush)
+            else:
+                packets = (self.make_data_packet(damage_time, process_damage_time, image, coding, sequence, options, flush), )
         except Exception:
             log("make_data_packet%s", (damage_time, process_damage_time, image, coding, sequence, options, flush),
                 exc_info=True)
             if not self.is_cancelled(sequence):
                 log.error("Error: failed to create data packet", exc_info=True)
-            packet = None
+            packets = ()
         finally:
             self.free_image_wrapper(image)
             del image
@@ -2175,10 +2259,10 @@ class WindowSource(WindowIconSource):
             self.statistics.encoding_pending.pop(sequence, None)
         #NOTE: we MUST send it (even if the window is cancelled by now..)
         #because the code may rely on the client having received this frame
-        if not packet:
-            return
-        #queue packet for sending:
-        self.queue_damage_packet(packet, damage_time, process_damage_time, options)
+        for packet in packets:
+            if packet:
+                #queue packet for sending:
+                self.queue_damage_packet(packet, damage_time, process_damage_time, options)
 
 
     def schedule_auto_refresh(self, packet : tuple, options) -> None:
@@ -2199,7 +2283,8 @@ class WindowSource(WindowIconSource):
         if encoding.startswith("png"):
             actual_quality = 100
             lossy = self.image_depth>32 or self.image_depth==30
-        elif encoding.startswith("rgb") or encoding=="mmap":
+        elif encoding.startswith("rgb") or encoding in ("mmap", "tile"):
+            #we only ever cache lossless tiles
             actual_quality = 100
             lossy = False
         else:
@@ -2223,6 +2308,9 @@ class WindowSource(WindowIconSource):
             #subtract this region from the list of refresh regions:
             #(window video source may remove it from the video subregion)
             self.remove_refresh_region(region)
+            if not options.get("auto_refresh", False) and self.refresh_tiles:
+                #the refresh tiles for this area are no longer needed:
+                self.refresh_tiles = remove_tiles(self.refresh_tiles, region)
             if not self.refresh_timer:
                 #nothing due for refresh, still nothing to do
                 return rec("lossless - nothing to do")
@@ -2250,6 +2338,10 @@ class WindowSource(WindowIconSource):
             if region_excluded:
                 region_pixcount -= region_excluded.width*region_excluded.height
         added_pixcount = self.add_refresh_region(region)
+        self.lossy_updates.append((now, region))
+        if self.refresh_tiles:
+            #this area will be refreshed again with the new contents:
+            self.refresh_tiles = remove_tiles(self.refresh_tiles, region)
         if window_pixcount<=0:
             #if everything was excluded window_pixcount can be 0
             pct = 100
@@ -2362,10 +2454,79 @@ class WindowSource(WindowIconSource):
             refresh_exclude = self.get_refresh_exclude()    #pylint: disable=assignment-from-none
             refreshlog("timer_full_refresh() after %ims, auto_refresh_encodings=%s, options=%s, regions=%s, refresh_exclude=%s",
                        1000.0*(monotonic()-ret), self.auto_refresh_encodings, options, regions, refresh_exclude)
+            if PROGRESSIVE_REFRESH:
+                self.progressive_refresh(regions)
+                return False
             self.do_send_regions(now, regions, self.auto_refresh_encodings[0], options,
                                  exclude_region=refresh_exclude, get_best_encoding=self.get_refresh_encoding)
         return False
 
+    def progressive_refresh(self, regions) -> None:
+        """
+            Instead of sending all the regions in one burst,
+            we split them into tiles and send them as background traffic,
+            starting with the most important ones.
+        """
+        tiles = order_tiles(split_tiles(regions), self.get_refresh_pointer_position(), tuple(self.lossy_updates))
+        pending = self.refresh_tiles
+        refreshlog("progressive_refresh(%s) %i tiles, %i pending", regions, len(tiles), len(pending))
+        #any tiles still pending from the previous refresh come first,
+        #(the areas updated since then have already been removed from them)
+        self.refresh_tiles = pending + plan_tiles(tiles, self.refresh_quality)
+        if not self.refresh_tiles_timer:
+            self.send_refresh_tiles()
+
+    def get_refresh_pointer_position(self) -> tuple[int,int] | None:
+        pos = self.get_client_pointer_position()
+        mapped_at = self.mapped_at
+        if not pos or not mapped_at:
+            return None
+        return pos[0]-mapped_at[0], pos[1]-mapped_at[1]
+
+    def get_refresh_bytes_per_pixel(self) -> float:
+        encodings = self.auto_refresh_encodings
+        pixels = size = 0
+        for _, coding, pixcount, _, compressed_size, _ in tuple(self.statistics.encoding_stats):
+            if coding in encodings:
+                pixels += pixcount
+                size += compressed_size
+        if pixels<=0:
+            return DEFAULT_BYTES_PER_PIXEL
+        return size/pixels
+
+    def send_refresh_tiles(self) -> bool:
+        """
+            Sends the next batch of refresh tiles,
+            using only the bandwidth that the other screen updates are not using.
+        """
+        self.refresh_tiles_timer = 0
+        if not self.refresh_tiles:
+            return False
+        if not self.can_refresh():
+            self.refresh_tiles = []
+            return False
+        gs = self.global_statistics
+        model = gs.bandwidth_model if gs else None
+        interval = REFRESH_TICK
+        if model and model.srtt:
+            #give the previous batch a chance to be acknowledged:
+            interval = min(500, max(REFRESH_TICK, int(model.srtt*1000)))
+        bpp = self.get_refresh_bytes_per_pixel()
+        #always send at least one tile per tick:
+        min_budget = max(1, int(REFRESH_TILE_SIZE*REFRESH_TILE_SIZE*bpp))
+        budget = get_refresh_budget(model, self.bandwidth_limit, interval/1000, min_budget)
+        tiles, quality, self.refresh_tiles = take_batch(self.refresh_tiles, budget, bpp, self.max_small_regions)
+        refreshlog("send_refresh_tiles() budget=%i bytes, %.2f bytes per pixel: %i tiles at quality %i, %i remaining",
+                   budget, bpp, len(tiles), quality, len(self.refresh_tiles))
+        if tiles:
+            options = self.get_refresh_options()
+            options["quality"] = quality
+            self.do_send_regions(monotonic(), tiles, self.auto_refresh_encodings[0], options,
+                                 exclude_region=self.get_refresh_exclude(), get_best_encoding=self.get_refresh_encoding)
+        if self.refresh_tiles:
+            self.refresh_tiles_timer = self.timeout_add(interval, self.send_refresh_tiles)
+        return False
+
     def get_refresh_encoding(self, w : int, h : int, options, coding : str) -> str:
         refresh_encodings = self.auto_refresh_encodings
         encoding = self.do_get_auto_encoding(w, h, options,
@@ -2392,6 +2553,7 @@ class WindowSource(WindowIconSource):
         #since we're going to refresh the whole window,
         #we don't need to track what needs refreshing:
         self.refresh_regions = []
+        self.refresh_tiles = []
         w, h = self.window_dimensions
         refreshlog("full_quality_refresh() for %sx%s window with pending refresh regions: %s", w, h, refresh_regions)
         new_options = damage_options.copy()
@@ -2430,9 +2592,12 @@ class WindowSource(WindowIconSource):
         ack_pending = [0, coding, 0, 0, 0, width*height, client_options, damage_time]
         statistics = self.statistics
         statistics.damage_ack_pending[damage_packet_sequence] = ack_pending
+        gs = self.global_statistics
         def start_send(bytecount:int):
             ack_pending[0] = monotonic()
             ack_pending[2] = bytecount
+            if gs:
+                gs.bandwidth_model.on_send((self.wid, damage_packet_sequence), ldata, ack_pending[0])
         def damage_packet_sent(bytecount:int):
             now = monotonic()
             ack_pending[3] = now
@@ -2454,10 +2619,17 @@ class WindowSource(WindowIconSource):
             now = monotonic()
             damage_in_latency = now-process_damage_time
             statistics.damage_in_latency.append((now, width*height, actual_batch_delay, damage_in_latency))
+        def damage_packet_evicted():
+            #a newer update replaced this one before it was sent,
+            #so we won't be getting an ack for it:
+            statistics.damage_ack_pending.pop(damage_packet_sequence, None)
+        if options and options.get("auto_refresh", False):
+            self.refresh_bytes += ldata
+            self.refresh_packets += 1
         #log.info("queuing %s packet with fail_cb=%s", coding, fail_cb)
         self.statistics.last_packet_time = monotonic()
         self.queue_packet(packet, self.wid, width*height, start_send, damage_packet_sent,
-                          self.get_fail_cb(packet), client_options.get("flush", 0))
+                          self.get_fail_cb(packet), client_options.get("flush", 0), damage_packet_evicted)
 
     def networksend_congestion_event(self, source, late_pct:int, cur_send_speed:int=0) -> None:
         gs = self.global_statistics
@@ -2557,7 +2729,13 @@ class WindowSource(WindowIconSource):
         #it is possible though unlikely
         #that we get the ack before we've had a chance to call
         #damage_packet_sent, so we must validate the data:
-        if bytecount>0 and end_send_at>0:
+        sent = bytecount>0 and end_send_at>0
+        if gs:
+            if sent:
+                gs.bandwidth_model.on_ack((self.wid, damage_packet_sequence), max(0, decode_time)/1000/1000)
+            else:
+                gs.bandwidth_model.on_lost((self.wid, damage_packet_sequence))
+        if sent:
             now = monotonic()
             if decode_time>0:
                 latency = int(1000*(now-damage_time))
@@ -2620,6 +2798,10 @@ class WindowSource(WindowIconSource):
         else:
             log.warn(" unknown cause")
         self.global_statistics.decode_errors += 1
+        tc = self.tile_cache
+        if tc:
+            #the client may not have the tiles we think it has:
+            tc.clear()
         if self.window:
             delay = min(1000, 250+self.global_statistics.decode_errors*100)
             self.decode_error_refresh_timer = self.timeout_add(delay, self.decode_error_refresh)
@@ -2640,6 +2822,142 @@ class WindowSource(WindowIconSource):
         return False
 
 
+    def get_classified_encoding(self, image : ImageWrapper, coding : str, options) -> str:
+        """
+            Uses the pixel statistics of this region to choose between
+            lossless encodings (for text and user interface elements)
+            and lossy encodings (for photographic content and video).
+            This runs in the encode thread.
+        """
+        if not CONTENT_CLASSIFIER or self.encoding!="auto" or self.strict or self._encoding_hint:
+            return coding
+        if coding not in CLASSIFIER_ENCODINGS or options.get("auto_refresh", False):
+            return coding
+        if image.get_planes()!=ImageWrapper.PACKED or self.image_depth not in (24, 32):
+            return coding
+        content_type = self.content_classifier.classify_image(image, self.statistics.last_damage_events)
+        if not content_type:
+            return coding
+        w = image.get_width()
+        h = image.get_height()
+        alpha = self._want_alpha or self.is_tray
+        if content_type==TEXT:
+            quality = options.get("quality", 100)
+            if coding in LOSSLESS_CLASSIFIER_ENCODINGS or quality>=100:
+                return coding
+            #the lossy encoding may have been chosen to reduce the bandwidth,
+            #in which case we let the auto-refresh send the lossless version later:
+            if not allow_lossless_text(w*h, quality, self.get_classifier_rate()):
+                return coding
+            #lz4 compressed rgb is cheap to encode and decode, and it never needs a refresh:
+            choices = (("rgb32" if alpha else "rgb24") if self.rgb_lz4 else "", "png")
+        else:
+            assert content_type in (PICTURE, VIDEO)
+            if coding in LOSSY_CLASSIFIER_ENCODINGS or options.get("quality", 100)>=100:
+                return coding
+            if alpha:
+                choices = ("webp", "jpega")
+            elif w*h<=WEBP_EFFICIENCY_CUTOFF:
+                choices = ("webp", "jpeg", "avif")
+            else:
+                choices = ("jpeg", "webp", "avif")
+        for encoding in choices:
+            if encoding and encoding in self.common_encodings and encoding in self._encoders:
+                log("get_classified_encoding: %s for %s content instead of %s", encoding, content_type, coding)
+                return encoding
+        return coding
+
+    def get_classifier_rate(self) -> int:
+        """ the bandwidth available for this window, in bits per second, or zero if unknown """
+        rates = []
+        if self.bandwidth_limit>0:
+            rates.append(self.bandwidth_limit)
+        gs = self.global_statistics
+        model = gs.bandwidth_model if gs else None
+        if model and model.is_ready():
+            rates.append(model.get_pacing_rate())
+        return min(rates) if rates else 0
+
+    def get_encode_tiles(self, image : ImageWrapper, coding : str, options) -> tuple[tuple[int,int],...]:
+        """
+            Returns the horizontal strips (y, height) that this image should be split into,
+            so that each strip can be encoded in parallel.
+            Returns an empty tuple if the image should be encoded in one go.
+        """
+        if not TILE_ENCODE or TILE_THREADS<=1:
+            return ()
+        w = image.get_width()
+        h = image.get_height()
+        if w*h<TILE_MIN_PIXELS or h<TILE_MIN_HEIGHT*2:
+            return ()
+        if image.get_planes()!=ImageWrapper.PACKED:
+            return ()
+        if "scaled-width" in options or "scaled-height" in options:
+            #we would need to scale each strip separately
+            return ()
+        encoder = self._encoders.get(coding)
+        if get_encoder_type(encoder) not in TILE_ENCODERS:
+            return ()
+        n = min(TILE_THREADS, h//TILE_MIN_HEIGHT)
+        #keep the strips height even, for the benefit of subsampling encoders:
+        strip_height = roundup(ceil(h/n), 2)
+        tiles = []
+        y = 0
+        while y<h:
+            sh = min(strip_height, h-y)
+            tiles.append((y, sh))
+            y += sh
+        if len(tiles)<2:
+            return ()
+        return tuple(tiles)
+
+    def make_tile_packets(self, damage_time, process_damage_time, image : ImageWrapper, tiles : tuple[tuple[int,int],...],
+                          coding : str, sequence : int, options, flush) -> tuple:
+        """
+            Encodes each strip of the image concurrently,
+            then creates the draw packets in order,
+            using the flush value so that the client paints them together.
+        """
+        if self.is_cancelled(sequence) or self.suspended:
+            return ()
+        if SCROLL_ALL and self.may_use_scrolling(image, options):
+            return ()
+        w = image.get_width()
+        start = monotonic()
+        options["cuda-device-context"] = self.cuda_device_context
+        encoder = self._encoders[coding]
+        sub_images = tuple(image.get_sub_image(0, y, w, h) for y, h in tiles)
+        keys = tuple(self.get_tile_key(sub_image, coding) for sub_image in sub_images)
+        #only encode the strips that the client does not have already:
+        encode = tuple(i for i, key in enumerate(keys) if not self.is_tile_cached(key))
+        executor = get_tile_executor()
+        results = {}
+        if encode:
+            #encode the first strip from this thread:
+            futures = tuple(executor.submit(encoder, coding, sub_images[i], dict(options)) for i in encode[1:])
+            results[encode[0]] = encoder(coding, sub_images[encode[0]], dict(options))
+            for i, future in zip(encode[1:], futures):
+                results[i] = future.result()
+        log("make_tile_packets: encoded %i strips out of %i of %s in %ims",
+            len(encode), len(tiles), image, 1000*(monotonic()-start))
+        packets = []
+        n = len(tiles)
+        for i, (sub_image, key) in enumerate(zip(sub_images, keys)):
+            #the last strip uses the original flush value:
+            tile_flush = (flush or 0) + n-1-i
+            if i not in results:
+                packet = self.make_tile_packet(sub_image, key, options, tile_flush)
+            else:
+                ret = results[i]
+                if not ret:
+                    log("make_tile_packets: no data from encoder %s for strip %i", get_encoder_type(encoder), i)
+                    continue
+                packet = self.make_encoded_packet(damage_time, process_damage_time, sub_image, encoder, ret,
+                                                  sequence, options, tile_flush, start, key)
+            if packet:
+                packets.append(packet)
+        return tuple(packets)
+
     def make_data_packet(self, damage_time, process_damage_time,
                          image : ImageWrapper, coding : str, sequence : int, options, flush) -> tuple | None:
         """
@@ -2671,12 +2989,11 @@ class WindowSource(WindowIconSource):
         h = image.get_height()
         if w<=0 or h<=0:
             raise RuntimeError(f"invalid dimensions: {w}x{h}")
-
-        #more useful is the actual number of bytes (assuming 32bpp)
-        #since we generally don't send the padding with it:
-        psize = w*h*4
         log("make_data_packet: image=%s, damage data: %s", image, (self.wid, x, y, w, h, coding))
         start = monotonic()
+        key = self.get_tile_key(image, coding)
+        if self.is_tile_cached(key):
+            return self.make_tile_packet(image, key, options, flush)
 
         options["cuda-device-context"] = self.cuda_device_context
         #by default, don't set rowstride (the container format will take care of providing it):
@@ -2689,17 +3006,88 @@ class WindowSource(WindowIconSource):
         if not ret:
             return nodata("no data from encoder %s for %s",
                           get_encoder_type(encoder), (coding, image, options))
+        return self.make_encoded_packet(damage_time, process_damage_time, image, encoder, ret,
+                                        sequence, options, flush, start, key)
+
+    def get_tile_key(self, image : ImageWrapper, coding : str) -> bytes:
+        """
+            Returns the hash of the pixels if this image can use the tile cache,
+            an empty value otherwise.
+        """
+        if not self.tile_cache or coding not in TILE_CACHE_ENCODINGS:
+            return b""
+        if image.get_width()*image.get_height()<TILE_CACHE_MIN_PIXELS:
+            return b""
+        if image.get_planes()!=ImageWrapper.PACKED:
+            return b""
+        return get_tile_hash(image)
+
+    def is_tile_cached(self, key : bytes) -> bool:
+        tc = self.tile_cache
+        return bool(key and tc and tc.lookup(key))
+
+    def make_tile_packet(self, image : ImageWrapper, key : bytes, options, flush) -> tuple:
+        """
+            The client already has these pixels,
+            send a reference to the tile instead.
+        """
+        x = image.get_target_x()
+        y = image.get_target_y()
+        w = image.get_width()
+        h = image.get_height()
+        client_options = {}
+        if flush not in (None, 0):
+            client_options["flush"] = flush
+        compresslog("compress: tile cache hit for %4ix%-4i pixels at %4i,%-4i for wid=%-5i",
+                    w, h, x, y, self.wid)
+        return self.make_draw_packet(x, y, w, h, "tile", key, 0, client_options, options)
 
+    def may_cache_tile(self, key : bytes, coding : str, data, client_options : dict) -> None:
+        """
+            Ask the client to keep this tile if it was encoded losslessly,
+            and to evict older tiles to make room for it.
+        """
+        tc = self.tile_cache
+        if not key or not tc or not is_lossless(coding, client_options):
+            return
+        evict = tc.add(key, len(data))
+        if evict is None:
+            return
+        if tc.reset:
+            #the cache was cleared since the last tile we sent:
+            tc.reset = False
+            client_options["tile-reset"] = True
+        client_options["tile"] = key
+        if evict:
+            client_options["tile-evict"] = evict
+
+    def make_encoded_packet(self, damage_time, process_damage_time, image : ImageWrapper,
+                            encoder : Callable, ret : tuple, sequence : int, options, flush, start : float,
+                            tile_key : bytes=b"") -> tuple | None:
+        """
+            Creates the draw packet from the data returned by the encoder.
+        """
+        x = image.get_target_x()
+        y = image.get_target_y()
+        w = image.get_width()
+        h = image.get_height()
+        #more useful is the actual number of bytes (assuming 32bpp)
+        #since we generally don't send the padding with it:
+        psize = w*h*4
         coding, data, client_options, outw, outh, outstride, bpp = ret
         #check for cancellation again since the code above may take some time to encode:
         #but never cancel mmap after encoding because we need to reclaim the space
         #by getting the client to move the mmap received pointer
         if coding!="mmap":
             if self.is_cancelled(sequence):
-                return nodata("cancelled after encoding")
+                log("make_data_packet: window %s with sequence=%s cancelled after encoding", self.wid, sequence)
+                return None
             if self.suspended:
-                return nodata("suspended after encoding")
+                log("make_data_packet: window %s with sequence=%s suspended after encoding", self.wid, sequence)
+                return None
         csize = len(data)
+        if outw==w and outh==h:
+            self.may_cache_tile(tile_key, coding, data, client_options)
         if INTEGRITY_HASH and coding!="mmap":
             #could be a compressed wrapper or just raw bytes:
             try:
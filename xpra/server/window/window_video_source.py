@@ -25,7 +25,12 @@ from xpra.server.window.window_source import (
     )
 from xpra.rectangle import rectangle, merge_all          #@UnresolvedImport
 from xpra.server.window.video_subregion import VideoSubregion, VIDEO_SUBREGION
-from xpra.server.window.video_scoring import get_pipeline_score
+from xpra.server.window.video_scoring import (
+    get_pipeline_score, get_pipeline_score_cache, score_bucket,
+    MIN_FPS_COST,
+    )
+from xpra.server.window.video_context_pool import get_video_context_pool, get_csc_key, get_encoder_key
+from xpra.server.window.thread_budget import get_thread_budget, get_weight
 from xpra.codecs.codec_constants import PREFERRED_ENCODING_ORDER, EDGE_ENCODING_ORDER, preforder
 from xpra.codecs.loader import has_codec
 from xpra.util import parse_scaling_value, engs, envint, envbool, csv, roundup, print_nested_dict, first_time, typedict
@@ -201,6 +206,7 @@ class WindowVideoSource(WindowSource):
         self._csc_encoder = None
         self._video_encoder = None
         self._last_pipeline_check = 0
+        self.has_focus = False
 
     def init_encoders(self) -> None:
         super().init_encoders()
@@ -291,6 +297,9 @@ class WindowVideoSource(WindowSource):
                 info[prefix] = i
         addcinfo("csc", self._csc_encoder)
         addcinfo("encoder", self._video_encoder)
+        encoder_threads = get_thread_budget().get_encoder_threads(self)
+        if encoder_threads and "encoder" in info:
+            info["encoder"]["allocated-threads"] = encoder_threads
         info.setdefault("encodings", {}).update({
                                                  "non-video"    : self.non_video_encodings,
                                                  "video"        : self.common_video_encodings,
@@ -338,6 +347,7 @@ class WindowVideoSource(WindowSource):
         super().cleanup()
         self.cleanup_codecs()
         self.stop_gstreamer_pipeline()
+        get_thread_budget().remove(self)
 
     def cleanup_codecs(self) -> None:
         """ Video encoders (x264, nvenc and vpx) and their csc helpers
@@ -366,21 +376,25 @@ class WindowVideoSource(WindowSource):
                 self.ve_clean(ve)
             self.call_in_encode_thread(False, clean)
 
-    # noinspection PyMethodMayBeStatic
     def csc_clean(self, csce) -> None:
         if csce:
-            csce.clean()
+            if self._csc_encoder==csce:
+                self._csc_encoder = None
+            #the pool will either keep it for re-use or clean it:
+            get_video_context_pool().release(csce)
 
     def ve_clean(self, ve) -> None:
         self.cancel_video_encoder_timer()
         if ve:
-            ve.clean()
+            get_video_context_pool().release(ve)
             #only send eos if this video encoder is still current,
             #(otherwise, sending the new stream will have taken care of it already,
             # and sending eos then would close the new stream, not the old one!)
             if self._video_encoder==ve:
+                self._video_encoder = None
                 log("sending eos for wid %i", self.wid)
-                self.queue_packet(("eos", self.wid))
+                #use the window's queue so that it is sent after the last frame:
+                self.queue_packet(("eos", self.wid), self.wid)
             if SAVE_VIDEO_STREAMS:
                 self.close_video_stream_file()
 
@@ -1223,8 +1237,33 @@ class WindowVideoSource(WindowSource):
         self.update_pipeline_scores(force_reload)
         if not self.verify_csc_and_encoder() and not force_reload:
             self.cleanup_codecs()
+        self.update_thread_budget()
         self._last_pipeline_check = monotonic()
 
+    def calculate_batch_delay(self, has_focus, other_is_fullscreen, other_is_maximized) -> None:
+        self.has_focus = has_focus
+        super().calculate_batch_delay(has_focus, other_is_fullscreen, other_is_maximized)
+
+    def get_thread_weight(self, width : int, height : int) -> int:
+        return get_weight(self.has_focus, width*height, self.get_video_fps(width, height))
+
+    def update_thread_budget(self) -> None:
+        """
+            Updates the weight of this window in the server's thread budget,
+            and re-creates the video encoder if its allocation has changed a lot.
+        """
+        budget = get_thread_budget()
+        ve = self._video_encoder
+        if ve is None:
+            #not using any encoder threads:
+            budget.remove(self)
+            return
+        budget.update(self, self.get_thread_weight(ve.get_width(), ve.get_height()))
+        if budget.should_recreate(self):
+            videolog("update_thread_budget() encoder threads allocation changed from %i to %i",
+                     budget.get_encoder_threads(self), budget.get_threads(self))
+            self.cleanup_codecs()
+
     def update_pipeline_scores(self, force_reload=False) -> None:
         """
             Calculate pipeline scores using get_video_pipeline_options(),
@@ -1361,7 +1400,9 @@ class WindowVideoSource(WindowSource):
             using csc encoders to convert to an intermediary format.
             Each solution is rated, and we return all of them in descending
             score (the best solution comes first).
-            Because this function is expensive to call, we cache the results.
+            Because this function is expensive to call, we cache the results,
+            (the cache is shared by all the windows and the speed and quality
+            targets are rounded so that small changes still hit the cache)
             This allows it to run more often from the timer thread.
 
             Can be called from any thread.
@@ -1387,10 +1428,44 @@ class WindowVideoSource(WindowSource):
                 #not the video region, or not really video content, raise quality a bit:
                 target_q = int(sqrt(target_q/100.0)*100)
                 scorelog("raising quality for video encoding of non-video region")
+        target_q = score_bucket(target_q)
+        target_s = score_bucket(target_s)
         scorelog("get_video_pipeline_options%s speed: %s (min %s), quality: %s (min %s)",
                  (encodings, width, height, src_format), target_s, min_s, target_q, min_q)
         vmw, vmh = self.video_max_size
-        ffps = self.get_video_fps(width, height)
+        #only values below MIN_FPS_COST affect the score:
+        ffps = min(MIN_FPS_COST, self.get_video_fps(width, height))
+        vs = self.video_subregion
+        detection = bool(vs) and vs.detection
+        #must copy reference to those objects because of threading races:
+        csce = self._csc_encoder
+        ve = self._video_encoder
+        #the scaling only depends on the encoder's maximum dimensions:
+        scalings : dict[tuple[int,int],tuple[int,int]] = {}
+        csc_can_scale = any(csc_spec.can_scale for l in vh.get_csc_specs(src_format).values() for csc_spec in l)
+        for encoding in encodings:
+            for especs in vh.get_encoder_specs(encoding).values():
+                for encoder_spec in especs:
+                    if not (csc_can_scale or encoder_spec.can_scale):
+                        continue
+                    max_size = min(encoder_spec.max_w, vmw), min(encoder_spec.max_h, vmh)
+                    if max_size not in scalings:
+                        scalings[max_size] = self.calculate_scaling(width, height, *max_size)
+        cache = get_pipeline_score_cache()
+        cache_key = (
+            vh.generation, tuple(encodings), width, height, src_format,
+            target_q, min_q, target_s, min_s, ffps, detection, self.is_shadow,
+            tuple(sorted(scalings.items())),
+            tuple(self.full_csc_modes.strtupleget(encoding) for encoding in encodings),
+            tuple(self.encoding_options.get(f"{encoding}.score-delta") for encoding in encodings),
+            #the current pipeline lowers the setup cost of matching options:
+            (type(csce), csce.get_dst_format(), csce.get_src_width(), csce.get_src_height()) if csce else None,
+            (ve.get_type(), ve.get_src_format(), ve.get_width(), ve.get_height()) if ve else None,
+            )
+        s = cache.get(cache_key)
+        if s is not None:
+            scorelog("get_video_pipeline_options%s using cached scores=%s", (encodings, width, height, src_format), s)
+            return self.set_pipeline_scores(encodings, width, height, src_format, s)
         scores = []
         for encoding in encodings:
             #these are the CSC modes the client can handle for this encoding:
@@ -1425,21 +1500,17 @@ class WindowVideoSource(WindowSource):
                     if not matches or self.is_cancelled():
                         no_match.append(encoder_spec.codec_type+" "+info)
                         continue
-                    max_w = min(encoder_spec.max_w, vmw)
-                    max_h = min(encoder_spec.max_h, vmh)
                     if (csc_spec and csc_spec.can_scale) or encoder_spec.can_scale:
-                        scaling = self.calculate_scaling(width, height, max_w, max_h)
+                        scaling = scalings[(min(encoder_spec.max_w, vmw), min(encoder_spec.max_h, vmh))]
                     else:
                         scaling = (1, 1)
                     score_delta = encoding_score_delta
                     if self.is_shadow and enc_in_format in ("NV12", "YUV420P", "YUV422P") and scaling==(1, 1):
                         #avoid subsampling with shadow servers:
                         score_delta -= 40
-                    vs = self.video_subregion
-                    detection = bool(vs) and vs.detection
                     score_data = get_pipeline_score(enc_in_format, csc_spec, encoder_spec, width, height, scaling,
                                                     target_q, min_q, target_s, min_s,
-                                                    self._csc_encoder, self._video_encoder,
+                                                    csce, ve,
                                                     score_delta, ffps, detection)
                     if score_data:
                         scores.append(score_data)
@@ -1462,14 +1533,20 @@ class WindowVideoSource(WindowSource):
             scorelog("no matching colorspace specs for %s: %s", encoding, no_match)
         s = tuple(sorted(scores, key=lambda x : -x[0]))
         scorelog("get_video_pipeline_options%s scores=%s", (encodings, width, height, src_format), s)
+        if not self.is_cancelled():
+            cache.set(cache_key, s)
+        return self.set_pipeline_scores(encodings, width, height, src_format, s)
+
+    def set_pipeline_scores(self, encodings : tuple[str,...], width : int, height : int, src_format : str,
+                            scores : tuple) -> tuple:
         if self.is_cancelled():
             self.last_pipeline_params = ()
             self.last_pipeline_scores = ()
         else:
             self.last_pipeline_params = (encodings, width, height, src_format)
-            self.last_pipeline_scores = s
+            self.last_pipeline_scores = scores
         self.last_pipeline_time = monotonic()
-        return s
+        return scores
 
 
     def get_video_fps(self, width : int, height : int) -> int:
@@ -1832,6 +1909,7 @@ class WindowVideoSource(WindowSource):
                       enc_in_format : str, encoder_scaling, enc_width : int, enc_height : int, encoder_spec) -> bool:
         options = typedict(self.encoding_options)
         self.assign_sq_options(options)
+        pool = get_video_context_pool()
         min_w = 8
         min_h = 8
         max_w = 16384
@@ -1851,9 +1929,14 @@ class WindowVideoSource(WindowSource):
             csc_speed = max(1, min(speed, 100-quality/2.0))
             csc_options = typedict({"speed" : csc_speed})
             csc_start = monotonic()
-            csce = csc_spec.make_instance()
-            csce.init_context(csc_width, csc_height, src_format,
-                                   enc_width, enc_height, enc_in_format, csc_options)
+            csc_key = get_csc_key(csc_spec.codec_type, csc_width, csc_height, src_format,
+                                  enc_width, enc_height, enc_in_format)
+            csce = pool.acquire(csc_key)
+            if csce is None:
+                csce = csc_spec.make_instance()
+                csce.init_context(csc_width, csc_height, src_format,
+                                       enc_width, enc_height, enc_in_format, csc_options)
+                pool.register(csce, csc_key)
             csc_end = monotonic()
             csclog("setup_pipeline: csc=%s, info=%s, setup took %.2fms",
                   csce, csce.get_info(), (csc_end-csc_start)*1000.0)
@@ -1874,7 +1957,6 @@ class WindowVideoSource(WindowSource):
         enc_start = monotonic()
         #FIXME: filter dst_formats to only contain formats the encoder knows about?
         dst_formats = self.full_csc_modes.strtupleget(encoder_spec.encoding)
-        ve = encoder_spec.make_instance()
         options.update(self.get_video_encoder_options(encoder_spec.encoding, width, height))
         if self.encoding=="grayscale":
             options["grayscale"] = True
@@ -1885,7 +1967,19 @@ class WindowVideoSource(WindowSource):
             options["scaled-height"] = enc_height*n//d
         options["dst-formats"] = dst_formats
 
-        ve.init_context(encoder_spec.encoding, enc_width, enc_height, enc_in_format, options)
+        ve_key = get_encoder_key(encoder_spec.codec_type, encoder_spec.encoding,
+                                 enc_width, enc_height, enc_in_format, options)
+        ve = pool.acquire(ve_key)
+        if ve is None:
+            ve = encoder_spec.make_instance()
+            ve.init_context(encoder_spec.encoding, enc_width, enc_height, enc_in_format, options)
+            pool.register(ve, ve_key)
+        else:
+            #re-using a pooled context, apply the current settings:
+            ve.set_encoding_speed(options.intget("speed", self._current_speed))
+            ve.set_encoding_quality(options.intget("quality", self._current_quality))
+        #the encoder keeps this number of threads until it is re-created:
+        get_thread_budget().set_encoder_threads(self, options.intget("threads", 0))
         #record new actual limits:
         self.actual_scaling = scaling
         self.width_mask = width_mask
@@ -1905,6 +1999,10 @@ class WindowVideoSource(WindowSource):
     def get_video_encoder_options(self, encoding, width, height) -> dict[str,Any]:
         #tweaks for "real" video:
         opts = {"cuda-device-context" : self.cuda_device_context}
+        threads = get_thread_budget().get_threads(self, self.get_thread_weight(width, height))
+        if threads:
+            #share the CPU with the other windows:
+            opts["threads"] = threads
         if not self._fixed_quality and not self._fixed_speed and self._fixed_min_quality<50:
             #only allow bandwidth to drive video encoders
             #when we don't have strict quality or speed requirements:
@@ -2041,11 +2139,27 @@ class WindowVideoSource(WindowSource):
             if not pixels:
                 return False
             stride = image.get_rowstride()
-            scroll_data.update(pixels, x, y, w, h, stride, bpp)
+            #only the rows that have been damaged need to be checksummed again:
+            damaged_rows = None
+            damage_rows = options.get("damage-rows")
+            if damage_rows is not None:
+                damaged_rows = tuple((ry-y, rh) for ry, rh in damage_rows)
+            scroll_data.update(pixels, x, y, w, h, stride, bpp, damaged_rows)
+            hashed, hdistance, hmatches = scroll_data.get_update_info()
+            scrolllog("checksummed %i rows out of %i, horizontal distance=%i (%i rows)", hashed, h, hdistance, hmatches)
             max_distance = min(1000, (100-min_percent)*h//100)
             scroll_data.calculate(max_distance)
             #marker telling us not to invalidate the scroll data from here on:
             options["scroll"] = True
+            if min_percent>0 and hdistance:
+                hscroll = scroll_data.get_horizontal_scroll()
+                if hscroll:
+                    distance, moved, repaint = hscroll
+                    match_pct = int(100*(h-sum(repaint.values()))/h)
+                    scrolllog("horizontal scroll by %i matches %i%% of %i lines", distance, match_pct, h)
+                    if match_pct>=min_percent and len(moved)+len(repaint)<20:
+                        self.encode_horizontal_scrolling(image, options, distance, moved, repaint, match_pct)
+                        return True
             if min_percent>0:
                 max_zones = 20
                 scroll, count = scroll_data.get_best_match()
@@ -2098,7 +2212,6 @@ class WindowVideoSource(WindowSource):
                     raw_scroll = {}
                     non_scroll = {0 : h}
         scrolllog(" will send scroll data=%s, non-scroll=%s", raw_scroll, non_scroll)
-        flush = len(non_scroll)
         #convert to a screen rectangle list for the client:
         scrolls = []
         for scroll, line_defs in raw_scroll.items():
@@ -2112,6 +2225,51 @@ class WindowVideoSource(WindowSource):
                                        f"by {scroll} lines from {y}+{line} (window height is {wh})")
                 scrolls.append((x, y+line, w, count, 0, scroll))
         del raw_scroll
+        rects = tuple((0, sy, w, sh) for sy, sh in non_scroll.items())
+        self.send_scroll_regions(image, options, scrolls, rects, match_pct, start)
+
+    def encode_horizontal_scrolling(self, image : ImageWrapper, options, distance : int,
+                                    moved : dict[int,int], repaint : dict[int,int], match_pct : int) -> None:
+        """
+            The lines in `moved` have all been scrolled horizontally by the same distance,
+            we only need to send the columns uncovered by the scroll,
+            and the lines in `repaint`.
+        """
+        start = monotonic()
+        options.pop("av-sync", None)
+        x = image.get_target_x()
+        y = image.get_target_y()
+        w = image.get_width()
+        scrolllog("encode_horizontal_scrolling(%s, %s, %i, %s, %s, %i)",
+                  image, options, distance, moved, repaint, match_pct)
+        scroll_width = w-abs(distance)
+        if distance>0:
+            #moving right, uncovers the columns on the left:
+            src_x = 0
+            exposed_x = 0
+        else:
+            src_x = -distance
+            exposed_x = scroll_width
+        scrolls = []
+        rects = []
+        for line, count in moved.items():
+            scrolls.append((x+src_x, y+line, scroll_width, count, distance, 0))
+            rects.append((exposed_x, line, abs(distance), count))
+        for line, count in repaint.items():
+            rects.append((0, line, w, count))
+        self.send_scroll_regions(image, options, scrolls, rects, match_pct, start)
+
+    def send_scroll_regions(self, image : ImageWrapper, options, scrolls : list, rects : tuple,
+                            match_pct : int, start : float) -> None:
+        """
+            Sends the `scrolls` as a single 'scroll' packet,
+            followed by the rectangles (relative to the image) which must be repainted.
+        """
+        x = image.get_target_x()
+        y = image.get_target_y()
+        w = image.get_width()
+        h = image.get_height()
+        flush = len(rects)
         #send the scrolls if we have any
         #(zero change scrolls have been removed - so maybe there are none)
         if scrolls:
@@ -2129,7 +2287,7 @@ class WindowVideoSource(WindowSource):
                  self._damage_packet_sequence, client_options, options)
         del scrolls
         #send the rest as rectangles:
-        if non_scroll:
+        if rects:
             if self.content_type.find("text")>=0:
                 quality = 100
                 options["quality"] = quality
@@ -2140,12 +2298,12 @@ class WindowVideoSource(WindowSource):
                 quality = min(100, quality + max(60, match_pct)//2)
                 options["quality"] = quality
             nsstart = monotonic()
-            for sy, sh in non_scroll.items():
+            for sx, sy, sw, sh in rects:
                 substart = monotonic()
-                sub = image.get_sub_image(0, sy, w, sh)
-                encoding = self.get_best_nonvideo_encoding(w, sh, options)
+                sub = image.get_sub_image(sx, sy, sw, sh)
+                encoding = self.get_best_nonvideo_encoding(sw, sh, options)
                 if not encoding:
-                    raise RuntimeError(f"no nonvideo encoding found for {w}x{sh} screen update")
+                    raise RuntimeError(f"no nonvideo encoding found for {sw}x{sh} screen update")
                 encode_fn = self._encoders[encoding]
                 ret = encode_fn(encoding, sub, options)
                 self.free_image_wrapper(sub)
@@ -2165,20 +2323,20 @@ class WindowVideoSource(WindowSource):
                 #    from PIL import Image
                 #    im = Image.frombuffer("RGBA", (w, sh), memoryview_to_bytes(sub.get_pixels()),
                 #                          "raw", "BGRA", sub.get_rowstride(), 1)
-                #    filename = "./scroll-%i-%i.png" % (self._sequence, len(non_scroll)-flush)
+                #    filename = "./scroll-%i-%i.png" % (self._sequence, len(rects)-flush)
                 #    im.save(filename, "png")
                 #    log.info("saved scroll y=%i h=%i to %s", sy, sh, filename)
                 packet = self.make_draw_packet(sub.get_target_x(), sub.get_target_y(), outw, outh,
                                                coding, data, outstride, client_options, options)
                 self.queue_damage_packet(packet, 0, 0, options)
-                psize = w*sh*4
+                psize = sw*sh*4
                 csize = len(data)
                 compresslog(COMPRESS_FMT,
-                     (monotonic()-substart)*1000.0, w, sh, x+0, y+sy, self.wid, coding,
+                     (monotonic()-substart)*1000.0, sw, sh, x+sx, y+sy, self.wid, coding,
                      100.0*csize/psize, ceil(psize/1024), ceil(csize/1024),
                      self._damage_packet_sequence, client_options, options)
             scrolllog("non-scroll (quality=%i, speed=%i) took %ims for %i rectangles",
-                      self._current_quality, self._current_speed, (monotonic()-nsstart)*1000, len(non_scroll))
+                      self._current_quality, self._current_speed, (monotonic()-nsstart)*1000, len(rects))
         else:
             scrolllog("no non_scroll areas")
         if flush!=0:
@@ -19,6 +19,7 @@ except ImportError:
 
 from xpra.os_util import load_binary_file, memoryview_to_bytes
 from xpra.net import compression
+from xpra.server.window.image_cache import get_image_cache, get_image_key
 from xpra.util import envbool, envint, csv
 from xpra.log import Logger
 
@@ -235,6 +236,25 @@ class WindowIconSource:
             w, h, pixel_format, len(pixel_data), self.wid)
         if pixel_format not in ("BGRA", "RGBA", "png"):
             raise RuntimeError(f"invalid window icon format {pixel_format}")
+        if SAVE_WINDOW_ICONS:
+            icon = self.encode_window_icon(w, h, pixel_format, pixel_data)[0]
+        else:
+            #the same icon is often used by many windows, and sent to every client:
+            key = get_image_key("icon", pixel_data, w, h, pixel_format, self.window_icon_size, self.window_icon_max_size)
+            icon = get_image_cache().get_or_encode(key, lambda : self.encode_window_icon(w, h, pixel_format, pixel_data))
+        if not icon:
+            return
+        w, h, pixel_data = icon
+        wrapper = compression.Compressed("png", pixel_data)
+        packet = ("window-icon", self.wid, w, h, wrapper.datatype, wrapper)
+        log("queuing window icon update: %s", packet)
+        self.queue_packet(packet, wait_for_more=True)
+
+    def encode_window_icon(self, w:int, h:int, pixel_format:str, pixel_data) -> tuple[tuple[int,int,bytes] | None, int]:
+        """
+            Converts the icon to png and scales it down if needed,
+            returns the new dimensions and png data, and the size of the data.
+        """
         if pixel_format=="BGRA":
             #BGRA data is always unpremultiplied
             #(that's what we get from NetWMIcons)
@@ -255,7 +275,7 @@ class WindowIconSource:
         if must_scale or must_convert or SAVE_WINDOW_ICONS:
             if Image is None:
                 log("cannot scale or convert window icon without python-pillow")
-                return
+                return None, 0
             #we're going to need a PIL Image:
             if pixel_format=="png":
                 image = Image.open(BytesIO(pixel_data))
@@ -285,10 +305,7 @@ class WindowIconSource:
             pixel_data = output.getvalue()
             output.close()
             w, h = image.size
-        wrapper = compression.Compressed("png", pixel_data)
-        packet = ("window-icon", self.wid, w, h, wrapper.datatype, wrapper)
-        log("queuing window icon update: %s", packet)
-        self.queue_packet(packet, wait_for_more=True)
+        return (w, h, pixel_data), len(pixel_data)
 
 
     @staticmethod
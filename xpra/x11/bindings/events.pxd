@@ -7,4 +7,5 @@
 from xpra.x11.bindings.xlib cimport Display, XEvent
 
 cdef parse_xevent(Display *d, XEvent *e)
+cdef bint coalesce_damage(XEvent *e)
 cdef init_x11_events(Display *display)
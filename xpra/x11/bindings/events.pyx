@@ -12,7 +12,7 @@ from typing import Callable, Dict
 from xpra.os_util import strtobytes, bytestostr
 from xpra.gtk_common.error import XError, xsync
 from xpra.x11.common import X11Event
-from xpra.util import csv
+from xpra.util import csv, envint, envbool
 
 from xpra.log import Logger
 log = Logger("x11", "bindings")
@@ -33,6 +33,13 @@ from libc.stdint cimport uintptr_t
 
 DEF XNone = 0
 
+#merge the damage events of each drawable until the pending events have been processed:
+DAMAGE_COALESCE = envbool("XPRA_X11_DAMAGE_COALESCE", True)
+#merge rectangles if the union wastes fewer pixels than this:
+cdef long long DAMAGE_MERGE_PIXELS = envint("XPRA_X11_DAMAGE_MERGE_PIXELS", 64*64)
+DEF MAX_DAMAGE_RECTS = 8
+MAX_DAMAGE_RECTANGLES = MAX_DAMAGE_RECTS
+
 cdef extern from "X11/Xlib.h":
     int BadWindow
     int MapRequest
@@ -286,8 +293,9 @@ cdef init_x11_events(Display *display):
         add_x_event_type_name(XFSelectionNotify, "XFSelectionNotify")
     event_base = get_XDamage_event_base(display)
     if event_base>0:
-        global DamageNotify
+        global DamageNotify, damage_notify
         DamageNotify = XDamageNotify+event_base
+        damage_notify = DamageNotify
         add_x_event_signal(DamageNotify, ("xpra-damage-event", None))
         add_x_event_type_name(DamageNotify, "DamageNotify")
     set_debug_events()
@@ -376,6 +384,123 @@ cdef atom_str(Display *display, Atom atom):
     return r
 
 
+cdef int damage_notify = -1
+
+
+cdef class DamageAccumulator:
+    """
+        Merges the damage rectangles reported for a drawable,
+        keeping at most MAX_DAMAGE_RECTS rectangles.
+    """
+    cdef Window window
+    cdef Window delivered_to
+    cdef Damage damage
+    cdef unsigned long serial
+    cdef unsigned int events
+    cdef int count
+    cdef int x1[MAX_DAMAGE_RECTS]
+    cdef int y1[MAX_DAMAGE_RECTS]
+    cdef int x2[MAX_DAMAGE_RECTS]
+    cdef int y2[MAX_DAMAGE_RECTS]
+
+    def __init__(self, Window window):
+        self.window = window
+        self.count = 0
+        self.events = 0
+
+    cpdef void add(self, int x, int y, int w, int h):
+        cdef int x2 = x+w
+        cdef int y2 = y+h
+        cdef long long area = <long long> w*h
+        cdef long long cost, best_cost = 0
+        cdef int i, best = -1
+        self.events += 1
+        for i in range(self.count):
+            if self.x1[i]<=x and self.y1[i]<=y and self.x2[i]>=x2 and self.y2[i]>=y2:
+                #already covered
+                return
+            #how many pixels we would add by using the union of the two rectangles:
+            cost = <long long> (max(x2, self.x2[i])-min(x, self.x1[i])) * (max(y2, self.y2[i])-min(y, self.y1[i]))
+            cost -= area + <long long> (self.x2[i]-self.x1[i]) * (self.y2[i]-self.y1[i])
+            if best<0 or cost<best_cost:
+                best = i
+                best_cost = cost
+        if best<0 or (best_cost>DAMAGE_MERGE_PIXELS and self.count<MAX_DAMAGE_RECTS):
+            i = self.count
+            self.x1[i] = x
+            self.y1[i] = y
+            self.x2[i] = x2
+            self.y2[i] = y2
+            self.count += 1
+            return
+        self.x1[best] = min(x, self.x1[best])
+        self.y1[best] = min(y, self.y1[best])
+        self.x2[best] = max(x2, self.x2[best])
+        self.y2[best] = max(y2, self.y2[best])
+
+    def get_rectangles(self) -> list:
+        cdef int i
+        return [(self.x1[i], self.y1[i], self.x2[i]-self.x1[i], self.y2[i]-self.y1[i]) for i in range(self.count)]
+
+    cdef list get_events(self):
+        cdef list events = []
+        cdef int i
+        for i in range(self.count):
+            pyev = X11Event("DamageNotify")
+            pyev.type = damage_notify
+            pyev.send_event = False
+            pyev.serial = self.serial
+            pyev.delivered_to = self.delivered_to
+            pyev.window = self.window
+            pyev.damage = self.damage
+            pyev.x = self.x1[i]
+            pyev.y = self.y1[i]
+            pyev.width = self.x2[i]-self.x1[i]
+            pyev.height = self.y2[i]-self.y1[i]
+            events.append(pyev)
+        return events
+
+
+cdef dict damage_accumulators = {}
+
+cdef bint coalesce_damage(XEvent *e):
+    """
+        Accumulates DamageNotify events,
+        returns True if the event has been consumed.
+        The merged events must then be retrieved using 'get_damage_events'.
+    """
+    if e.type!=damage_notify or not DAMAGE_COALESCE or e.xany.send_event:
+        return False
+    cdef XDamageNotifyEvent *damage_e = <XDamageNotifyEvent*> e
+    cdef Window window = e.xany.window
+    cdef DamageAccumulator acc = damage_accumulators.get(window)
+    if acc is None:
+        acc = DamageAccumulator(window)
+        damage_accumulators[window] = acc
+    acc.delivered_to = e.xany.window
+    acc.damage = damage_e.damage
+    acc.serial = e.xany.serial
+    acc.add(damage_e.area.x, damage_e.area.y, damage_e.area.width, damage_e.area.height)
+    return True
+
+def get_damage_events() -> list:
+    """
+        Returns the merged DamageNotify events accumulated so far,
+        at most MAX_DAMAGE_RECTS for each drawable.
+    """
+    global damage_accumulators
+    if not damage_accumulators:
+        return []
+    accumulators = damage_accumulators
+    damage_accumulators = {}
+    cdef list events = []
+    cdef DamageAccumulator acc
+    for acc in accumulators.values():
+        verbose("%i damage events for %#x merged into %i", acc.events, acc.window, acc.count)
+        events += acc.get_events()
+    return events
+
+
 cdef parse_xevent(Display *d, XEvent *e):
     cdef XDamageNotifyEvent * damage_e
     cdef XFixesCursorNotifyEvent * cursor_e
@@ -30,6 +30,7 @@ from xpra.x11.bindings.xlib cimport (
     )
 from libc.stdlib cimport free, malloc       #pylint: disable=syntax-error
 from libc.string cimport memset
+from libc.stdint cimport uint8_t, uint32_t
 
 from xpra.log import Logger
 log = Logger("x11", "bindings", "window")
@@ -298,7 +299,7 @@ cdef extern from "X11/extensions/Xfixes.h":
 cdef extern from "X11/extensions/Xdamage.h":
     ctypedef XID Damage
     unsigned int XDamageReportDeltaRectangles
-    #unsigned int XDamageReportRawRectangles
+    unsigned int XDamageReportRawRectangles
     unsigned int XDamageNotify
     ctypedef struct XDamageNotifyEvent:
         Damage damage
@@ -312,6 +313,55 @@ cdef extern from "X11/extensions/Xdamage.h":
     void XDamageSubtract(Display *, Damage, XserverRegion repair, XserverRegion parts)
 
 
+###################################
+# xcb, used for pipelining requests
+###################################
+
+cdef extern from "xcb/xcb.h":
+    ctypedef struct xcb_connection_t:
+        pass
+    ctypedef struct xcb_generic_error_t:
+        uint8_t error_code
+    ctypedef struct xcb_get_property_cookie_t:
+        unsigned int sequence
+    ctypedef struct xcb_get_property_reply_t:
+        uint8_t format
+        uint32_t type
+        uint32_t bytes_after
+        uint32_t value_len
+    int XCB_GET_PROPERTY_TYPE_ANY
+    xcb_get_property_cookie_t xcb_get_property(xcb_connection_t *c, uint8_t _delete, uint32_t window,
+                                               uint32_t property, uint32_t type,
+                                               uint32_t long_offset, uint32_t long_length)
+    xcb_get_property_reply_t *xcb_get_property_reply(xcb_connection_t *c, xcb_get_property_cookie_t cookie,
+                                                     xcb_generic_error_t **e)
+    void *xcb_get_property_value(const xcb_get_property_reply_t *R)
+    int xcb_get_property_value_length(const xcb_get_property_reply_t *R)
+
+cdef extern from "X11/Xlib-xcb.h":
+    xcb_connection_t *XGetXCBConnection(Display *dpy)
+
+
+cdef object xcb_property_data(xcb_get_property_reply_t *reply):
+    #returns the data using the same layout as XGetWindowProperty:
+    cdef char *value = <char *> xcb_get_property_value(reply)
+    cdef int length = xcb_get_property_value_length(reply)
+    if reply.format!=32 or sizeof(long)==4:
+        return value[:length]
+    #Xlib stores 32-bit items in a C long:
+    cdef unsigned int nitems = length//4
+    cdef int *items = <int *> value
+    cdef long *longs = <long *> malloc(nitems*sizeof(long)+1)
+    if longs==NULL:
+        raise MemoryError()
+    cdef unsigned int i
+    for i in range(nitems):
+        longs[i] = items[i]
+    data = (<char *> longs)[:nitems*sizeof(long)]
+    free(longs)
+    return data
+
+
 cdef inline long cast_to_long(i):
     if i < 0:
         return <long>i
@@ -693,9 +743,11 @@ cdef class X11WindowBindingsInstance(X11CoreBindingsInstance):
                                   XDamageQueryExtension,
                                   XDamageQueryVersion)
 
-    def XDamageCreate(self, Window xwindow):
+    def XDamageCreate(self, Window xwindow, bint raw=False):
         self.context_check("XDamageCreate")
-        return XDamageCreate(self.display, xwindow, XDamageReportDeltaRectangles)
+        #raw mode reports every drawing operation, without needing XDamageSubtract:
+        cdef int level = XDamageReportRawRectangles if raw else XDamageReportDeltaRectangles
+        return XDamageCreate(self.display, xwindow, level)
 
     def XDamageDestroy(self, Damage handle):
         self.context_check("XDamageDestroy")
@@ -1048,6 +1100,52 @@ cdef class X11WindowBindingsInstance(X11CoreBindingsInstance):
         return data
 
 
+    def GetWindowProperties(self, Window xwindow, properties, int buffer_size=64*1024) -> Dict[str,Any]:
+        """
+            Fetches multiple properties with a single round trip:
+            all the requests are sent before we wait for the first reply.
+            Returns a dictionary with the actual type atom and the data for each property,
+            or None if the property is not set.
+            Properties that cannot be retrieved or do not fit in the buffer are omitted,
+            the caller can use XGetWindowProperty for those.
+        """
+        self.context_check("GetWindowProperties")
+        cdef int n = len(properties)
+        if n==0:
+            return {}
+        #resolve the atoms first, as this may require round trips of its own:
+        cdef list atoms = [self.xatom(prop) for prop in properties]
+        cdef xcb_connection_t *conn = XGetXCBConnection(self.display)
+        cdef xcb_get_property_cookie_t *cookies = <xcb_get_property_cookie_t *> malloc(n*sizeof(xcb_get_property_cookie_t))
+        if cookies==NULL:
+            raise MemoryError()
+        cdef xcb_get_property_reply_t *reply = NULL
+        cdef xcb_generic_error_t *error = NULL
+        cdef int i
+        props = {}
+        try:
+            for i in range(n):
+                cookies[i] = xcb_get_property(conn, 0, xwindow, atoms[i], XCB_GET_PROPERTY_TYPE_ANY, 0, buffer_size//4)
+            #we must collect all the replies, even if we fail to parse some of them:
+            for i in range(n):
+                error = NULL
+                reply = xcb_get_property_reply(conn, cookies[i], &error)
+                if error!=NULL:
+                    log("GetWindowProperties(%#x, ..) error %i for %s", xwindow, error.error_code, properties[i])
+                    free(error)
+                if reply==NULL:
+                    continue
+                try:
+                    if reply.type==XNone:
+                        props[properties[i]] = None
+                    elif reply.bytes_after==0:
+                        props[properties[i]] = (reply.type, xcb_property_data(reply))
+                finally:
+                    free(reply)
+        finally:
+            free(cookies)
+        return props
+
     def GetWindowPropertyType(self, Window xwindow, property, incr=False):
         #as above, but for any property type
         #and returns the type found
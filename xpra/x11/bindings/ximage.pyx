@@ -7,6 +7,8 @@
 from time import monotonic
 
 from xpra.os_util import bytestostr
+from xpra.util import envint
+from xpra.codecs.image_wrapper import record_copy
 from xpra.x11.bindings.display_source import get_display_name   # @UnresolvedImport
 from xpra.log import Logger
 
@@ -30,6 +32,10 @@ log = Logger("x11", "bindings", "ximage")
 xshmdebug = Logger("x11", "bindings", "ximage", "xshm", "verbose")
 ximagedebug = Logger("x11", "bindings", "ximage", "verbose")
 
+#maximum number of XShm segments per window
+#used for keeping the pixels of images that have not been freed yet:
+cdef unsigned int XSHM_SEGMENTS = max(1, envint("XPRA_XSHM_SEGMENTS", 4))
+
 
 cdef inline unsigned int roundup(unsigned int n, unsigned int m):
     return (n + m - 1) & ~(m - 1)
@@ -191,6 +197,9 @@ cdef class XImageWrapper:
     cdef unsigned char sub
     cdef object pixel_format
     cdef void *pixels
+    #the buffer we borrowed the pixels from:
+    cdef Py_buffer pixels_view
+    cdef unsigned char borrowed
     cdef object del_callback
     cdef uint64_t timestamp
     cdef object palette
@@ -376,35 +385,30 @@ cdef class XImageWrapper:
         self.pixel_format = pixel_format
 
     def set_pixels(self, pixels):
-        """ overrides the context of the image with the given pixels buffer """
-        if self.pixels!=NULL:
-            if not self.sub:
-                free(self.pixels)
-            self.pixels = NULL
-
+        """
+            overrides the context of the image with the given pixels buffer,
+            the buffer is referenced (not copied) until the image is freed
+        """
         cdef Py_buffer py_buf
         if PyObject_GetBuffer(pixels, &py_buf, PyBUF_ANY_CONTIGUOUS):
             raise ValueError(f"failed to read pixel data from {type(pixels)}")
-
+        self.free_pixels()
         #Note: we can't free the XImage, because it may
         #still be used somewhere else (see XShmWrapper)
-        if posix_memalign(<void **> &self.pixels, 64, py_buf.len):
-            PyBuffer_Release(&py_buf)
-            raise RuntimeError("posix_memalign failed!")
-        assert self.pixels!=NULL
-        #from now on, we own the buffer,
+        self.pixels_view = py_buf
+        self.borrowed = True
+        self.pixels = py_buf.buf
+        #from now on, we hold the buffer,
         #so we're no longer a direct sub-image,
-        #and we must free the buffer later:
+        #and we must release the buffer later:
         self.sub = False
         if self.image==NULL:
             self.thread_safe = 1
             #we can now mark this object as thread safe
             #if we have already freed the XImage
             #which needs to be freed from the UI thread
-            #but our new buffer is just a malloc buffer,
+            #but our new buffer is just a python buffer,
             #which is safe from any thread
-        memcpy(self.pixels, py_buf.buf, py_buf.len)
-        PyBuffer_Release(&py_buf)
 
 
     def free(self):
@@ -424,10 +428,18 @@ cdef class XImageWrapper:
     cdef free_pixels(self):
         ximagedebug("%s.free_pixels() pixels=%#x", self, <uintptr_t> self.pixels)
         if self.pixels!=NULL:
-            if not self.sub:
+            if self.borrowed:
+                self.borrowed = False
+                PyBuffer_Release(&self.pixels_view)
+            elif not self.sub:
                 free(self.pixels)
             self.pixels = NULL
 
+    def __dealloc__(self):
+        if self.borrowed:
+            self.borrowed = False
+            PyBuffer_Release(&self.pixels_view)
+
     def freeze(self):
         #we don't need to do anything here because the non-XShm version
         #already uses a copy of the pixels
@@ -475,6 +487,7 @@ cdef class XImageWrapper:
                 memcpy(to, img_buf, cpy_size)
                 to += rowstride
                 img_buf += oldstride
+        record_copy("restride", newsize)
         #we can now free the pixels buffer if present
         #(but not the ximage - this is not running in the UI thread!)
         self.free_pixels()
@@ -489,44 +502,40 @@ cdef class XImageWrapper:
         return True
 
 
-cdef class XShmWrapper:
+cdef class XShmSegment:
+    """
+        A shared memory XImage, which may be referenced
+        by the XShmImageWrappers we have handed out.
+    """
     cdef Display *display
-    cdef Visual *visual
-    cdef Window window
-    cdef unsigned int width
-    cdef unsigned int height
-    cdef unsigned int depth
     cdef XShmSegmentInfo shminfo
     cdef XImage *image
     cdef unsigned int ref_count
     cdef Bool got_image
-    cdef Bool closed
+    #set when an image wrapper relies on the pixels not being modified:
+    cdef Bool frozen
+    cdef object release_callback
 
-    cdef init(self, Display *display, Window xwindow, Visual *visual, unsigned int width, unsigned int height, unsigned int depth):
-        self.display = display
-        self.window = xwindow
-        self.visual = visual
-        self.width = width
-        self.height = height
-        self.depth = depth
+    def __cinit__(self):
+        self.display = NULL
+        self.image = NULL
+        self.shminfo.shmaddr = <char *> -1
+        self.shminfo.shmid = -1
 
     def __repr__(self):
-        return "XShmWrapper(%#x - %ix%i)" % (self.window, self.width, self.height)
+        return "XShmSegment(%#x)" % self.shminfo.shmid
 
-    def setup(self):
+    cdef setup(self, Display *display, Visual *visual, unsigned int depth, unsigned int width, unsigned int height):
         #returns:
         # (init_ok, may_retry_this_window, XShm_global_failure)
-        self.ref_count = 0
-        self.closed = False
-        self.shminfo.shmaddr = <char *> -1
-
-        self.image = XShmCreateImage(self.display, self.visual, self.depth,
+        self.display = display
+        self.image = XShmCreateImage(display, visual, depth,
                           ZPixmap, NULL, &self.shminfo,
-                          self.width, self.height)
-        xshmdebug("XShmWrapper.setup() XShmCreateImage(%ix%i-%i) %s", self.width, self.height, self.depth, self.image!=NULL)
+                          width, height)
+        xshmdebug("XShmSegment.setup() XShmCreateImage(%ix%i-%i) %s", width, height, depth, self.image!=NULL)
         if self.image==NULL:
-            xshmlog.error("XShmWrapper.setup() XShmCreateImage(%ix%i-%i) failed!", self.width, self.height, self.depth)
-            self.cleanup()
+            xshmlog.error("XShmSegment.setup() XShmCreateImage(%ix%i-%i) failed!", width, height, depth)
+            self.free()
             #if we cannot create an XShm XImage, we may try again
             #(it could be dimensions are too big?)
             return False, True, False
@@ -535,41 +544,137 @@ cdef class XShmWrapper:
         #  even on the last line, without reading past the end of the buffer)
         cdef size_t size = self.image.bytes_per_line * (self.image.height + 1)
         self.shminfo.shmid = shmget(IPC_PRIVATE, size, IPC_CREAT | 0o777)
-        xshmdebug("XShmWrapper.setup() shmget(PRIVATE, %i bytes, %#x) shmid=%#x", size, IPC_CREAT | 0777, self.shminfo.shmid)
+        xshmdebug("XShmSegment.setup() shmget(PRIVATE, %i bytes, %#x) shmid=%#x", size, IPC_CREAT | 0777, self.shminfo.shmid)
         if self.shminfo.shmid < 0:
-            xshmlog.error("XShmWrapper.setup() shmget(PRIVATE, %i bytes, %#x) failed, bytes_per_line=%i, width=%i, height=%i", size, IPC_CREAT | 0777, self.image.bytes_per_line, self.width, self.height)
-            self.cleanup()
+            xshmlog.error("XShmSegment.setup() shmget(PRIVATE, %i bytes, %#x) failed, bytes_per_line=%i, width=%i, height=%i", size, IPC_CREAT | 0777, self.image.bytes_per_line, width, height)
+            self.free()
             #only try again if we get EINVAL,
             #the other error codes probably mean this is never going to work..
             return False, errno==EINVAL, errno!=EINVAL
         # Attach:
         self.image.data = <char *> shmat(self.shminfo.shmid, NULL, 0)
         self.shminfo.shmaddr = self.image.data
-        xshmdebug("XShmWrapper.setup() shmat(%s, NULL, 0) %s", self.shminfo.shmid, self.shminfo.shmaddr != <char *> -1)
+        xshmdebug("XShmSegment.setup() shmat(%s, NULL, 0) %s", self.shminfo.shmid, self.shminfo.shmaddr != <char *> -1)
         if self.shminfo.shmaddr == <char *> -1:
-            xshmlog.error("XShmWrapper.setup() shmat(%s, NULL, 0) failed!", self.shminfo.shmid)
-            self.cleanup()
+            xshmlog.error("XShmSegment.setup() shmat(%s, NULL, 0) failed!", self.shminfo.shmid)
+            self.free()
             #we may try again with this window, or any other window:
             #(as this really shouldn't happen at all)
             return False, True, False
 
         # set as read/write, and attach to the display:
         self.shminfo.readOnly = False
-        cdef Bool a = XShmAttach(self.display, &self.shminfo)
-        xshmdebug("XShmWrapper.setup() XShmAttach(..) %s", bool(a))
+        cdef Bool a = XShmAttach(display, &self.shminfo)
+        xshmdebug("XShmSegment.setup() XShmAttach(..) %s", bool(a))
         if not a:
-            xshmlog.error("XShmWrapper.setup() XShmAttach(..) failed!")
-            self.cleanup()
+            xshmlog.error("XShmSegment.setup() XShmAttach(..) failed!")
+            self.free()
             #we may try again with this window, or any other window:
             #(as this really shouldn't happen at all)
             return False, True, False
         return True, True, False
 
+    def free_image_callback(self):
+        self.ref_count -= 1
+        xshmdebug("XShmSegment.free_image_callback() new ref_count=%i", self.ref_count)
+        if self.ref_count==0:
+            self.frozen = False
+            cb = self.release_callback
+            if cb:
+                cb(self)
+
+    def __dealloc__(self):
+        if self.ref_count==0:
+            self.free()
+
+    cdef free(self):
+        assert self.ref_count==0, "%s cannot be freed: still has a ref count of %i" % (self, self.ref_count)
+        self.release_callback = None
+        has_shm = self.shminfo.shmaddr!=<char *> -1
+        xshmdebug("XShmSegment.free() has_shm=%s, image=%#x, shmid=%#x", has_shm, <uintptr_t> self.image, self.shminfo.shmid)
+        if has_shm:
+            XShmDetach(self.display, &self.shminfo)
+        has_image = self.image!=NULL
+        if has_image:
+            XDestroyImage(self.image)
+            self.image = NULL
+        if has_shm:
+            shmctl(self.shminfo.shmid, IPC_RMID, NULL)
+            shmdt(self.shminfo.shmaddr)
+            self.shminfo.shmaddr = <char *> -1
+            self.shminfo.shmid = -1
+        if has_shm or has_image:
+            call_context_check("XShmSegment.free()")
+
+
+cdef class XShmWrapper:
+    """
+        Captures window contents using XShm.
+        The pixels of the shared memory segment are handed out to image wrappers without copying them,
+        so when the window is damaged and those image wrappers have not been freed yet,
+        the next image is captured into another segment.
+    """
+    cdef Display *display
+    cdef Visual *visual
+    cdef Window window
+    cdef unsigned int width
+    cdef unsigned int height
+    cdef unsigned int depth
+    cdef XShmSegment segment
+    #segments still referenced by image wrappers:
+    cdef object retired
+    #a segment we can capture into:
+    cdef object spare
+    cdef Bool closed
+
+    cdef init(self, Display *display, Window xwindow, Visual *visual, unsigned int width, unsigned int height, unsigned int depth):
+        self.display = display
+        self.window = xwindow
+        self.visual = visual
+        self.width = width
+        self.height = height
+        self.depth = depth
+        self.retired = []
+        self.spare = []
+
+    def __repr__(self):
+        return "XShmWrapper(%#x - %ix%i)" % (self.window, self.width, self.height)
+
+    def setup(self):
+        #returns:
+        # (init_ok, may_retry_this_window, XShm_global_failure)
+        self.closed = False
+        cdef XShmSegment segment = XShmSegment()
+        r = segment.setup(self.display, self.visual, self.depth, self.width, self.height)
+        if not r[0]:
+            self.cleanup()
+            return r
+        segment.release_callback = self.segment_released
+        self.segment = segment
+        return r
+
+    cdef XShmSegment new_segment(self):
+        if self.spare:
+            return self.spare.pop()
+        cdef XShmSegment segment = XShmSegment()
+        if not segment.setup(self.display, self.visual, self.depth, self.width, self.height)[0]:
+            return None
+        segment.release_callback = self.segment_released
+        return segment
+
     def get_size(self):
         return self.width, self.height
 
+    def get_info(self):
+        return {
+            "segments"  : int(self.segment is not None)+len(self.retired)+len(self.spare),
+            "retired"   : len(self.retired),
+            "spare"     : len(self.spare),
+            }
+
     def get_image(self, Drawable drawable, int x, int y, int w, int h):
-        assert self.image!=NULL, "cannot retrieve image wrapper: XImage is NULL!"
+        cdef XShmSegment segment = self.segment
+        assert segment is not None and segment.image!=NULL, "cannot retrieve image wrapper: XImage is NULL!"
         if self.closed:
             return None
         cdef int maxw = self.width
@@ -596,18 +701,18 @@ cdef class XShmWrapper:
         if y+h>maxh:
             h = maxh-y
             assert h>0
-        if not self.got_image:
-            if not XShmGetImage(self.display, drawable, self.image, 0, 0, 0xFFFFFFFF):
+        if not segment.got_image:
+            if not XShmGetImage(self.display, drawable, segment.image, 0, 0, 0xFFFFFFFF):
                 xshmlog("XShmWrapper.get_image(%#x, %i, %i, %i, %i) XShmGetImage failed!", drawable, x, y, w, h)
                 return None
-            self.got_image = True
-        self.ref_count += 1
+            segment.got_image = True
+        segment.ref_count += 1
         cdef XShmImageWrapper imageWrapper = XShmImageWrapper(x, y, w, h)
-        imageWrapper.set_image(self.image)
-        imageWrapper.set_free_callback(self.free_image_callback)
+        imageWrapper.set_image(segment.image)
+        imageWrapper.set_segment(segment)
         if self.depth==8:
             imageWrapper.set_palette(self.read_palette())
-        xshmdebug("XShmWrapper.get_image(%#x, %i, %i, %i, %i)=%s (ref_count=%i)", drawable, x, y, w, h, imageWrapper, self.ref_count)
+        xshmdebug("XShmWrapper.get_image(%#x, %i, %i, %i, %i)=%s (%s ref_count=%i)", drawable, x, y, w, h, imageWrapper, segment, segment.ref_count)
         return imageWrapper
 
     def read_palette(self):
@@ -646,10 +751,26 @@ cdef class XShmWrapper:
 
     def discard(self):
         #force next get_image call to get a new image from the server
-        self.got_image = False
+        cdef XShmSegment segment = self.segment
+        if segment is None:
+            return
+        cdef XShmSegment new_segment
+        if segment.ref_count>0 and (segment.frozen or len(self.retired)+1<XSHM_SEGMENTS):
+            #the pixels are still being used,
+            #so capture the next image into another segment:
+            new_segment = self.new_segment()
+            if new_segment is not None:
+                xshmdebug("XShmWrapper.discard() retiring %s, now using %s", segment, new_segment)
+                self.retired.append(segment)
+                self.segment = new_segment
+                return
+            if segment.frozen:
+                xshmlog.warn("Warning: failed to allocate a new XShm segment")
+                xshmlog.warn(" the next capture will modify the pixels of frozen images")
+        segment.got_image = False
 
     def __dealloc__(self):
-        xshmdebug("XShmWrapper.__dealloc__() ref_count=%i", self.ref_count)
+        xshmdebug("XShmWrapper.__dealloc__()")
         self.cleanup()
 
     def cleanup(self):
@@ -658,43 +779,40 @@ cdef class XShmWrapper:
         #and they will point to our Image XShm area.
         #so we have to wait until *they* are freed,
         #and rely on them telling us via the free_image_callback.
-        xshmdebug("XShmWrapper.cleanup() ref_count=%i", self.ref_count)
+        xshmdebug("XShmWrapper.cleanup() segment=%s, retired=%s", self.segment, self.retired)
         self.closed = True
-        if self.ref_count==0:
-            self.free()
-
-    def free_image_callback(self):
-        self.ref_count -= 1
-        xshmdebug("XShmWrapper.free_image_callback() closed=%s, new ref_count=%i", self.closed, self.ref_count)
-        if self.closed and self.ref_count==0:
-            self.free()
-
-    cdef free(self):
-        assert self.ref_count==0, "XShmWrapper %s cannot be freed: still has a ref count of %i" % (self, self.ref_count)
-        assert self.closed, "XShmWrapper %s cannot be freed: it is not closed yet" % self
-        has_shm = self.shminfo.shmaddr!=<char *> -1
-        xshmdebug("XShmWrapper.free() has_shm=%s, image=%#x, shmid=%#x", has_shm, <uintptr_t> self.image, self.shminfo.shmid)
-        if has_shm:
-            XShmDetach(self.display, &self.shminfo)
-        has_image = self.image!=NULL
-        if has_image:
-            XDestroyImage(self.image)
-            self.image = NULL
-        if has_shm:
-            shmctl(self.shminfo.shmid, IPC_RMID, NULL)
-            shmdt(self.shminfo.shmaddr)
-            self.shminfo.shmaddr = <char *> -1
-            self.shminfo.shmid = -1
-        if has_shm or has_image:
-            call_context_check("XShmWrapper.free()")
+        cdef XShmSegment segment = self.segment
+        if segment is not None and segment.ref_count==0:
+            self.segment = None
+            segment.free()
+        spare = self.spare or ()
+        self.spare = []
+        for segment in spare:
+            segment.free()
+
+    def segment_released(self, XShmSegment segment):
+        #the last image wrapper using this segment has been freed:
+        xshmdebug("XShmWrapper.segment_released(%s) closed=%s", segment, self.closed)
+        if segment in self.retired:
+            self.retired.remove(segment)
+            segment.got_image = False
+            if not self.closed and not self.spare:
+                #keep it so we can capture into it again:
+                self.spare.append(segment)
+                return
+        elif segment is self.segment and self.closed:
+            self.segment = None
+        else:
+            return
+        segment.free()
 
 
 cdef class XShmImageWrapper(XImageWrapper):
 
-    cdef object free_callback
+    cdef XShmSegment segment
 
     def __init__(self, *args):
-        self.free_callback = None
+        self.segment = None
 
     def __repr__(self):
         return "XShmImageWrapper(%s: %s, %s, %s, %s)" % (self.pixel_format, self.x, self.y, self.width, self.height)
@@ -715,23 +833,29 @@ cdef class XShmImageWrapper(XImageWrapper):
         return ptr
 
     def freeze(self):
+        self.timestamp = int(monotonic()*1000)
+        cdef XShmSegment segment = self.segment
+        if segment is not None and self.pixels==NULL and XSHM_SEGMENTS>1:
+            #the segment will not be used for capturing again until this image is freed,
+            #so we can keep using its pixels without copying them:
+            segment.frozen = True
+            return False
         #we just force a restride, which will allocate a new pixel buffer:
         cdef unsigned int newstride = roundup(self.width*len(self.pixel_format), 4)
-        self.timestamp = int(monotonic()*1000)
         return self.restride(newstride)
 
     def free(self):
         #ensure we never try to XDestroyImage:
         self.image = NULL
         self.free_pixels()
-        cb = self.free_callback
-        if cb:
-            self.free_callback = None
-            cb()
-        xshmdebug("XShmImageWrapper.free() done for %s, callback fired=%s", self, bool(cb))
-
-    cdef set_free_callback(self, object callback):
-        self.free_callback = callback
+        cdef XShmSegment segment = self.segment
+        if segment is not None:
+            self.segment = None
+            segment.free_image_callback()
+        xshmdebug("XShmImageWrapper.free() done for %s, segment=%s", self, segment)
+
+    cdef set_segment(self, XShmSegment segment):
+        self.segment = segment
 
 
 cdef int xpixmap_counter = 0
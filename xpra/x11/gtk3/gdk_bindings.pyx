@@ -11,6 +11,7 @@ from typing import Callable, Dict, Set
 import gi
 gi.require_version('GdkX11', '3.0')
 from gi.repository import GObject           #@UnresolvedImport
+from gi.repository import GLib              #@UnresolvedImport
 from gi.repository import GdkX11            #@UnresolvedImport @UnusedImport
 from gi.repository import Gdk               #@UnresolvedImport
 from gi.repository import Gtk               #@UnresolvedImport
@@ -26,8 +27,8 @@ from xpra.x11.bindings.xlib cimport (
     Display, Window, Visual, Atom,
     XEvent, XGetErrorText, XGetAtomName, XFree,
     )
-from xpra.x11.bindings.events cimport parse_xevent, init_x11_events
-from xpra.x11.bindings.events import get_x_event_signals, get_x_event_type_name
+from xpra.x11.bindings.events cimport parse_xevent, init_x11_events, coalesce_damage
+from xpra.x11.bindings.events import get_x_event_signals, get_x_event_type_name, get_damage_events
 
 from libc.stdint cimport uintptr_t
 from xpra.gtk_common.gtk3.gdk_bindings cimport wrap, unwrap, get_raw_display_for
@@ -394,6 +395,22 @@ cdef _route_event(int etype, event, signal, parent_signal):
         _maybe_send_event(DEBUG, handlers, parent_signal, event, "catchall-parent-signal")
 
 
+cdef int damage_flush_pending = 0
+
+def flush_damage_events() -> None:
+    global damage_flush_pending
+    damage_flush_pending = 0
+    for pyev in get_damage_events():
+        event_args = get_x_event_signals(pyev.type)
+        if event_args is None:
+            continue
+        signal, parent_signal = event_args
+        try:
+            _route_event(pyev.type, pyev, signal, parent_signal)
+        except Exception:
+            log.warn("Unhandled exception routing %s:", pyev, exc_info=True)
+
+
 cdef GdkFilterReturn x_event_filter(GdkXEvent * e_gdk,
                                     GdkEvent * gdk_event,
                                     void * userdata) except GDK_FILTER_CONTINUE with gil:
@@ -402,9 +419,17 @@ cdef GdkFilterReturn x_event_filter(GdkXEvent * e_gdk,
     cdef double start = monotonic()
     cdef int etype
 
+    cdef XEvent * e = <XEvent*>e_gdk
+    global damage_flush_pending
+    if coalesce_damage(e):
+        #deliver the merged damage once we have processed the pending events,
+        #using the same priority as the X11 event source so a stream of events cannot starve it:
+        if not damage_flush_pending:
+            damage_flush_pending = 1
+            GLib.idle_add(flush_damage_events, priority=GLib.PRIORITY_DEFAULT)
+        return GDK_FILTER_CONTINUE  # @UndefinedVariable
     gdk_display = Gdk.get_default_root_window().get_display()
     cdef Display *display = get_xdisplay_for(gdk_display)
-    cdef XEvent * e = <XEvent*>e_gdk
     try:
         pyev = parse_xevent(display, e)
     except Exception:
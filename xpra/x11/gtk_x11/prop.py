@@ -15,6 +15,7 @@ the conversions for plain python types is found in prop_conv.py
 """
 
 import struct
+from typing import Any
 
 from xpra.x11.prop_conv import prop_encode, prop_decode, PROP_TYPES, PROP_SIZES
 from xpra.x11.bindings.window import X11WindowBindings, PropertyError
@@ -85,14 +86,37 @@ def prop_type_get(xid:int, key:str):
         return None
 
 
+def prop_prefetch(xid:int, keys) -> dict[str,Any]:
+    """
+        Retrieves the raw data for all these properties in a single round trip,
+        the result can be passed to 'prop_get' as 'prefetched'.
+    """
+    try:
+        with XSyncContext():
+            return X11WindowBindings().GetWindowProperties(xid, tuple(keys))
+    except XError:
+        log("prop_prefetch%s", (xid, keys), exc_info=True)
+        return {}
+
+
 # May return None.
-def prop_get(xid:int, key:str, etype, ignore_errors:bool=False, raise_xerrors:bool=False):
+def prop_get(xid:int, key:str, etype, ignore_errors:bool=False, raise_xerrors:bool=False, prefetched=None):
     #ie: 0x4000, "_NET_WM_PID", "u32"
     if isinstance(etype, (list, tuple)):
         scalar_type = etype[0]
     else:
         scalar_type = etype #ie: "u32"
     type_atom = PROP_TYPES[scalar_type][1]  #ie: "CARDINAL"
+    if prefetched and key in prefetched:
+        value = prefetched[key]
+        if value is None:
+            if not ignore_errors:
+                log("Missing property %s (%s)", key, type_atom)
+            return None
+        actual_type, data = value
+        if actual_type==_get_xatom(type_atom):
+            return do_prop_decode(key, etype, data, ignore_errors)
+        #not the type we expected, let raw_prop_get deal with it
     buffer_size = PROP_SIZES.get(scalar_type, 65536)
     data = raw_prop_get(xid, key, type_atom, buffer_size, ignore_errors, raise_xerrors)
     if data is None:
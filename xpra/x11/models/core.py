@@ -21,7 +21,7 @@ from xpra.x11.bindings.res import ResBindings #@UnresolvedImport
 from xpra.x11.bindings.send_wm import send_wm_delete_window
 from xpra.x11.models.model_stub import WindowModelStub
 from xpra.x11.gtk_x11.composite import CompositeHelper
-from xpra.x11.gtk_x11.prop import prop_get, prop_set, prop_del, prop_type_get, PYTHON_TYPES
+from xpra.x11.gtk_x11.prop import prop_get, prop_set, prop_del, prop_type_get, prop_prefetch, PYTHON_TYPES
 from xpra.x11.gtk3.gdk_bindings import add_event_receiver, remove_event_receiver
 from xpra.log import Logger
 
@@ -48,6 +48,7 @@ FORCE_QUIT = envbool("XPRA_FORCE_QUIT", True)
 XSHAPE = envbool("XPRA_XSHAPE", True)
 FRAME_EXTENTS = envbool("XPRA_FRAME_EXTENTS", True)
 OPAQUE_REGION = envbool("XPRA_OPAQUE_REGION", True)
+PREFETCH_PROPERTIES = envbool("XPRA_X11_PREFETCH_PROPERTIES", True)
 
 
 CurrentTime = constants["CurrentTime"]
@@ -250,6 +251,8 @@ class CoreX11WindowModel(WindowModelStub):
         self._damage_forward_handle = None
         self._setup_done = False
         self._kill_count = 0
+        #raw property data, only used while reading the initial properties:
+        self._prefetched : dict[str,Any] = {}
 
 
     def __repr__(self) -> str:  #pylint: disable=arguments-differ
@@ -414,24 +417,32 @@ class CoreX11WindowModel(WindowModelStub):
         #but we don't export them as "dynamic" properties, so this won't be propagated
         #maybe we want to catch errors parsing _NET_WM_ICON ?
         metalog("initial X11_properties: querying %s", self._initial_x11_properties)
+        if PREFETCH_PROPERTIES:
+            #fetch them all in one round trip, the handlers will use this data:
+            self._prefetched = prop_prefetch(self.xid, self._initial_x11_properties)
+            metalog("prefetched %i properties", len(self._prefetched))
         #to make sure we don't call the same handler twice which is pointless
         #(the same handler may handle more than one X11 property)
         handlers = set()
-        for mutable in self._initial_x11_properties:
-            handler = self._x11_property_handlers.get(mutable)
-            if not handler:
-                log.error(f"Error: unknown initial X11 property: {mutable!r}")
-            elif handler not in handlers:
-                handlers.add(handler)
-                try:
-                    handler(self)
-                except XError:
-                    log("handler %s failed", handler, exc_info=True)
-                    #these will be caught in call_setup()
-                    raise
-                except Exception:
-                    #try to continue:
-                    log.error("Error parsing initial property {mutable!r}", exc_info=True)
+        try:
+            for mutable in self._initial_x11_properties:
+                handler = self._x11_property_handlers.get(mutable)
+                if not handler:
+                    log.error(f"Error: unknown initial X11 property: {mutable!r}")
+                elif handler not in handlers:
+                    handlers.add(handler)
+                    try:
+                        handler(self)
+                    except XError:
+                        log("handler %s failed", handler, exc_info=True)
+                        #these will be caught in call_setup()
+                        raise
+                    except Exception:
+                        #try to continue:
+                        log.error("Error parsing initial property {mutable!r}", exc_info=True)
+        finally:
+            #from now on, the properties may change:
+            self._prefetched = {}
 
     def _scrub_x11(self) -> None:
         metalog("scrub_x11() x11 properties=%s", self._scrub_x11_properties)
@@ -529,7 +540,8 @@ class CoreX11WindowModel(WindowModelStub):
         """
         if ignore_errors is None and (not self._setup_done or not self._managed):
             ignore_errors = True
-        return prop_get(self.xid, key, ptype, ignore_errors=bool(ignore_errors), raise_xerrors=raise_xerrors)
+        return prop_get(self.xid, key, ptype, ignore_errors=bool(ignore_errors), raise_xerrors=raise_xerrors,
+                        prefetched=self._prefetched)
 
     def prop_del(self, key) -> None:
         prop_del(self.xid, key)
@@ -6,8 +6,9 @@
 # later version. See the file COPYING for details.
 
 import re
-from time import monotonic_ns
+from time import monotonic, monotonic_ns
 from typing import Any
+from gi.repository import GObject  # @UnresolvedImport
 
 from xpra.x11.x11_server_core import X11ServerCore
 from xpra.net.compression import Compressed
@@ -17,10 +18,12 @@ from xpra.server.shadow.root_window_model import RootWindowModel
 from xpra.server.shadow.gtk_shadow_server_base import GTKShadowServerBase
 from xpra.server.shadow.gtk_root_window_model import GTKImageCapture
 from xpra.server.shadow.shadow_server_base import ShadowServerBase
+from xpra.server.shadow.damage_regions import DamageRegions
 from xpra.server.server_uuid import del_mode, del_uuid
 from xpra.x11.gtk_x11.prop import prop_get
 from xpra.x11.bindings.window import X11WindowBindings     #@UnresolvedImport
 from xpra.gtk_common.gtk_util import get_default_root_window, get_root_size
+from xpra.gtk_common.gobject_util import one_arg_signal
 from xpra.gtk_common.error import xsync, xlog
 from xpra.log import Logger
 
@@ -30,6 +33,11 @@ XSHM : bool = envbool("XPRA_SHADOW_XSHM", True)
 POLL_CURSOR : int = envint("XPRA_SHADOW_POLL_CURSOR", 20)
 NVFBC : bool = envbool("XPRA_SHADOW_NVFBC", True)
 GSTREAMER : bool = envbool("XPRA_SHADOW_GSTREAMER", False)
+#capture the areas reported by XDamage instead of polling the whole screen:
+XDAMAGE : bool = envbool("XPRA_SHADOW_XDAMAGE", True)
+#use XGetImage for the damaged areas when they cover less than this percentage of the screen,
+#instead of grabbing the whole screen with XShm:
+XDAMAGE_PARTIAL_PCT : int = envint("XPRA_SHADOW_XDAMAGE_PARTIAL_PCT", 25)
 nvfbc = None
 if NVFBC:
     try:
@@ -177,11 +185,12 @@ def window_matches(wspec, model_class):
 
 
 class XImageCapture:
-    __slots__ = ("xshm", "xwindow", "XImage")
+    __slots__ = ("xshm", "xwindow", "XImage", "partial")
     def __init__(self, xwindow:int):
         log("XImageCapture(%#x)", xwindow)
         self.xshm = None
         self.xwindow = xwindow
+        self.partial = False
         from xpra.x11.bindings.ximage import XImageBindings     #@UnresolvedImport pylint: disable=import-outside-toplevel
         self.XImage = XImageBindings()
         assert XSHM and self.XImage.has_XShm(), "no XShm support"
@@ -213,7 +222,19 @@ class XImageCapture:
             log.warn(" %s", e)
         self.close_xshm()
 
+    def refresh_damage(self, pixels:int, total:int) -> bool:
+        """
+            Only some areas of the screen have been damaged:
+            when they are small enough, we can capture them individually
+            rather than grabbing the whole screen.
+        """
+        self.partial = pixels*100<total*XDAMAGE_PARTIAL_PCT
+        if self.partial:
+            return True
+        return self.refresh()
+
     def refresh(self) -> bool:
+        self.partial = False
         if self.xshm:
             #discard to ensure we will call XShmGetImage next time around
             self.xshm.discard()
@@ -230,6 +251,13 @@ class XImageCapture:
 
     def get_image(self, x:int, y:int, width:int, height:int):
         log("XImageCapture.get_image%s for %#x", (x, y, width, height), self.xwindow)
+        if self.partial:
+            try:
+                with xsync:
+                    return self.XImage.get_ximage(self.xwindow, x, y, width, height)
+            except Exception as e:
+                self._err(e)
+                return None
         if self.xshm is None:
             log("no xshm, cannot get image")
             return None
@@ -294,6 +322,55 @@ def setup_capture(window):
     return GTKImageCapture(window)
 
 
+class RootDamageHandler(GObject.GObject):
+    """
+        Receives the XDamage events for the root window
+        and forwards the damaged areas to the callback.
+    """
+    __gsignals__ = {
+        "xpra-damage-event"     : one_arg_signal,
+        }
+
+    #the desktop models may also be receiving events for the root window:
+    MAX_RECEIVERS = 20
+
+    def __init__(self, xid:int, callback):
+        super().__init__()
+        self.xid : int = xid
+        self.callback = callback
+        self.damage_handle : int = 0
+
+    def __repr__(self):
+        return f"RootDamageHandler({self.xid:#x})"
+
+    def setup(self) -> None:
+        # pylint: disable=import-outside-toplevel
+        from xpra.x11.gtk3.gdk_bindings import add_event_receiver
+        wb = X11WindowBindings()
+        with xsync:
+            wb.ensure_XDamage_support()
+            #raw mode reports each drawing operation,
+            #so we never have to call XDamageSubtract:
+            self.damage_handle = wb.XDamageCreate(self.xid, True)
+        log("damage handle(%#x)=%#x", self.xid, self.damage_handle)
+        add_event_receiver(self.xid, self, self.MAX_RECEIVERS)
+
+    def cleanup(self) -> None:
+        # pylint: disable=import-outside-toplevel
+        from xpra.x11.gtk3.gdk_bindings import remove_event_receiver
+        remove_event_receiver(self.xid, self)
+        dh = self.damage_handle
+        if dh:
+            self.damage_handle = 0
+            with xlog:
+                X11WindowBindings().XDamageDestroy(dh)
+
+    def do_xpra_damage_event(self, event) -> None:
+        self.callback(event.x, event.y, event.width, event.height)
+
+GObject.type_register(RootDamageHandler)
+
+
 class X11ShadowModel(RootWindowModel):
     __slots__ = ("xid", "override_redirect", "transient_for", "parent", "relative_position")
     def __init__(self, root_window, capture=None, title="", geometry=None):
@@ -327,6 +404,9 @@ class ShadowX11Server(GTKShadowServerBase, X11ServerCore):
         X11ServerCore.__init__(self)
         self.session_type = "X11 shadow"
         self.modify_keymap = False
+        self.root_damage = None
+        self.damage_regions = DamageRegions()
+        self.last_capture : float = 0
 
     def init(self, opts) -> None:
         GTKShadowServerBase.init(self, opts)
@@ -358,8 +438,86 @@ class ShadowX11Server(GTKShadowServerBase, X11ServerCore):
     def setup_capture(self):
         capture = setup_capture(self.root)
         log(f"setup_capture({self.root})={capture}")
+        self.cleanup_root_damage()
+        if XDAMAGE and isinstance(capture, XImageCapture):
+            self.setup_root_damage()
         return capture
 
+    def cleanup_capture(self) -> None:
+        self.cleanup_root_damage()
+        super().cleanup_capture()
+
+
+    ############################################################################
+    # damage driven refresh
+    # when the capture backend supports it, we only capture the areas reported by XDamage,
+    # otherwise we poll the whole screen using the refresh timer
+
+    def setup_root_damage(self) -> None:
+        rd = RootDamageHandler(self.root.get_xid(), self.root_damaged)
+        try:
+            rd.setup()
+        except Exception as e:
+            log("setup_root_damage()", exc_info=True)
+            log.info(f"XDamage is not available, using polling: {e}")
+            return
+        self.root_damage = rd
+        self.damage_regions = DamageRegions()
+        log("using XDamage for %s", self.root)
+
+    def cleanup_root_damage(self) -> None:
+        rd = self.root_damage
+        if rd:
+            self.root_damage = None
+            rd.cleanup()
+
+    def root_damaged(self, x:int, y:int, width:int, height:int) -> None:
+        self.damage_regions.add(x, y, width, height)
+        self.schedule_damage_refresh()
+
+    def schedule_damage_refresh(self) -> None:
+        if self.refresh_timer or not self.mapped or not self.damage_regions:
+            return
+        #honour the refresh rate:
+        elapsed = int(1000*(monotonic()-self.last_capture))
+        delay = max(0, self.refresh_delay-elapsed)
+        self.refresh_timer = self.timeout_add(delay, self.refresh)
+
+    def start_refresh(self, wid:int) -> None:
+        if self.root_damage and wid not in self.mapped:
+            #start with the whole screen:
+            self.damage_regions.add(0, 0, *get_root_size())
+        super().start_refresh(wid)
+
+    def start_refresh_timer(self) -> None:
+        if self.root_damage:
+            self.schedule_damage_refresh()
+        else:
+            super().start_refresh_timer()
+
+    def refresh(self) -> bool:
+        if not self.root_damage:
+            return super().refresh()
+        self.refresh_timer = 0
+        if not self.mapped:
+            return False
+        self.refresh_window_models()
+        rects = self.damage_regions.take()
+        if not rects or not self.capture:
+            return False
+        self.last_capture = monotonic()
+        rw, rh = get_root_size()
+        pixels = sum(r.width*r.height for r in rects)
+        self.capture.refresh_damage(pixels, rw*rh)
+        log("refresh() %i damaged pixels in %s", pixels, rects)
+        for window in tuple(self._id_to_window.values()):
+            wx, wy, ww, wh = window.get_geometry()
+            for r in rects:
+                area = r.intersection(wx, wy, ww, wh)
+                if area:
+                    self.refresh_window_area(window, area.x-wx, area.y-wy, area.width, area.height)
+        return False
+
 
     def get_root_window_model_class(self) -> type:
         return X11ShadowModel
@@ -440,6 +598,8 @@ class ShadowX11Server(GTKShadowServerBase, X11ServerCore):
         merge_dicts(info, ShadowServerBase.get_info(self, proto))
         info.setdefault("features", {})["shadow"] = True
         info.setdefault("server", {})["type"] = "Python/gtk3/x11-shadow"
+        if self.root_damage:
+            info.setdefault("shadow", {})["damage"] = self.damage_regions.get_info()
         return info
 
     def do_make_screenshot_packet(self) -> tuple[str,int,int,str,int,Compressed]: